@@ -8,11 +8,22 @@ import os
 # Import extensions from extensions module
 from app.extensions import db, jwt
 from app.utils.project_profile import load_project_profile
-from app.utils.schema_helpers import ensure_user_landlord_flag
 from app.utils.audit import register_audit_listeners
+from app.utils.search import register_search_listeners
+from app.cli import register_commands
+from app.utils.storage import StorageRequest, register_storage_listeners
+from app.utils.template_registry import register_template_listeners
 
-def create_app():
+def create_app(start_jobs=False):
+    """App-Factory ohne Seiteneffekte auf die Datenbank.
+
+    Migrationen laufen über ``flask init-db`` (siehe ``app/cli.py``).
+    Hintergrundjobs startet ``start_jobs=True`` oder der Aufrufer selbst
+    (Gunicorn je Worker nach dem Fork).
+    """
     app = Flask(__name__)
+    # Uploads werden beim Parsen in eine hashende Temp-Datei gestreamt
+    app.request_class = StorageRequest
     
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-me')
@@ -38,7 +49,15 @@ def create_app():
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-me')
     app.config['UPLOAD_FOLDER'] = upload_dir
     app.config['PREFERRED_URL_SCHEME'] = os.environ.get('PREFERRED_URL_SCHEME', 'https')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024
+    # Auslieferung durch den Webserver: X-Sendfile (Apache) oder X-Accel-Redirect (nginx)
+    app.config['USE_X_SENDFILE'] = os.environ.get('STORAGE_X_SENDFILE', '0') == '1'
+    app.config['STORAGE_ACCEL_REDIRECT'] = os.environ.get('STORAGE_ACCEL_REDIRECT')
+    # PDF-Exporte (xhtml2pdf/reportlab) in eigenem Prozess; 0 = im Web-Worker
+    app.config['EXPORT_PROCESSES'] = int(os.environ.get('EXPORT_PROCESSES', 1))
+    app.config['EXPORT_PROCESS_IDLE_SECONDS'] = int(os.environ.get('EXPORT_PROCESS_IDLE_SECONDS', 300))
+    # Abfrageabstand für Benachrichtigungen, wenn alle SSE-Threads belegt sind
+    app.config['SSE_SHORT_POLL_SECONDS'] = int(os.environ.get('SSE_SHORT_POLL_SECONDS', 30))
     
     # Session Configuration
     app.config['SESSION_TYPE'] = 'filesystem'
@@ -52,6 +71,9 @@ def create_app():
     jwt.init_app(app)
     CORS(app)
     register_audit_listeners()
+    register_search_listeners()
+    register_template_listeners()
+    register_storage_listeners()
     
     # Swagger UI configuration
     SWAGGER_URL = '/api/docs'
@@ -106,9 +128,10 @@ def create_app():
     
     # Register blueprints first to avoid circular imports
     register_blueprints(app)
-    
-    # Then initialize database
-    initialize_database(app)
+    register_commands(app)
+
+    if start_jobs:
+        start_background_jobs(app)
     
     # Add context processor for buildings after database is initialized
     @app.context_processor
@@ -201,21 +224,15 @@ def create_app():
                 'path': rule.rule
             })
         return jsonify(routes)
-    
-    print("🚀 Starting Flask server on port 5000...")
-    print("📊 Access the application at: http://localhost:5000")
-    
+
     return app
 
 def register_blueprints(app):
     """Register all blueprints to avoid circular imports"""
-    print("📋 Registering blueprints...")
-    
     # Setup Routes (Web only)
     try:
         from app.routes.setup import setup_bp
         app.register_blueprint(setup_bp, url_prefix='/setup')
-        print("✅ Setup routes registered")
     except ImportError as e:
         print(f"❌ Failed to import setup routes: {e}")
     
@@ -228,7 +245,6 @@ def register_blueprints(app):
             app.add_url_rule('/api/auth/logout', view_func=auth_bp.view_functions['auth.api_logout'], methods=['POST'])
         except KeyError:
             pass
-        print("✅ Auth routes registered")
     except ImportError as e:
         print(f"❌ Failed to import auth routes: {e}")
     
@@ -236,7 +252,6 @@ def register_blueprints(app):
     try:
         from app.routes.main import main_bp
         app.register_blueprint(main_bp)
-        print("✅ Main routes registered")
     except ImportError as e:
         print(f"❌ Failed to import main routes: {e}")
     
@@ -244,7 +259,6 @@ def register_blueprints(app):
     try:
         from app.routes.apartments import apartments_bp
         app.register_blueprint(apartments_bp, url_prefix='/apartments')
-        print("✅ Apartment routes registered")
     except ImportError as e:
         print(f"❌ Failed to import apartment routes: {e}")
 
@@ -252,7 +266,6 @@ def register_blueprints(app):
     try:
         from app.routes.tenants import tenants_bp
         app.register_blueprint(tenants_bp, url_prefix='/tenants')
-        print("✅ Tenant routes registered")
     except ImportError as e:
         print(f"❌ Failed to import tenant routes: {e}")
 
@@ -260,7 +273,6 @@ def register_blueprints(app):
     try:
         from app.routes.meter_readings import meter_bp
         app.register_blueprint(meter_bp, url_prefix='/meter-readings')
-        print("✅ Meter reading routes registered")
     except ImportError as e:
         print(f"❌ Failed to import meter reading routes: {e}")
 
@@ -268,7 +280,6 @@ def register_blueprints(app):
     try:
         from app.routes.meters import meters_bp
         app.register_blueprint(meters_bp, url_prefix='/meters')
-        print("✅ Meter management routes registered")
     except ImportError as e:
         print(f"❌ Failed to import meter management routes: {e}")
 
@@ -276,7 +287,6 @@ def register_blueprints(app):
     try:
         from app.routes.documents import documents_bp
         app.register_blueprint(documents_bp, url_prefix='/documents')
-        print("✅ Document routes registered")
     except ImportError as e:
         print(f"❌ Failed to import document routes: {e}")
 
@@ -284,7 +294,6 @@ def register_blueprints(app):
     try:
         from app.routes.settlements import settlements_bp
         app.register_blueprint(settlements_bp, url_prefix='/settlements')
-        print("✅ Settlement routes registered")
     except ImportError as e:
         print(f"❌ Failed to import settlement routes: {e}")
 
@@ -292,7 +301,6 @@ def register_blueprints(app):
     try:
         from app.routes.buildings import buildings_bp
         app.register_blueprint(buildings_bp, url_prefix='/buildings')
-        print("✅ Buildings routes registered")
     except ImportError as e:
         print(f"❌ Failed to import buildings routes: {e}")
 
@@ -300,7 +308,6 @@ def register_blueprints(app):
     try:
         from app.routes.meter_types import meter_types_bp
         app.register_blueprint(meter_types_bp, url_prefix='/meter-types')
-        print("✅ Meter types routes registered")
     except ImportError as e:
         print(f"❌ Failed to import meter types routes: {e}")
 
@@ -308,7 +315,6 @@ def register_blueprints(app):
     try:
         from app.routes.contracts import contracts_bp
         app.register_blueprint(contracts_bp, url_prefix='/contracts')
-        print("✅ Contract routes registered at /contracts")
     except ImportError as e:
         print(f"❌ Failed to import contract routes: {e}")
 
@@ -316,7 +322,6 @@ def register_blueprints(app):
     try:
         from app.routes.contract_templates import templates_bp
         app.register_blueprint(templates_bp, url_prefix='/contract-templates')
-        print("✅ Contract templates routes registered")
     except ImportError as e:
         print(f"❌ Failed to import contract templates routes: {e}")
 
@@ -324,28 +329,24 @@ def register_blueprints(app):
     try:
         from app.routes.protocols import protocols_bp
         app.register_blueprint(protocols_bp, url_prefix='/protocols')
-        print("✅ Protocol routes registered")
     except ImportError as e:
         print(f"❌ Failed to import protocol routes: {e}")
 
     try:
         from app.routes.costs import costs_bp
         app.register_blueprint(costs_bp)
-        print("✅ Costs routes registered")
     except ImportError as e:
         print(f"⚠️  Costs routes not available: {e}")
 
     try:
         from app.routes.reports import reports_bp
         app.register_blueprint(reports_bp)
-        print("✅ Reports routes registered")
     except ImportError as e:
         print(f"⚠️  Reports routes not available: {e}")
 
     try:
         from app.routes.settings import settings_bp
         app.register_blueprint(settings_bp)
-        print("✅ Settings routes registered")
     except ImportError as e:
         print(f"⚠️  Settings routes not available: {e}")
 
@@ -353,28 +354,24 @@ def register_blueprints(app):
     try:
         from app.routes.contract_editor import contract_editor_bp
         app.register_blueprint(contract_editor_bp)
-        print("✅ Contract editor routes registered")
     except ImportError as e:
         print(f"❌ Failed to import contract editor routes: {e}")
 
     try:
         from app.routes.contract_editor import landlords_api_bp
         app.register_blueprint(landlords_api_bp)
-        print("✅ Landlord API routes registered")
     except ImportError as e:
         print(f"⚠️  Landlord API routes not available: {e}")
 
     try:
         from app.routes.users import users_bp
         app.register_blueprint(users_bp)
-        print("✅ User routes registered")
     except ImportError as e:
         print(f"⚠️  User routes not available: {e}")
 
     try:
         from app.routes.buildings import buildings_api_bp
         app.register_blueprint(buildings_api_bp, url_prefix='/api/buildings')
-        print("✅ Buildings API routes registered")
     except ImportError as e:
         print(f"⚠️  Buildings API routes not available: {e}")
 
@@ -382,7 +379,6 @@ def register_blueprints(app):
     try:
         from app.routes.apartments import apartments_api_bp
         app.register_blueprint(apartments_api_bp, url_prefix='/api/apartments')
-        print("✅ Apartments API routes registered")
     except ImportError as e:
         print(f"⚠️  Apartments API routes not available: {e}")
 
@@ -390,7 +386,6 @@ def register_blueprints(app):
     try:
         from app.routes.tenants import tenants_api_bp
         app.register_blueprint(tenants_api_bp, url_prefix='/api/tenants')
-        print("✅ Tenants API routes registered")
     except ImportError as e:
         print(f"⚠️  Tenants API routes not available: {e}")
 
@@ -398,15 +393,34 @@ def register_blueprints(app):
     try:
         from app.routes.meter_readings import meter_readings_api_bp
         app.register_blueprint(meter_readings_api_bp, url_prefix='/api/meter-readings')
-        print("✅ Meter readings API routes registered")
     except ImportError as e:
         print(f"⚠️  Meter readings API routes not available: {e}")
 
+    # Costs API Routes (Sammelimport)
+    try:
+        from app.routes.costs import costs_api_bp
+        app.register_blueprint(costs_api_bp, url_prefix='/api/costs')
+    except ImportError as e:
+        print(f"⚠️  Costs API routes not available: {e}")
+
+    # Incomes API Routes (Sammelimport)
+    try:
+        from app.routes.main import incomes_api_bp
+        app.register_blueprint(incomes_api_bp, url_prefix='/api/incomes')
+    except ImportError as e:
+        print(f"⚠️  Incomes API routes not available: {e}")
+
+    # Delta-Sync API für die Mobil-App
+    try:
+        from app.routes.sync import sync_api_bp
+        app.register_blueprint(sync_api_bp, url_prefix='/api/sync')
+    except ImportError as e:
+        print(f"⚠️  Sync API routes not available: {e}")
+
     # Documents API Routes (separate registration)
     try:
         from app.routes.documents import documents_api_bp
         app.register_blueprint(documents_api_bp, url_prefix='/api/documents')
-        print("✅ Documents API routes registered")
     except ImportError as e:
         print(f"⚠️  Documents API routes not available: {e}")
 
@@ -414,126 +428,75 @@ def register_blueprints(app):
     try:
         from app.routes.settlements import settlements_api_bp
         app.register_blueprint(settlements_api_bp, url_prefix='/api/settlements')
-        print("✅ Settlements API routes registered")
     except ImportError as e:
         print(f"⚠️  Settlements API routes not available: {e}")
 
+    # Globale Suche
+    try:
+        from app.routes.search import search_bp, search_api_bp
+        app.register_blueprint(search_bp, url_prefix='/search')
+        app.register_blueprint(search_api_bp, url_prefix='/api/search')
+    except ImportError as e:
+        print(f"⚠️  Search routes not available: {e}")
+
     # Settings Routes (optional - if they exist)
     # RSS Feeds Routes
     try:
         from app.routes.rss_feeds import rss_bp
         app.register_blueprint(rss_bp, url_prefix='/rss')
-        print("✅ RSS feeds routes registered")
-        
-        # Standard-RSS-Feeds initialisieren - NUR im App-Kontext
-        def init_rss_feeds():
-            try:
-                from app.routes.rss_feeds import initialize_default_feeds
-                initialize_default_feeds()
-                print("✅ Default RSS feeds initialized")
-            except Exception as e:
-                print(f"⚠️  Could not initialize default RSS feeds: {e}")
-        
-        # Spätere Initialisierung nach Datenbank-Setup
-        init_rss_feeds()
-        
     except ImportError as e:
         print(f"❌ Failed to import RSS feeds routes: {e}")
 
 
-    # Debug routes check
-    print("🔍 DEBUG: Checking registered routes...")
-    for rule in app.url_map.iter_rules():
-        if 'contracts' in rule.rule or 'protocols' in rule.rule:
-            print(f"  📍 {rule.rule} -> {rule.endpoint}")
+def start_background_jobs(app):
+    """Startet Hintergrundjobs (Feeds, Erinnerungen, Sync-Bereinigung, Rechnungsentwürfe, Texterkennung) außerhalb des Request-Pfads."""
+    app.config.setdefault('RSS_SCHEDULER_ENABLED', os.environ.get('RSS_SCHEDULER_ENABLED', '1') != '0')
+    app.config.setdefault(
+        'NOTIFICATION_SCHEDULER_ENABLED', os.environ.get('NOTIFICATION_SCHEDULER_ENABLED', '1') != '0'
+    )
+    app.config.setdefault('SYNC_RETENTION_ENABLED', os.environ.get('SYNC_RETENTION_ENABLED', '1') != '0')
+    app.config.setdefault('SYNC_CHANGE_RETENTION_DAYS', int(os.environ.get('SYNC_CHANGE_RETENTION_DAYS', '90')))
+    app.config.setdefault('DRAFT_INVOICE_CLEANUP_ENABLED', os.environ.get('DRAFT_INVOICE_CLEANUP_ENABLED', '1') != '0')
+    app.config.setdefault('TEXT_EXTRACTION_ENABLED', os.environ.get('TEXT_EXTRACTION_ENABLED', '1') != '0')
+    app.config.setdefault('TEXT_EXTRACTION_WORKERS', int(os.environ.get('TEXT_EXTRACTION_WORKERS', '2')))
+    try:
+        from app.routes.rss_feeds import start_feed_scheduler
+        start_feed_scheduler(app)
+    except Exception as e:
+        print(f"⚠️  Could not start RSS scheduler: {e}")
 
-    print("🔍 DEBUG: Checking template directories...")
-    print(f"  Template folders: {app.jinja_loader.list_templates()[:10]}...")
+    try:
+        from app.utils.notifications import start_notification_scheduler
+        start_notification_scheduler(app)
+    except Exception as e:
+        print(f"⚠️  Could not start notification scheduler: {e}")
 
-def initialize_database(app):
-    """Initialize database after all blueprints are registered"""
-    with app.app_context():
-        try:
-            db.create_all()
-            print("📦 Creating database tables...")
-            print("✅ Database tables created")
-
-            # Sicherstellen, dass Vermieter-Flags in der Users-Tabelle vorhanden sind,
-            # bevor weitere Abfragen auf die User-Tabelle erfolgen.
-            ensure_user_landlord_flag()
-
-            # Debug: Prüfen der User-Tabelle
-            from app.models import User
-            users = User.query.all()
-            print(f"🔍 DEBUG: Found {len(users)} users in database:")
-            for user in users:
-                print(f"🔍 DEBUG: User {user.id}: {user.first_name} {user.last_name} ({user.email})")
-
-            # Falls kein Admin existiert, ersten Benutzer hochstufen
-            if users and not any(u.role == 'admin' for u in users):
-                users[0].role = 'admin'
-                db.session.commit()
-                print(f"✅ Elevated user {users[0].username} to admin (fallback)")
-            
-            # Prüfe ob status Spalte in tenants Tabelle existiert
-            from sqlalchemy import inspect, text
-            inspector = inspect(db.engine)
-            columns = [col['name'] for col in inspector.get_columns('tenants')]
-            
-            if 'status' not in columns:
-                print("🔄 Adding status column to tenants table...")
-                db.session.execute(text('ALTER TABLE tenants ADD COLUMN status VARCHAR(20) DEFAULT "active"'))
-                db.session.commit()
-                print("✅ Status column added to tenants table")
-                
-            # Bestehende Mieter auf active setzen, falls nicht gesetzt
-            from app.models import Tenant
-            tenants_without_status = Tenant.query.filter(Tenant.status == None).all()
-            for tenant in tenants_without_status:
-                tenant.status = 'active'
-            if tenants_without_status:
-                db.session.commit()
-                print(f"✅ Updated status for {len(tenants_without_status)} existing tenants")
-
-            # Prüfe ob tenant_audit_logs Tabelle existiert
-            if 'tenant_audit_logs' not in inspector.get_table_names():
-                print("🔄 Creating tenant_audit_logs table...")
-                # Tabelle wird automatisch durch db.create_all() erstellt
-                print("✅ Tenant audit logs table created")
-
-            # Sicherstellen, dass neue Betriebskosten-Spalten vorhanden sind
-            try:
-                cost_columns = [col['name'] for col in inspector.get_columns('operating_costs')]
-                if 'system_invoice_number' not in cost_columns:
-                    print("🔄 Adding system_invoice_number to operating_costs...")
-                    db.session.execute(text('ALTER TABLE operating_costs ADD COLUMN system_invoice_number VARCHAR(120)'))
-                    db.session.commit()
-                    print("✅ system_invoice_number added")
-                if 'allocation_percent' not in cost_columns:
-                    print("🔄 Adding allocation_percent to operating_costs...")
-                    db.session.execute(text('ALTER TABLE operating_costs ADD COLUMN allocation_percent FLOAT DEFAULT 0.0'))
-                    db.session.commit()
-                    print("✅ allocation_percent added")
-                if 'vendor_invoice_number' not in cost_columns:
-                    print("🔄 Adding vendor_invoice_number to operating_costs...")
-                    db.session.execute(text('ALTER TABLE operating_costs ADD COLUMN vendor_invoice_number VARCHAR(120)'))
-                    db.session.commit()
-                    print("✅ vendor_invoice_number added")
-            except Exception as mig_exc:
-                print(f"⚠️ Could not migrate operating_costs columns: {mig_exc}")
-
-            # Settlement-Felder absichern (falls alte Datenbankversion)
-            try:
-                settlement_columns = [col['name'] for col in inspector.get_columns('settlements')]
-                if 'tenant_id' not in settlement_columns:
-                    print("🔄 Adding tenant_id to settlements...")
-                    db.session.execute(text('ALTER TABLE settlements ADD COLUMN tenant_id VARCHAR(36)'))
-                    db.session.commit()
-                    print("✅ tenant_id added")
-            except Exception as mig_exc:
-                print(f"⚠️ Could not migrate settlements columns: {mig_exc}")
-                
-        except Exception as e:
-            print(f"❌ Database initialization error: {e}")
-            import traceback
-            traceback.print_exc()
\ No newline at end of file
+    try:
+        from app.routes.sync import start_sync_retention
+        start_sync_retention(app)
+    except Exception as e:
+        print(f"⚠️  Could not start sync retention: {e}")
+
+    try:
+        from app.routes.costs import start_draft_invoice_cleanup
+        start_draft_invoice_cleanup(app)
+    except Exception as e:
+        print(f"⚠️  Could not start draft invoice cleanup: {e}")
+
+    try:
+        from app.utils.text_extraction import start_text_extraction
+        start_text_extraction(app)
+    except Exception as e:
+        print(f"⚠️  Could not start text extraction: {e}")
+
+
+def stop_background_jobs(app):
+    """Beendet die Hintergrundjobs dieses Prozesses und gibt ihre Sperren frei."""
+    from app.utils.scheduler import BackgroundJob
+
+    for job in list(app.extensions.values()):
+        if isinstance(job, BackgroundJob):
+            try:
+                job.stop()
+            except Exception as e:
+                print(f"⚠️  Could not stop background job {job.name}: {e}")
\ No newline at end of file
@@ -0,0 +1,134 @@
+import sys
+
+import click
+
+from app.extensions import db
+from app.utils.contract_tree import migrate_paragraph_trees
+from app.utils.protocol_pipeline import backfill_protocol_summaries
+from app.utils.schema_helpers import (
+    ensure_user_landlord_flag,
+    ensure_rss_feed_columns,
+    ensure_rss_item_search,
+    ensure_notification_columns,
+    ensure_document_columns,
+    ensure_revision_storage_columns,
+    ensure_protocol_summary_columns,
+    ensure_search_index,
+)
+from app.utils.search import ensure_search_populated
+
+
+def register_commands(app):
+    """CLI-Befehle (``flask --app wsgi <befehl>``)."""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Tabellen anlegen, Migrationen und Datenübernahmen ausführen.
+
+        Läuft vor dem Start des Servers (Docker: vor Gunicorn); der Serverstart
+        selbst verändert die Datenbank nicht.
+        """
+        if not initialize_database(app):
+            sys.exit(1)
+        click.echo("✅ Database ready")
+
+
+def initialize_database(app):
+    """Tabellen anlegen, Spalten nachziehen und Bestandsdaten übernehmen.
+
+    Gibt ``False`` zurück, wenn dabei ein Fehler auftritt.
+    """
+    with app.app_context():
+        try:
+            print("📦 Creating database tables...")
+            db.create_all()
+            print("✅ Database tables created")
+
+            # Sicherstellen, dass Vermieter-Flags in der Users-Tabelle vorhanden sind,
+            # bevor weitere Abfragen auf die User-Tabelle erfolgen.
+            ensure_user_landlord_flag()
+            ensure_rss_feed_columns()
+            app.config['RSS_SEARCH_FTS'] = ensure_rss_item_search()
+            ensure_notification_columns()
+            ensure_document_columns()
+            ensure_revision_storage_columns()
+            ensure_protocol_summary_columns()
+            app.config['SEARCH_FTS'] = ensure_search_index()
+            ensure_search_populated()
+            migrate_paragraph_trees()
+            backfill_protocol_summaries()
+
+            # Falls kein Admin existiert, ersten Benutzer hochstufen
+            from app.models import User
+            if not User.query.filter_by(role='admin').first():
+                first_user = User.query.order_by(User.created_at).first()
+                if first_user:
+                    first_user.role = 'admin'
+                    db.session.commit()
+                    print(f"✅ Elevated user {first_user.username} to admin (fallback)")
+            
+            # Prüfe ob status Spalte in tenants Tabelle existiert
+            from sqlalchemy import inspect, text
+            inspector = inspect(db.engine)
+            columns = [col['name'] for col in inspector.get_columns('tenants')]
+            
+            if 'status' not in columns:
+                print("🔄 Adding status column to tenants table...")
+                db.session.execute(text('ALTER TABLE tenants ADD COLUMN status VARCHAR(20) DEFAULT "active"'))
+                db.session.commit()
+                print("✅ Status column added to tenants table")
+                
+            # Bestehende Mieter auf active setzen, falls nicht gesetzt
+            from app.models import Tenant
+            tenants_without_status = Tenant.query.filter(Tenant.status == None).all()
+            for tenant in tenants_without_status:
+                tenant.status = 'active'
+            if tenants_without_status:
+                db.session.commit()
+                print(f"✅ Updated status for {len(tenants_without_status)} existing tenants")
+
+            # Prüfe ob tenant_audit_logs Tabelle existiert
+            if 'tenant_audit_logs' not in inspector.get_table_names():
+                print("🔄 Creating tenant_audit_logs table...")
+                # Tabelle wird automatisch durch db.create_all() erstellt
+                print("✅ Tenant audit logs table created")
+
+            # Sicherstellen, dass neue Betriebskosten-Spalten vorhanden sind
+            try:
+                cost_columns = [col['name'] for col in inspector.get_columns('operating_costs')]
+                if 'system_invoice_number' not in cost_columns:
+                    print("🔄 Adding system_invoice_number to operating_costs...")
+                    db.session.execute(text('ALTER TABLE operating_costs ADD COLUMN system_invoice_number VARCHAR(120)'))
+                    db.session.commit()
+                    print("✅ system_invoice_number added")
+                if 'allocation_percent' not in cost_columns:
+                    print("🔄 Adding allocation_percent to operating_costs...")
+                    db.session.execute(text('ALTER TABLE operating_costs ADD COLUMN allocation_percent FLOAT DEFAULT 0.0'))
+                    db.session.commit()
+                    print("✅ allocation_percent added")
+                if 'vendor_invoice_number' not in cost_columns:
+                    print("🔄 Adding vendor_invoice_number to operating_costs...")
+                    db.session.execute(text('ALTER TABLE operating_costs ADD COLUMN vendor_invoice_number VARCHAR(120)'))
+                    db.session.commit()
+                    print("✅ vendor_invoice_number added")
+            except Exception as mig_exc:
+                print(f"⚠️ Could not migrate operating_costs columns: {mig_exc}")
+
+            # Settlement-Felder absichern (falls alte Datenbankversion)
+            try:
+                settlement_columns = [col['name'] for col in inspector.get_columns('settlements')]
+                if 'tenant_id' not in settlement_columns:
+                    print("🔄 Adding tenant_id to settlements...")
+                    db.session.execute(text('ALTER TABLE settlements ADD COLUMN tenant_id VARCHAR(36)'))
+                    db.session.commit()
+                    print("✅ tenant_id added")
+            except Exception as mig_exc:
+                print(f"⚠️ Could not migrate settlements columns: {mig_exc}")
+                
+        except Exception as e:
+            print(f"❌ Database initialization error: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    return True
+
@@ -2,6 +2,7 @@ from app.extensions import db  # Statt: from app import db
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 import uuid
+import zlib
 from flask import url_for
 import json
 
@@ -446,6 +447,11 @@ class Document(db.Model):
     file_path = db.Column(db.String(255), nullable=False)
     file_size = db.Column(db.Integer)
     mime_type = db.Column(db.String(100))
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 des Blobs
+    extraction_status = db.Column(db.String(20))  # pending, done, empty, unsupported, failed
+    extracted_text = db.Column(db.Text)
+    extracted_fields = db.Column(db.Text)  # JSON: erkannte Rechnungswerte
+    extracted_at = db.Column(db.DateTime)
     description = db.Column(db.Text)
     uploaded_by = db.Column(db.String(36), db.ForeignKey('users.id'))
     is_archived = db.Column(db.Boolean, default=False)
@@ -694,8 +700,39 @@ class Contract(db.Model):
     revisions = db.relationship('ContractRevision', backref='revision_contract', lazy=True)
     inventory_items = db.relationship('InventoryItem', backref='inventory_contract', lazy=True, cascade='all, delete-orphan')
     blocks = db.relationship('ContractBlock', backref='block_contract', lazy=True, cascade='all, delete-orphan')
-    
-    
+    paragraphs = db.relationship('ContractParagraph', backref='paragraph_contract', lazy=True, cascade='all, delete-orphan')
+
+
+class ContractParagraph(db.Model):
+    """Knoten des Paragraphen-Baums (Tree-Editor).
+
+    ``path`` enthält die Knoten-IDs aller Vorfahren und des Knotens selbst
+    (``/a/b/``), ``sort_key`` die Reihenfolge unter Geschwistern mit Lücken,
+    damit Einfügen und Verschieben nur einzelne Zeilen ändern.
+    """
+    __tablename__ = 'contract_paragraphs'
+    __table_args__ = (
+        db.UniqueConstraint('contract_id', 'node_id', name='uq_contract_paragraphs_node'),
+        db.Index('ix_contract_paragraphs_path', 'contract_id', 'path'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    contract_id = db.Column(db.String(36), db.ForeignKey('contracts.id'), nullable=False, index=True)
+    node_id = db.Column(db.String(64), nullable=False)  # ID aus dem Editor
+    parent_id = db.Column(db.String(64))  # node_id des Elternknotens, None = Paragraph
+    path = db.Column(db.String(1000), nullable=False)
+    depth = db.Column(db.Integer, nullable=False, default=0)
+    sort_key = db.Column(db.Integer, nullable=False, default=0)
+    node_type = db.Column(db.String(20), default='paragraph')
+    title = db.Column(db.String(255))
+    content = db.Column(db.Text)
+    category = db.Column(db.String(50))
+    icon = db.Column(db.String(50))
+    mandatory = db.Column(db.Boolean, default=False)
+    extra = db.Column(db.Text)  # weitere Felder aus dem Editor (JSON)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 # In models.py - Neue Models
 class InventoryItem(db.Model):
     __tablename__ = 'inventory_items'
@@ -714,6 +751,12 @@ class InventoryItem(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        # Eine Erinnerung je Benutzer, Art, Objekt und Zeitfenster
+        db.UniqueConstraint('user_id', 'kind', 'subject_id', 'dedup_window', name='uq_notifications_dedup'),
+        db.Index('ix_notifications_user_created', 'user_id', 'created_at'),
+        db.Index('ix_notifications_created', 'created_at'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
@@ -721,6 +764,9 @@ class Notification(db.Model):
     message = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(50), default='info')
     link = db.Column(db.String(255))
+    kind = db.Column(db.String(50))  # maintenance, contract_end, move_out
+    subject_id = db.Column(db.String(36))
+    dedup_window = db.Column(db.String(20))
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -761,6 +807,9 @@ class ClauseTemplate(db.Model):
 
 class Protocol(db.Model):
     __tablename__ = 'protocols'
+    __table_args__ = (
+        db.Index('ix_protocols_type_date', 'protocol_type', 'protocol_date'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     contract_id = db.Column(db.String(36), db.ForeignKey('contracts.id'), nullable=False)
@@ -770,6 +819,13 @@ class Protocol(db.Model):
     # Protokolldaten
     protocol_data = db.Column(db.Text)  # JSON mit Protokolldaten (Raumzustände, Mängel, etc.)
     final_content = db.Column(db.Text)  # Finaler HTML Inhalt
+
+    # Kennzahlen aus protocol_data, beim Speichern gesetzt (Liste, Filter, Export)
+    key_count = db.Column(db.Integer)
+    inventory_count = db.Column(db.Integer)
+    meter_count = db.Column(db.Integer)  # Zähler mit erfasstem Stand
+    has_damages = db.Column(db.Boolean, default=False, index=True)
+    notes = db.Column(db.Text)
     
     # Unterschriften
     landlord_signed = db.Column(db.Boolean, default=False)
@@ -803,12 +859,55 @@ class ContractRevision(db.Model):
     change_description = db.Column(db.Text, nullable=False)
     old_data = db.Column(db.Text)
     new_data = db.Column(db.Text)
+    # Komprimierte Ablage (app.utils.revision_store); leer bei Klartext-Revisionen
+    storage = db.Column(db.String(10))  # full, delta
+    payload = db.Column(db.LargeBinary)
+    base_id = db.Column(db.String(36))  # Basisrevision eines Deltas
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships - KORRIGIERT
     user = db.relationship('User', backref='contract_revisions')
 
+
+class ContractBatch(db.Model):
+    """Sammellauf: eine Änderung (Indexmiete, Klausel) für viele Verträge samt neuem PDF."""
+    __tablename__ = 'contract_batches'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    description = db.Column(db.String(255), nullable=False)
+    change = db.Column(db.Text, nullable=False)  # JSON: {"type": "rent_index", ...}
+    filters = db.Column(db.Text)  # JSON der Auswahl (Gebäude, Status)
+    status = db.Column(db.String(20), default='pending')  # pending, running, done, failed
+    total = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    created_by = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    user = db.relationship('User', backref='contract_batches')
+    items = db.relationship('ContractBatchItem', backref='batch', lazy=True, cascade='all, delete-orphan')
+
+
+class ContractBatchItem(db.Model):
+    __tablename__ = 'contract_batch_items'
+    __table_args__ = (
+        db.Index('ix_contract_batch_items_status', 'batch_id', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(36), db.ForeignKey('contract_batches.id'), nullable=False)
+    contract_id = db.Column(db.String(36), db.ForeignKey('contracts.id'), nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, rendered, done, failed
+    html = db.Column(db.Text)  # gerendertes HTML bis zur Übernahme
+    pdf_path = db.Column(db.String(255))
+    contract_updated_at = db.Column(db.DateTime)  # Stand des Vertrags beim Rendern
+    revision_id = db.Column(db.String(36))
+    error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class ProtocolRevision(db.Model):
     __tablename__ = 'protocol_revisions'
     
@@ -821,6 +920,10 @@ class ProtocolRevision(db.Model):
     change_description = db.Column(db.Text, nullable=False)
     old_data = db.Column(db.Text)
     new_data = db.Column(db.Text)
+    # Komprimierte Ablage (app.utils.revision_store); leer bei Klartext-Revisionen
+    storage = db.Column(db.String(10))  # full, delta
+    payload = db.Column(db.LargeBinary)
+    base_id = db.Column(db.String(36))  # Basisrevision eines Deltas
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -838,6 +941,20 @@ class RSSFeed(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     update_interval = db.Column(db.Integer, default=60)
     last_updated = db.Column(db.DateTime)
+
+    # Conditional GET und Abrufstatistik
+    etag = db.Column(db.String(255))
+    modified = db.Column(db.String(100))  # Last-Modified-Header des Servers
+    last_fetched_at = db.Column(db.DateTime)
+    last_fetch_status = db.Column(db.Integer)  # HTTP-Status, 0 bei Netzwerkfehler
+    last_fetch_ms = db.Column(db.Integer)
+    last_fetch_error = db.Column(db.Text)
+    next_fetch_at = db.Column(db.DateTime)  # vom Hintergrund-Scheduler gesetzt
+    consecutive_failures = db.Column(db.Integer, default=0)
+
+    # Aufbewahrung; leer = globale Vorgabe (RSS_RETENTION_DAYS / RSS_MAX_ITEMS_PER_FEED)
+    retention_days = db.Column(db.Integer)
+    max_items = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -845,11 +962,16 @@ class RSSFeed(db.Model):
 
 class RSSItem(db.Model):
     __tablename__ = 'rss_items'
+    __table_args__ = (
+        db.Index('ix_rss_items_feed_read', 'feed_id', 'is_read'),
+        db.Index('ix_rss_items_published', 'published_date'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     feed_id = db.Column(db.String(36), db.ForeignKey('rss_feeds.id'), nullable=False)
     title = db.Column(db.String(500), nullable=False)
     description = db.Column(db.Text)
+    description_z = db.Column(db.LargeBinary)  # zlib-komprimierte Beschreibung älterer Einträge
     link = db.Column(db.String(500))
     published_date = db.Column(db.DateTime, nullable=False)
     guid = db.Column(db.String(500), unique=True)
@@ -858,12 +980,19 @@ class RSSItem(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     is_starred = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def content(self):
+        """Beschreibung, bei Bedarf aus der komprimierten Fassung entpackt."""
+        if self.description is None and self.description_z:
+            return zlib.decompress(self.description_z).decode('utf-8')
+        return self.description or ''
     
     def to_dict(self):
         return {
             'id': self.id,
             'title': self.title,
-            'description': self.description,
+            'description': self.content,
             'link': self.link,
             'published_date': self.published_date.isoformat() if self.published_date else None,
             'author': self.author,
@@ -872,6 +1001,19 @@ class RSSItem(db.Model):
             'is_read': self.is_read,
             'is_starred': self.is_starred
         }
+
+class RSSItemTombstone(db.Model):
+    """GUID eines durch die Aufbewahrung gelöschten Eintrags.
+
+    Verhindert, dass der Eintrag beim nächsten Abruf erneut als ungelesen
+    importiert wird, solange der Feed ihn noch ausliefert.
+    """
+    __tablename__ = 'rss_item_tombstones'
+
+    guid = db.Column(db.String(500), primary_key=True)
+    feed_id = db.Column(db.String(36), db.ForeignKey('rss_feeds.id'), nullable=False, index=True)
+    published_date = db.Column(db.DateTime, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
     
 # Zusätzliche Modelle in models.py hinzufügen
 
@@ -1030,4 +1172,57 @@ class MaintenanceTask(db.Model):
     def reminder_date(self):
         if not self.scheduled_on:
             return None
-        return self.scheduled_on - timedelta(days=self.reminder_days_before or 0)
\ No newline at end of file
+        return self.scheduled_on - timedelta(days=self.reminder_days_before or 0)
+
+
+class IdempotencyKey(db.Model):
+    """Gespeicherte Antworten für wiederholbare API-Schreibaufrufe (Idempotency-Key)."""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('endpoint', 'key', name='uq_idempotency_endpoint_key'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    endpoint = db.Column(db.String(100), nullable=False)
+    key = db.Column(db.String(200), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response_body = db.Column(db.Text)
+    created_by = db.Column(db.String(36))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SyncChange(db.Model):
+    """Fortlaufende Änderungssequenz für die Delta-Synchronisation der Mobil-App."""
+    __tablename__ = 'sync_changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    table_name = db.Column(db.String(80), nullable=False)
+    record_id = db.Column(db.String(64), nullable=False)
+    action = db.Column(db.String(20), nullable=False)  # insert, update, delete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class SchedulerLock(db.Model):
+    """Sperrzeile für Hintergrundjobs; nur der Inhaber führt den Job aus."""
+    __tablename__ = 'scheduler_locks'
+
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SearchDocument(db.Model):
+    """Suchtext je Datensatz; Inhaltsquelle des FTS5-Index ``search_fts``."""
+    __tablename__ = 'search_documents'
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='uq_search_documents_entity'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.String(36), nullable=False)
+    title = db.Column(db.String(255))
+    body = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -4,6 +4,12 @@ from flask import Blueprint, request, jsonify, render_template, redirect, url_fo
 from app.extensions import db
 from app.routes.main import login_required
 from app.models import User
+from app.utils.contract_render import contract_variables, render_block_contract, render_paragraph_sections
+from app.utils.reorder import apply_order, next_sort_order
+from app.utils.template_registry import template_library
+from app.utils.contract_tree import (
+    END, NodeNotFound, TreeError, delete_node, insert_node, load_tree, move_node, replace_tree, update_node,
+)
 import uuid, json
 from datetime import datetime
 
@@ -54,29 +60,13 @@ def get_contract_models():
         return (None, None, None, None, None, None, None, None, None, None)
     
 def load_contract_tree(contract):
-    """Lädt die Paragraphen-Struktur aus contract_data (JSON)"""
-    try:
-        if not contract.contract_data:
-            return []
-        data = json.loads(contract.contract_data)
-        return data.get('paragraph_tree', [])
-    except Exception:
-        return []
+    """Lädt die Paragraphen-Struktur aus contract_paragraphs"""
+    return load_tree(contract.id)
 
 
 def save_contract_tree(contract, tree):
-    """Speichert die Paragraphen-Struktur in contract_data (JSON)"""
-    try:
-        data = {}
-        if contract.contract_data:
-            # Bestehende Daten (z.B. Formulardaten) nicht verlieren
-            data = json.loads(contract.contract_data)
-        data['paragraph_tree'] = tree
-        contract.contract_data = json.dumps(data)
-    except Exception as e:
-        current_app.logger.error(f"Error saving contract tree JSON: {e}", exc_info=True)
-        # Fallback: einfach nur Tree speichern
-        contract.contract_data = json.dumps({'paragraph_tree': tree})
+    """Ersetzt die komplette Paragraphen-Struktur in contract_paragraphs"""
+    replace_tree(contract.id, tree)
 
 
 def _build_default_paragraph_tree(contract):
@@ -379,20 +369,10 @@ def block_editor(contract_id):
         db.joinedload(Contract.blocks)
     ).get_or_404(contract_id)
     
-    # Template-Blöcke nach Kategorien gruppieren
-    template_blocks = ContractTemplateBlock.query.filter_by(is_active=True)\
-        .order_by(ContractTemplateBlock.category, ContractTemplateBlock.sort_order).all()
-    
-    blocks_by_category = {}
-    for block in template_blocks:
-        category = block.category or 'allgemein'
-        if category not in blocks_by_category:
-            blocks_by_category[category] = []
-        blocks_by_category[category].append(block)
-    
+    # Template-Blöcke nach Kategorien (aus der Vorlagenbibliothek)
     return render_template('contract_editor/block_editor.html',
                          contract=contract,
-                         template_blocks=blocks_by_category)
+                         template_blocks=template_library().blocks_by_category)
 
 @contract_editor_bp.route('/<contract_id>/add-template-block', methods=['POST'])
 @login_required
@@ -404,8 +384,8 @@ def add_template_block(contract_id):
         template_block_id = request.json.get('template_block_id')
         template_block = ContractTemplateBlock.query.get_or_404(template_block_id)
         
-        # Bestehende Blöcke zählen für Sortierreihenfolge
-        existing_blocks_count = ContractBlock.query.filter_by(contract_id=contract_id).count()
+        # Sortierschlüssel hinter dem letzten Block
+        sort_order = next_sort_order(ContractBlock, contract_id=contract_id)
         
         # Neuen Block erstellen
         block = ContractBlock(
@@ -414,7 +394,7 @@ def add_template_block(contract_id):
             block_type=template_block.block_type,
             title=template_block.title,
             content=template_block.content,
-            sort_order=existing_blocks_count + 1,
+            sort_order=sort_order,
             is_required=template_block.is_required,
             variables=template_block.variables
         )
@@ -442,8 +422,8 @@ def create_block(contract_id):
         
         data = request.json
         
-        # Bestehende Blöcke zählen für Sortierreihenfolge
-        existing_blocks_count = ContractBlock.query.filter_by(contract_id=contract_id).count()
+        # Sortierschlüssel hinter dem letzten Block
+        sort_order = next_sort_order(ContractBlock, contract_id=contract_id)
         
         block = ContractBlock(
             id=str(uuid.uuid4()),
@@ -451,7 +431,7 @@ def create_block(contract_id):
             block_type=data.get('block_type', 'paragraph'),
             title=data.get('title'),
             content=data.get('content'),
-            sort_order=existing_blocks_count + 1,
+            sort_order=sort_order,
             is_required=data.get('is_required', False)
         )
         
@@ -498,6 +478,22 @@ def manage_block(contract_id, block_id):
         current_app.logger.error(f"Error managing block: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@contract_editor_bp.route('/templates')
+@login_required
+def template_library_api():
+    """Klausel- und Blockvorlagen als JSON; per ETag revalidierbar"""
+    library = template_library()
+    response = current_app.response_class(library.payload, mimetype='application/json')
+    response.set_etag(library.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def _ordered_items(items):
+    """Einträge der Sortier-Requests in Zielreihenfolge (``sort_order`` ist optional)"""
+    return sorted(items, key=lambda item: item.get('sort_order', 0) or 0)
+
+
 @contract_editor_bp.route('/<contract_id>/update-block-order', methods=['POST'])
 @login_required
 def update_block_order(contract_id):
@@ -506,14 +502,12 @@ def update_block_order(contract_id):
         Contract, _, _, _, _, _, _, _, ContractBlock, _ = get_contract_models()
         
         block_order = request.json.get('block_order', [])
-        
-        for item in block_order:
-            block = ContractBlock.query.filter_by(id=item['block_id'], contract_id=contract_id).first()
-            if block:
-                block.sort_order = item['sort_order']
-        
+        ordered_ids = [item['block_id'] for item in _ordered_items(block_order)]
+
+        changes = apply_order(ContractBlock, ordered_ids, 'contract_id', contract_id)
+
         db.session.commit()
-        return jsonify({'success': True, 'message': 'Reihenfolge aktualisiert'})
+        return jsonify({'success': True, 'message': 'Reihenfolge aktualisiert', 'updated': len(changes)})
         
     except Exception as e:
         db.session.rollback()
@@ -524,129 +518,7 @@ def generate_block_based_contract_html(contract, blocks=None, inventory_items=No
     """Generiert Vertrags-HTML basierend auf Blöcken"""
     if blocks is None:
         blocks = contract.blocks
-    if inventory_items is None:
-        inventory_items = getattr(contract, 'inventory_items', [])
-    
-    # Variablen für Platzhalter
-    variables = {
-        'mieter_vorname': contract.tenant.first_name,
-        'mieter_nachname': contract.tenant.last_name,
-        'wohnung_adresse': f"{contract.apartment.building.street} {contract.apartment.building.street_number}",
-        'miete_netto': f"{contract.rent_net:.2f}",
-        'miete_nebenkosten': f"{contract.rent_additional:.2f}",
-        'kaution': f"{contract.deposit:.2f}",
-        'vertragsbeginn': contract.start_date.strftime('%d.%m.%Y'),
-        'vertragsende': contract.end_date.strftime('%d.%m.%Y') if contract.end_date else "unbefristet",
-        'datum_heute': datetime.now().strftime('%d.%m.%Y')
-    }
-    
-    # Vermieter-Informationen
-    if hasattr(contract, 'landlord') and contract.landlord:
-        landlord = contract.landlord
-        variables['vermieter_name'] = landlord.company_name or f"{landlord.first_name} {landlord.last_name}"
-    else:
-        variables['vermieter_name'] = "[Vermieter]"
-    
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <style>
-            body {{
-                font-family: "Times New Roman", Times, serif;
-                line-height: 1.6;
-                margin: 2cm;
-                font-size: 12pt;
-                color: #000;
-            }}
-            .header {{
-                text-align: center;
-                margin-bottom: 2cm;
-                border-bottom: 2px solid #000;
-                padding-bottom: 1cm;
-            }}
-            .section {{
-                margin-bottom: 0.8cm;
-                page-break-inside: avoid;
-            }}
-            .section h2 {{
-                font-size: 12pt;
-                font-weight: bold;
-                margin: 0.5cm 0 0.3cm 0;
-            }}
-            .clause {{
-                margin-bottom: 0.5cm;
-                text-align: justify;
-            }}
-            .signature-area {{
-                margin-top: 3cm;
-            }}
-            .signature-line {{
-                border-top: 1px solid #000;
-                width: 8cm;
-                margin-top: 2cm;
-            }}
-            .footer {{
-                margin-top: 1cm;
-                font-size: 10pt;
-                color: #666;
-                text-align: center;
-            }}
-            .page-break {{
-                page-break-before: always;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>MIETVERTRAG</h1>
-            <p>Vertragsnummer: {contract.contract_number}</p>
-        </div>
-    """
-    
-    # Blöcke hinzufügen
-    for block in sorted(blocks, key=lambda x: x.sort_order):
-        # Variablen ersetzen
-        content = block.content
-        for key, value in variables.items():
-            content = content.replace(f'§{key}§', str(value))
-        
-        html_content += f"""
-        <div class="section">
-            <h2>{block.title}</h2>
-            <div class="clause">
-                {content}
-            </div>
-        </div>
-        """
-    
-    html_content += f"""
-        <div class="signature-area">
-            <p><strong>Ort, Datum: ____________________</strong></p>
-            
-            <div style="display: flex; justify-content: space-between;">
-                <div>
-                    <div class="signature-line"></div>
-                    <p><strong>Vermieter</strong></p>
-                    <p>{variables['vermieter_name']}</p>
-                </div>
-                <div>
-                    <div class="signature-line"></div>
-                    <p><strong>Mieter</strong></p>
-                    <p>{variables['mieter_vorname']} {variables['mieter_nachname']}</p>
-                </div>
-            </div>
-        </div>
-        
-        <div class="footer">
-            <p>Dieses Dokument wurde am {variables['datum_heute']} generiert und ist rechtlich bindend.</p>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return html_content
+    return render_block_contract(contract, blocks)
 
 # Ändern Sie diese Route - von clause_management zu edit_contract_content
 @contract_editor_bp.route('/<contract_id>/edit-content')
@@ -670,27 +542,10 @@ def edit_contract_content(contract_id):
             db.joinedload(Contract.tenant)
         ).get_or_404(contract_id)
         
-        # Klausel-Templates laden
-        clause_templates = ClauseTemplate.query.filter_by(is_active=True).order_by(ClauseTemplate.sort_order).all() if ClauseTemplate else []
-        
-        # Standard-Klauseln nach Kategorien gruppieren
-        clauses_by_category = {}
-        if StandardClauseTemplate:
-            try:
-                standard_clauses = StandardClauseTemplate.query.filter_by(is_active=True).order_by(StandardClauseTemplate.sort_order).all()
-                for clause in standard_clauses:
-                    category = clause.category if hasattr(clause, 'category') else 'allgemein'
-                    if category not in clauses_by_category:
-                        clauses_by_category[category] = []
-                    clauses_by_category[category].append(clause)
-            except Exception as e:
-                current_app.logger.warning(f"Could not load standard clauses: {e}")
-                # Fallback: Verwende ClauseTemplate als Standard-Klauseln
-                for template in clause_templates:
-                    category = template.category if hasattr(template, 'category') else 'allgemein'
-                    if category not in clauses_by_category:
-                        clauses_by_category[category] = []
-                    clauses_by_category[category].append(template)
+        # Klausel-Templates aus der Vorlagenbibliothek (einmal je Prozess geladen)
+        library = template_library()
+        clause_templates = library.clauses
+        clauses_by_category = library.clauses_by_category
         
         # Inventory Items laden
         inventory_items = InventoryItem.query.filter_by(contract_id=contract_id).all() if InventoryItem else []
@@ -786,8 +641,8 @@ def add_clause_to_contract(contract_id):
                 'error': f'Klausel "{clause_template.title}" ist bereits im Vertrag vorhanden'
             }), 400
         
-        # Bestehende Klauseln zählen für Sortierreihenfolge
-        existing_clauses_count = ContractClause.query.filter_by(contract_id=contract_id).count()
+        # Sortierschlüssel hinter der letzten Klausel
+        sort_order = next_sort_order(ContractClause, contract_id=contract_id)
         
         # Neue Klausel erstellen
         clause = ContractClause(
@@ -796,7 +651,7 @@ def add_clause_to_contract(contract_id):
             clause_template_id=clause_template_id,
             custom_title=clause_template.title,
             custom_content=clause_template.content,
-            sort_order=existing_clauses_count
+            sort_order=sort_order
         )
         
         db.session.add(clause)
@@ -1044,8 +899,8 @@ def create_custom_clause_handler(contract_id):
         if not title or not content:
             return jsonify({'success': False, 'error': 'Titel und Inhalt sind erforderlich'}), 400
         
-        # Bestehende Klauseln zählen für Sortierreihenfolge
-        existing_clauses_count = ContractClause.query.filter_by(contract_id=contract_id).count()
+        # Sortierschlüssel hinter der letzten Klausel
+        sort_order = next_sort_order(ContractClause, contract_id=contract_id)
         
         # Neue benutzerdefinierte Klausel erstellen
         clause = ContractClause(
@@ -1054,7 +909,7 @@ def create_custom_clause_handler(contract_id):
             clause_template_id=None,  # Keine Template-ID für benutzerdefinierte Klauseln
             custom_title=title,
             custom_content=content,
-            sort_order=existing_clauses_count
+            sort_order=sort_order
         )
         
         db.session.add(clause)
@@ -1079,14 +934,12 @@ def update_clause_order_handler(contract_id):
         
         data = request.json
         clause_order = data.get('clause_order', [])
-        
-        for item in clause_order:
-            clause = ContractClause.query.filter_by(id=item['clause_id'], contract_id=contract_id).first()
-            if clause:
-                clause.sort_order = item['sort_order']
-        
+        ordered_ids = [item['clause_id'] for item in _ordered_items(clause_order)]
+
+        changes = apply_order(ContractClause, ordered_ids, 'contract_id', contract_id)
+
         db.session.commit()
-        return jsonify({'success': True, 'message': 'Reihenfolge aktualisiert'})
+        return jsonify({'success': True, 'message': 'Reihenfolge aktualisiert', 'updated': len(changes)})
         
     except Exception as e:
         db.session.rollback()
@@ -1191,25 +1044,12 @@ def tree_editor(contract_id):
             db.joinedload(Contract.clauses) if hasattr(Contract, 'clauses') else db.lazyload('*')
         ).get_or_404(contract_id)
 
-        # Klausel-Templates (Standardklauseln) laden & nach Kategorien gruppieren
-        clauses_by_category = {}
-        template_subclauses = {}
-        if ClauseTemplate:
-            templates = ClauseTemplate.query.filter_by(is_active=True).order_by(ClauseTemplate.sort_order).all()
-            for tpl in templates:
-                category = tpl.category or 'allgemein'
-                if category not in clauses_by_category:
-                    clauses_by_category[category] = []
-                clauses_by_category[category].append(tpl)
-                try:
-                    if tpl.variables:
-                        template_subclauses[tpl.id] = json.loads(tpl.variables).get('subclauses', [])
-                    else:
-                        template_subclauses[tpl.id] = []
-                except Exception:
-                    template_subclauses[tpl.id] = []
-
-        # Paragraphen-Baum aus JSON laden oder mit Standardwerten vorbelegen
+        # Klausel-Templates nach Kategorien, Unterklauseln bereits geparst
+        library = template_library()
+        clauses_by_category = library.clauses_by_category
+        template_subclauses = library.subclauses
+
+        # Paragraphen-Baum laden oder mit Standardwerten vorbelegen
         initial_tree = load_contract_tree(contract)
         if not initial_tree:
             initial_tree = _build_default_paragraph_tree(contract)
@@ -1232,33 +1072,139 @@ def tree_editor(contract_id):
 @login_required
 def save_contract_structure(contract_id):
     """
-    Speichert die Paragraphen-/Unterparagraphen-Struktur als JSON in contracts.contract_data
-    Erwarteter Body: { "tree": [ ... ] }
+    Ersetzt die komplette Paragraphen-/Unterparagraphen-Struktur in contract_paragraphs
+    Erwarteter Body: { "tree": [ ... ], "known_sections": [ ... ] }
+
+    Antwortet mit der Vorschau als Abschnittsliste; HTML wird nur für
+    Abschnitte mitgeschickt, deren Schlüssel der Editor noch nicht kennt.
+    Einzelne Änderungen schickt der Editor über die Knoten-API (/paragraphs).
     """
     try:
-        (Contract, ClauseTemplate, ContractClause, Apartment, Tenant,
-         StandardClauseTemplate, InventoryItem, Landlord,
-         ContractBlock, ContractTemplateBlock) = get_contract_models()
-
-        if Contract is None:
+        contract = _load_tree_contract(contract_id)
+        if contract is None:
             return jsonify({'success': False, 'error': 'Contract model not available'}), 503
 
-        contract = Contract.query.get_or_404(contract_id)
-
         data = request.get_json(silent=True) or {}
         tree = data.get('tree', [])
 
         if not isinstance(tree, list):
             return jsonify({'success': False, 'error': 'Invalid tree format'}), 400
 
-        # JSON in contract_data mitschreiben
         save_contract_tree(contract, tree)
         contract.updated_at = datetime.utcnow()
 
         db.session.commit()
 
-        return jsonify({'success': True, 'message': 'Struktur gespeichert'})
+        return _tree_preview_response(contract, data, message='Struktur gespeichert')
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error saving contract structure for {contract_id}: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+def _load_tree_contract(contract_id):
+    (Contract, ClauseTemplate, ContractClause, Apartment, Tenant,
+     StandardClauseTemplate, InventoryItem, Landlord,
+     ContractBlock, ContractTemplateBlock) = get_contract_models()
+    if Contract is None:
+        return None
+    return Contract.query.options(
+        db.joinedload(Contract.apartment).joinedload(Apartment.building),
+        db.joinedload(Contract.tenant)
+    ).get_or_404(contract_id)
+
+
+def _tree_preview_response(contract, data, **extra):
+    """Vorschau des gespeicherten Baums; bekannte Abschnitte ohne HTML."""
+    known_sections = set(data.get('known_sections') or [])
+    sections, stats = render_paragraph_sections(load_tree(contract.id), contract_variables(contract))
+    return jsonify({
+        'success': True,
+        **extra,
+        'sections': [
+            {'key': key, 'html': None if key in known_sections else fragment}
+            for key, fragment in sections
+        ],
+        'render_stats': stats,
+    })
+
+
+def _apply_tree_change(contract_id, change, status=200):
+    """Führt eine Knotenänderung aus, speichert und antwortet mit der Vorschau."""
+    try:
+        contract = _load_tree_contract(contract_id)
+        if contract is None:
+            return jsonify({'success': False, 'error': 'Contract model not available'}), 503
+        data = request.get_json(silent=True) or {}
+        result = change(contract, data) or {}
+        contract.updated_at = datetime.utcnow()
+        db.session.commit()
+        response = _tree_preview_response(contract, data, **result)
+        return response, status
+    except NodeNotFound as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except TreeError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error changing paragraph tree of {contract_id}: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@contract_editor_bp.route('/<contract_id>/paragraphs')
+@login_required
+def get_paragraphs(contract_id):
+    """Paragraphen-Baum als JSON"""
+    contract = _load_tree_contract(contract_id)
+    if contract is None:
+        return jsonify({'success': False, 'error': 'Contract model not available'}), 503
+    return jsonify({'success': True, 'tree': load_contract_tree(contract)})
+
+
+@contract_editor_bp.route('/<contract_id>/paragraphs', methods=['POST'])
+@login_required
+def create_paragraph(contract_id):
+    """
+    Fügt einen Knoten (mit Unterknoten) ein
+    Body: { "node": {...}, "parent_id": null, "after_id": "..." }
+    Ohne "after_id" wird der Knoten hinten angehängt, mit null vorne.
+    """
+    def change(contract, data):
+        node_id = insert_node(
+            contract.id, data.get('node'), data.get('parent_id'), data.get('after_id', END)
+        )
+        return {'node_id': node_id}
+
+    return _apply_tree_change(contract_id, change, status=201)
+
+
+@contract_editor_bp.route('/<contract_id>/paragraphs/<node_id>', methods=['PATCH'])
+@login_required
+def update_paragraph(contract_id, node_id):
+    """Ändert Felder eines Knotens. Body: { "changes": {"title": ..., "content": ...} }"""
+    def change(contract, data):
+        update_node(contract.id, node_id, data.get('changes'))
+
+    return _apply_tree_change(contract_id, change)
+
+
+@contract_editor_bp.route('/<contract_id>/paragraphs/<node_id>/move', methods=['POST'])
+@login_required
+def move_paragraph(contract_id, node_id):
+    """Verschiebt einen Knoten. Body: { "parent_id": null, "after_id": null }"""
+    def change(contract, data):
+        move_node(contract.id, node_id, data.get('parent_id'), data.get('after_id'))
+
+    return _apply_tree_change(contract_id, change)
+
+
+@contract_editor_bp.route('/<contract_id>/paragraphs/<node_id>', methods=['DELETE'])
+@login_required
+def delete_paragraph(contract_id, node_id):
+    """Löscht einen Knoten samt Unterknoten"""
+    def change(contract, data):
+        return {'deleted': delete_node(contract.id, node_id)}
+
+    return _apply_tree_change(contract_id, change)
@@ -2,15 +2,23 @@ from flask import Blueprint, request, jsonify, render_template, redirect, url_fo
 from flask_jwt_extended import jwt_required
 from app.extensions import db
 from app.routes.main import login_required
+from app.routes.users import require_admin
 from datetime import datetime
 import uuid
 import json
 import os
 
 from app.routes.contract_editor import load_contract_tree
+from app.utils.bulk_contracts import batch_progress, create_batch, parse_change, start_batch
+from app.utils.contract_tree import copy_tree
 from app.models import Landlord, Protocol, Meter, MeterReading, Document, Tenant
 from app.utils.schema_helpers import ensure_archiving_columns
 from app.utils.pdf_generator import generate_professional_contract_html, save_contract_pdf
+from app.utils.revision_store import add_revision
+from app.utils.contract_render import render_block_contract
+from app.utils.search import matching_ids
+from app.utils.storage import resolve_path, send_stored, store_upload
+from app.utils.template_registry import template_library
 
 contracts_bp = Blueprint('contracts', __name__)
 
@@ -80,12 +88,11 @@ def contracts_list():
         )
 
         if q:
-            like_term = f"%{q}%"
-            query = query.join(Tenant, Contract.tenant_id == Tenant.id).filter(
+            # Volltextindex: Vertragsnummer/-text oder Name des Mieters
+            query = query.filter(
                 db.or_(
-                    Contract.contract_number.ilike(like_term),
-                    Tenant.first_name.ilike(like_term),
-                    Tenant.last_name.ilike(like_term)
+                    Contract.id.in_(matching_ids('contract', q)),
+                    Contract.tenant_id.in_(matching_ids('tenant', q))
                 )
             )
 
@@ -116,6 +123,65 @@ def contracts_list():
         flash(f'Fehler beim Laden der Mietverträge: {str(e)}', 'danger')
         return render_template('contracts/list.html', contracts=[])
 
+@contracts_bp.route('/batches', methods=['GET', 'POST'])
+@login_required
+def contract_batches():
+    """Sammelläufe: Änderung für alle Verträge eines Gebäudes/Status samt neuer PDFs"""
+    require_admin()
+    from app.models import Building, ContractBatch
+
+    if request.method == 'POST':
+        try:
+            change = parse_change(request.form)
+            batch = create_batch(
+                session.get('user_id'),
+                change,
+                building_id=request.form.get('building_id') or None,
+                status=request.form.get('status') or None,
+                description=(request.form.get('description') or '').strip() or None,
+            )
+        except ValueError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('contracts.contract_batches'))
+        start_batch(batch.id)
+        flash(f'Sammellauf für {batch.total} Verträge gestartet', 'success')
+        return redirect(url_for('contracts.contract_batches'))
+
+    batches = ContractBatch.query.order_by(ContractBatch.created_at.desc()).limit(20).all()
+    return render_template(
+        'contracts/batches.html',
+        batches=[batch_progress(batch) for batch in batches],
+        buildings=Building.query.order_by(Building.name).all(),
+        clauses=template_library().clauses,
+    )
+
+
+@contracts_bp.route('/batches/<batch_id>')
+@login_required
+def contract_batch_status(batch_id):
+    """Fortschritt eines Sammellaufs (JSON)"""
+    require_admin()
+    from app.models import ContractBatch
+
+    batch = ContractBatch.query.get_or_404(batch_id)
+    return jsonify(batch_progress(batch))
+
+
+@contracts_bp.route('/batches/<batch_id>/resume', methods=['POST'])
+@login_required
+def resume_contract_batch(batch_id):
+    """Abgebrochenen Sammellauf fortsetzen; erledigte Verträge bleiben unverändert"""
+    require_admin()
+    from app.models import ContractBatch
+
+    batch = ContractBatch.query.get_or_404(batch_id)
+    if batch.status == 'done':
+        flash('Der Sammellauf ist bereits abgeschlossen', 'info')
+    else:
+        start_batch(batch.id)
+        flash('Sammellauf wird fortgesetzt', 'success')
+    return redirect(url_for('contracts.contract_batches'))
+
 @contracts_bp.route('/create', methods=['GET', 'POST'])
 @login_required
 def create_contract():
@@ -187,15 +253,13 @@ def create_contract():
 
                 # Erste Revision erstellen
                 if ContractRevision:
-                    revision = ContractRevision(
-                        id=str(uuid.uuid4()),
-                        contract_id=contract.id,
-                        revision_number=1,
-                        changed_by=session.get('user_id'),
-                        change_description="Vertrag initial erstellt",
+                    add_revision(
+                        ContractRevision,
+                        contract.id,
+                        session.get('user_id'),
+                        "Vertrag initial erstellt",
                         new_data=json.dumps(dict(request.form))
                     )
-                    db.session.add(revision)
 
                 db.session.commit()
 
@@ -402,16 +466,14 @@ def terminate_contract(contract_id):
         contract.status = 'terminated'
         
         if ContractRevision:
-            revision = ContractRevision(
-                id=str(uuid.uuid4()),
-                contract_id=contract.id,
-                revision_number=len(contract.revisions) + 1,
-                changed_by=session.get('user_id'),
-                change_description="Vertrag gekündigt",
+            add_revision(
+                ContractRevision,
+                contract.id,
+                session.get('user_id'),
+                "Vertrag gekündigt",
                 old_data=json.dumps({'status': contract.status}),
                 new_data=json.dumps({'status': 'terminated'})
             )
-            db.session.add(revision)
         
         db.session.commit()
         
@@ -459,18 +521,17 @@ def duplicate_contract(contract_id):
         )
 
         db.session.add(duplicate)
+        db.session.flush()
+        copy_tree(original.id, duplicate.id)
 
         if ContractRevision:
-            revision = ContractRevision(
-                id=str(uuid.uuid4()),
-                contract_id=duplicate.id,
-                revision_number=1,
-                changed_by=session.get('user_id'),
-                change_description=f"Dupliziert von Vertrag {original.contract_number}",
-                old_data=None,
+            add_revision(
+                ContractRevision,
+                duplicate.id,
+                session.get('user_id'),
+                f"Dupliziert von Vertrag {original.contract_number}",
                 new_data=json.dumps({'source_contract': original.id})
             )
-            db.session.add(revision)
 
         db.session.commit()
         flash('Vertrag dupliziert. Der Entwurf kann nun angepasst werden.', 'success')
@@ -536,16 +597,14 @@ def edit_contract(contract_id):
                 
                 # Neue Revision erstellen
                 if ContractRevision:
-                    revision = ContractRevision(
-                        id=str(uuid.uuid4()),
-                        contract_id=contract.id,
-                        revision_number=len(contract.revisions) + 1,
-                        changed_by=session.get('user_id'),
-                        change_description=request.form['change_description'],
+                    add_revision(
+                        ContractRevision,
+                        contract.id,
+                        session.get('user_id'),
+                        request.form['change_description'],
                         old_data=json.dumps(old_data),
                         new_data=json.dumps(dict(request.form))
                     )
-                    db.session.add(revision)
                 
                 db.session.commit()
                 
@@ -584,16 +643,14 @@ def activate_contract(contract_id):
         
         # Revision für Aktivierung erstellen
         if ContractRevision:
-            revision = ContractRevision(
-                id=str(uuid.uuid4()),
-                contract_id=contract.id,
-                revision_number=len(contract.revisions) + 1,
-                changed_by=session.get('user_id'),
-                change_description="Vertrag aktiviert",
+            add_revision(
+                ContractRevision,
+                contract.id,
+                session.get('user_id'),
+                "Vertrag aktiviert",
                 old_data=json.dumps({'status': 'draft'}),
                 new_data=json.dumps({'status': 'active'})
             )
-            db.session.add(revision)
         
         db.session.commit()
         
@@ -614,123 +671,7 @@ def generate_block_based_contract_html(contract, blocks=None, inventory_items=No
     """Generiert Vertrags-HTML basierend auf Blöcken"""
     if blocks is None:
         blocks = contract.blocks
-    if inventory_items is None:
-        inventory_items = contract.inventory_items
-    
-    # Variablen für Platzhalter
-    variables = {
-        'mieter_vorname': contract.tenant.first_name,
-        'mieter_nachname': contract.tenant.last_name,
-        'vermieter_name': contract.landlord.company_name or f"{contract.landlord.first_name} {contract.landlord.last_name}",
-        'wohnung_adresse': f"{contract.apartment.building.street} {contract.apartment.building.street_number}",
-        'miete_netto': f"{contract.rent_net:.2f}",
-        'miete_nebenkosten': f"{contract.rent_additional:.2f}",
-        'kaution': f"{contract.deposit:.2f}",
-        'vertragsbeginn': contract.start_date.strftime('%d.%m.%Y'),
-        'vertragsende': contract.end_date.strftime('%d.%m.%Y') if contract.end_date else "unbefristet",
-        'datum_heute': datetime.now().strftime('%d.%m.%Y')
-    }
-    
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="utf-8">
-        <style>
-            body {{
-                font-family: "Times New Roman", Times, serif;
-                line-height: 1.6;
-                margin: 2cm;
-                font-size: 12pt;
-                color: #000;
-            }}
-            .header {{
-                text-align: center;
-                margin-bottom: 2cm;
-                border-bottom: 2px solid #000;
-                padding-bottom: 1cm;
-            }}
-            .section {{
-                margin-bottom: 0.8cm;
-                page-break-inside: avoid;
-            }}
-            .section h2 {{
-                font-size: 12pt;
-                font-weight: bold;
-                margin: 0.5cm 0 0.3cm 0;
-            }}
-            .clause {{
-                margin-bottom: 0.5cm;
-                text-align: justify;
-            }}
-            .signature-area {{
-                margin-top: 3cm;
-            }}
-            .signature-line {{
-                border-top: 1px solid #000;
-                width: 8cm;
-                margin-top: 2cm;
-            }}
-            .footer {{
-                margin-top: 1cm;
-                font-size: 10pt;
-                color: #666;
-                text-align: center;
-            }}
-            .page-break {{
-                page-break-before: always;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>MIETVERTRAG</h1>
-            <p>Vertragsnummer: {contract.contract_number}</p>
-        </div>
-    """
-    
-    # Blöcke hinzufügen
-    for block in sorted(blocks, key=lambda x: x.sort_order):
-        # Variablen ersetzen
-        content = block.content
-        for key, value in variables.items():
-            content = content.replace(f'§{key}§', str(value))
-        
-        html_content += f"""
-        <div class="section">
-            <h2>{block.title}</h2>
-            <div class="clause">
-                {content}
-            </div>
-        </div>
-        """
-    
-    html_content += f"""
-        <div class="signature-area">
-            <p><strong>Ort, Datum: ____________________</strong></p>
-            
-            <div style="display: flex; justify-content: space-between;">
-                <div>
-                    <div class="signature-line"></div>
-                    <p><strong>Vermieter</strong></p>
-                    <p>{variables['vermieter_name']}</p>
-                </div>
-                <div>
-                    <div class="signature-line"></div>
-                    <p><strong>Mieter</strong></p>
-                    <p>{variables['mieter_vorname']} {variables['mieter_nachname']}</p>
-                </div>
-            </div>
-        </div>
-        
-        <div class="footer">
-            <p>Dieses Dokument wurde am {variables['datum_heute']} generiert und ist rechtlich bindend.</p>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return html_content
+    return render_block_contract(contract, blocks)
 
 @contracts_bp.route('/<contract_id>/generate-pdf')
 @login_required
@@ -752,14 +693,7 @@ def generate_contract_pdf(contract_id):
         return redirect(url_for('contracts.contract_detail', contract_id=contract_id))
 
     # 2. Paragraph-Tree laden
-    paragraph_tree = []
-    try:
-        if contract.contract_data:
-            data = json.loads(contract.contract_data)
-            paragraph_tree = data.get('paragraph_tree', [])
-    except Exception as e:
-        current_app.logger.error(f"Tree-Editor Daten fehlerhaft: {e}")
-        paragraph_tree = []
+    paragraph_tree = load_contract_tree(contract)
 
     # 3. Klauseln laden (falls genutzt)
     clauses = ContractClause.query.filter_by(contract_id=contract.id).order_by(
@@ -794,35 +728,24 @@ def generate_contract_pdf(contract_id):
         flash("Fehler beim PDF-Erstellen.", "danger")
         return redirect(url_for('contracts.contract_detail', contract_id=contract_id))
 
-    # 7. Finale HTML-Version speichern
-    contract.final_content = html_content
-
-    # 8. Neue Revision erzeugen
+    # 7. Neue Revision erzeugen (komprimiert gegenüber der vorigen)
     try:
-        # letzte Revision suchen
-        last_rev = (
-            ContractRevision.query
-            .filter_by(contract_id=contract.id)
-            .order_by(ContractRevision.revision_number.desc())
-            .first()
-        )
-        next_rev = (last_rev.revision_number + 1) if last_rev else 1
-
-        revision = ContractRevision(
-            id=str(uuid.uuid4()),
-            contract_id=contract.id,
-            revision_number=next_rev,
-            changed_by=session.get('user_id'),
-            change_description="PDF generiert",
+        add_revision(
+            ContractRevision,
+            contract.id,
+            session.get('user_id'),
+            "PDF generiert",
             old_data=contract.final_content,
             new_data=html_content
         )
-        db.session.add(revision)
 
     except Exception as e:
         current_app.logger.error(f"Revision konnte nicht gespeichert werden: {e}", exc_info=True)
         flash("PDF erstellt – Revision konnte aber nicht gespeichert werden.", "warning")
 
+    # 8. Finale HTML-Version speichern
+    contract.final_content = html_content
+
     db.session.commit()
 
     flash("PDF erfolgreich generiert!", "success")
@@ -846,17 +769,17 @@ def download_contract(contract_id):
             flash('Für diesen Vertrag wurde noch kein PDF hochgeladen.', 'warning')
             return redirect(url_for('contracts.contract_detail', contract_id=contract_id))
         
-        from flask import send_file
-        import os
-        
-        upload_root = current_app.config.get('UPLOAD_FOLDER') or os.path.abspath('uploads')
-        file_path = os.path.join(upload_root, 'contracts', contract.pdf_path)
+        file_path = resolve_path(contract.pdf_path, 'contracts')
         
         if not os.path.exists(file_path):
             flash('PDF-Datei wurde nicht gefunden.', 'danger')
             return redirect(url_for('contracts.contract_detail', contract_id=contract_id))
         
-        return send_file(file_path, as_attachment=True, download_name=f"Vertrag_{contract.contract_number}.pdf")
+        return send_stored(
+            file_path,
+            download_name=f"Vertrag_{contract.contract_number}.pdf",
+            mimetype='application/pdf',
+        )
         
     except Exception as e:
         current_app.logger.error(f"Error downloading contract {contract_id}: {str(e)}", exc_info=True)
@@ -886,17 +809,7 @@ def upload_contract_pdf(contract_id):
             return redirect(url_for('contracts.contract_detail', contract_id=contract_id))
         
         if file and file.filename.lower().endswith('.pdf'):
-            import os
-            from werkzeug.utils import secure_filename
-            
-            filename = secure_filename(file.filename)
-            unique_filename = f"contract_{contract.contract_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            upload_root = current_app.config.get('UPLOAD_FOLDER') or os.path.abspath('uploads')
-            file_path = os.path.join(upload_root, 'contracts', unique_filename)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            file.save(file_path)
-            
-            contract.pdf_path = unique_filename
+            contract.pdf_path = store_upload(file).path
             db.session.commit()
             
             current_app.logger.info(f"PDF uploaded for contract: {contract.contract_number}")
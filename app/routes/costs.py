@@ -1,15 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+import json
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, session
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.routes.main import login_required
 from app.extensions import db
 from sqlalchemy import inspect, text
-from app.models import OperatingCost, CostCategory, Building
+from app.models import OperatingCost, CostCategory, Building, Document
 import uuid
-from datetime import datetime
-import os
-from werkzeug.utils import secure_filename
+from datetime import datetime, timedelta
 from app.routes.contracts import ensure_writable_dir
+from app.utils.bulk_import import run_bulk_insert, existing_values
+from app.utils.scheduler import BackgroundJob, jobs_allowed
+from app.utils.storage import release_blob, store_upload
+from app.utils.text_extraction import mark_pending, queue_extraction
 
 costs_bp = Blueprint('costs', __name__, url_prefix='/costs')
+costs_api_bp = Blueprint('costs_api', __name__)
+
+# Vorab analysierte Rechnungen ohne gespeicherte Kostenposition
+DRAFT_INVOICE_MAX_AGE_HOURS = 24
+DRAFT_INVOICE_TICK_SECONDS = 60 * 60
 
 
 def _ensure_cost_columns(inspector):
@@ -25,7 +35,7 @@ def _ensure_cost_columns(inspector):
             conn.execute(text("ALTER TABLE operating_costs ADD COLUMN vendor_invoice_number VARCHAR(120)"))
 
 
-def _parse_cost_form(form, existing_cost=None, document_path=None):
+def _cost_values(form, current_system_number=None):
     def parse_float(value, default=0.0):
         try:
             return float(value)
@@ -44,42 +54,82 @@ def _parse_cost_form(form, existing_cost=None, document_path=None):
     invoice_date_raw = form.get('invoice_date')
     until_consumed = bool(form.get('until_consumed'))
 
+    return {
+        'building_id': form.get('building_id'),
+        'cost_category_id': form.get('cost_category_id'),
+        'description': form.get('description'),
+        'amount_net': net_val,
+        'tax_rate': tax_val,
+        'amount_gross': gross_val if gross_val else net_val * (1 + tax_val / 100),
+        'billing_period_start': datetime.strptime(start_date_raw, '%Y-%m-%d').date(),
+        'billing_period_end': datetime.strptime(end_date_val, '%Y-%m-%d').date() if end_date_val else None,
+        'invoice_date': datetime.strptime(invoice_date_raw, '%Y-%m-%d').date() if invoice_date_raw else None,
+        'invoice_number': form.get('invoice_number'),
+        'vendor_invoice_number': form.get('vendor_invoice_number'),
+        'system_invoice_number': form.get('system_invoice_number') or current_system_number or f"SYS-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{str(uuid.uuid4())[:6]}",
+        'distribution_method': form.get('distribution_method') or 'manual',
+        'allocation_percent': parse_float(form.get('allocation_percent'), 0),
+        'until_consumed': until_consumed,
+    }
+
+
+def _parse_cost_form(form, existing_cost=None, document_path=None):
     target = existing_cost or OperatingCost(id=str(uuid.uuid4()))
-    target.building_id = form.get('building_id')
-    target.cost_category_id = form.get('cost_category_id')
-    target.description = form.get('description')
-    target.amount_net = net_val
-    target.tax_rate = tax_val
-    target.amount_gross = gross_val if gross_val else net_val * (1 + tax_val / 100)
-    target.billing_period_start = datetime.strptime(start_date_raw, '%Y-%m-%d').date()
-    target.billing_period_end = datetime.strptime(end_date_val, '%Y-%m-%d').date() if end_date_val else None
-    target.invoice_date = datetime.strptime(invoice_date_raw, '%Y-%m-%d').date() if invoice_date_raw else None
-    target.invoice_number = form.get('invoice_number')
-    target.vendor_invoice_number = form.get('vendor_invoice_number')
-    target.system_invoice_number = form.get('system_invoice_number') or target.system_invoice_number or f"SYS-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{str(uuid.uuid4())[:6]}"
-    target.distribution_method = form.get('distribution_method') or 'manual'
-    target.allocation_percent = parse_float(form.get('allocation_percent'), 0)
-    target.until_consumed = until_consumed
+    for field, value in _cost_values(form, target.system_invoice_number).items():
+        setattr(target, field, value)
     if document_path is not None:
         target.document_path = document_path
     return target
 
 
-def _handle_invoice_upload(file_storage, existing_path=None):
+def _create_invoice_document(stored):
+    document = Document(
+        documentable_type='cost',
+        document_type='invoice',
+        file_name=stored.filename,
+        file_path=stored.path,
+        file_size=stored.size,
+        mime_type=stored.mime_type,
+        content_hash=stored.sha256,
+        uploaded_by=session.get('user_id'),
+    )
+    mark_pending(document)
+    db.session.add(document)
+    return document
+
+
+def _handle_invoice_upload(file_storage, form=None, existing_path=None):
+    """Gibt ``(document_path, Document)`` zurück.
+
+    Wurde die Rechnung bereits über ``/costs/invoice/analyze`` hochgeladen,
+    verweist ``invoice_document_id`` auf das vorhandene Dokument. Übernommen
+    werden nur noch nicht verknüpfte Dokumente.
+    """
+    document_id = form.get('invoice_document_id') if form else None
+    if document_id:
+        invoice = Document.query.filter_by(
+            id=document_id, documentable_type='cost', documentable_id=None
+        ).first()
+        if invoice is not None:
+            return invoice.file_path, invoice
+
     document = file_storage.get('invoice_document') if file_storage else None
     if not document or not document.filename:
-        return existing_path
+        return existing_path, None
+
+    ensure_writable_dir(current_app.config['UPLOAD_FOLDER'])
+    stored = store_upload(document)
+    return stored.path, _create_invoice_document(stored)
 
-    upload_root = current_app.config['UPLOAD_FOLDER']
-    ensure_writable_dir(upload_root)
-    cost_dir = os.path.join(upload_root, 'costs')
-    ensure_writable_dir(cost_dir)
 
-    safe_name = secure_filename(document.filename)
-    unique_name = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}_{safe_name}"
-    target_path = os.path.join(cost_dir, unique_name)
-    document.save(target_path)
-    return os.path.join('costs', unique_name)
+def _queue_invoice(invoice):
+    # Extraktion darf das Speichern der Kosten nie scheitern lassen
+    if invoice is None or invoice.extraction_status != 'pending':
+        return
+    try:
+        queue_extraction(invoice)
+    except Exception as exc:
+        current_app.logger.warning('Texterkennung für Rechnung %s nicht gestartet: %s', invoice.id, exc)
 
 
 @costs_bp.route('/', methods=['GET', 'POST'])
@@ -105,10 +155,13 @@ def costs_home():
 
     if request.method == 'POST':
         try:
-            document_path = _handle_invoice_upload(request.files)
+            document_path, invoice = _handle_invoice_upload(request.files, request.form)
             cost = _parse_cost_form(request.form, document_path=document_path)
             db.session.add(cost)
+            if invoice is not None:
+                invoice.documentable_id = cost.id
             db.session.commit()
+            _queue_invoice(invoice)
             flash('Kostenposition gespeichert.', 'success')
             return redirect(url_for('costs.costs_home'))
         except Exception as exc:
@@ -180,9 +233,12 @@ def delete_category(category_id):
 def update_cost(cost_id):
     cost = OperatingCost.query.get_or_404(cost_id)
     try:
-        document_path = _handle_invoice_upload(request.files, cost.document_path)
+        document_path, invoice = _handle_invoice_upload(request.files, request.form, cost.document_path)
         _parse_cost_form(request.form, cost, document_path)
+        if invoice is not None:
+            invoice.documentable_id = cost.id
         db.session.commit()
+        _queue_invoice(invoice)
         flash('Kostenposition aktualisiert.', 'success')
     except Exception as exc:
         db.session.rollback()
@@ -191,6 +247,82 @@ def update_cost(cost_id):
     return redirect(url_for('costs.costs_home'))
 
 
+@costs_bp.route('/invoice/analyze', methods=['POST'])
+@login_required
+def analyze_invoice():
+    """Speichert eine Rechnung vorab und startet die Texterkennung.
+
+    Das Formular fragt anschließend ``invoice_status`` ab und übernimmt
+    erkannte Werte in leere Felder. Das Dokument wird beim Speichern der
+    Kosten verknüpft; wird das Formular verworfen, räumt
+    ``prune_draft_invoices`` es später weg.
+    """
+    upload = request.files.get('invoice_document')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'Keine Datei übergeben'}), 400
+    try:
+        ensure_writable_dir(current_app.config['UPLOAD_FOLDER'])
+        invoice = _create_invoice_document(store_upload(upload))
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.error('Rechnung konnte nicht gespeichert werden: %s', exc, exc_info=True)
+        return jsonify({'error': str(exc)}), 500
+    _queue_invoice(invoice)
+    return jsonify({'document_id': invoice.id, 'status': invoice.extraction_status}), 202
+
+
+@costs_bp.route('/invoice/<document_id>', methods=['GET'])
+@login_required
+def invoice_status(document_id):
+    invoice = Document.query.filter_by(id=document_id, documentable_type='cost').first_or_404()
+    return jsonify({
+        'document_id': invoice.id,
+        'status': invoice.extraction_status,
+        'candidates': json.loads(invoice.extracted_fields) if invoice.extracted_fields else {},
+    })
+
+
+def prune_draft_invoices(now=None):
+    """Löscht vorab analysierte Rechnungen, die nie einer Kostenposition zugeordnet wurden.
+
+    Maßgeblich ist ``DRAFT_INVOICE_MAX_AGE_HOURS``; die Datei wird erst nach
+    dem Commit freigegeben und bleibt, solange noch ein Datensatz auf sie zeigt.
+    """
+    hours = current_app.config.get('DRAFT_INVOICE_MAX_AGE_HOURS', DRAFT_INVOICE_MAX_AGE_HOURS)
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=hours)
+    drafts = Document.query.filter(
+        Document.documentable_type == 'cost',
+        Document.documentable_id.is_(None),
+        Document.created_at < cutoff,
+    ).all()
+    paths = {draft.file_path for draft in drafts}
+    for draft in drafts:
+        db.session.delete(draft)
+    db.session.commit()
+    for path in paths:
+        release_blob(path)
+    if drafts:
+        print(f"🧹 Draft invoices removed: {len(drafts)}")
+    return {'deleted': len(drafts)}
+
+
+def start_draft_invoice_cleanup(app):
+    """Startet die periodische Bereinigung verworfener Rechnungsanalysen."""
+    if not app.config.get('DRAFT_INVOICE_CLEANUP_ENABLED', True) or not jobs_allowed(app):
+        return None
+
+    job = BackgroundJob(
+        app,
+        'draft_invoice_cleanup',
+        prune_draft_invoices,
+        tick=app.config.get('DRAFT_INVOICE_TICK', DRAFT_INVOICE_TICK_SECONDS),
+    )
+    job.start()
+    app.extensions['draft_invoice_cleanup'] = job
+    return job
+
+
 @costs_bp.route('/<cost_id>/archive', methods=['POST'])
 @login_required
 def archive_cost(cost_id):
@@ -234,3 +366,48 @@ def delete_cost(cost_id):
         current_app.logger.error('Kosten konnten nicht gelöscht werden: %s', exc, exc_info=True)
         flash(f'Kosten konnten nicht gelöscht werden: {exc}', 'danger')
     return redirect(url_for('costs.costs_home'))
+
+
+def _build_cost_rows(items):
+    """Prüft alle Kostenpositionen eines Sammelimports mit je einer Abfrage pro Referenztabelle."""
+    dicts = [item for item in items if isinstance(item, dict)]
+    known_buildings = existing_values(Building.id, [item.get('building_id') for item in dicts])
+    known_categories = existing_values(CostCategory.id, [item.get('cost_category_id') for item in dicts])
+    taken_numbers = existing_values(
+        OperatingCost.system_invoice_number, [item.get('system_invoice_number') for item in dicts]
+    )
+
+    validated = []
+    for item in items:
+        if not isinstance(item, dict):
+            validated.append((None, 'Eintrag muss ein JSON-Objekt sein'))
+            continue
+        try:
+            values = _cost_values(item)
+            if values['building_id'] not in known_buildings:
+                raise ValueError(f"Gebäude {values['building_id']} nicht gefunden")
+            if values['cost_category_id'] and values['cost_category_id'] not in known_categories:
+                raise ValueError(f"Kategorie {values['cost_category_id']} nicht gefunden")
+            if values['system_invoice_number'] in taken_numbers:
+                raise ValueError(f"Systemrechnungsnummer {values['system_invoice_number']} bereits vergeben")
+            taken_numbers.add(values['system_invoice_number'])
+            values['id'] = str(uuid.uuid4())
+            values['document_path'] = item.get('document_path')
+            validated.append((values, None))
+        except (TypeError, ValueError) as exc:
+            validated.append((None, str(exc)))
+    return validated
+
+
+@costs_api_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_costs_api():
+    """Sammelimport von Betriebskosten (JSON-Array oder NDJSON)."""
+    _ensure_cost_columns(inspect(db.engine))
+    return run_bulk_insert(
+        'costs.bulk',
+        OperatingCost,
+        _build_cost_rows,
+        'Kostenpositionen',
+        user_id=get_jwt_identity(),
+    )
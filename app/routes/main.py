@@ -1,13 +1,20 @@
-from flask import Blueprint, render_template, redirect, url_for, session, request, flash, jsonify
+from flask import Blueprint, render_template, redirect, url_for, session, request, flash, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import User, Apartment, Tenant, Building, Meter, MeterType, MeterReading, Document, Settlement, Contract, Protocol, OperatingCost, Income, DueDate, MaintenanceTask, Notification
 from datetime import datetime, timedelta, date
+import time
 import uuid
 from app.extensions import db
 from app.utils.project_profile import load_project_profile
 from app.utils.schema_helpers import ensure_archiving_columns, ensure_user_landlord_flag
+from app.utils.events import broker, format_sse, notification_relay, serialize_notification, TooManyConnections
+from app.utils.bulk_import import run_bulk_insert, existing_values, parse_iso_date, parse_number
+from app.utils.storage import release_blob, resolve_path, send_stored, store_upload
+from app.utils.text_extraction import mark_pending, queue_extraction
 from sqlalchemy import inspect, text
 
 main_bp = Blueprint('main', __name__)
+incomes_api_bp = Blueprint('incomes_api', __name__)
 
 
 def _contract_options(contracts):
@@ -43,39 +50,6 @@ def login_required(f):
 # app.permanent_session_lifetime = timedelta(hours=24)
 
 
-def _ensure_notifications_table():
-    inspector = inspect(db.engine)
-    if not inspector.has_table('notifications'):
-        db.create_all()
-
-
-def _push_notification(user_id, title, message, link=None, category='info', dedup_hours=24):
-    """Leichte Deduplizierung, damit Erinnerungen nicht gespammt werden."""
-    if not user_id:
-        return None
-
-    _ensure_notifications_table()
-    window_start = datetime.utcnow() - timedelta(hours=dedup_hours)
-    existing = Notification.query.filter(
-        Notification.user_id == user_id,
-        Notification.title == title,
-        Notification.message == message,
-        Notification.created_at >= window_start,
-    ).first()
-    if existing:
-        return existing
-
-    notif = Notification(
-        user_id=user_id,
-        title=title,
-        message=message,
-        link=link,
-        category=category,
-    )
-    db.session.add(notif)
-    db.session.commit()
-    return notif
-
 def _build_dashboard_context(user=None):
     ensure_archiving_columns()
     ensure_user_landlord_flag()
@@ -106,55 +80,13 @@ def _build_dashboard_context(user=None):
     )
     total_expenses = sum((c.amount_gross or 0) for c in OperatingCost.query.all())
 
-    due_contracts = [
-        c for c in contracts
-        if c.end_date and datetime.utcnow().date() <= c.end_date <= datetime.utcnow().date() + timedelta(days=30)
-    ]
     open_protocols = [p for p in protocols if not p.pdf_path]
     due_dates_open = DueDate.query.filter_by(status='open').order_by(DueDate.due_on.asc()).limit(10).all()
 
-    _ensure_notifications_table()
+    # Erinnerungen erzeugt der Hintergrundjob (app.utils.notifications); hier nur lesen
     notifications = []
     unread_notifications = 0
     if user:
-        # Erinnerungen für Wartungen
-        reminders_dirty = False
-        for task in MaintenanceTask.query.filter_by(status='open').all():
-            if task.reminder_date and task.reminder_date <= date.today():
-                _push_notification(
-                    user.id,
-                    f"Wartung fällig: {task.title}",
-                    f"{task.category} am {task.scheduled_on.strftime('%d.%m.%Y')} einplanen.",
-                    link=url_for('main.maintenance_list'),
-                    category='maintenance'
-                )
-                if not task.reminder_sent:
-                    task.reminder_sent = True
-                    reminders_dirty = True
-
-        if reminders_dirty:
-            db.session.commit()
-
-        # Erinnerungen für Vertragsende und Auszug
-        for contract in due_contracts:
-            _push_notification(
-                user.id,
-                f"Vertrag endet am {contract.end_date.strftime('%d.%m.%Y')}",
-                f"{contract.contract_number or 'Mietvertrag'} läuft aus.",
-                link=url_for('contracts.contract_detail', contract_id=contract.id),
-                category='contract'
-            )
-
-        for tenant in tenants:
-            if tenant.move_out_date and date.today() <= tenant.move_out_date <= date.today() + timedelta(days=30):
-                _push_notification(
-                    user.id,
-                    f"Auszug geplant: {tenant.first_name} {tenant.last_name}",
-                    f"Auszug am {tenant.move_out_date.strftime('%d.%m.%Y')} prüfen.",
-                    link=url_for('tenants.tenant_detail', tenant_id=tenant.id) if hasattr(tenant, 'id') else None,
-                    category='tenant'
-                )
-
         notifications = Notification.query.filter_by(user_id=user.id).order_by(Notification.created_at.desc()).limit(15).all()
         unread_notifications = Notification.query.filter_by(user_id=user.id, is_read=False).count()
 
@@ -314,32 +246,145 @@ def dashboard():
                          **context)
 
 
+def _notification_cursor(notification):
+    return f"{notification.created_at.isoformat()}|{notification.id}"
+
+
+def _notifications_after(user_id, cursor):
+    """Benachrichtigungen, die neuer als ``cursor`` (``created_at|id``) sind."""
+    created_at, _, last_id = cursor.partition('|')
+    created_at = datetime.fromisoformat(created_at)
+    return Notification.query.filter(
+        Notification.user_id == user_id,
+        (Notification.created_at > created_at)
+        | ((Notification.created_at == created_at) & (Notification.id > last_id)),
+    ).order_by(Notification.created_at.desc(), Notification.id.desc()).limit(20).all()
+
+
+def _notification_snapshot(user_id, items=None):
+    if items is None:
+        items = Notification.query.filter_by(user_id=user_id).order_by(
+            Notification.created_at.desc(), Notification.id.desc()
+        ).limit(20).all()
+    unread = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+    return {
+        'items': [serialize_notification(n) for n in items],
+        'unread': unread,
+        'cursor': _notification_cursor(items[0]) if items else None,
+    }
+
+
+def _too_many_connections():
+    response = jsonify({'error': 'Zu viele offene Verbindungen', 'fallback': 'poll'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
+
+
+def _short_poll(user_id, cursor):
+    """Antwort ohne Warten, wenn alle Threads für Streams vergeben sind."""
+    try:
+        items = _notifications_after(user_id, cursor)
+    except ValueError:
+        return jsonify({'error': 'Ungültiger Cursor'}), 400
+    data = _notification_snapshot(user_id, items) if items else {'items': [], 'cursor': cursor, 'unread': None}
+    data['retry_after'] = current_app.config.get('SSE_SHORT_POLL_SECONDS', 30)
+    return jsonify(data)
+
+
 @main_bp.route('/notifications')
 @login_required
 def notifications_feed():
-    _ensure_notifications_table()
-    user_id = session.get('user_id')
-    items = Notification.query.filter_by(user_id=user_id).order_by(Notification.created_at.desc()).limit(20).all()
-    unread = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+    return jsonify(_notification_snapshot(session.get('user_id')))
 
-    def serialize(n):
-        return {
-            'id': n.id,
-            'title': n.title,
-            'message': n.message,
-            'category': n.category,
-            'link': n.link,
-            'created_at': n.created_at.strftime('%d.%m.%Y %H:%M'),
-            'is_read': n.is_read,
-        }
 
-    return jsonify({'items': [serialize(n) for n in items], 'unread': unread})
+@main_bp.route('/notifications/stream')
+@login_required
+def notifications_stream():
+    """Server-Sent Events: ``snapshot`` beim Verbinden, danach ``notification``
+    und ``job``. Die Verbindung wird nach ``SSE_MAX_STREAM_SECONDS`` beendet;
+    der Browser verbindet sich selbständig neu."""
+    user_id = session.get('user_id')
+    try:
+        subscription = broker.subscribe(user_id)
+    except TooManyConnections:
+        return _too_many_connections()
+
+    notification_relay(current_app._get_current_object()).ensure_running()
+    snapshot = _notification_snapshot(user_id)
+    # Datenbankverbindung nicht für die Dauer des Streams belegen
+    db.session.close()
+
+    heartbeat = current_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+    max_age = current_app.config.get('SSE_MAX_STREAM_SECONDS', 300)
+
+    def generate():
+        with subscription:
+            yield 'retry: 5000\n\n'
+            yield format_sse('snapshot', snapshot)
+            deadline = time.monotonic() + max_age
+            while time.monotonic() < deadline:
+                item = subscription.get(timeout=heartbeat)
+                if subscription.overflowed:
+                    yield format_sse('resync', {})
+                    return
+                if item is None:
+                    yield ': ping\n\n'
+                    continue
+                yield format_sse(*item)
+
+    response = current_app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Auch schließen, wenn der Client vor dem ersten Ereignis abbricht
+    response.call_on_close(subscription.close)
+    return response
+
+
+@main_bp.route('/notifications/poll')
+@login_required
+def notifications_poll():
+    """Long-Polling als Rückfallebene für Clients ohne SSE.
+
+    Ohne ``cursor`` wird sofort der aktuelle Stand geliefert, sonst wird bis
+    zu ``timeout`` Sekunden (max. 30) auf neue Benachrichtigungen gewartet.
+    Ist das Verbindungslimit erreicht, antwortet der Endpunkt sofort (kurzes
+    Polling mit ``retry_after``), statt einen Worker-Thread zu belegen.
+    """
+    user_id = session.get('user_id')
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return jsonify(_notification_snapshot(user_id))
+
+    timeout = max(1, min(request.args.get('timeout', 25, type=int), 30))
+    try:
+        subscription = broker.subscribe(user_id)
+    except TooManyConnections:
+        return _short_poll(user_id, cursor)
+
+    with subscription:
+        notification_relay(current_app._get_current_object()).ensure_running()
+        try:
+            items = _notifications_after(user_id, cursor)
+        except ValueError:
+            return jsonify({'error': 'Ungültiger Cursor'}), 400
+        if not items:
+            db.session.close()
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                item = subscription.get(timeout=max(0, deadline - time.monotonic()))
+                if item and item[0] == 'notification':
+                    break
+            items = _notifications_after(user_id, cursor)
+
+    if not items:
+        return jsonify({'items': [], 'cursor': cursor, 'unread': None})
+    return jsonify(_notification_snapshot(user_id, items))
 
 
 @main_bp.route('/notifications/mark-all-read', methods=['POST'])
 @login_required
 def mark_all_notifications():
-    _ensure_notifications_table()
     user_id = session.get('user_id')
     Notification.query.filter_by(user_id=user_id, is_read=False).update({Notification.is_read: True})
     db.session.commit()
@@ -417,6 +462,54 @@ def delete_income(income_id):
     return redirect(request.referrer or url_for('main.dashboard'))
 
 
+def _build_income_rows(items):
+    """Prüft alle Einnahmen eines Sammelimports mit je einer Abfrage für Verträge und Mieter."""
+    dicts = [item for item in items if isinstance(item, dict)]
+    known_contracts = existing_values(Contract.id, [item.get('contract_id') for item in dicts])
+    known_tenants = existing_values(Tenant.id, [item.get('tenant_id') for item in dicts])
+
+    validated = []
+    for item in items:
+        if not isinstance(item, dict):
+            validated.append((None, 'Eintrag muss ein JSON-Objekt sein'))
+            continue
+        try:
+            contract_id = item.get('contract_id')
+            if contract_id not in known_contracts:
+                raise ValueError(f'Vertrag {contract_id} nicht gefunden')
+            tenant_id = item.get('tenant_id') or None
+            if tenant_id and tenant_id not in known_tenants:
+                raise ValueError(f'Mieter {tenant_id} nicht gefunden')
+            amount = parse_number(item.get('amount'), 'amount')
+            if amount <= 0:
+                raise ValueError('Bitte einen Betrag größer 0 angeben.')
+            validated.append(({
+                'id': str(uuid.uuid4()),
+                'contract_id': contract_id,
+                'tenant_id': tenant_id,
+                'income_type': item.get('income_type') or 'rent',
+                'amount': amount,
+                'received_on': parse_iso_date(item.get('received_on'), 'received_on', default=date.today()),
+                'notes': item.get('notes'),
+            }, None))
+        except ValueError as exc:
+            validated.append((None, str(exc)))
+    return validated
+
+
+@incomes_api_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_incomes_api():
+    """Sammelimport von Einnahmen (JSON-Array oder NDJSON)."""
+    return run_bulk_insert(
+        'incomes.bulk',
+        Income,
+        _build_income_rows,
+        'Einnahmen',
+        user_id=get_jwt_identity(),
+    )
+
+
 @main_bp.route('/landlord/due-dates', methods=['POST'])
 @login_required
 def add_due_date_entry():
@@ -704,8 +797,8 @@ def create_meter_reading_page():
 @main_bp.route('/documents')
 @login_required
 def documents_page():
-    documents = Document.query.order_by(Document.created_at.desc()).all()
-    return render_template('documents/list.html', documents=documents)
+    # Liste mit Filtern und Seitenumbruch liegt im Dokumente-Blueprint
+    return redirect(url_for('documents.documents_list', **request.args))
 
 @main_bp.route('/documents/upload', methods=['GET', 'POST'])
 @login_required
@@ -723,30 +816,32 @@ def upload_document_page():
             
             # Vereinfachte Datei-Prüfung
             if file and '.' in file.filename:
-                # Datei speichern
-                import os
-                from werkzeug.utils import secure_filename
-                
-                filename = secure_filename(file.filename)
-                unique_filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                file_path = os.path.join('uploads', 'documents', unique_filename)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                file.save(file_path)
-                
+                # Datei inhaltsadressiert ablegen
+                stored = store_upload(file)
+
                 # Dokument in Datenbank speichern
+                apartment_id = request.form.get('apartment_id') or None
+                tenant_id = request.form.get('tenant_id') or None
                 document = Document(
-                    filename=unique_filename,
-                    original_filename=filename,
-                    file_type=file.content_type or 'application/octet-stream',
-                    file_size=os.path.getsize(file_path),
-                    category=request.form['category'],
+                    file_name=stored.filename,
+                    file_path=stored.path,
+                    file_size=stored.size,
+                    mime_type=stored.mime_type,
+                    content_hash=stored.sha256,
+                    document_type=request.form.get('category') or 'other',
                     description=request.form.get('description'),
-                    apartment_id=request.form.get('apartment_id') or None,
-                    tenant_id=request.form.get('tenant_id') or None
+                    documentable_type='apartment' if apartment_id else ('tenant' if tenant_id else None),
+                    documentable_id=apartment_id or tenant_id,
+                    uploaded_by=session.get('user_id')
                 )
                 
+                mark_pending(document)
                 db.session.add(document)
                 db.session.commit()
+                try:
+                    queue_extraction(document)
+                except Exception as e:
+                    print(f"⚠️  Text extraction not queued for {document.id}: {e}")
                 flash('Dokument erfolgreich hochgeladen!', 'success')
                 return redirect(url_for('main.documents_page'))
             else:
@@ -763,34 +858,36 @@ def upload_document_page():
 @main_bp.route('/documents/<document_id>/download')
 @login_required
 def download_document_page(document_id):
-    from flask import send_file
     import os
     
     document = Document.query.get_or_404(document_id)
-    file_path = os.path.join('uploads', 'documents', document.filename)
+    file_path = resolve_path(document.file_path)
     
-    if not os.path.exists(file_path):
+    if not file_path or not os.path.exists(file_path):
         flash('Datei nicht gefunden', 'danger')
         return redirect(url_for('main.documents_page'))
     
-    return send_file(file_path, as_attachment=True, download_name=document.original_filename)
+    return send_stored(
+        file_path,
+        download_name=document.file_name,
+        mimetype=document.mime_type,
+        etag=document.content_hash,
+    )
 
 @main_bp.route('/documents/<document_id>/delete', methods=['POST'])
 @login_required
 def delete_document_page(document_id):
-    import os
-    
     document = Document.query.get_or_404(document_id)
     
     try:
-        # Datei löschen
-        file_path = os.path.join('uploads', 'documents', document.filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        file_path = document.file_path
         
         # Datenbank-Eintrag löschen
         db.session.delete(document)
         db.session.commit()
+        
+        # Datei nur löschen, wenn kein anderer Datensatz sie noch nutzt
+        release_blob(file_path)
         flash('Dokument erfolgreich gelöscht!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -1,22 +1,21 @@
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, session, current_app, send_from_directory
-from flask_jwt_extended import jwt_required
+from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, session, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.extensions import db
 from app.models import MeterReading, Meter, MeterType, Apartment, Tenant, User, Building  # ✅ Building hinzugefügt
 from datetime import datetime
 from app.routes.main import login_required
+from app.utils.bulk_import import run_bulk_insert, existing_values, parse_iso_date, parse_number
+from app.utils.storage import store_upload
+from app.utils.thumbnails import schedule_derivatives, send_photo
+from app.utils.export_writers import column_widths, pdf_response, table_pdf, xlsx_response
 import os
-from werkzeug.utils import secure_filename
 import uuid
 import csv
 import io
 from flask import Response
-import pandas as pd
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
 
 meter_bp = Blueprint('meter_readings', __name__)
+meter_readings_api_bp = Blueprint('meter_readings_api', __name__)
 
 # Konfiguration für Datei-Uploads
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'heic'}
@@ -311,60 +310,36 @@ def export_excel():
         readings = get_filtered_readings_for_export(request.args)
         
         # Daten für Excel vorbereiten
-        data = []
+        headers = [
+            'Datum', 'Gebäude', 'Adresse', 'PLZ', 'Stadt', 'Zählernummer', 'Beschreibung',
+            'Unterzähler von', 'Wohnung', 'Kategorie', 'Zählertyp', 'Wert', 'Einheit', 'Ablesetyp', 'Notizen'
+        ]
+        rows = []
         for reading in readings:
             parent_meter = reading.meter.parent_meter
-            data.append({
-                'Datum': reading.reading_date.strftime('%d.%m.%Y'),
-                'Gebäude': reading.meter.building.name,
-                'Adresse': f"{reading.meter.building.street} {reading.meter.building.street_number}",
-                'PLZ': reading.meter.building.zip_code,
-                'Stadt': reading.meter.building.city,
-                'Zählernummer': reading.meter.meter_number,
-                'Beschreibung': reading.meter.description or '',
-                'Unterzähler von': parent_meter.meter_number if parent_meter else '',
-                'Wohnung': reading.meter.apartment.apartment_number if reading.meter.apartment else '',
-                'Kategorie': reading.meter.meter_type.category,
-                'Zählertyp': reading.meter.meter_type.name,
-                'Wert': reading.reading_value,
-                'Einheit': reading.meter.meter_type.unit,
-                'Ablesetyp': reading.reading_type,
-                'Notizen': reading.notes or ''
-            })
-        
-        # DataFrame erstellen
-        df = pd.DataFrame(data)
-        
-        # Excel erstellen
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Zählerstände', index=False)
-            
-            # Formatierung
-            workbook = writer.book
-            worksheet = writer.sheets['Zählerstände']
-            
-            # Spaltenbreiten anpassen
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+            rows.append([
+                reading.reading_date.strftime('%d.%m.%Y'),
+                reading.meter.building.name,
+                f"{reading.meter.building.street} {reading.meter.building.street_number}",
+                reading.meter.building.zip_code,
+                reading.meter.building.city,
+                reading.meter.meter_number,
+                reading.meter.description or '',
+                parent_meter.meter_number if parent_meter else '',
+                reading.meter.apartment.apartment_number if reading.meter.apartment else '',
+                reading.meter.meter_type.category,
+                reading.meter.meter_type.name,
+                reading.reading_value,
+                reading.meter.meter_type.unit,
+                reading.reading_type,
+                reading.notes or ''
+            ])
         
-        output.seek(0)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"zählerstände_export_{timestamp}.xlsx"
         
-        return Response(
-            output.getvalue(),
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment;filename={filename}"}
+        return xlsx_response(
+            filename, headers, rows, sheet_title='Zählerstände', column_widths=column_widths(headers, rows)
         )
         
     except Exception as e:
@@ -379,25 +354,6 @@ def export_pdf():
         # Verwende die neue Funktion für Export (ohne Paginierung)
         readings = get_filtered_readings_for_export(request.args)
         
-        # PDF erstellen
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=30)
-        elements = []
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30,
-            textColor=colors.HexColor('#1e40af')
-        )
-        
-        # Titel
-        title = Paragraph("Zählerstände - Export", title_style)
-        elements.append(title)
-        
         # Metadaten
         meta_data = [
             f"Erstellt am: {datetime.now().strftime('%d.%m.%Y %H:%M')}",
@@ -405,64 +361,34 @@ def export_pdf():
             f"Exportiert von: MietAssistent"
         ]
         
-        for meta in meta_data:
-            elements.append(Paragraph(meta, styles['Normal']))
-            elements.append(Spacer(1, 5))
-        
-        elements.append(Spacer(1, 20))
-        
-        # Tabelle erstellen
-        if readings:
-            # Tabellen-Header
-            table_data = [[
-                'Datum', 'Gebäude', 'Zähler', 'Wohnung', 
-                'Kategorie', 'Wert', 'Einheit', 'Typ'
-            ]]
-            
-            # Tabellen-Daten
-            for reading in readings:
-                table_data.append([
-                    reading.reading_date.strftime('%d.%m.%Y'),
-                    reading.meter.building.name,
-                    f"{reading.meter.meter_number}{' (U)' if reading.meter.parent_meter_id else ''}",
-                    reading.meter.apartment.apartment_number if reading.meter.apartment else '-',
-                    reading.meter.meter_type.category,
-                    str(reading.reading_value),
-                    reading.meter.meter_type.unit,
-                    reading.reading_type
-                ])
-            
-            # Tabelle formatieren
-            table = Table(table_data, repeatRows=1)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            
-            elements.append(table)
-        else:
-            elements.append(Paragraph("Keine Zählerstände gefunden", styles['Normal']))
+        # Tabellen-Daten
+        rows = [
+            [
+                reading.reading_date.strftime('%d.%m.%Y'),
+                reading.meter.building.name,
+                f"{reading.meter.meter_number}{' (U)' if reading.meter.parent_meter_id else ''}",
+                reading.meter.apartment.apartment_number if reading.meter.apartment else '-',
+                reading.meter.meter_type.category,
+                str(reading.reading_value),
+                reading.meter.meter_type.unit,
+                reading.reading_type
+            ]
+            for reading in readings
+        ]
         
-        # PDF erstellen
-        doc.build(elements)
-        buffer.seek(0)
+        # PDF im Exportprozess erstellen
+        data = table_pdf(
+            "Zählerstände - Export",
+            meta_data,
+            ['Datum', 'Gebäude', 'Zähler', 'Wohnung', 'Kategorie', 'Wert', 'Einheit', 'Typ'],
+            rows,
+            empty_text="Keine Zählerstände gefunden",
+        )
         
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"zaehlerstaende_export_{timestamp}.pdf"
         
-        return Response(
-            buffer.getvalue(),
-            mimetype="application/pdf",
-            headers={"Content-Disposition": f"attachment;filename={filename}"}
-        )
+        return pdf_response(filename, data)
         
     except Exception as e:
         flash(f'Fehler beim PDF-Export: {str(e)}', 'danger')
@@ -562,13 +488,8 @@ def create_meter_reading():
             if 'photo' in request.files:
                 file = request.files['photo']
                 if file and file.filename and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                    upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'meter_photos')
-                    os.makedirs(upload_dir, exist_ok=True)
-                    file_path = os.path.join(upload_dir, unique_filename)
-                    file.save(file_path)
-                    reading.photo_path = unique_filename
+                    reading.photo_path = store_upload(file).path
+                    schedule_derivatives(reading.photo_path, 'meter_photos')
             
             db.session.add(reading)
             db.session.commit()
@@ -614,9 +535,8 @@ def reading_detail(reading_id):
 @meter_bp.route('/photos/<path:filename>')
 @login_required
 def meter_photo(filename):
-    """Stellt hochgeladene Zählerfotos bereit."""
-    directory = os.path.join(current_app.config['UPLOAD_FOLDER'], 'meter_photos')
-    return send_from_directory(directory, filename)
+    """Stellt hochgeladene Zählerfotos bereit (``?size=thumb|preview|print``)."""
+    return send_photo(filename, 'meter_photos', request.args.get('size'))
 
 @meter_bp.route('/debug/upload-test')
 @login_required
@@ -680,6 +600,48 @@ def create_meter_reading_api():
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+def _build_reading_rows(items, user_id=None):
+    """Prüft alle Zählerstände eines Sammelimports mit einer Zähler-Abfrage."""
+    known_meters = existing_values(
+        Meter.id, [item.get('meter_id') for item in items if isinstance(item, dict)]
+    )
+    validated = []
+    for item in items:
+        if not isinstance(item, dict):
+            validated.append((None, 'Eintrag muss ein JSON-Objekt sein'))
+            continue
+        try:
+            meter_id = item.get('meter_id')
+            if meter_id not in known_meters:
+                raise ValueError(f'Zähler {meter_id} nicht gefunden')
+            validated.append(({
+                'id': str(uuid.uuid4()),
+                'meter_id': meter_id,
+                'reading_value': parse_number(item.get('reading_value'), 'reading_value'),
+                'reading_date': parse_iso_date(item.get('reading_date'), 'reading_date'),
+                'reading_type': item.get('reading_type') or 'actual',
+                'notes': item.get('notes', ''),
+                'is_manual_entry': True,
+                'created_by': user_id,
+            }, None))
+        except ValueError as e:
+            validated.append((None, str(e)))
+    return validated
+
+
+@meter_readings_api_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_meter_readings_api():
+    """Sammelimport von Zählerständen (JSON-Array oder NDJSON)."""
+    user_id = get_jwt_identity()
+    return run_bulk_insert(
+        'meter_readings.bulk',
+        MeterReading,
+        lambda items: _build_reading_rows(items, user_id),
+        'Zählerstände',
+        user_id=user_id,
+    )
+
 @meter_bp.route('/api/meters/<meter_id>/readings', methods=['GET'])
 @jwt_required()
 def get_meter_readings_by_meter(meter_id):
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, send_from_directory, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, send_file
 from app.routes.main import login_required
 from app.extensions import db
 from app.models import Protocol, Contract, ProtocolRevision, Meter, MeterReading
@@ -8,21 +8,44 @@ from datetime import datetime
 import re
 import os
 from types import SimpleNamespace
-from io import BytesIO
-import pandas as pd
-from xhtml2pdf import pisa
-from app.utils.pdf_generator import save_protocol_pdf
+from app.utils.protocol_pipeline import (
+    apply_protocol_summary, parse_protocol_data, protocol_pdf_path, render_protocol_document, store_protocol_uploads,
+)
+from app.utils.revision_store import add_revision
+from app.utils.export_writers import csv_response, html_to_pdf, pdf_response, xlsx_response
 from app.utils.schema_helpers import ensure_archiving_columns
+from app.utils.thumbnails import send_photo
+from app.routes.sync import latest_readings
 
 protocols_bp = Blueprint('protocols', __name__)
 
+def _filtered_protocols(query, include_archived=False):
+    """Filter der Liste und des Exports (Typ, nur mit Mängeln) auf den Kennzahl-Spalten.
+
+    Der Export enthält wie bisher auch archivierte Protokolle.
+    """
+    if not include_archived:
+        query = query.filter((Protocol.is_archived.is_(False)) | (Protocol.is_archived.is_(None)))
+    protocol_type = (request.args.get('type') or '').strip()
+    if protocol_type:
+        query = query.filter(Protocol.protocol_type == protocol_type)
+    if request.args.get('damages'):
+        query = query.filter(Protocol.has_damages.is_(True))
+    return query.order_by(Protocol.protocol_date.desc())
+
+
 @protocols_bp.route('/')
 @login_required
 def protocols_list():
     """Liste aller Protokolle"""
     ensure_archiving_columns()
-    protocols = Protocol.query.filter((Protocol.is_archived.is_(False)) | (Protocol.is_archived.is_(None))).order_by(Protocol.protocol_date.desc()).all()
-    return render_template('protocols/list.html', protocols=protocols)
+    protocols = _filtered_protocols(Protocol.query.options(db.joinedload(Protocol.protocol_contract))).all()
+    return render_template(
+        'protocols/list.html',
+        protocols=protocols,
+        type_filter=request.args.get('type', ''),
+        damages_filter=bool(request.args.get('damages')),
+    )
 
 
 @protocols_bp.route('/create', methods=['GET', 'POST'])
@@ -47,14 +70,10 @@ def create_protocol():
         )
     ).options(db.joinedload(Meter.meter_type)).all()
 
-    # Ermittle letzte Zählerstände für Anzeige
+    # Letzte Zählerstände für die Anzeige (eine Abfrage)
+    latest = {reading.meter_id: reading.reading_value for reading in latest_readings([meter.id for meter in meters])}
     for meter in meters:
-        last_reading = (
-            MeterReading.query.filter_by(meter_id=meter.id)
-            .order_by(MeterReading.reading_date.desc())
-            .first()
-        )
-        meter.latest_reading_value = last_reading.reading_value if last_reading else None
+        meter.latest_reading_value = latest.get(meter.id)
 
     if request.method == 'POST':
         try:
@@ -106,12 +125,10 @@ def create_protocol():
                 })
 
             meter_entries = []
-            meter_photo_map = {}
-            upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'protocols')
-            os.makedirs(upload_dir, exist_ok=True)
-
-            uploaded_files = request.files.getlist('protocol_upload')
-            attachment_paths = []
+            meter_photo_map, attachment_paths = store_protocol_uploads(
+                {meter.id: request.files.get(f'meter_photo_{meter.id}') for meter in meters},
+                request.files.getlist('protocol_upload'),
+            )
 
             for meter in meters:
                 raw_value = request.form.get(f'meter_readings[{meter.id}]')
@@ -124,14 +141,7 @@ def create_protocol():
                             "Ungültiger Zählerstand für %s: %s", meter.id, raw_value
                         )
                         value = None
-                photo = request.files.get(f'meter_photo_{meter.id}')
-                photo_name = None
-
-                if photo and photo.filename:
-                    ext = os.path.splitext(photo.filename)[1]
-                    photo_name = f"meter_{meter.id}_{uuid.uuid4().hex}{ext}"
-                    photo.save(os.path.join(upload_dir, photo_name))
-                    meter_photo_map[str(meter.id)] = photo_name
+                photo_name = meter_photo_map.get(str(meter.id))
 
                 meter_entries.append({
                     'id': meter.id,
@@ -156,14 +166,6 @@ def create_protocol():
                     )
                     db.session.add(reading)
 
-            # Protokollanhänge speichern
-            for file in uploaded_files:
-                if file and file.filename:
-                    ext = os.path.splitext(file.filename)[1]
-                    stored_name = f"protocol_{uuid.uuid4().hex}{ext}"
-                    file.save(os.path.join(upload_dir, stored_name))
-                    attachment_paths.append(stored_name)
-
             try:
                 computed_key_count = sum(
                     (int(key.get('quantity')) if isinstance(key.get('quantity'), int) else int(re.findall(r"\d+", str(key.get('quantity') or '1'))[0]))
@@ -202,28 +204,19 @@ def create_protocol():
                 # erstes PDF oder Bild als pdf_path, damit abrufbar
                 protocol.pdf_path = attachment_paths[0]
 
-            protocol.final_content = render_template(
-                'protocols/protocol_document.html',
-                protocol=protocol,
-                contract=contract,
-                protocol_data=protocol_data,
-                meter_entries=meter_entries,
-                keys=key_entries,
-                inventory_entries=inventory_entries
-            )
+            apply_protocol_summary(protocol)
+            protocol.final_content = render_protocol_document(protocol, contract, protocol_data)
 
             db.session.add(protocol)
 
             if ProtocolRevision:
-                revision = ProtocolRevision(
-                    id=str(uuid.uuid4()),
-                    protocol_id=protocol.id,
-                    revision_number=1,
-                    changed_by=session.get('user_id'),
-                    change_description='Protokoll erstellt',
+                add_revision(
+                    ProtocolRevision,
+                    protocol.id,
+                    session.get('user_id'),
+                    'Protokoll erstellt',
                     new_data=protocol.protocol_data
                 )
-                db.session.add(revision)
 
             db.session.commit()
             flash('Protokoll erfolgreich gespeichert.', 'success')
@@ -264,10 +257,7 @@ def edit_protocol(protocol_id):
             )
         ).options(db.joinedload(Meter.meter_type)).all()
 
-    try:
-        existing_payload = json.loads(protocol.protocol_data) if protocol.protocol_data else {}
-    except Exception:
-        existing_payload = {}
+    existing_payload = parse_protocol_data(protocol)
 
     if request.method == 'POST':
         try:
@@ -292,11 +282,11 @@ def edit_protocol(protocol_id):
             ]
 
             meter_entries = []
-            meter_photo_map = existing_payload.get('meter_photos', {}) if isinstance(existing_payload, dict) else {}
-            if not isinstance(meter_photo_map, dict):
-                meter_photo_map = {}
-            upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'protocols')
-            os.makedirs(upload_dir, exist_ok=True)
+            new_photos, new_attachments = store_protocol_uploads(
+                {meter.id: request.files.get(f'meter_photo_{meter.id}') for meter in meters},
+                request.files.getlist('protocol_upload'),
+            )
+            meter_photo_map = dict(existing_payload['meter_photos'], **new_photos)
 
             for meter in meters:
                 raw_value = request.form.get(f'meter_readings[{meter.id}]')
@@ -306,13 +296,7 @@ def edit_protocol(protocol_id):
                         value = float(raw_value)
                     except (TypeError, ValueError):
                         value = None
-                photo = request.files.get(f'meter_photo_{meter.id}')
-                photo_name = meter_photo_map.get(str(meter.id)) if isinstance(meter_photo_map, dict) else None
-                if photo and photo.filename:
-                    ext = os.path.splitext(photo.filename)[1]
-                    photo_name = f"meter_{meter.id}_{uuid.uuid4().hex}{ext}"
-                    photo.save(os.path.join(upload_dir, photo_name))
-                    meter_photo_map[str(meter.id)] = photo_name
+                photo_name = meter_photo_map.get(str(meter.id))
 
                 meter_entries.append({
                     'id': meter.id,
@@ -337,16 +321,7 @@ def edit_protocol(protocol_id):
                     )
                     db.session.add(reading)
 
-            uploaded_files = request.files.getlist('protocol_upload')
-            attachment_paths = existing_payload.get('attachments', []) if isinstance(existing_payload, dict) else []
-            if not isinstance(attachment_paths, list):
-                attachment_paths = []
-            for file in uploaded_files:
-                if file and file.filename:
-                    ext = os.path.splitext(file.filename)[1]
-                    stored_name = f"protocol_{uuid.uuid4().hex}{ext}"
-                    file.save(os.path.join(upload_dir, stored_name))
-                    attachment_paths.append(stored_name)
+            attachment_paths = existing_payload['attachments'] + new_attachments
 
             try:
                 computed_key_count = sum((int(item.get('quantity') or 1) for item in key_entries))
@@ -369,9 +344,21 @@ def edit_protocol(protocol_id):
                 'follow_up_notes': request.form.get('follow_up_notes')
             }
 
+            previous_data = protocol.protocol_data
             protocol.protocol_type = protocol_type
             protocol.protocol_date = protocol_date
             protocol.protocol_data = json.dumps(protocol_data, ensure_ascii=False)
+            apply_protocol_summary(protocol)
+            protocol.final_content = render_protocol_document(protocol, contract, protocol_data)
+
+            add_revision(
+                ProtocolRevision,
+                protocol.id,
+                session.get('user_id'),
+                'Protokoll bearbeitet',
+                old_data=previous_data,
+                new_data=protocol.protocol_data
+            )
             db.session.commit()
             flash('Protokoll aktualisiert.', 'success')
             return redirect(url_for('protocols.protocol_detail', protocol_id=protocol.id))
@@ -380,7 +367,7 @@ def edit_protocol(protocol_id):
             current_app.logger.error(f"Error updating protocol: {exc}", exc_info=True)
             flash(f'Protokoll konnte nicht aktualisiert werden: {exc}', 'danger')
 
-    payload_ns = SimpleNamespace(**existing_payload) if isinstance(existing_payload, dict) else None
+    payload_ns = SimpleNamespace(**existing_payload)
     return render_template(
         'protocols/create.html',
         contract=contract,
@@ -399,28 +386,11 @@ def protocol_detail(protocol_id):
         ensure_archiving_columns()
         protocol = Protocol.query.get_or_404(protocol_id)
         contract = Contract.query.get(protocol.contract_id)
-        data = {}
-        try:
-            data = json.loads(protocol.protocol_data) if protocol.protocol_data else {}
-        except json.JSONDecodeError:
-            pass
-
-        keys = data.get('keys') if isinstance(data.get('keys'), list) else []
-        meter_entries = data.get('meter_entries') if isinstance(data.get('meter_entries'), list) else []
-        attachments = data.get('attachments') if isinstance(data.get('attachments'), list) else []
-        inventory_entries = data.get('inventory') if isinstance(data.get('inventory'), list) else []
-
-        data['keys'] = keys
-        data['meter_entries'] = meter_entries
-        data['meter_photos'] = data.get('meter_photos') if isinstance(data.get('meter_photos'), dict) else {}
-        data['attachments'] = attachments
-        data['inventory'] = inventory_entries
-
-        if not data.get('key_count') and keys:
-            try:
-                data['key_count'] = sum((int(k.get('quantity') or 1) for k in keys))
-            except Exception:
-                data['key_count'] = len(keys)
+        data = parse_protocol_data(protocol)
+        keys = data['keys']
+        meter_entries = data['meter_entries']
+        attachments = data['attachments']
+        inventory_entries = data['inventory']
 
         protocol_data = SimpleNamespace(**data)
 
@@ -443,55 +413,57 @@ def protocol_detail(protocol_id):
 @protocols_bp.route('/photos/<path:filename>')
 @login_required
 def protocol_photo(filename):
-    """Stellt hochgeladene Zählerstand-Fotos bereit."""
-    directory = os.path.join(current_app.config['UPLOAD_FOLDER'], 'protocols')
-    return send_from_directory(directory, filename)
+    """Stellt hochgeladene Zählerstand-Fotos bereit (``?size=thumb|preview|print``)."""
+    return send_photo(filename, 'protocols', request.args.get('size'))
+
+
+EXPORT_HEADERS = ['Protokoll-ID', 'Vertragsnummer', 'Typ', 'Datum', 'Schlüsselanzahl', 'Inventarposten', 'Zählerstände', 'Mängel', 'Anmerkungen']
+
+
+def _export_rows():
+    """Exportzeilen direkt aus den Kennzahl-Spalten, blockweise aus der Datenbank."""
+    query = _filtered_protocols(db.session.query(
+        Protocol.id, Contract.contract_number, Protocol.protocol_type, Protocol.protocol_date,
+        Protocol.key_count, Protocol.inventory_count, Protocol.meter_count, Protocol.has_damages, Protocol.notes,
+    ).outerjoin(Contract, Contract.id == Protocol.contract_id), include_archived=True)
+    for row in query.yield_per(500):
+        yield [
+            row.id,
+            row.contract_number or '',
+            row.protocol_type,
+            row.protocol_date.strftime('%d.%m.%Y'),
+            row.key_count or 0,
+            row.inventory_count or 0,
+            row.meter_count or 0,
+            'ja' if row.has_damages else 'nein',
+            row.notes or '',
+        ]
 
 
 @protocols_bp.route('/export/<string:fmt>')
 @login_required
 def export_protocols(fmt):
     ensure_archiving_columns()
-    protocols = Protocol.query.order_by(Protocol.protocol_date.desc()).all()
-
-    records = []
-    for proto in protocols:
-        try:
-            data = json.loads(proto.protocol_data) if proto.protocol_data else {}
-        except json.JSONDecodeError:
-            data = {}
-        records.append({
-            'Protokoll-ID': proto.id,
-            'Vertragsnummer': proto.protocol_contract.contract_number if proto.protocol_contract else '',
-            'Typ': proto.protocol_type,
-            'Datum': proto.protocol_date.strftime('%d.%m.%Y'),
-            'Schlüsselanzahl': data.get('key_count', ''),
-            'Inventarposten': len(data.get('inventory', []) or []),
-            'Anmerkungen': data.get('notes', ''),
-        })
-
-    if not records:
+    if not _filtered_protocols(db.session.query(Protocol.id), include_archived=True).first():
         flash('Keine Protokolle vorhanden.', 'warning')
         return redirect(url_for('protocols.protocols_list'))
 
-    df = pd.DataFrame(records)
-    buffer = BytesIO()
-
     if fmt == 'csv':
-        buffer.write(df.to_csv(index=False).encode('utf-8'))
-        buffer.seek(0)
-        return send_file(buffer, mimetype='text/csv', download_name='protokolle.csv', as_attachment=True)
+        return csv_response('protokolle.csv', EXPORT_HEADERS, _export_rows())
 
     if fmt == 'xlsx':
-        df.to_excel(buffer, index=False)
-        buffer.seek(0)
-        return send_file(buffer, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', download_name='protokolle.xlsx', as_attachment=True)
+        return xlsx_response('protokolle.xlsx', EXPORT_HEADERS, _export_rows(), sheet_title='Protokolle')
 
     if fmt == 'pdf':
-        html = render_template('protocols/export_pdf.html', protocols=records)
-        pisa.CreatePDF(html, dest=buffer)
-        buffer.seek(0)
-        return send_file(buffer, mimetype='application/pdf', download_name='protokolle.pdf', as_attachment=True)
+        html = render_template(
+            'protocols/export_pdf.html',
+            protocols=(dict(zip(EXPORT_HEADERS, row)) for row in _export_rows()),
+        )
+        data = html_to_pdf(html)
+        if data is not None:
+            return pdf_response('protokolle.pdf', data)
+        flash('PDF konnte nicht erstellt werden.', 'danger')
+        return redirect(url_for('protocols.protocols_list'))
 
     flash('Unbekanntes Exportformat', 'danger')
     return redirect(url_for('protocols.protocols_list'))
@@ -504,22 +476,15 @@ def download_protocol_pdf(protocol_id):
     protocol = Protocol.query.get_or_404(protocol_id)
     contract = Contract.query.get(protocol.contract_id)
 
-    html = protocol.final_content or render_template(
-        'protocols/protocol_document.html',
-        protocol=protocol,
-        contract=contract,
-        protocol_data=json.loads(protocol.protocol_data or '{}'),
-        meter_entries=json.loads(protocol.protocol_data or '{}').get('meter_entries', []) if protocol.protocol_data else [],
-        keys=json.loads(protocol.protocol_data or '{}').get('keys', []) if protocol.protocol_data else [],
-        inventory_entries=json.loads(protocol.protocol_data or '{}').get('inventory', []) if protocol.protocol_data else []
-    )
-
-    buffer = BytesIO()
-    pisa.CreatePDF(html, dest=buffer)
-    buffer.seek(0)
+    if not protocol.final_content:
+        # Ältere Protokolle ohne gespeichertes Druck-HTML
+        protocol.final_content = render_protocol_document(protocol, contract, parse_protocol_data(protocol))
 
-    save_protocol_pdf(protocol, html)
+    path = protocol_pdf_path(protocol, protocol.final_content)
+    if path is None:
+        flash('PDF konnte nicht erstellt werden.', 'danger')
+        return redirect(url_for('protocols.protocol_detail', protocol_id=protocol.id))
     db.session.commit()
 
     filename = f"protokoll_{protocol.protocol_date.strftime('%Y%m%d')}.pdf"
-    return send_file(buffer, mimetype='application/pdf', download_name=filename, as_attachment=True)
+    return send_file(path, mimetype='application/pdf', download_name=filename, as_attachment=True)
@@ -1,15 +1,26 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, session
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, session, current_app
 from app.extensions import db
-from app.models import RSSFeed, RSSItem, User
+from app.models import RSSFeed, RSSItem, RSSItemTombstone, User
+from app.utils.bulk_import import existing_values
+from app.utils.schema_helpers import RSS_SEARCH_TABLE, fts_enabled
+from app.utils.rss_retention import compact_rss_items, retention_cutoff
+from app.utils.scheduler import BackgroundJob, DEFAULT_TICK_SECONDS, jobs_allowed
+from app.utils.search import fts_match_expression
+from app.utils.rss_fetcher import fetch_feed_conditional, fetch_feeds_concurrently, DEFAULT_TIMEOUT, DEFAULT_WORKERS
+from sqlalchemy import case, func, insert, or_, text
+from sqlalchemy.orm import contains_eager, joinedload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import random
 import uuid
-from datetime import datetime
-import feedparser
+from datetime import datetime, timedelta
 import html
 import ssl
 import time
 
 rss_bp = Blueprint('rss', __name__)
 
+ITEMS_PER_PAGE = 50
+
 # SSL Kontext für Feed-Parsing
 if hasattr(ssl, '_create_unverified_context'):
     ssl._create_default_https_context = ssl._create_unverified_context
@@ -24,24 +35,15 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _fetch_timeout():
+    return current_app.config.get('RSS_FETCH_TIMEOUT', DEFAULT_TIMEOUT)
+
 def fetch_feed(feed_url):
     """Holt einen RSS-Feed und gibt die Einträge zurück"""
-    try:
-        # User-Agent setzen um Blockierung zu vermeiden
-        headers = {
-            'User-Agent': 'MietAssistent/2.0 (+http://localhost:5000)'
-        }
-        
-        # Feed mit Timeout parsen
-        feed = feedparser.parse(feed_url, request_headers=headers)
-        
-        if feed.bozo:
-            print(f"⚠️  Feed parsing error for {feed_url}: {feed.bozo_exception}")
-            
-        return feed
-    except Exception as e:
-        print(f"❌ Error fetching feed {feed_url}: {str(e)}")
-        return None
+    result = fetch_feed_conditional(feed_url, timeout=_fetch_timeout())
+    if result['error']:
+        print(f"⚠️  Feed fetch error for {feed_url}: {result['error']}")
+    return result['feed']
 
 def sanitize_html(html_content):
     """Entfernt unsichere HTML-Tags"""
@@ -66,13 +68,16 @@ def rss_dashboard():
         feeds = RSSFeed.query.filter_by(is_active=True).order_by(RSSFeed.name).all()
         print(f"🔍 DEBUG: Found {len(feeds)} active feeds")
         
-        # Ungelesene Items zählen
+        # Ungelesene/markierte Items mit einer gruppierten Abfrage zählen
+        counters = feed_counters()
         for feed in feeds:
-            feed.unread_count = RSSItem.query.filter_by(feed_id=feed.id, is_read=False).count()
-            print(f"🔍 DEBUG: Feed {feed.name} has {feed.unread_count} unread items")
+            feed.unread_count = counters.get(feed.id, {}).get('unread', 0)
+            feed.starred_count = counters.get(feed.id, {}).get('starred', 0)
         
         # Letzte Items für Vorschau
-        recent_items = RSSItem.query.order_by(RSSItem.published_date.desc()).limit(10).all()
+        recent_items = RSSItem.query.options(joinedload(RSSItem.feed)).order_by(
+            RSSItem.published_date.desc()
+        ).limit(10).all()
         print(f"🔍 DEBUG: Found {len(recent_items)} recent items")
         
         # VERWENDE DAS RICHTIGE TEMPLATE - main/rss.html
@@ -93,10 +98,12 @@ def rss_items():
     """Alle RSS-Items anzeigen - Jetzt unter /rss/items erreichbar"""
     category = request.args.get('category', 'all')
     feed_id = request.args.get('feed_id', 'all')
-    show_read = request.args.get('show_read', 'false') == 'true'
+    show_read = request.args.get('show_read', 'false') in ('true', 'on')
+    q = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
     
     # Filter erstellen
-    query = RSSItem.query.join(RSSFeed)
+    query = RSSItem.query.join(RSSFeed).options(contains_eager(RSSItem.feed))
     
     if category != 'all':
         query = query.filter(RSSFeed.category == category)
@@ -106,16 +113,23 @@ def rss_items():
     
     if not show_read:
         query = query.filter(RSSItem.is_read == False)
+
+    if q:
+        query = search_items(query, q)
     
-    items = query.order_by(RSSItem.published_date.desc()).all()
+    pagination = query.order_by(RSSItem.published_date.desc()).paginate(
+        page=page, per_page=ITEMS_PER_PAGE, error_out=False
+    )
     feeds = RSSFeed.query.filter_by(is_active=True).all()
     
     return render_template('rss/items.html', 
-                         items=items, 
+                         items=pagination.items,
+                         pagination=pagination,
                          feeds=feeds,
                          selected_category=category,
                          selected_feed=feed_id,
-                         show_read=show_read)
+                         show_read=show_read,
+                         q=q)
 
 @rss_bp.route('/feeds')
 @login_required
@@ -141,7 +155,8 @@ def add_feed():
                 return redirect(url_for('rss.manage_feeds'))
             
             # Feed testen
-            feed_data = fetch_feed(url)
+            fetch_result = fetch_feed_conditional(url, timeout=_fetch_timeout())
+            feed_data = fetch_result['feed']
             if not feed_data or not hasattr(feed_data, 'entries'):
                 flash('Ungültiger RSS-Feed oder keine Einträge gefunden!', 'danger')
                 return redirect(url_for('rss.manage_feeds'))
@@ -158,8 +173,8 @@ def add_feed():
             db.session.add(new_feed)
             db.session.commit()
             
-            # Feed-Einträge sofort abrufen
-            update_feed_items(new_feed)
+            # Bereits abgerufene Einträge übernehmen
+            update_feed_items(new_feed, fetch_result)
             
             flash(f'Feed "{name}" erfolgreich hinzugefügt!', 'success')
             return redirect(url_for('rss.manage_feeds'))
@@ -183,6 +198,8 @@ def edit_feed(feed_id):
             feed.category = request.form.get('category', 'general')
             feed.is_active = request.form.get('is_active') == 'true'
             feed.update_interval = int(request.form.get('update_interval', 60))
+            feed.retention_days = request.form.get('retention_days', type=int) or None
+            feed.max_items = request.form.get('max_items', type=int) or None
             
             db.session.commit()
             flash('Feed erfolgreich aktualisiert!', 'success')
@@ -203,6 +220,7 @@ def delete_feed(feed_id):
     try:
         # Zugehörige Items löschen
         RSSItem.query.filter_by(feed_id=feed_id).delete()
+        RSSItemTombstone.query.filter_by(feed_id=feed_id).delete()
         
         # Feed löschen
         db.session.delete(feed)
@@ -278,89 +296,220 @@ def mark_all_read():
 @login_required
 def api_rss_items():
     """API für RSS-Items (für AJAX) - Jetzt unter /rss/api/items erreichbar"""
-    limit = request.args.get('limit', 20, type=int)
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    offset = max(request.args.get('offset', 0, type=int), 0)
     feed_id = request.args.get('feed_id')
+    q = request.args.get('q', '').strip()
     
-    query = RSSItem.query
+    query = RSSItem.query.options(joinedload(RSSItem.feed))
     
     if feed_id and feed_id != 'all':
         query = query.filter_by(feed_id=feed_id)
+
+    if q:
+        query = search_items(query, q)
     
-    items = query.order_by(RSSItem.published_date.desc()).limit(limit).all()
+    items = query.order_by(RSSItem.published_date.desc()).offset(offset).limit(limit).all()
     
     return jsonify({
         'items': [item.to_dict() for item in items]
     })
 
-def update_feed_items(feed):
-    """Aktualisiert die Items eines Feeds"""
+@rss_bp.route('/api/counters')
+@login_required
+def api_rss_counters():
+    """Ungelesene und markierte Einträge je Feed"""
+    return jsonify({'feeds': feed_counters()})
+
+def feed_counters():
+    """Zählt ungelesene und markierte Einträge aller Feeds in einer GROUP-BY-Abfrage."""
+    rows = db.session.query(
+        RSSItem.feed_id,
+        func.sum(case((RSSItem.is_read == False, 1), else_=0)),
+        func.sum(case((RSSItem.is_starred == True, 1), else_=0)),
+    ).group_by(RSSItem.feed_id)
+    return {
+        feed_id: {'unread': int(unread or 0), 'starred': int(starred or 0)}
+        for feed_id, unread, starred in rows
+    }
+
+def search_items(query, term):
+    """Schränkt ``query`` auf Einträge ein, deren Titel, Beschreibung oder
+    Kategorien ``term`` enthalten (FTS5, sonst ``LIKE``)."""
+    if fts_enabled('RSS_SEARCH_FTS', RSS_SEARCH_TABLE):
+        match = fts_match_expression(term)
+        if not match:
+            return query
+        return query.filter(text(
+            f"rss_items.rowid IN (SELECT rowid FROM {RSS_SEARCH_TABLE} WHERE {RSS_SEARCH_TABLE} MATCH :match)"
+        ).bindparams(match=match))
+
+    pattern = f'%{term}%'
+    return query.filter(or_(
+        RSSItem.title.ilike(pattern),
+        RSSItem.description.ilike(pattern),
+        RSSItem.categories.ilike(pattern),
+    ))
+
+def _record_fetch(feed, result):
+    """Übernimmt Status und Latenz eines Abrufs in den Feed."""
+    feed.last_fetched_at = datetime.utcnow()
+    feed.last_fetch_status = result['status']
+    feed.last_fetch_ms = result['elapsed_ms']
+    feed.last_fetch_error = result['error']
+
+def _schedule_next_fetch(feed, success):
+    """Plant den nächsten Abruf: Intervall mit Streuung, bei Fehlern exponentiell verlängert."""
+    interval = feed.update_interval or 60
+    if success:
+        feed.consecutive_failures = 0
+        minutes = interval
+    else:
+        feed.consecutive_failures = (feed.consecutive_failures or 0) + 1
+        max_backoff = current_app.config.get('RSS_MAX_BACKOFF_MINUTES', 24 * 60)
+        minutes = min(interval * 2 ** min(feed.consecutive_failures, 10), max(max_backoff, interval))
+    feed.next_fetch_at = datetime.utcnow() + timedelta(minutes=minutes * random.uniform(0.9, 1.1))
+
+def _entry_published_date(entry):
+    if getattr(entry, 'published_parsed', None):
+        return datetime.fromtimestamp(time.mktime(entry.published_parsed))
+    if getattr(entry, 'updated_parsed', None):
+        return datetime.fromtimestamp(time.mktime(entry.updated_parsed))
+    return datetime.utcnow()
+
+def _store_feed_entries(feed, feed_data):
+    """Speichert neue Einträge eines geparsten Feeds.
+
+    Vorhandene GUIDs werden mit einer ``IN``-Abfrage je Block ermittelt, neue
+    Einträge per ``executemany`` eingefügt. Das umgeht bewusst den
+    Revisions-Log pro Zeile; doppelte GUIDs aus parallelen Abrufen werden
+    unter SQLite per ``ON CONFLICT DO NOTHING`` verworfen.
+
+    Einträge, die die Aufbewahrung bereits gelöscht hat (Tombstone) oder die
+    älter als ``retention_days`` sind, werden nicht erneut importiert.
+    """
+    cutoff = retention_cutoff(feed, datetime.utcnow())
+    rows = {}
+    for entry in feed_data.entries:
+        guid = entry.get('id') or entry.get('link')
+        if not guid or guid in rows:
+            continue
+        published_date = _entry_published_date(entry)
+        if published_date < cutoff:
+            continue
+        rows[guid] = {
+            'id': str(uuid.uuid4()),
+            'feed_id': feed.id,
+            'title': html.escape(entry.title) if hasattr(entry, 'title') else 'Ohne Titel',
+            'description': sanitize_html(entry.description) if hasattr(entry, 'description') else '',
+            'link': entry.get('link', ''),
+            'published_date': published_date,
+            'guid': guid,
+            'author': entry.get('author', ''),
+            'categories': ','.join(tag.term for tag in entry.tags if tag.get('term')) if hasattr(entry, 'tags') else '',
+            'is_read': False,
+            'is_starred': False,
+            'created_at': datetime.utcnow(),
+        }
+
+    known_guids = existing_values(RSSItem.guid, rows.keys()) | existing_values(RSSItemTombstone.guid, rows.keys())
+    new_rows = [row for guid, row in rows.items() if guid not in known_guids]
+    if not new_rows:
+        return 0
+
+    if db.engine.dialect.name == 'sqlite':
+        statement = sqlite_insert(RSSItem).on_conflict_do_nothing(index_elements=['guid'])
+    else:
+        statement = insert(RSSItem)
+    db.session.execute(statement, new_rows)
+    return len(new_rows)
+
+def update_feed_items(feed, fetch_result=None):
+    """Aktualisiert die Items eines Feeds.
+
+    Ohne ``fetch_result`` wird der Feed per Conditional GET (ETag/Last-Modified)
+    abgerufen. Bei 304 wird nicht geparst, nur der Abrufstatus gespeichert.
+    """
+    if fetch_result is None:
+        fetch_result = fetch_feed_conditional(feed.url, feed.etag, feed.modified, timeout=_fetch_timeout())
+
     try:
-        feed_data = fetch_feed(feed.url)
-        if not feed_data or not hasattr(feed_data, 'entries'):
+        _record_fetch(feed, fetch_result)
+
+        if fetch_result['status'] == 304:
+            _schedule_next_fetch(feed, True)
+            feed.last_updated = datetime.utcnow()
+            db.session.commit()
+            print(f"✅ Feed {feed.name} unchanged (304, {fetch_result['elapsed_ms']} ms)")
+            return True
+
+        feed_data = fetch_result['feed']
+        if feed_data is None or (fetch_result['error'] and not feed_data.entries):
+            _schedule_next_fetch(feed, False)
+            db.session.commit()
+            print(f"❌ Error fetching feed {feed.name}: {fetch_result['error']}")
             return False
-        
-        new_items_count = 0
-        
-        for entry in feed_data.entries:
-            # Prüfen ob Item bereits existiert
-            existing_item = RSSItem.query.filter_by(guid=entry.get('id', entry.link)).first()
-            if existing_item:
-                continue
-            
-            # Published date verarbeiten
-            published_date = None
-            if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                published_date = datetime.fromtimestamp(time.mktime(entry.published_parsed))
-            elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
-                published_date = datetime.fromtimestamp(time.mktime(entry.updated_parsed))
-            else:
-                published_date = datetime.utcnow()
-            
-            # Neues Item erstellen
-            new_item = RSSItem(
-                id=str(uuid.uuid4()),
-                feed_id=feed.id,
-                title=html.escape(entry.title) if hasattr(entry, 'title') else 'Ohne Titel',
-                description=sanitize_html(entry.description) if hasattr(entry, 'description') else '',
-                link=entry.link if hasattr(entry, 'link') else '',
-                published_date=published_date,
-                guid=entry.get('id', entry.link),
-                author=entry.get('author', ''),
-                categories=','.join([tag.term for tag in entry.tags]) if hasattr(entry, 'tags') else ''
-            )
-            
-            db.session.add(new_item)
-            new_items_count += 1
-        
-        # Feed aktualisieren
+
+        new_items_count = _store_feed_entries(feed, feed_data)
+
+        # Validatoren erst mit den Einträgen speichern, damit ein fehlgeschlagener
+        # Import beim nächsten Abruf nicht per 304 übersprungen wird
+        feed.etag = fetch_result['etag']
+        feed.modified = fetch_result['modified']
         feed.last_updated = datetime.utcnow()
+        _schedule_next_fetch(feed, True)
         db.session.commit()
-        
-        print(f"✅ Updated feed {feed.name}: {new_items_count} new items")
+
+        print(f"✅ Updated feed {feed.name}: {new_items_count} new items ({fetch_result['elapsed_ms']} ms)")
         return True
-        
+
     except Exception as e:
         db.session.rollback()
         print(f"❌ Error updating feed {feed.name}: {str(e)}")
+        try:
+            _record_fetch(feed, dict(fetch_result, error=str(e)))
+            _schedule_next_fetch(feed, False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
         return False
 
-def update_all_feeds():
-    """Aktualisiert alle aktiven Feeds"""
-    active_feeds = RSSFeed.query.filter_by(is_active=True).all()
-    
-    for feed in active_feeds:
-        try:
-            # Prüfen ob Update notwendig
-            if feed.last_updated:
-                time_since_update = (datetime.utcnow() - feed.last_updated).total_seconds() / 60
-                if time_since_update < feed.update_interval:
-                    continue
-            
-            update_feed_items(feed)
-            
-        except Exception as e:
-            print(f"❌ Error updating feed {feed.name}: {str(e)}")
-            continue
+def _feed_is_due(feed, now):
+    if feed.next_fetch_at:
+        return feed.next_fetch_at <= now
+    if not feed.last_updated:
+        return True
+    minutes_since_update = (now - feed.last_updated).total_seconds() / 60
+    return minutes_since_update >= (feed.update_interval or 60)
+
+def update_all_feeds(force=False):
+    """Aktualisiert alle fälligen aktiven Feeds.
+
+    Die Abrufe laufen parallel mit Zeitlimit je Feed; gespeichert wird
+    anschließend nacheinander im aufrufenden Thread.
+    """
+    now = datetime.utcnow()
+    due_feeds = [
+        feed for feed in RSSFeed.query.filter_by(is_active=True).all()
+        if force or _feed_is_due(feed, now)
+    ]
+
+    results = fetch_feeds_concurrently(
+        [{'id': f.id, 'url': f.url, 'etag': f.etag, 'modified': f.modified} for f in due_feeds],
+        timeout=_fetch_timeout(),
+        max_workers=current_app.config.get('RSS_FETCH_WORKERS', DEFAULT_WORKERS),
+    )
+
+    summary = {'updated': 0, 'not_modified': 0, 'failed': 0}
+    for feed in due_feeds:
+        result = results[feed.id]
+        if not update_feed_items(feed, result):
+            summary['failed'] += 1
+        elif result['status'] == 304:
+            summary['not_modified'] += 1
+        else:
+            summary['updated'] += 1
+    return summary
 
 def initialize_default_feeds():
     """Initialisiert die Standard-Feeds bei der Installation"""
@@ -411,7 +560,6 @@ def initialize_default_feeds():
                 name=feed_data['name'],
                 url=feed_data['url'],
                 category=feed_data['category'],
-                last_updated=datetime.utcnow()
             )
             db.session.add(feed)
             print(f"✅ Added default feed: {feed_data['name']}")
@@ -419,6 +567,47 @@ def initialize_default_feeds():
     db.session.commit()
     print("✅ Standard-RSS-Feeds initialisiert")
 
+def refresh_due_feeds():
+    """Job des Hintergrund-Schedulers: legt beim ersten Lauf die Standard-Feeds an
+    und aktualisiert alle fälligen Feeds."""
+    if RSSFeed.query.first() is None:
+        initialize_default_feeds()
+
+    summary = update_all_feeds()
+    if any(summary.values()):
+        print(f"📰 RSS refresh: {summary['updated']} updated, "
+              f"{summary['not_modified']} unchanged, {summary['failed']} failed")
+
+def start_feed_scheduler(app):
+    """Startet Feed-Aktualisierung und Bereinigung im Hintergrund (``RSS_SCHEDULER_ENABLED``).
+
+    Jeder Prozess startet die Threads; über die Sperrzeilen ``rss_refresh`` und
+    ``rss_compaction`` arbeitet immer nur einer davon.
+    """
+    if not app.config.get('RSS_SCHEDULER_ENABLED', True) or not jobs_allowed(app):
+        return None
+
+    job = BackgroundJob(
+        app,
+        'rss_refresh',
+        refresh_due_feeds,
+        tick=app.config.get('RSS_SCHEDULER_TICK', DEFAULT_TICK_SECONDS),
+    )
+    job.start()
+    app.extensions['rss_scheduler'] = job
+
+    compaction = BackgroundJob(
+        app,
+        'rss_compaction',
+        compact_rss_items,
+        tick=app.config.get('RSS_COMPACTION_TICK', 6 * 60 * 60),
+    )
+    compaction.start()
+    app.extensions['rss_compaction'] = compaction
+
+    print(f"✅ RSS scheduler started ({job.owner})")
+    return job
+
 @rss_bp.route('/debug/db-status')
 @login_required
 def debug_db_status():
@@ -441,9 +630,23 @@ def debug_db_status():
 def debug_update_all_feeds():
     """Debug-Route um alle Feeds manuell zu aktualisieren"""
     try:
-        update_all_feeds()
-        flash('Alle Feeds wurden aktualisiert', 'success')
+        summary = update_all_feeds()
+        flash(
+            f"Feeds aktualisiert: {summary['updated']} neu geladen, "
+            f"{summary['not_modified']} unverändert, {summary['failed']} fehlgeschlagen",
+            'success' if not summary['failed'] else 'warning'
+        )
     except Exception as e:
         flash(f'Fehler beim Aktualisieren: {str(e)}', 'danger')
     
-    return redirect(url_for('rss.rss_dashboard'))
\ No newline at end of file
+    return redirect(url_for('rss.rss_dashboard'))
+
+@rss_bp.route('/debug/compact', methods=['POST'])
+@login_required
+def debug_compact_items():
+    """Debug-Route: Aufbewahrungsregeln sofort anwenden und Kennzahlen zurückgeben"""
+    try:
+        return jsonify({'status': 'success', 'metrics': compact_rss_items()})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'error': str(e)}), 500
\ No newline at end of file
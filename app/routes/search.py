@@ -0,0 +1,52 @@
+import time
+
+from flask import Blueprint, jsonify, render_template, request
+from flask_jwt_extended import jwt_required
+
+from app.routes.main import login_required
+from app.utils.search import DEFAULT_LIMIT, SEARCH_ENTITIES, search
+
+search_bp = Blueprint('search', __name__)
+search_api_bp = Blueprint('search_api', __name__)
+
+TYPE_LABELS = {
+    'tenant': 'Mieter',
+    'contract': 'Vertrag',
+    'apartment': 'Wohnung',
+    'building': 'Gebäude',
+    'meter': 'Zähler',
+    'document': 'Dokument',
+    'cost': 'Betriebskosten',
+    'protocol': 'Protokoll',
+}
+
+
+def _run_search():
+    q = (request.args.get('q') or '').strip()
+    types = [t for t in request.args.getlist('type') if t in SEARCH_ENTITIES]
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    started = time.perf_counter()
+    results = search(q, types, limit) if q else []
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+    for result in results:
+        result['label'] = TYPE_LABELS.get(result['type'], result['type'])
+    return q, types, results, took_ms
+
+
+@search_bp.route('/')
+@login_required
+def search_page():
+    """Globale Suche über Mieter, Verträge, Objekte, Zähler, Dokumente, Kosten und Protokolle."""
+    q, types, results, took_ms = _run_search()
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'query': q, 'results': results, 'took_ms': took_ms})
+    return render_template(
+        'search/results.html', q=q, types=types, results=results, took_ms=took_ms, type_labels=TYPE_LABELS
+    )
+
+
+@search_api_bp.route('', methods=['GET'])
+@jwt_required()
+def search_api():
+    q, _, results, took_ms = _run_search()
+    return jsonify({'query': q, 'results': results, 'took_ms': took_ms})
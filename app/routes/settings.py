@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from datetime import datetime
 
 from app.extensions import db
@@ -13,10 +13,8 @@ import json
 from app.routes.main import login_required
 from app.utils.schema_helpers import ensure_user_landlord_flag
 from app.utils.project_profile import load_project_profile
-from io import BytesIO
-import pandas as pd
-from flask import send_file
-from xhtml2pdf import pisa
+from app.utils.revision_store import compact_revisions
+from app.utils.export_writers import csv_response, html_to_pdf, pdf_response, xlsx_response
 from flask import render_template_string
 
 settings_bp = Blueprint('settings_web', __name__, url_prefix='/settings')
@@ -147,29 +145,24 @@ def export_revisions():
 
     fmt = (request.args.get('format') or 'csv').lower()
     logs = RevisionLog.query.order_by(RevisionLog.created_at.desc()).all()
-    data = [
-        {
-            'Datum': log.created_at.strftime('%d.%m.%Y %H:%M'),
-            'Tabelle': get_revision_table_label(log.table_name),
-            'Datensatz': log.record_id,
-            'Aktion': log.action,
-            'Benutzer': f"{log.user.first_name} {log.user.last_name}" if log.user else 'System',
-            'Details': log.short_summary,
-            'IP': log.ip_address,
-        }
+    headers = ['Datum', 'Tabelle', 'Datensatz', 'Aktion', 'Benutzer', 'Details', 'IP']
+    rows = [
+        [
+            log.created_at.strftime('%d.%m.%Y %H:%M'),
+            get_revision_table_label(log.table_name),
+            log.record_id,
+            log.action,
+            f"{log.user.first_name} {log.user.last_name}" if log.user else 'System',
+            log.short_summary,
+            log.ip_address,
+        ]
         for log in logs
     ]
-
-    df = pd.DataFrame(data)
     filename = f"revisions_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
     if fmt == 'xlsx':
-        output = BytesIO()
-        df.to_excel(output, index=False)
-        output.seek(0)
-        return send_file(output, as_attachment=True, download_name=f"{filename}.xlsx", mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        return xlsx_response(f"{filename}.xlsx", headers, rows, sheet_title='Revisionen')
     if fmt == 'pdf':
-        html_table = df.to_html(index=False, classes='table table-sm table-striped')
         html = render_template_string(
             """
             <html><head><style>
@@ -178,18 +171,33 @@ def export_revisions():
             th, td { padding: 6px; font-size: 11px; border: 1px solid #ccc; }
             </style></head><body>
             <h2>Revisionsprotokoll</h2>
-            {{ table|safe }}
+            <table class="table table-sm table-striped">
+            <thead><tr>{% for header in headers %}<th>{{ header }}</th>{% endfor %}</tr></thead>
+            <tbody>
+            {% for row in rows %}<tr>{% for value in row %}<td>{{ value if value is not none else '' }}</td>{% endfor %}</tr>
+            {% endfor %}
+            </tbody></table>
             </body></html>
             """,
-            table=html_table
+            headers=headers,
+            rows=rows,
         )
-        pdf_buffer = BytesIO()
-        pisa.CreatePDF(html, dest=pdf_buffer)
-        pdf_buffer.seek(0)
-        return send_file(pdf_buffer, as_attachment=True, download_name=f"{filename}.pdf", mimetype='application/pdf')
+        data = html_to_pdf(html)
+        if data is None:
+            flash('PDF konnte nicht erstellt werden.', 'danger')
+            return redirect(url_for('settings_web.revisions_overview'))
+        return pdf_response(f"{filename}.pdf", data)
 
     # default CSV
-    output = BytesIO()
-    output.write(df.to_csv(index=False, sep=';').encode('utf-8-sig'))
-    output.seek(0)
-    return send_file(output, as_attachment=True, download_name=f"{filename}.csv", mimetype='text/csv')
+    return csv_response(f"{filename}.csv", headers, rows, delimiter=';', bom=True)
+
+
+@settings_bp.route('/revisions/storage', methods=['GET', 'POST'])
+@login_required
+def revision_storage():
+    """Speicherbedarf der Vertrags-/Protokollrevisionen; POST komprimiert den Bestand."""
+    user = User.query.get(session.get('user_id'))
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Nur Administratoren'}), 403
+
+    return jsonify(compact_revisions(dry_run=request.method != 'POST'))
@@ -0,0 +1,356 @@
+import gzip
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import delete, func, select
+
+from app.extensions import db
+from app.models import Apartment, Meter, MeterReading, MeterType, SyncChange
+from app.utils.bulk_import import run_bulk_insert, chunked, existing_values, parse_iso_date, parse_number
+from app.utils.scheduler import BackgroundJob, jobs_allowed
+
+sync_api_bp = Blueprint('sync_api', __name__)
+
+DEFAULT_CHANGE_LIMIT = 5000
+MAX_CHANGE_LIMIT = 20000
+SYNC_ENTITIES = ('meter_types', 'apartments', 'meters', 'meter_readings')
+DEFAULT_RETENTION_DAYS = 90
+RETENTION_TICK_SECONDS = 6 * 60 * 60
+PRUNE_BATCH_SIZE = 5000
+
+
+def _serialize_meter_type(meter_type):
+    return {
+        'id': meter_type.id,
+        'name': meter_type.name,
+        'category': meter_type.category,
+        'unit': meter_type.unit,
+        'decimal_places': meter_type.decimal_places,
+        'is_active': meter_type.is_active,
+    }
+
+
+def _serialize_apartment(apartment):
+    return {
+        'id': apartment.id,
+        'building_id': apartment.building_id,
+        'apartment_number': apartment.apartment_number,
+        'floor': apartment.floor,
+        'unit_type': apartment.unit_type,
+        'status': apartment.status,
+        'updated_at': apartment.updated_at.isoformat() if apartment.updated_at else None,
+    }
+
+
+def _serialize_meter(meter):
+    return {
+        'id': meter.id,
+        'meter_number': meter.meter_number,
+        'description': meter.description,
+        'building_id': meter.building_id,
+        'apartment_id': meter.apartment_id,
+        'parent_meter_id': meter.parent_meter_id,
+        'meter_type_id': meter.meter_type_id,
+        'is_main_meter': meter.is_main_meter,
+        'is_virtual_meter': meter.is_virtual_meter,
+        'multiplier': float(meter.multiplier) if meter.multiplier else 1.0,
+        'location_description': meter.location_description,
+        'updated_at': meter.updated_at.isoformat() if meter.updated_at else None,
+    }
+
+
+def _serialize_reading(reading):
+    return {
+        'id': reading.id,
+        'meter_id': reading.meter_id,
+        'reading_value': float(reading.reading_value),
+        'reading_date': reading.reading_date.isoformat(),
+        'reading_type': reading.reading_type,
+        'created_at': reading.created_at.isoformat() if reading.created_at else None,
+    }
+
+
+def _compressed_json(payload, status=200):
+    """JSON-Antwort, die bei ``Accept-Encoding: gzip`` komprimiert ausgeliefert wird."""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    if request.accept_encodings['gzip'] and len(body) > 512:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _parse_token(raw):
+    if raw in (None, ''):
+        return 0
+    try:
+        token = int(raw)
+    except ValueError:
+        raise ValueError('Ungültiger Sync-Token')
+    if token < 0:
+        raise ValueError('Ungültiger Sync-Token')
+    return token
+
+
+def _load_by_ids(model, ids):
+    records = []
+    for chunk in chunked(ids):
+        records.extend(model.query.filter(model.id.in_(chunk)).all())
+    return records
+
+
+def latest_readings(meter_ids=None):
+    """Letzter nicht archivierter Zählerstand je Zähler (eine Abfrage je Block)."""
+    def _query(ids):
+        rank = func.row_number().over(
+            partition_by=MeterReading.meter_id,
+            order_by=(MeterReading.reading_date.desc(), MeterReading.created_at.desc()),
+        ).label('rank')
+        ranked = db.session.query(MeterReading.id.label('id'), rank).filter(
+            (MeterReading.is_archived.is_(False)) | (MeterReading.is_archived.is_(None))
+        )
+        if ids is not None:
+            ranked = ranked.filter(MeterReading.meter_id.in_(ids))
+        ranked = ranked.subquery()
+        return MeterReading.query.join(ranked, MeterReading.id == ranked.c.id).filter(ranked.c.rank == 1).all()
+
+    if meter_ids is None:
+        return _query(None)
+    readings = []
+    for chunk in chunked(meter_ids):
+        readings.extend(_query(chunk))
+    return readings
+
+
+def _full_snapshot():
+    return {
+        'meter_types': [_serialize_meter_type(mt) for mt in MeterType.query.all()],
+        'apartments': [_serialize_apartment(apt) for apt in Apartment.query.all()],
+        'meters': [_serialize_meter(meter) for meter in Meter.query.all()],
+        'latest_readings': [_serialize_reading(r) for r in latest_readings()],
+        'deleted': {entity: [] for entity in SYNC_ENTITIES},
+    }
+
+
+def _delta_since(since, limit):
+    rows = db.session.query(
+        SyncChange.seq, SyncChange.table_name, SyncChange.record_id, SyncChange.action
+    ).filter(SyncChange.seq > since).order_by(SyncChange.seq).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    token = rows[-1].seq if rows else since
+
+    # Nur die jeweils letzte Aktion je Datensatz ist relevant
+    last_action = {}
+    for row in rows:
+        last_action[(row.table_name, row.record_id)] = row.action
+
+    changed = {entity: set() for entity in SYNC_ENTITIES}
+    deleted = {entity: set() for entity in SYNC_ENTITIES}
+    for (table_name, record_id), action in last_action.items():
+        if table_name not in changed:
+            continue
+        (deleted if action == 'delete' else changed)[table_name].add(record_id)
+
+    models = {'meter_types': MeterType, 'apartments': Apartment, 'meters': Meter}
+    serializers = {
+        'meter_types': _serialize_meter_type,
+        'apartments': _serialize_apartment,
+        'meters': _serialize_meter,
+    }
+    payload = {}
+    for entity, model in models.items():
+        records = _load_by_ids(model, changed[entity])
+        payload[entity] = [serializers[entity](record) for record in records]
+        # Zwischenzeitlich gelöschte Datensätze als Tombstone melden
+        deleted[entity] |= changed[entity] - {record.id for record in records}
+
+    readings = latest_readings(changed['meter_readings'])
+    payload['latest_readings'] = [_serialize_reading(r) for r in readings]
+    # Zähler, für die kein Stand mehr existiert
+    deleted['meter_readings'] |= changed['meter_readings'] - {r.meter_id for r in readings}
+
+    payload['deleted'] = {entity: sorted(ids) for entity, ids in deleted.items()}
+    return payload, token, has_more
+
+
+@sync_api_bp.route('/changes', methods=['GET'])
+@jwt_required()
+def sync_changes():
+    """Delta-Sync: Änderungen an Zählern, Zählertypen, Wohnungen und letzten Ständen.
+
+    Ohne ``since`` (oder bei unbekanntem Token) wird ein vollständiger Stand
+    geliefert, ebenso wenn ``since`` älter ist als die älteste aufbewahrte
+    Änderung. Der zurückgegebene ``token`` ist beim nächsten Aufruf als
+    ``since`` zu übergeben; bei ``has_more`` sofort erneut abrufen.
+    """
+    try:
+        since = _parse_token(request.args.get('since'))
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    limit = request.args.get('limit', DEFAULT_CHANGE_LIMIT, type=int)
+    limit = max(1, min(limit or DEFAULT_CHANGE_LIMIT, MAX_CHANGE_LIMIT))
+
+    oldest_token, current_token = db.session.query(func.min(SyncChange.seq), func.max(SyncChange.seq)).one()
+    current_token = current_token or 0
+    # Änderungen zwischen ``since`` und der ältesten Zeile wurden bereits gelöscht
+    pruned = oldest_token is not None and since < oldest_token - 1
+    if since == 0 or since > current_token or pruned:
+        payload = _full_snapshot()
+        payload.update({'token': str(current_token), 'full_sync': True, 'has_more': False})
+    else:
+        payload, token, has_more = _delta_since(since, limit)
+        payload.update({'token': str(token), 'full_sync': False, 'has_more': has_more})
+
+    payload['server_time'] = datetime.utcnow().isoformat()
+    return _compressed_json(payload)
+
+
+def _conflict(kind, message, item, server_reading=None):
+    return {
+        'status': 'conflict',
+        'conflict': kind,
+        'error': message,
+        'client_id': item.get('client_id'),
+        'server_reading': _serialize_reading(server_reading) if server_reading else None,
+    }
+
+
+def _build_offline_reading_rows(items, user_id=None):
+    """Prüft offline erfasste Zählerstände auf Konflikte mit dem Serverstand.
+
+    Konflikte: ``duplicate`` (gleicher Zähler, Tag und Wert existiert bereits),
+    ``stale_base`` (der Client kannte einen anderen letzten Stand als den
+    aktuellen) und ``lower_than_previous`` (Wert unter dem letzten Stand).
+    Die beiden letzten lassen sich mit ``force: true`` übersteuern.
+    """
+    dicts = [item for item in items if isinstance(item, dict)]
+    known_meters = existing_values(Meter.id, [item.get('meter_id') for item in dicts])
+    latest_by_meter = {r.meter_id: r for r in latest_readings(known_meters)}
+
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            parsed.append((item, None, 'Eintrag muss ein JSON-Objekt sein'))
+            continue
+        try:
+            if item.get('meter_id') not in known_meters:
+                raise ValueError(f"Zähler {item.get('meter_id')} nicht gefunden")
+            parsed.append((item, {
+                'id': str(uuid.uuid4()),
+                'meter_id': item['meter_id'],
+                'reading_value': parse_number(item.get('reading_value'), 'reading_value'),
+                'reading_date': parse_iso_date(item.get('reading_date'), 'reading_date'),
+                'reading_type': item.get('reading_type') or 'actual',
+                'notes': item.get('notes', ''),
+                'is_manual_entry': True,
+                'created_by': user_id,
+            }, None))
+        except ValueError as exc:
+            parsed.append((item, None, str(exc)))
+
+    # Vorhandene Stände im betroffenen Zeitraum mit einer Abfrage je Block laden
+    existing_keys = set()
+    dates = [row['reading_date'] for _, row, _ in parsed if row]
+    if dates:
+        for chunk in chunked(known_meters):
+            existing_keys.update(
+                (meter_id, reading_date, float(value))
+                for meter_id, reading_date, value in db.session.query(
+                    MeterReading.meter_id, MeterReading.reading_date, MeterReading.reading_value
+                ).filter(
+                    MeterReading.meter_id.in_(chunk),
+                    MeterReading.reading_date.between(min(dates), max(dates)),
+                )
+            )
+
+    validated = []
+    for item, row, error in parsed:
+        if error:
+            validated.append((None, error))
+            continue
+        key = (row['meter_id'], row['reading_date'], row['reading_value'])
+        latest = latest_by_meter.get(row['meter_id'])
+        if key in existing_keys:
+            validated.append((None, _conflict('duplicate', 'Zählerstand bereits vorhanden', item, latest)))
+            continue
+        if latest and not item.get('force'):
+            if 'base_reading_id' in item and item.get('base_reading_id') != latest.id:
+                validated.append((None, _conflict(
+                    'stale_base', 'Zwischenzeitlich wurde ein neuerer Stand erfasst', item, latest
+                )))
+                continue
+            if row['reading_date'] >= latest.reading_date and row['reading_value'] < latest.reading_value:
+                validated.append((None, _conflict(
+                    'lower_than_previous', 'Wert liegt unter dem letzten Zählerstand', item, latest
+                )))
+                continue
+        existing_keys.add(key)
+        validated.append((row, None))
+    return validated
+
+
+@sync_api_bp.route('/readings', methods=['POST'])
+@jwt_required()
+def sync_upload_readings():
+    """Upload offline erfasster Zählerstände mit Konflikterkennung (JSON-Array oder NDJSON)."""
+    user_id = get_jwt_identity()
+    return run_bulk_insert(
+        'sync.readings',
+        MeterReading,
+        lambda items: _build_offline_reading_rows(items, user_id),
+        'Zählerstände (Offline-Sync)',
+        user_id=user_id,
+    )
+
+
+def prune_sync_changes(now=None):
+    """Löscht Sync-Einträge, die älter als ``SYNC_CHANGE_RETENTION_DAYS`` sind.
+
+    Gelöscht wird immer ein Anfang der Sequenz (bis zur jüngsten abgelaufenen
+    Zeile), so erkennt ``/changes`` veraltete Tokens an der ältesten Zeile. Die
+    neueste Zeile bleibt erhalten, damit der Token nicht auf 0 zurückfällt.
+    """
+    days = current_app.config.get('SYNC_CHANGE_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    newest = db.session.query(func.max(SyncChange.seq)).scalar()
+    expired = db.session.query(func.max(SyncChange.seq)).filter(SyncChange.created_at < cutoff).scalar()
+    if expired is None:
+        return {'deleted': 0}
+    last_deleted = min(expired, newest - 1)
+
+    deleted = 0
+    while True:
+        batch = select(SyncChange.seq).where(SyncChange.seq <= last_deleted).order_by(SyncChange.seq).limit(PRUNE_BATCH_SIZE)
+        count = db.session.execute(
+            delete(SyncChange).where(SyncChange.seq.in_(batch)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        deleted += count
+        if count < PRUNE_BATCH_SIZE:
+            break
+    if deleted:
+        print(f"🧹 Sync changes pruned: {deleted}")
+    return {'deleted': deleted}
+
+
+def start_sync_retention(app):
+    """Startet die periodische Bereinigung von ``sync_changes``."""
+    if not app.config.get('SYNC_RETENTION_ENABLED', True) or not jobs_allowed(app):
+        return None
+
+    job = BackgroundJob(
+        app,
+        'sync_retention',
+        prune_sync_changes,
+        tick=app.config.get('SYNC_RETENTION_TICK', RETENTION_TICK_SECONDS),
+    )
+    job.start()
+    app.extensions['sync_retention'] = job
+    return job
@@ -2,10 +2,37 @@ import json
 from datetime import date, datetime
 
 from flask import has_request_context, request, session as flask_session
-from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy import event, insert, inspect as sa_inspect
 
 from app.extensions import db
-from app.models import RevisionLog
+from app.models import RevisionLog, SchedulerLock, SyncChange
+
+# Tabellen der Delta-Synchronisation und das Attribut, unter dem Änderungen
+# geführt werden. Zählerstände werden je Zähler geführt, da die Sync-API
+# nur den jeweils letzten Stand ausliefert.
+SYNC_TRACKED_TABLES = {
+    'apartments': 'id',
+    'meter_types': 'id',
+    'meters': 'id',
+    'meter_readings': 'meter_id',
+}
+
+# Spalten, deren Änderung keinen Revisionseintrag erzeugt. Die Abrufstatistik
+# der RSS-Feeds ändert sich bei jeder Aktualisierung, Lese-/Favoritenstatus bei
+# jedem Klick; beides sind keine fachlichen Änderungen.
+AUDIT_IGNORED_COLUMNS = {
+    'rss_feeds': {
+        'last_updated', 'etag', 'modified', 'last_fetched_at',
+        'last_fetch_status', 'last_fetch_ms', 'last_fetch_error',
+        'next_fetch_at', 'consecutive_failures',
+    },
+    # Lesestatus und Favoriten sind Nutzerzustand, keine Stammdaten
+    'rss_items': {'is_read', 'is_starred'},
+    # Ergebnis der Textextraktion, vom Hintergrundprozess geschrieben
+    'documents': {'extraction_status', 'extracted_text', 'extracted_fields', 'extracted_at'},
+    # Pfad und Tiefe folgen aus parent_id und werden beim Verschieben mitgeführt
+    'contract_paragraphs': {'path', 'depth'},
+}
 
 
 def _current_user_context():
@@ -23,6 +50,8 @@ def _serialize_value(value):
         return None
     if isinstance(value, (datetime, date)):
         return value.isoformat()
+    if isinstance(value, bytes):
+        return f'<{len(value)} Bytes>'
     return value
 
 
@@ -39,6 +68,47 @@ def _build_snapshot(obj):
     return data
 
 
+def _track_sync_change(session, obj, action):
+    table_name = getattr(obj, '__tablename__', None)
+    key_attr = SYNC_TRACKED_TABLES.get(table_name)
+    if not key_attr:
+        return
+    record_id = getattr(obj, key_attr, None)
+    if record_id is None:
+        return
+    if table_name == 'meter_readings' and action == 'delete':
+        # Der Zähler bleibt bestehen, nur sein letzter Stand kann sich ändern
+        action = 'update'
+    session.add(SyncChange(table_name=table_name, record_id=str(record_id), action=action))
+
+
+def record_bulk_sync_changes(table_name, rows, action='insert'):
+    """Schreibt Sync-Einträge für Zeilen, die am ORM vorbei eingefügt wurden."""
+    key_attr = SYNC_TRACKED_TABLES.get(table_name)
+    if not key_attr or not rows:
+        return
+    record_ids = list(dict.fromkeys(str(row[key_attr]) for row in rows if row.get(key_attr)))
+    if record_ids:
+        db.session.execute(insert(SyncChange), [
+            {'table_name': table_name, 'record_id': record_id, 'action': action}
+            for record_id in record_ids
+        ])
+
+
+def record_bulk_audit(table_name, record_id, action, changes):
+    """Ein Revisionseintrag für eine Sammeländerung am ORM vorbei (z. B. Umsortieren)."""
+    user_id, ip_address, user_agent = _current_user_context()
+    db.session.execute(insert(RevisionLog).values(
+        table_name=table_name,
+        record_id=str(record_id) if record_id is not None else None,
+        action=action,
+        user_id=user_id,
+        changes=json.dumps(changes, ensure_ascii=False, default=_serialize_value),
+        ip_address=ip_address,
+        user_agent=user_agent,
+    ))
+
+
 def register_audit_listeners():
     """Registriert einfache Revisions-Logs für Einfügen/Ändern/Löschen."""
 
@@ -48,8 +118,9 @@ def register_audit_listeners():
 
         # Inserts
         for obj in session.new:
-            if isinstance(obj, RevisionLog):
+            if isinstance(obj, (RevisionLog, SyncChange, SchedulerLock)):
                 continue
+            _track_sync_change(session, obj, 'insert')
             log = RevisionLog(
                 table_name=getattr(obj, '__tablename__', obj.__class__.__name__),
                 record_id=str(getattr(obj, 'id', None)),
@@ -63,14 +134,15 @@ def register_audit_listeners():
 
         # Updates
         for obj in session.dirty:
-            if isinstance(obj, RevisionLog):
+            if isinstance(obj, (RevisionLog, SyncChange, SchedulerLock)):
                 continue
             state = sa_inspect(obj)
             if not state.attrs:
                 continue
             changes = {}
+            ignored = AUDIT_IGNORED_COLUMNS.get(getattr(obj, '__tablename__', None), ())
             for attr in state.attrs:
-                if attr.key in ['updated_at']:
+                if attr.key in ['updated_at'] or attr.key in ignored:
                     continue
                 hist = attr.history
                 if hist.has_changes():
@@ -81,6 +153,7 @@ def register_audit_listeners():
                         'new': _serialize_value(new_val)
                     }
             if changes:
+                _track_sync_change(session, obj, 'update')
                 log = RevisionLog(
                     table_name=getattr(obj, '__tablename__', obj.__class__.__name__),
                     record_id=str(getattr(obj, 'id', None)),
@@ -94,8 +167,9 @@ def register_audit_listeners():
 
         # Deletes
         for obj in session.deleted:
-            if isinstance(obj, RevisionLog):
+            if isinstance(obj, (RevisionLog, SyncChange, SchedulerLock)):
                 continue
+            _track_sync_change(session, obj, 'delete')
             log = RevisionLog(
                 table_name=getattr(obj, '__tablename__', obj.__class__.__name__),
                 record_id=str(getattr(obj, 'id', None)),
@@ -0,0 +1,398 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, func, insert, update
+
+from app.extensions import db
+from app.models import (
+    Apartment, Contract, ContractBatch, ContractBatchItem, ContractParagraph, ContractRevision,
+)
+from app.utils.contract_tree import END, insert_node, load_trees
+from app.utils.events import broker
+from app.utils.export_writers import DEFAULT_EXPORT_PROCESSES, html_to_pdf
+from app.utils.pdf_generator import generate_professional_contract_html
+from app.utils.revision_store import add_revision
+from app.utils.scheduler import acquire_lock, instance_id, release_lock
+from app.utils.template_registry import template_library
+
+CHUNK_SIZE = 20
+LOOKUP_BATCH_SIZE = 500
+LOCK_TTL_SECONDS = 600
+# Verträge, die zwischen Rendern und Übernahme geändert wurden, werden neu gerendert
+MAX_PASSES = 3
+
+
+# --- Änderungen ----------------------------------------------------------------
+
+def parse_change(data):
+    """Prüft die gewünschte Änderung; ``ValueError`` bei ungültigen Angaben.
+
+    ``rent_index``: Nettomiete um ``percent`` Prozent anpassen.
+    ``clause``: Paragraph aus einer Klausel-Vorlage anhängen (Inhalt wird
+    beim Anlegen übernommen, damit ein fortgesetzter Lauf gleich bleibt).
+    """
+    kind = data.get('type')
+    if kind == 'rent_index':
+        try:
+            percent = float(str(data.get('percent') or '').replace(',', '.'))
+        except ValueError:
+            raise ValueError('Bitte eine Prozentzahl für die Mietanpassung angeben')
+        if not -50 < percent < 100 or percent == 0:
+            raise ValueError('Die Mietanpassung muss zwischen -50 % und 100 % liegen')
+        return {'type': 'rent_index', 'percent': percent}
+    if kind == 'clause':
+        template = template_library().clauses_by_id.get(data.get('clause_template_id'))
+        if template is None:
+            raise ValueError('Klausel-Vorlage nicht gefunden')
+        return {
+            'type': 'clause',
+            'clause_template_id': template.id,
+            'node': {
+                'type': 'paragraph',
+                'title': template.title,
+                'content': template.content,
+                'category': template.category or '',
+                'icon': '',
+                'mandatory': template.is_mandatory,
+                'children': [
+                    {'type': 'subparagraph', 'title': sub.get('title'), 'content': sub.get('content'), 'children': []}
+                    for sub in template.subclauses if isinstance(sub, dict)
+                ],
+            },
+        }
+    raise ValueError('Unbekannte Änderung')
+
+
+def describe_change(change):
+    if change['type'] == 'rent_index':
+        return f"Mietanpassung {change['percent']:+.2f} %".replace('.', ',')
+    return f"Klausel „{change['node']['title']}“ ergänzt"
+
+
+def _apply(contract, change, tree, batch_id):
+    """Wendet die Änderung auf den Vertrag an; gibt den Baum für das Rendern zurück.
+
+    Der neue Paragraph bekommt die ID des Laufs, so wird er bei einer
+    Wiederholung nicht doppelt angelegt.
+    """
+    if change['type'] == 'rent_index':
+        contract.rent_net = round((contract.rent_net or 0) * (1 + change['percent'] / 100), 2)
+        return tree
+    if any(node.get('id') == batch_id for node in tree):
+        return tree
+    return tree + [dict(change['node'], id=batch_id)]
+
+
+# --- Auswahl und Anlage -------------------------------------------------------------
+
+def select_contract_ids(building_id=None, status=None):
+    """IDs der nicht archivierten Verträge eines Gebäudes und/oder Status."""
+    query = db.session.query(Contract.id).filter(
+        (Contract.is_archived.is_(False)) | (Contract.is_archived.is_(None))
+    )
+    if building_id:
+        query = query.join(Apartment, Contract.apartment_id == Apartment.id).filter(
+            Apartment.building_id == building_id
+        )
+    if status:
+        query = query.filter(Contract.status == status)
+    return [contract_id for (contract_id,) in query.order_by(Contract.contract_number)]
+
+
+def create_batch(user_id, change, building_id=None, status=None, description=None):
+    """Legt einen Sammellauf mit einem Eintrag je ausgewähltem Vertrag an."""
+    contract_ids = select_contract_ids(building_id, status)
+    if not contract_ids:
+        raise ValueError('Keine Verträge für diese Auswahl gefunden')
+    batch = ContractBatch(
+        description=description or describe_change(change),
+        change=json.dumps(change, ensure_ascii=False),
+        filters=json.dumps({'building_id': building_id, 'status': status}),
+        status='pending',
+        total=len(contract_ids),
+        created_by=user_id,
+    )
+    db.session.add(batch)
+    db.session.flush()
+    db.session.execute(insert(ContractBatchItem), [
+        {'batch_id': batch.id, 'contract_id': contract_id, 'status': 'pending'} for contract_id in contract_ids
+    ])
+    db.session.commit()
+    return batch
+
+
+def batch_progress(batch):
+    counts = dict(
+        db.session.query(ContractBatchItem.status, func.count())
+        .filter(ContractBatchItem.batch_id == batch.id)
+        .group_by(ContractBatchItem.status)
+    )
+    return {
+        'id': batch.id,
+        'description': batch.description,
+        'status': batch.status,
+        'total': batch.total,
+        'pending': counts.get('pending', 0),
+        'rendered': counts.get('rendered', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'error': batch.error,
+        'created_at': batch.created_at.isoformat() if batch.created_at else None,
+        'finished_at': batch.finished_at.isoformat() if batch.finished_at else None,
+    }
+
+
+# --- PDF-Erzeugung (Exportprozess) -------------------------------------------------------
+
+def _pdf_job(app, html, output_path):
+    """Rendert über den Exportprozess (``html_to_pdf``); gibt eine Fehlermeldung oder None zurück."""
+    with app.app_context():
+        data = html_to_pdf(html)
+    if data is None:
+        return 'PDF-Erzeugung fehlgeschlagen'
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'wb') as output_file:
+        output_file.write(data)
+    return None
+
+
+def _render_pdfs(jobs):
+    """Erzeugt PDFs für ``{contract_id: (html, pfad)}``; gibt ``{contract_id: fehler}`` zurück.
+
+    Es werden so viele PDFs gleichzeitig angefragt, wie der Exportprozesspool
+    (``EXPORT_PROCESSES``) abarbeiten kann.
+    """
+    if not jobs:
+        return {}
+    app = current_app._get_current_object()
+    workers = max(1, min(app.config.get('EXPORT_PROCESSES', DEFAULT_EXPORT_PROCESSES), len(jobs)))
+    errors = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='contract-pdf') as executor:
+        futures = {
+            contract_id: executor.submit(_pdf_job, app, html, path) for contract_id, (html, path) in jobs.items()
+        }
+    for contract_id, future in futures.items():
+        try:
+            errors[contract_id] = future.result()
+        except Exception as e:
+            errors[contract_id] = str(e)
+    return errors
+
+
+def _pdf_filename(contract_number, batch_id):
+    return f"contract_{contract_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{batch_id[:8]}.pdf"
+
+
+def _pdf_dir():
+    upload_root = current_app.config.get('UPLOAD_FOLDER') or os.path.abspath('uploads')
+    return os.path.join(upload_root, 'contracts')
+
+
+# --- Ablauf ---------------------------------------------------------------------------
+
+def _update_items(values):
+    table = ContractBatchItem.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('item_id')).values(
+            status=bindparam('new_status'), html=bindparam('new_html'), pdf_path=bindparam('new_pdf_path'),
+            contract_updated_at=bindparam('new_contract_updated_at'), revision_id=bindparam('new_revision_id'),
+            error=bindparam('new_error'), updated_at=bindparam('now'),
+        ),
+        [dict({'new_' + key: value for key, value in row.items() if key != 'item_id'},
+              item_id=row['item_id'], now=datetime.utcnow()) for row in values],
+    )
+
+
+def _item_values(item_id, status, html=None, pdf_path=None, contract_updated_at=None, revision_id=None, error=None):
+    return {
+        'item_id': item_id, 'status': status, 'html': html, 'pdf_path': pdf_path,
+        'contract_updated_at': contract_updated_at, 'revision_id': revision_id, 'error': error,
+    }
+
+
+def _render_chunk(batch_id, change, items):
+    """Phase 1: HTML rendern (Änderung nur im Speicher) und PDFs parallel erzeugen."""
+    contract_ids = [contract_id for _, contract_id in items]
+    contracts = {contract.id: contract for contract in Contract.query.options(
+        db.joinedload(Contract.apartment).joinedload(Apartment.building),
+        db.joinedload(Contract.tenant),
+        db.joinedload(Contract.landlord),
+    ).filter(Contract.id.in_(contract_ids))}
+    trees = load_trees(contract_ids)
+
+    rendered, errors = {}, {}
+    with db.session.no_autoflush:
+        for contract_id in contract_ids:
+            contract = contracts.get(contract_id)
+            if contract is None:
+                errors[contract_id] = 'Vertrag nicht gefunden'
+                continue
+            try:
+                stamp = contract.updated_at
+                tree = _apply(contract, change, trees.get(contract_id, []), batch_id)
+                html = generate_professional_contract_html(contract, paragraph_tree=tree)
+                path = os.path.join(_pdf_dir(), _pdf_filename(contract.contract_number, batch_id))
+                rendered[contract_id] = (html, path, stamp)
+            except Exception as e:
+                errors[contract_id] = str(e)
+    # Die Änderung wird erst in Phase 2 gespeichert
+    db.session.rollback()
+
+    errors.update({
+        contract_id: error
+        for contract_id, error in _render_pdfs({cid: (html, path) for cid, (html, path, _) in rendered.items()}).items()
+        if error
+    })
+    values = []
+    for item_id, contract_id in items:
+        if contract_id in errors:
+            values.append(_item_values(item_id, 'failed', error=errors[contract_id]))
+        else:
+            html, path, stamp = rendered[contract_id]
+            values.append(_item_values(item_id, 'rendered', html, os.path.basename(path), stamp))
+    _update_items(values)
+
+
+def _render_pending(batch_id, change, owner):
+    while True:
+        items = db.session.query(ContractBatchItem.id, ContractBatchItem.contract_id).filter(
+            ContractBatchItem.batch_id == batch_id, ContractBatchItem.status == 'pending'
+        ).order_by(ContractBatchItem.id).limit(CHUNK_SIZE).all()
+        if not items:
+            return
+        _render_chunk(batch_id, change, items)
+        db.session.commit()
+        _publish(batch_id)
+        if not acquire_lock(_lock_name(batch_id), owner, LOCK_TTL_SECONDS):
+            raise RuntimeError('Sperre des Sammellaufs verloren')
+
+
+def _apply_rendered(batch_id, change, user_id, description):
+    """Phase 2: Änderungen, PDFs und Revisionen aller gerenderten Verträge in einer Transaktion.
+
+    Gibt die Zahl der Verträge zurück, die seit dem Rendern geändert wurden
+    und daher erneut gerendert werden müssen.
+    """
+    items = db.session.query(
+        ContractBatchItem.id, ContractBatchItem.contract_id, ContractBatchItem.html,
+        ContractBatchItem.pdf_path, ContractBatchItem.contract_updated_at,
+    ).filter(ContractBatchItem.batch_id == batch_id, ContractBatchItem.status == 'rendered').all()
+    if not items:
+        return 0
+
+    contract_ids = [item.contract_id for item in items]
+    contracts, existing_nodes = {}, set()
+    for start in range(0, len(contract_ids), LOOKUP_BATCH_SIZE):
+        chunk = contract_ids[start:start + LOOKUP_BATCH_SIZE]
+        contracts.update({contract.id: contract for contract in Contract.query.filter(Contract.id.in_(chunk))})
+        existing_nodes.update(contract_id for (contract_id,) in db.session.query(ContractParagraph.contract_id).filter(
+            ContractParagraph.contract_id.in_(chunk), ContractParagraph.node_id == batch_id
+        ))
+
+    values, stale_files = [], []
+    for item in items:
+        contract = contracts.get(item.contract_id)
+        if contract is None or contract.updated_at != item.contract_updated_at:
+            values.append(_item_values(item.id, 'pending'))
+            stale_files.append(item.pdf_path)
+            continue
+        if change['type'] == 'clause':
+            if item.contract_id not in existing_nodes:
+                insert_node(contract.id, dict(change['node'], id=batch_id), None, END)
+        else:
+            _apply(contract, change, [], batch_id)
+        revision = add_revision(
+            ContractRevision, contract.id, user_id, f"{description} (Sammellauf)",
+            old_data=contract.final_content, new_data=item.html,
+        )
+        contract.final_content = item.html
+        contract.pdf_path = item.pdf_path
+        values.append(_item_values(item.id, 'done', pdf_path=item.pdf_path, revision_id=revision.id))
+
+    _update_items(values)
+    db.session.commit()
+
+    for filename in stale_files:
+        try:
+            os.remove(os.path.join(_pdf_dir(), filename))
+        except OSError:
+            pass
+    return len(stale_files)
+
+
+def _lock_name(batch_id):
+    return f'batch:{batch_id}'
+
+
+def _publish(batch_id):
+    batch = db.session.get(ContractBatch, batch_id)
+    if batch is not None:
+        broker.publish('contract_batch', batch_progress(batch), [batch.created_by])
+
+
+def _set_status(batch_id, status, error=None):
+    values = {'status': status, 'error': error, 'updated_at': datetime.utcnow()}
+    if status in ('done', 'failed'):
+        values['finished_at'] = datetime.utcnow()
+    db.session.execute(update(ContractBatch.__table__).where(ContractBatch.__table__.c.id == batch_id).values(**values))
+    db.session.commit()
+
+
+def run_batch(app, batch_id):
+    """Arbeitet einen Sammellauf ab; setzt nach Abbruch an der letzten Stelle fort.
+
+    Bereits gerenderte Verträge werden nicht erneut gerendert, bereits
+    übernommene nicht erneut geändert. Gibt ``False`` zurück, wenn der Lauf
+    schon in einem anderen Thread oder Prozess bearbeitet wird.
+    """
+    owner = instance_id()
+    with app.app_context():
+        try:
+            if not acquire_lock(_lock_name(batch_id), owner, LOCK_TTL_SECONDS):
+                return False
+            batch = db.session.get(ContractBatch, batch_id)
+            change, user_id, description = json.loads(batch.change), batch.created_by, batch.description
+            _set_status(batch_id, 'running')
+            for _ in range(MAX_PASSES):
+                _render_pending(batch_id, change, owner)
+                if not _apply_rendered(batch_id, change, user_id, description):
+                    break
+            failed = db.session.query(func.count(ContractBatchItem.id)).filter(
+                ContractBatchItem.batch_id == batch_id, ContractBatchItem.status.in_(('failed', 'pending'))
+            ).scalar()
+            _set_status(batch_id, 'failed' if failed else 'done', f'{failed} Verträge nicht erzeugt' if failed else None)
+            print(f"✅ Contract batch {batch_id[:8]} finished ({failed} failed)")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Contract batch {batch_id[:8]} failed: {e}")
+            _set_status(batch_id, 'failed', str(e))
+            return True
+        finally:
+            try:
+                _publish(batch_id)
+                release_lock(_lock_name(batch_id), owner)
+            except Exception:
+                db.session.rollback()
+            db.session.remove()
+
+
+def start_batch(batch_id):
+    """Startet (oder setzt fort) einen Sammellauf im Hintergrund.
+
+    Fehlgeschlagene Einträge werden dabei erneut versucht.
+    """
+    db.session.execute(
+        update(ContractBatchItem.__table__)
+        .where(ContractBatchItem.__table__.c.batch_id == batch_id, ContractBatchItem.__table__.c.status == 'failed')
+        .values(status='pending', error=None)
+    )
+    db.session.commit()
+    app = current_app._get_current_object()
+    thread = threading.Thread(target=run_batch, args=(app, batch_id), name=f'contract-batch-{batch_id[:8]}', daemon=True)
+    thread.start()
+    return thread
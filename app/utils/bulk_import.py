@@ -0,0 +1,216 @@
+import hashlib
+import json
+from datetime import datetime
+
+from flask import current_app, jsonify, request
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import IdempotencyKey, RevisionLog
+from app.utils.audit import record_bulk_sync_changes
+from app.utils.search import index_rows
+
+# SQLite erlaubt (je nach Version) nur 999 gebundene Parameter pro Statement
+LOOKUP_CHUNK_SIZE = 500
+MAX_BULK_ITEMS = 20000
+
+NDJSON_MIMETYPES = {
+    'application/x-ndjson',
+    'application/ndjson',
+    'application/jsonlines',
+    'application/x-jsonlines',
+}
+
+
+class BulkPayloadError(ValueError):
+    """Der Request-Body eines Sammelimports ist nicht lesbar."""
+
+
+def read_bulk_payload():
+    """Liest ein JSON-Array, ``{"items": [...]}`` oder NDJSON aus dem Request.
+
+    NDJSON wird zeilenweise aus dem Eingabestrom gelesen. Zurückgegeben wird
+    ``(items, request_hash)``; der Hash dient dem Abgleich bei Idempotency-Keys.
+    """
+    digest = hashlib.sha256()
+
+    if (request.mimetype or '').lower() in NDJSON_MIMETYPES:
+        items = []
+        for line_no, line in enumerate(iter(request.stream.readline, b''), start=1):
+            digest.update(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                raise BulkPayloadError(f'Ungültige JSON-Zeile {line_no}: {exc}')
+            if len(items) > MAX_BULK_ITEMS:
+                raise BulkPayloadError(f'Maximal {MAX_BULK_ITEMS} Einträge pro Anfrage erlaubt')
+        return items, digest.hexdigest()
+
+    raw = request.get_data(cache=True)
+    digest.update(raw)
+    try:
+        payload = json.loads(raw or b'null')
+    except ValueError as exc:
+        raise BulkPayloadError(f'Ungültiges JSON: {exc}')
+
+    if isinstance(payload, dict):
+        payload = payload.get('items')
+    if not isinstance(payload, list):
+        raise BulkPayloadError('Erwartet wird ein JSON-Array, {"items": [...]} oder NDJSON')
+    if len(payload) > MAX_BULK_ITEMS:
+        raise BulkPayloadError(f'Maximal {MAX_BULK_ITEMS} Einträge pro Anfrage erlaubt')
+    return payload, digest.hexdigest()
+
+
+def chunked(values, size=LOOKUP_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def existing_values(column, values):
+    """Ermittelt mit wenigen ``IN``-Abfragen, welche Werte in ``column`` existieren."""
+    wanted = {value for value in values if isinstance(value, (str, int)) and value != ''}
+    found = set()
+    for chunk in chunked(wanted):
+        found.update(row[0] for row in db.session.query(column).filter(column.in_(chunk)))
+    return found
+
+
+def parse_iso_date(value, field, default=None):
+    if value in (None, ''):
+        if default is not None:
+            return default
+        raise ValueError(f'{field} fehlt')
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        raise ValueError(f'{field} ist kein gültiges Datum (YYYY-MM-DD)')
+
+
+def parse_number(value, field):
+    if value in (None, '') or isinstance(value, bool):
+        raise ValueError(f'{field} fehlt')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} ist keine Zahl')
+
+
+def _replay(stored, request_hash):
+    if stored.request_hash != request_hash:
+        return jsonify({
+            'error': 'Idempotency-Key wurde bereits für eine andere Anfrage verwendet'
+        }), 422
+    response = current_app.response_class(
+        stored.response_body,
+        status=stored.status_code,
+        mimetype='application/json',
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def run_bulk_insert(endpoint, model, build_rows, label, user_id=None):
+    """Validiert und speichert einen Sammelimport in einer Transaktion.
+
+    ``build_rows(items)`` prüft alle Einträge in einem Durchlauf und liefert je
+    Eintrag ein Tupel ``(row, error)``; ``error`` ist ein Text oder ein Dict,
+    das in das Ergebnis des Eintrags übernommen wird. Gültige Zeilen werden per
+    ``executemany`` eingefügt; statt eines Revisionseintrags pro Zeile entsteht
+    ein zusammenfassender Eintrag. Mit ``?atomic=1`` wird bei einem Fehler
+    nichts gespeichert. Ein ``Idempotency-Key``-Header macht Wiederholungen sicher.
+    """
+    idempotency_key = (request.headers.get('Idempotency-Key') or '').strip() or None
+
+    try:
+        items, request_hash = read_bulk_payload()
+    except BulkPayloadError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    if idempotency_key:
+        stored = IdempotencyKey.query.filter_by(endpoint=endpoint, key=idempotency_key).first()
+        if stored:
+            return _replay(stored, request_hash)
+
+    if not items:
+        return jsonify({'error': 'Keine Einträge übermittelt'}), 400
+
+    atomic = request.args.get('atomic', '').lower() in ('1', 'true', 'yes')
+    validated = build_rows(items)
+    has_errors = any(error for _, error in validated)
+
+    rows = []
+    results = []
+    for index, (row, error) in enumerate(validated):
+        if error:
+            result = {'index': index, 'status': 'error'}
+            result.update(error if isinstance(error, dict) else {'error': error})
+            results.append(result)
+        elif atomic and has_errors:
+            results.append({'index': index, 'status': 'skipped'})
+        else:
+            rows.append(row)
+            results.append({'index': index, 'status': 'created', 'id': row['id']})
+
+    if not rows:
+        return jsonify({
+            'total': len(items),
+            'created': 0,
+            'failed': sum(1 for r in results if r['status'] != 'skipped'),
+            'results': results,
+        }), 422
+
+    status_code = 207 if has_errors else 201
+    body = {
+        'total': len(items),
+        'created': len(rows),
+        'failed': len(items) - len(rows),
+        'results': results,
+    }
+    response_body = json.dumps(body, ensure_ascii=False)
+
+    try:
+        db.session.execute(insert(model), rows)
+        record_bulk_sync_changes(model.__tablename__, rows)
+        index_rows(model, rows)
+        db.session.add(RevisionLog(
+            table_name=model.__tablename__,
+            action='insert',
+            user_id=user_id,
+            changes=json.dumps({
+                'summary': f'Sammelimport: {len(rows)} {label}',
+                'count': len(rows),
+                'idempotency_key': idempotency_key,
+            }, ensure_ascii=False),
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent'),
+        ))
+        if idempotency_key:
+            db.session.execute(insert(IdempotencyKey), [{
+                'endpoint': endpoint,
+                'key': idempotency_key,
+                'request_hash': request_hash,
+                'status_code': status_code,
+                'response_body': response_body,
+                'created_by': user_id,
+            }])
+        db.session.commit()
+    except IntegrityError as exc:
+        db.session.rollback()
+        if idempotency_key:
+            stored = IdempotencyKey.query.filter_by(endpoint=endpoint, key=idempotency_key).first()
+            if stored:
+                return _replay(stored, request_hash)
+        current_app.logger.warning('Sammelimport %s abgewiesen: %s', endpoint, exc)
+        return jsonify({'error': 'Konflikt beim Speichern (doppelte oder ungültige Referenzen)'}), 409
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.error('Sammelimport %s fehlgeschlagen: %s', endpoint, exc, exc_info=True)
+        return jsonify({'error': str(exc)}), 500
+
+    return current_app.response_class(response_body, status=status_code, mimetype='application/json')
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# Platzhalter in Klauseln und Blöcken: §variablen_name§
+PLACEHOLDER_PATTERN = re.compile(r'§(\w+)§')
+FRAGMENT_CACHE_SIZE = 1024
+
+_fragments = OrderedDict()
+_lock = threading.Lock()
+
+
+def _money(value):
+    return f"{value or 0:.2f}"
+
+
+def _date(value, fallback=''):
+    return value.strftime('%d.%m.%Y') if value else fallback
+
+
+def contract_variables(contract):
+    """Werte für alle Platzhalter eines Vertrags."""
+    tenant = getattr(contract, 'tenant', None)
+    landlord = getattr(contract, 'landlord', None)
+    apartment = getattr(contract, 'apartment', None)
+    building = getattr(apartment, 'building', None)
+
+    if landlord is not None:
+        landlord_name = landlord.company_name or f"{landlord.first_name or ''} {landlord.last_name or ''}".strip()
+    else:
+        landlord_name = '[Vermieter]'
+
+    return {
+        'mieter_vorname': getattr(tenant, 'first_name', '') or '',
+        'mieter_nachname': getattr(tenant, 'last_name', '') or '',
+        'vermieter_name': landlord_name,
+        'wohnung_adresse': f"{building.street or ''} {building.street_number or ''}".strip() if building else '',
+        'miete_netto': _money(contract.rent_net),
+        'miete_nebenkosten': _money(contract.rent_additional),
+        'kaution': _money(contract.deposit),
+        'vertragsbeginn': _date(contract.start_date),
+        'vertragsende': _date(contract.end_date, 'unbefristet'),
+        'datum_heute': datetime.now().strftime('%d.%m.%Y'),
+    }
+
+
+def substitute(text, variables):
+    """Ersetzt alle bekannten Platzhalter in einem Durchlauf; unbekannte bleiben stehen."""
+    if not text or '§' not in text:
+        return text or ''
+    return PLACEHOLDER_PATTERN.sub(
+        lambda match: str(variables[match.group(1)]) if match.group(1) in variables else match.group(0),
+        text,
+    )
+
+
+def _fingerprint(*parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _cached(key, render):
+    with _lock:
+        fragment = _fragments.get(key)
+        if fragment is not None:
+            _fragments.move_to_end(key)
+            return fragment, False
+    fragment = render()
+    with _lock:
+        _fragments[key] = fragment
+        if len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+    return fragment, True
+
+
+# --- Paragraphen-Baum (Tree-Editor, professionelles PDF) ---------------------
+
+def _render_children(parts, children, prefix, variables):
+    for idx, child in enumerate(children or [], start=1):
+        number = f"{prefix}.{idx}"
+        parts.append(
+            f'\n    <div class="subclause">\n'
+            f'        <div class="subclause-title">§ {number} {child.get("title") or ""}</div>\n'
+            f'        <div class="clause-body">{substitute(child.get("content"), variables)}</div>\n'
+            f'    </div>\n'
+        )
+        if child.get('children'):
+            _render_children(parts, child['children'], number, variables)
+
+
+def _render_paragraph(node, number, variables):
+    parts = [
+        f'\n<div class="clause">\n'
+        f'    <div class="clause-title">§ {number} {node.get("title") or ""}</div>\n'
+        f'    <div class="clause-body">{substitute(node.get("content"), variables)}</div>\n'
+        f'</div>\n'
+    ]
+    if node.get('children'):
+        _render_children(parts, node['children'], str(number), variables)
+    return ''.join(parts)
+
+
+def render_paragraph_sections(paragraph_tree, variables=None):
+    """Rendert den Baum abschnittsweise; gibt ``[(schlüssel, html)]`` und Statistik zurück.
+
+    Jeder Paragraph (mit Unterparagraphen) ist ein Abschnitt. Der Schlüssel
+    ist ein Hash über Nummer, Inhalt und verwendete Variablen; unveränderte
+    Abschnitte kommen aus dem Fragment-Cache.
+    """
+    variables = variables or {}
+    sections = []
+    stats = {'rendered': 0, 'cached': 0}
+    for idx, node in enumerate(paragraph_tree or [], start=1):
+        number = node.get('number') or str(idx)
+        used = {name: variables.get(name) for name in _placeholders(node)}
+        key = _fingerprint('paragraph', number, node.get('title'), node.get('content'), node.get('children'), used)
+        fragment, rendered = _cached(key, lambda: _render_paragraph(node, number, variables))
+        stats['rendered' if rendered else 'cached'] += 1
+        sections.append((key, fragment))
+    return sections, stats
+
+
+def render_paragraph_tree(paragraph_tree, variables=None):
+    sections, _ = render_paragraph_sections(paragraph_tree, variables)
+    return ''.join(fragment for _, fragment in sections)
+
+
+def _placeholders(node):
+    names = set(PLACEHOLDER_PATTERN.findall(node.get('content') or ''))
+    for child in node.get('children') or []:
+        names |= _placeholders(child)
+    return names
+
+
+# --- Vertragsblöcke (Block-Editor) -------------------------------------------
+
+def render_blocks(blocks, variables):
+    """Rendert Vertragsblöcke nach ``sort_order`` mit ersetzten Platzhaltern."""
+    parts = []
+    for block in sorted(blocks, key=lambda block: block.sort_order or 0):
+        content = block.content or ''
+        used = {name: variables.get(name) for name in PLACEHOLDER_PATTERN.findall(content)}
+        key = _fingerprint('block', block.title, content, used)
+        fragment, _ = _cached(key, lambda: (
+            f'\n        <div class="section">\n'
+            f'            <h2>{block.title}</h2>\n'
+            f'            <div class="clause">\n'
+            f'                {substitute(content, variables)}\n'
+            f'            </div>\n'
+            f'        </div>\n'
+        ))
+        parts.append(fragment)
+    return ''.join(parts)
+
+
+def render_block_contract(contract, blocks):
+    """Vollständiges Vertrags-HTML aus Blöcken (Block-Editor)."""
+    variables = contract_variables(contract)
+    parts = [f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <style>
+            body {{
+                font-family: "Times New Roman", Times, serif;
+                line-height: 1.6;
+                margin: 2cm;
+                font-size: 12pt;
+                color: #000;
+            }}
+            .header {{
+                text-align: center;
+                margin-bottom: 2cm;
+                border-bottom: 2px solid #000;
+                padding-bottom: 1cm;
+            }}
+            .section {{
+                margin-bottom: 0.8cm;
+                page-break-inside: avoid;
+            }}
+            .section h2 {{
+                font-size: 12pt;
+                font-weight: bold;
+                margin: 0.5cm 0 0.3cm 0;
+            }}
+            .clause {{
+                margin-bottom: 0.5cm;
+                text-align: justify;
+            }}
+            .signature-area {{
+                margin-top: 3cm;
+            }}
+            .signature-line {{
+                border-top: 1px solid #000;
+                width: 8cm;
+                margin-top: 2cm;
+            }}
+            .footer {{
+                margin-top: 1cm;
+                font-size: 10pt;
+                color: #666;
+                text-align: center;
+            }}
+            .page-break {{
+                page-break-before: always;
+            }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>MIETVERTRAG</h1>
+            <p>Vertragsnummer: {contract.contract_number}</p>
+        </div>
+    """]
+    parts.append(render_blocks(blocks, variables))
+    parts.append(f"""
+        <div class="signature-area">
+            <p><strong>Ort, Datum: ____________________</strong></p>
+            
+            <div style="display: flex; justify-content: space-between;">
+                <div>
+                    <div class="signature-line"></div>
+                    <p><strong>Vermieter</strong></p>
+                    <p>{variables['vermieter_name']}</p>
+                </div>
+                <div>
+                    <div class="signature-line"></div>
+                    <p><strong>Mieter</strong></p>
+                    <p>{variables['mieter_vorname']} {variables['mieter_nachname']}</p>
+                </div>
+            </div>
+        </div>
+        
+        <div class="footer">
+            <p>Dieses Dokument wurde am {variables['datum_heute']} generiert und ist rechtlich bindend.</p>
+        </div>
+    </body>
+    </html>
+    """)
+    return ''.join(parts)
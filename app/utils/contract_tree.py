@@ -0,0 +1,297 @@
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, func, insert, literal, update
+
+from app.extensions import db
+from app.models import Contract, ContractParagraph
+from app.utils.reorder import SORT_GAP
+
+# Position "hinter dem letzten Geschwister" für insert_node/move_node
+END = object()
+
+NODE_COLUMNS = ('title', 'content', 'category', 'icon', 'mandatory')
+# Schlüssel, die nicht in ``extra`` landen
+STRUCTURE_KEYS = {'id', 'type', 'children'}
+
+
+class TreeError(ValueError):
+    pass
+
+
+class NodeNotFound(TreeError):
+    pass
+
+
+def _node_id(node, seen):
+    node_id = str(node.get('id') or '')[:64]
+    if not node_id or node_id in seen:
+        node_id = str(uuid.uuid4())
+    seen.add(node_id)
+    return node_id
+
+
+def _extra(node):
+    extra = {key: value for key, value in node.items() if key not in STRUCTURE_KEYS and key not in NODE_COLUMNS}
+    return json.dumps(extra) if extra else None
+
+
+def _node_values(node):
+    values = {column: node.get(column) for column in NODE_COLUMNS}
+    values['mandatory'] = bool(values['mandatory'])
+    values['node_type'] = node.get('type') or 'paragraph'
+    values['extra'] = _extra(node)
+    return values
+
+
+def _flatten(contract_id, nodes, parent=None, seen=None, now=None):
+    """Zeilen für einen (Teil-)Baum; ``parent`` ist ``(node_id, path, depth)`` oder None."""
+    seen = set() if seen is None else seen
+    now = now or datetime.utcnow()
+    parent_id, parent_path, depth = parent or (None, '/', -1)
+    rows = []
+    for index, node in enumerate(nodes or [], start=1):
+        if not isinstance(node, dict):
+            continue
+        node_id = _node_id(node, seen)
+        path = f'{parent_path}{node_id}/'
+        rows.append(dict(
+            _node_values(node),
+            contract_id=contract_id, node_id=node_id, parent_id=parent_id,
+            path=path, depth=depth + 1, sort_key=index * SORT_GAP, updated_at=now,
+        ))
+        rows.extend(_flatten(contract_id, node.get('children'), (node_id, path, depth + 1), seen, now))
+    return rows
+
+
+def _to_node(row):
+    node = {
+        'id': row.node_id,
+        'type': row.node_type or 'paragraph',
+        'title': row.title,
+        'content': row.content,
+        'category': row.category or '',
+        'icon': row.icon or '',
+        'mandatory': bool(row.mandatory),
+    }
+    if row.extra:
+        node.update(json.loads(row.extra))
+    node['children'] = []
+    return node
+
+
+def load_tree(contract_id):
+    """Paragraphen-Baum eines Vertrags als verschachtelte Liste (eine Abfrage)."""
+    return load_trees([contract_id]).get(contract_id, [])
+
+
+def load_trees(contract_ids):
+    """Bäume mehrerer Verträge mit einer Abfrage; gibt ``{contract_id: baum}`` zurück."""
+    rows = ContractParagraph.query.filter(ContractParagraph.contract_id.in_(list(contract_ids))).order_by(
+        ContractParagraph.depth, ContractParagraph.sort_key
+    ).all()
+    nodes = {}
+    trees = {}
+    for row in rows:
+        node = nodes[(row.contract_id, row.node_id)] = _to_node(row)
+        parent = nodes.get((row.contract_id, row.parent_id))
+        (parent['children'] if parent else trees.setdefault(row.contract_id, [])).append(node)
+    return trees
+
+
+def _touch(contract_id):
+    """Baumänderungen zählen als Vertragsänderung (``updated_at``, z. B. für Sammelläufe)."""
+    table = Contract.__table__
+    db.session.execute(update(table).where(table.c.id == contract_id).values(updated_at=datetime.utcnow()))
+
+
+def replace_tree(contract_id, tree):
+    """Ersetzt den kompletten Baum (Sammel-Insert, z. B. beim Speichern der Gesamtstruktur)."""
+    table = ContractParagraph.__table__
+    db.session.execute(delete(table).where(table.c.contract_id == contract_id))
+    rows = _flatten(contract_id, tree)
+    if rows:
+        db.session.execute(insert(table), rows)
+    _touch(contract_id)
+    return len(rows)
+
+
+def copy_tree(source_contract_id, target_contract_id):
+    return replace_tree(target_contract_id, load_tree(source_contract_id))
+
+
+def _get(contract_id, node_id):
+    row = ContractParagraph.query.filter_by(contract_id=contract_id, node_id=node_id).first()
+    if row is None:
+        raise NodeNotFound(f'Knoten {node_id} nicht gefunden')
+    return row
+
+
+def _sort_key(contract_id, parent_id, after_id, exclude_id=None):
+    """Sortierschlüssel für eine neue Position unter ``parent_id``.
+
+    ``after_id`` ist das vorangehende Geschwister (None = erste Position,
+    ``END`` = hinter dem letzten). Ist keine Lücke mehr frei, werden die
+    Geschwister mit einem Sammel-Update neu nummeriert.
+    """
+    query = db.session.query(ContractParagraph.id, ContractParagraph.node_id, ContractParagraph.sort_key).filter(
+        ContractParagraph.contract_id == contract_id,
+        ContractParagraph.parent_id == parent_id if parent_id else ContractParagraph.parent_id.is_(None),
+    )
+    if exclude_id is not None:
+        query = query.filter(ContractParagraph.node_id != exclude_id)
+    siblings = query.order_by(ContractParagraph.sort_key).all()
+
+    if after_id is END:
+        index = len(siblings)
+    elif after_id is None:
+        index = 0
+    else:
+        index = next((i + 1 for i, sibling in enumerate(siblings) if sibling.node_id == after_id), None)
+        if index is None:
+            raise NodeNotFound(f'Knoten {after_id} ist kein Geschwister unter diesem Elternknoten')
+
+    lower = siblings[index - 1].sort_key if index > 0 else None
+    upper = siblings[index].sort_key if index < len(siblings) else None
+    if lower is None and upper is None:
+        return SORT_GAP
+    if upper is None:
+        return lower + SORT_GAP
+    if lower is None:
+        return upper - SORT_GAP
+    if upper - lower > 1:
+        return (lower + upper) // 2
+
+    table = ContractParagraph.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('row_id')).values(sort_key=bindparam('new_key')),
+        [
+            {'row_id': sibling.id, 'new_key': (i + (2 if i >= index else 1)) * SORT_GAP}
+            for i, sibling in enumerate(siblings)
+        ],
+    )
+    return (index + 1) * SORT_GAP
+
+
+def _parent(contract_id, parent_id):
+    if not parent_id:
+        return None, '/', -1
+    parent = _get(contract_id, parent_id)
+    return parent.node_id, parent.path, parent.depth
+
+
+def insert_node(contract_id, node, parent_id=None, after_id=END):
+    """Fügt einen Knoten samt Unterknoten ein; gibt die gespeicherte ``node_id`` zurück."""
+    if not isinstance(node, dict):
+        raise TreeError('Ungültiger Knoten')
+    existing = {
+        node_id for (node_id,) in db.session.query(ContractParagraph.node_id).filter_by(contract_id=contract_id)
+    }
+    parent = _parent(contract_id, parent_id)
+    rows = _flatten(contract_id, [node], parent, seen=existing)
+    rows[0]['sort_key'] = _sort_key(contract_id, parent[0], after_id)
+    for row in rows:
+        db.session.add(ContractParagraph(**row))
+    _touch(contract_id)
+    return rows[0]['node_id']
+
+
+def update_node(contract_id, node_id, changes):
+    """Übernimmt geänderte Felder eines Knotens; Struktur bleibt unverändert."""
+    row = _get(contract_id, node_id)
+    changes = {key: value for key, value in (changes or {}).items() if key not in ('id', 'children')}
+    for column in NODE_COLUMNS:
+        if column in changes:
+            value = changes.pop(column)
+            setattr(row, column, bool(value) if column == 'mandatory' else value)
+    if 'type' in changes:
+        row.node_type = changes.pop('type') or row.node_type
+    if changes:
+        extra = json.loads(row.extra) if row.extra else {}
+        extra.update(changes)
+        row.extra = json.dumps(extra)
+    _touch(contract_id)
+    return row
+
+
+def move_node(contract_id, node_id, parent_id=None, after_id=None):
+    """Verschiebt einen Knoten hinter ``after_id`` unter ``parent_id``.
+
+    Innerhalb derselben Ebene ändert sich nur der Sortierschlüssel; bei
+    einem neuen Elternknoten wird der Pfad des Teilbaums per Präfix ersetzt.
+    """
+    row = _get(contract_id, node_id)
+    new_parent_id, parent_path, parent_depth = _parent(contract_id, parent_id)
+    if parent_path.startswith(row.path):
+        raise TreeError('Ein Knoten kann nicht unter sich selbst verschoben werden')
+
+    row.sort_key = _sort_key(contract_id, new_parent_id, after_id, exclude_id=row.node_id)
+    if new_parent_id != row.parent_id:
+        old_path = row.path
+        new_path = f'{parent_path}{row.node_id}/'
+        db.session.execute(
+            update(ContractParagraph).where(
+                ContractParagraph.contract_id == contract_id,
+                ContractParagraph.path.startswith(old_path, autoescape=True),
+                ContractParagraph.id != row.id,
+            ).values(
+                path=literal(new_path) + func.substr(ContractParagraph.path, len(old_path) + 1),
+                depth=ContractParagraph.depth + (parent_depth + 1 - row.depth),
+            ).execution_options(synchronize_session='fetch')
+        )
+        row.parent_id = new_parent_id
+        row.path = new_path
+        row.depth = parent_depth + 1
+    _touch(contract_id)
+    return row
+
+
+def delete_node(contract_id, node_id):
+    """Löscht einen Knoten mit allen Unterknoten; gibt die Anzahl zurück."""
+    row = _get(contract_id, node_id)
+    if row.mandatory:
+        raise TreeError('Pflichtparagraphen können nicht gelöscht werden')
+    subtree = ContractParagraph.query.filter(
+        ContractParagraph.contract_id == contract_id,
+        ContractParagraph.path.startswith(row.path, autoescape=True),
+    ).all()
+    for node in subtree:
+        db.session.delete(node)
+    _touch(contract_id)
+    return len(subtree)
+
+
+def migrate_paragraph_trees():
+    """Übernimmt ``paragraph_tree`` aus ``contracts.contract_data`` in ``contract_paragraphs``.
+
+    Der Schlüssel wird danach aus dem JSON entfernt; übrige Formulardaten
+    bleiben erhalten. Mehrfache Aufrufe sind unschädlich.
+    """
+    candidates = db.session.query(Contract.id, Contract.contract_data).filter(
+        Contract.contract_data.like('%paragraph_tree%')
+    ).all()
+    if not candidates:
+        return 0
+    migrated_ids = {
+        contract_id for (contract_id,) in db.session.query(ContractParagraph.contract_id).distinct()
+    }
+    table = Contract.__table__
+    migrated = 0
+    for contract_id, raw in candidates:
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+        if not isinstance(data, dict) or 'paragraph_tree' not in data:
+            continue
+        tree = data.pop('paragraph_tree')
+        if contract_id not in migrated_ids and isinstance(tree, list):
+            replace_tree(contract_id, tree)
+            migrated += 1
+        db.session.execute(
+            update(table).where(table.c.id == contract_id).values(contract_data=json.dumps(data) if data else None)
+        )
+    db.session.commit()
+    print(f"✅ Migrated paragraph trees of {migrated} contracts to contract_paragraphs")
+    return migrated
@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+from flask import g, has_request_context
+
+from app.extensions import db
+from app.models import Apartment, Building, Contract, Meter, OperatingCost, Settlement, Tenant
+
+LOOKUP_BATCH_SIZE = 500
+EMPTY_LABEL = '–'
+
+TargetType = namedtuple('TargetType', 'model prefix format options')
+
+# documentable_type -> Modell, Beschriftung und benötigte Relationen
+# (``options`` als Funktion, da Backrefs erst nach dem Mapper-Setup existieren)
+TARGET_TYPES = {
+    'apartment': TargetType(
+        Apartment, 'Wohnung', lambda apartment: apartment.get_full_identifier(),
+        lambda: (db.joinedload(Apartment.building),),
+    ),
+    'tenant': TargetType(
+        Tenant, 'Mieter', lambda tenant: f"{tenant.first_name} {tenant.last_name}", None,
+    ),
+    'contract': TargetType(Contract, 'Vertrag', lambda contract: contract.contract_number, None),
+    'building': TargetType(Building, 'Gebäude', lambda building: building.name, None),
+    'meter': TargetType(Meter, 'Zähler', lambda meter: meter.meter_number, None),
+    'cost': TargetType(OperatingCost, 'Kosten', lambda cost: cost.description or cost.system_invoice_number, None),
+    'settlement': TargetType(Settlement, 'Abrechnung', lambda settlement: str(settlement.settlement_year), None),
+}
+
+
+class TargetResolver:
+    """Beschriftet polymorphe Ziele (``documentable_type``/``documentable_id``).
+
+    Fehlende Ziele werden je Typ mit einer ``IN``-Abfrage nachgeladen; bereits
+    bekannte Beschriftungen bleiben im Resolver gespeichert.
+    """
+
+    def __init__(self):
+        self._labels = {}
+
+    def resolve(self, targets):
+        """Lädt die Beschriftungen für ``(typ, id)``-Paare; gibt sie als Dict zurück."""
+        targets = {(target_type, target_id) for target_type, target_id in targets if target_type and target_id}
+        missing = {}
+        for target_type, target_id in targets - self._labels.keys():
+            missing.setdefault(target_type, []).append(target_id)
+
+        for target_type, ids in missing.items():
+            target = TARGET_TYPES.get(target_type)
+            if target is None:
+                self._labels.update({(target_type, target_id): None for target_id in ids})
+                continue
+            found = {}
+            for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+                query = target.model.query.options(*(target.options() if target.options else ())).filter(
+                    target.model.id.in_(ids[start:start + LOOKUP_BATCH_SIZE])
+                )
+                found.update({obj.id: f"{target.prefix}: {target.format(obj)}" for obj in query})
+            self._labels.update({(target_type, target_id): found.get(target_id) for target_id in ids})
+
+        return {key: self._labels[key] for key in targets}
+
+    def label(self, target_type, target_id):
+        if not target_type or not target_id:
+            return EMPTY_LABEL
+        return self.resolve([(target_type, target_id)]).get((target_type, target_id)) or EMPTY_LABEL
+
+    def label_documents(self, documents):
+        """Setzt ``target_label`` an allen Dokumenten mit einer Abfrage je Zieltyp."""
+        self.resolve((doc.documentable_type, doc.documentable_id) for doc in documents)
+        for doc in documents:
+            doc.target_label = self.label(doc.documentable_type, doc.documentable_id)
+        return documents
+
+
+def target_resolver():
+    """Resolver des laufenden Requests (außerhalb eines Requests jeweils neu)."""
+    if not has_request_context():
+        return TargetResolver()
+    if 'target_resolver' not in g:
+        g.target_resolver = TargetResolver()
+    return g.target_resolver
@@ -0,0 +1,228 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from app.extensions import db
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_RELAY_INTERVAL = 5
+DEFAULT_RELAY_OVERLAP = 120
+RELAY_PAGE_SIZE = 500
+QUEUE_SIZE = 100
+
+
+class TooManyConnections(Exception):
+    """Die maximale Zahl gleichzeitiger Abonnements dieses Workers ist erreicht."""
+
+
+class Subscription:
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def get(self, timeout):
+        """Nächstes Ereignis ``(event, data)`` oder ``None`` nach ``timeout`` Sekunden."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _offer(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Langsamer Client: weitere Ereignisse verwerfen, Client lädt neu
+            self.overflowed = True
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBroker:
+    """Einfacher Publish/Subscribe-Verteiler innerhalb eines Prozesses.
+
+    Ereignisse gehen an die Abonnements eines Benutzers oder (ohne
+    ``user_ids``) an alle. Die Zahl gleichzeitiger Abonnements ist begrenzt,
+    da jede offene Verbindung einen Worker-Thread belegt.
+    """
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    @property
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if sum(len(subs) for subs in self._subscribers.values()) >= self.max_connections:
+                raise TooManyConnections()
+            subscription = Subscription(self, user_id)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subs = self._subscribers.get(subscription.user_id)
+            if subs:
+                subs.discard(subscription)
+                if not subs:
+                    del self._subscribers[subscription.user_id]
+
+    def subscribed_users(self):
+        with self._lock:
+            return set(self._subscribers)
+
+    def publish(self, event, data, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                targets = [s for subs in self._subscribers.values() for s in subs]
+            else:
+                targets = [s for user_id in user_ids for s in self._subscribers.get(user_id, ())]
+        for subscription in targets:
+            subscription._offer((event, data))
+        return len(targets)
+
+
+broker = EventBroker()
+
+
+def format_sse(event, data, event_id=None):
+    lines = []
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    lines.extend(f'data: {line}' for line in payload.splitlines())
+    return '\n'.join(lines) + '\n\n'
+
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'category': notification.category,
+        'link': notification.link,
+        'created_at': notification.created_at.strftime('%d.%m.%Y %H:%M'),
+        'is_read': notification.is_read,
+    }
+
+
+class NotificationRelay:
+    """Überträgt neue Benachrichtigungen aus der Datenbank an die lokalen Abonnenten.
+
+    Benachrichtigungen entstehen im Hintergrundjob, der nur in einem Worker
+    läuft. Jeder Worker fragt deshalb, solange Clients verbunden sind, in
+    einem Thread neue Zeilen ab: eine Abfrage pro Intervall und Worker statt
+    zwei pro Client und Poll.
+
+    ``created_at`` wird beim Einfügen gesetzt, sichtbar wird die Zeile erst
+    beim Commit. Damit spät committete Zeilen nicht hinter der Marke landen,
+    liest jede Abfrage die letzten ``overlap`` Sekunden erneut; bereits
+    übertragene Zeilen werden an ihrer ``id`` erkannt.
+    """
+
+    def __init__(self, app, interval=DEFAULT_RELAY_INTERVAL, overlap=DEFAULT_RELAY_OVERLAP):
+        self.app = app
+        self.interval = interval
+        self.overlap = timedelta(seconds=overlap)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._watermark = None  # created_at der jüngsten übertragenen Zeile
+        self._seen = {}  # id -> created_at der Zeilen im Überlappungsfenster
+
+    def ensure_running(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._watermark = datetime.utcnow()
+            # Was beim Start schon sichtbar ist, hat der Client mit der Seite geladen
+            with self.app.app_context():
+                try:
+                    self._seen = dict(self._window_rows())
+                finally:
+                    db.session.remove()
+            self._thread = threading.Thread(target=self._run, name='notification-relay', daemon=True)
+            self._thread.start()
+
+    def _window_rows(self):
+        """``(id, created_at)`` ab ``Marke - overlap``, seitenweise nach ``(created_at, id)``."""
+        from app.models import Notification
+
+        created_at, last_id = self._watermark - self.overlap, ''
+        while True:
+            page = db.session.query(Notification.id, Notification.created_at).filter(or_(
+                Notification.created_at > created_at,
+                and_(Notification.created_at == created_at, Notification.id > last_id),
+            )).order_by(Notification.created_at, Notification.id).limit(RELAY_PAGE_SIZE).all()
+            yield from page
+            if len(page) < RELAY_PAGE_SIZE:
+                return
+            created_at, last_id = page[-1].created_at, page[-1].id
+
+    def poll_once(self):
+        from app.models import Notification
+
+        users = broker.subscribed_users()
+        if not users:
+            return 0
+        with self.app.app_context():
+            try:
+                new = [(row_id, created_at) for row_id, created_at in self._window_rows() if row_id not in self._seen]
+                for start in range(0, len(new), RELAY_PAGE_SIZE):
+                    ids = [row_id for row_id, _ in new[start:start + RELAY_PAGE_SIZE]]
+                    rows = Notification.query.filter(
+                        Notification.id.in_(ids), Notification.user_id.in_(users)
+                    ).order_by(Notification.created_at, Notification.id).all()
+                    for notification in rows:
+                        broker.publish('notification', serialize_notification(notification), [notification.user_id])
+                for row_id, created_at in new:
+                    self._seen[row_id] = created_at
+                    self._watermark = max(self._watermark, created_at)
+                horizon = self._watermark - self.overlap
+                self._seen = {row_id: created_at for row_id, created_at in self._seen.items() if created_at >= horizon}
+                return len(new)
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        # Läuft, solange Abonnenten verbunden sind; ein neuer Client startet ihn erneut
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"⚠️  Notification relay error: {e}")
+            with self._lock:
+                if not broker.subscribed_users():
+                    self._thread = None
+                    return
+
+
+def notification_relay(app):
+    relay = app.extensions.get('notification_relay')
+    if relay is None:
+        relay = NotificationRelay(
+            app,
+            app.config.get('SSE_RELAY_INTERVAL', DEFAULT_RELAY_INTERVAL),
+            app.config.get('SSE_RELAY_OVERLAP', DEFAULT_RELAY_OVERLAP),
+        )
+        app.extensions['notification_relay'] = relay
+        broker.max_connections = app.config.get('SSE_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS)
+    return relay
@@ -0,0 +1,225 @@
+import csv
+import io
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import Response, current_app, stream_with_context
+
+# Zeilen je geschriebenem Block; begrenzt den Speicher unabhängig von der Datenmenge
+CHUNK_ROWS = 500
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PDF_MIMETYPE = 'application/pdf'
+DEFAULT_EXPORT_PROCESSES = 1
+DEFAULT_IDLE_SECONDS = 300
+
+# xhtml2pdf und reportlab laufen in einem eigenen Exportprozess; die Web-Worker
+# laden sie nie. Gestartet beim ersten PDF, beendet nach der Leerlaufzeit.
+_pool = None
+_pool_busy = 0
+_pool_timer = None
+_pool_lock = threading.Lock()
+
+
+def _attachment(filename):
+    return {'Content-Disposition': f'attachment; filename="{filename}"'}
+
+
+def csv_stream(headers, rows, delimiter=','):
+    """CSV blockweise als Text erzeugen; ``rows`` darf ein Generator sein."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+    writer.writerow(headers)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(filename, headers, rows, delimiter=',', bom=False):
+    """Streamt eine CSV-Datei, ohne alle Zeilen im Speicher zu halten."""
+    def generate():
+        if bom:
+            yield '\ufeff'
+        yield from csv_stream(headers, rows, delimiter)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers=_attachment(filename),
+    )
+
+
+def xlsx_response(filename, headers, rows, sheet_title=None, column_widths=None):
+    """XLSX im Write-only-Modus von openpyxl; der Speicher bleibt konstant.
+
+    Die Datei wird in eine temporäre Datei geschrieben (ab 8 MB auf der
+    Platte) und von dort in Blöcken ausgeliefert. ``column_widths`` setzt
+    die Spaltenbreiten (in Zeichen) in der Reihenfolge der Überschriften.
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    for index, width in enumerate(column_widths or [], start=1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+    sheet.append(list(headers))
+    for row in rows:
+        sheet.append(list(row))
+
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    workbook.save(output)
+    output.seek(0)
+
+    def generate():
+        try:
+            while True:
+                chunk = output.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            output.close()
+
+    return Response(generate(), mimetype=XLSX_MIMETYPE, headers=_attachment(filename))
+
+
+def column_widths(headers, rows, padding=2):
+    """Spaltenbreite je Spalte: längster Wert plus ``padding`` (``rows`` als Liste)."""
+    widths = [len(str(header)) for header in headers]
+    for row in rows:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value if value is not None else '')))
+    return [width + padding for width in widths]
+
+
+def pdf_response(filename, data):
+    """PDF-Bytes als Download."""
+    return Response(data, mimetype=PDF_MIMETYPE, headers=_attachment(filename))
+
+
+# --- Exportprozess ------------------------------------------------------------------
+
+def _shutdown_idle(pool):
+    global _pool, _pool_timer
+    with _pool_lock:
+        if _pool is not pool or _pool_busy:
+            return
+        _pool, _pool_timer = None, None
+    pool.shutdown(wait=False)
+
+
+def run_export(func, *args):
+    """Führt ``func(*args)`` im Exportprozess aus und gibt das Ergebnis zurück.
+
+    ``func`` muss eine Funktion auf Modulebene sein, Argumente und Ergebnis
+    picklebar. Mit ``EXPORT_PROCESSES = 0`` läuft sie im aufrufenden Prozess.
+    """
+    global _pool, _pool_busy, _pool_timer
+    processes = current_app.config.get('EXPORT_PROCESSES', DEFAULT_EXPORT_PROCESSES)
+    if processes <= 0:
+        return func(*args)
+
+    with _pool_lock:
+        if _pool_timer is not None:
+            _pool_timer.cancel()
+            _pool_timer = None
+        if _pool is None:
+            # spawn: der Exportprozess erbt weder Threads noch Datenbankverbindungen
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        pool = _pool
+        _pool_busy += 1
+    try:
+        return pool.submit(func, *args).result()
+    except BrokenProcessPool:
+        # Exportprozess ist abgestürzt; der nächste Aufruf startet einen neuen
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+    finally:
+        with _pool_lock:
+            _pool_busy -= 1
+            if not _pool_busy and _pool is pool:
+                _pool_timer = threading.Timer(
+                    current_app.config.get('EXPORT_PROCESS_IDLE_SECONDS', DEFAULT_IDLE_SECONDS),
+                    _shutdown_idle,
+                    args=(pool,),
+                )
+                _pool_timer.daemon = True
+                _pool_timer.start()
+
+
+def _render_html_pdf(html):
+    from xhtml2pdf import pisa
+
+    buffer = io.BytesIO()
+    result = pisa.CreatePDF(html, dest=buffer)
+    return buffer.getvalue(), result.err
+
+
+def html_to_pdf(html):
+    """PDF aus HTML (xhtml2pdf) als Bytes; ``None``, wenn xhtml2pdf Fehler meldet."""
+    data, errors = run_export(_render_html_pdf, html)
+    if errors:
+        current_app.logger.error(f"PDF Generation Error: {errors}")
+        return None
+    return data
+
+
+def _render_table_pdf(title, meta_lines, headers, rows, empty_text):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=30)
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        textColor=colors.HexColor('#1e40af'),
+    )
+
+    elements = [Paragraph(title, title_style)]
+    for line in meta_lines:
+        elements.append(Paragraph(line, styles['Normal']))
+        elements.append(Spacer(1, 5))
+    elements.append(Spacer(1, 20))
+
+    if rows:
+        table = Table([list(headers)] + [list(row) for row in rows], repeatRows=1)
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]))
+        elements.append(table)
+    else:
+        elements.append(Paragraph(empty_text, styles['Normal']))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def table_pdf(title, meta_lines, headers, rows, empty_text='Keine Einträge gefunden'):
+    """Tabellen-PDF (reportlab, A4) mit Titel und Metadatenzeilen als Bytes."""
+    return run_export(_render_table_pdf, title, list(meta_lines), list(headers), [list(row) for row in rows], empty_text)
@@ -0,0 +1,170 @@
+import uuid
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import cast, func, insert, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.extensions import db
+from app.models import Contract, MaintenanceTask, Notification, Tenant, User
+from app.utils.bulk_import import chunked
+from app.utils.scheduler import BackgroundJob, jobs_allowed
+
+DEFAULT_TICK_SECONDS = 15 * 60
+# Vorlauf für Vertragsende und Auszug
+LOOKAHEAD_DAYS = 30
+
+
+def _url_builder():
+    """Baut Links ohne Request-Kontext (der Job läuft im Hintergrund)."""
+    adapter = current_app.url_map.bind(
+        'localhost', script_name=current_app.config.get('APPLICATION_ROOT') or '/'
+    )
+
+    def build(endpoint, **values):
+        try:
+            return adapter.build(endpoint, values)
+        except Exception:
+            return None
+
+    return build
+
+
+def recipient_ids():
+    """Aktive Benutzer, die Erinnerungen erhalten (alle außer Mieter-Konten)."""
+    return [
+        row.id for row in db.session.query(User.id).filter(
+            or_(User.is_active.is_(True), User.is_active.is_(None)),
+            or_(User.role != 'tenant', User.role.is_(None)),
+        )
+    ]
+
+
+def due_reminders(today=None):
+    """Ermittelt alle fälligen Erinnerungen mit je einer Abfrage pro Art.
+
+    Jede Erinnerung trägt ``kind``, ``subject_id`` und ``dedup_window``; das
+    Fenster ist das Ereignisdatum, sodass eine verschobene Wartung oder ein
+    geändertes Vertragsende erneut gemeldet wird.
+    """
+    today = today or date.today()
+    horizon = today + timedelta(days=LOOKAHEAD_DAYS)
+    link = _url_builder()
+    reminders = []
+
+    reminder_day = func.date(
+        MaintenanceTask.scheduled_on,
+        '-' + cast(func.coalesce(MaintenanceTask.reminder_days_before, 0), db.String) + ' days',
+    )
+    tasks = db.session.query(
+        MaintenanceTask.id, MaintenanceTask.title, MaintenanceTask.category, MaintenanceTask.scheduled_on
+    ).filter(
+        MaintenanceTask.status == 'open',
+        reminder_day <= today.isoformat(),
+    ).all()
+    for task in tasks:
+        reminders.append({
+            'kind': 'maintenance',
+            'subject_id': task.id,
+            'dedup_window': task.scheduled_on.isoformat(),
+            'title': f"Wartung fällig: {task.title}",
+            'message': f"{task.category} am {task.scheduled_on.strftime('%d.%m.%Y')} einplanen.",
+            'link': link('main.maintenance_list'),
+            'category': 'maintenance',
+        })
+
+    contracts = db.session.query(Contract.id, Contract.contract_number, Contract.end_date).filter(
+        or_(Contract.is_archived.is_(False), Contract.is_archived.is_(None)),
+        Contract.end_date.between(today, horizon),
+    ).all()
+    for contract in contracts:
+        reminders.append({
+            'kind': 'contract_end',
+            'subject_id': contract.id,
+            'dedup_window': contract.end_date.isoformat(),
+            'title': f"Vertrag endet am {contract.end_date.strftime('%d.%m.%Y')}",
+            'message': f"{contract.contract_number or 'Mietvertrag'} läuft aus.",
+            'link': link('contracts.contract_detail', contract_id=contract.id),
+            'category': 'contract',
+        })
+
+    tenants = db.session.query(Tenant.id, Tenant.first_name, Tenant.last_name, Tenant.move_out_date).filter(
+        Tenant.move_out_date.between(today, horizon),
+    ).all()
+    for tenant in tenants:
+        reminders.append({
+            'kind': 'move_out',
+            'subject_id': tenant.id,
+            'dedup_window': tenant.move_out_date.isoformat(),
+            'title': f"Auszug geplant: {tenant.first_name} {tenant.last_name}",
+            'message': f"Auszug am {tenant.move_out_date.strftime('%d.%m.%Y')} prüfen.",
+            'link': link('tenants.tenant_detail', tenant_id=tenant.id),
+            'category': 'tenant',
+        })
+
+    return reminders
+
+
+def store_notifications(rows):
+    """Speichert Benachrichtigungen in einem Sammel-Upsert.
+
+    Bereits vorhandene Schlüssel (Benutzer, Art, Objekt, Fenster) werden
+    übersprungen. Gibt die Anzahl der neu angelegten Zeilen zurück.
+    """
+    if not rows:
+        return 0
+    table = Notification.__table__
+    if db.engine.dialect.name == 'sqlite':
+        statement = sqlite_insert(table).on_conflict_do_nothing(
+            index_elements=['user_id', 'kind', 'subject_id', 'dedup_window']
+        )
+    else:
+        statement = insert(table)
+    result = db.session.connection().execute(statement, rows)
+    return max(result.rowcount or 0, 0)
+
+
+def generate_notifications(today=None):
+    """Job: fällige Erinnerungen berechnen und an alle Empfänger verteilen."""
+    reminders = due_reminders(today)
+    users = recipient_ids()
+    now = datetime.utcnow()
+
+    rows = [
+        dict(reminder, id=str(uuid.uuid4()), user_id=user_id, is_read=False, created_at=now)
+        for reminder in reminders
+        for user_id in users
+    ]
+    created = store_notifications(rows)
+
+    task_ids = [r['subject_id'] for r in reminders if r['kind'] == 'maintenance']
+    for chunk in chunked(task_ids):
+        db.session.execute(
+            update(MaintenanceTask)
+            .where(MaintenanceTask.id.in_(chunk), MaintenanceTask.reminder_sent.isnot(True))
+            .values(reminder_sent=True)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+    if created:
+        print(f"🔔 Notifications: {created} created for {len(users)} users ({len(reminders)} reminders due)")
+    return {'reminders': len(reminders), 'recipients': len(users), 'created': created}
+
+
+def start_notification_scheduler(app):
+    """Startet die Erinnerungsberechnung im Hintergrund (``NOTIFICATION_SCHEDULER_ENABLED``)."""
+    if not app.config.get('NOTIFICATION_SCHEDULER_ENABLED', True) or not jobs_allowed(app):
+        return None
+
+    job = BackgroundJob(
+        app,
+        'notifications',
+        generate_notifications,
+        tick=app.config.get('NOTIFICATION_TICK', DEFAULT_TICK_SECONDS),
+        initial_delay=10,
+    )
+    job.start()
+    app.extensions['notification_scheduler'] = job
+    print("✅ Notification scheduler started")
+    return job
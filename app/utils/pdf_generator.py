@@ -1,28 +1,30 @@
-from xhtml2pdf import pisa
 from flask import current_app
 from datetime import datetime
 import os
 import json
 
+from app.utils.contract_render import contract_variables, render_paragraph_tree
+from app.utils.export_writers import html_to_pdf
+
 
 def generate_pdf_from_html(html_content: str, output_path: str) -> bool:
     """
-    Generiert ein PDF aus HTML-Inhalt mit xhtml2pdf.
+    Generiert ein PDF aus HTML-Inhalt mit xhtml2pdf (im Exportprozess).
 
     :param html_content: Vollständiger HTML-String
     :param output_path: Zielpfad für die PDF-Datei
     :return: True bei Erfolg, False bei Fehler
     """
     try:
+        data = html_to_pdf(html_content)
+        if data is None:
+            return False
+
         # Zielverzeichnis sicherstellen
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-        with open(output_path, "w+b") as output_file:
-            pdf = pisa.CreatePDF(html_content, dest=output_file)
-
-        if pdf.err:
-            current_app.logger.error(f"PDF Generation Error: {pdf.err}")
-            return False
+        with open(output_path, "wb") as output_file:
+            output_file.write(data)
 
         return True
 
@@ -125,23 +127,6 @@ def generate_professional_contract_html(contract, clauses=None, paragraph_tree=N
 
     contract_number = getattr(contract, "contract_number", "") or ""
 
-    # ---------- Unterklauseln rendern ----------
-    def render_children(children, prefix: str) -> str:
-        html_parts = []
-        for idx, child in enumerate(children or [], start=1):
-            num = f"{prefix}.{idx}"
-            title = child.get("title") or ""
-            content = child.get("content") or ""
-            html_parts.append(f"""
-    <div class="subclause">
-        <div class="subclause-title">§ {num} {title}</div>
-        <div class="clause-body">{content}</div>
-    </div>
-""")
-            if child.get("children"):
-                html_parts.append(render_children(child["children"], num))
-        return "".join(html_parts)
-
     # ---------- HTML + CSS (sauber escapte f-String-Variante) ----------
     html = f"""<!DOCTYPE html>
 <html>
@@ -269,22 +254,8 @@ def generate_professional_contract_html(contract, clauses=None, paragraph_tree=N
 <pdf:pagebreak/>
 """
 
-    # ---------- Paragraphen aus dem Tree ----------
-    parts = [html]
-    for idx, node in enumerate(paragraph_tree or [], start=1):
-        number = node.get("number") or str(idx)
-        title = node.get("title") or ""
-        content = node.get("content") or ""
-
-        parts.append(f"""
-<div class="clause">
-    <div class="clause-title">§ {number} {title}</div>
-    <div class="clause-body">{content}</div>
-</div>
-""")
-
-        if node.get("children"):
-            parts.append(render_children(node["children"], str(number)))
+    # ---------- Paragraphen aus dem Tree (abschnittsweise gecacht) ----------
+    parts = [html, render_paragraph_tree(paragraph_tree, contract_variables(contract))]
 
     # ---------- Unterschriftenblock ----------
     parts.append(f"""
@@ -0,0 +1,201 @@
+import hashlib
+import html as html_lib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, render_template
+from sqlalchemy import bindparam, update
+
+from app.extensions import db
+from app.models import Protocol
+from app.utils.pdf_generator import generate_pdf_from_html
+from app.utils.storage import store_upload, upload_session
+from app.utils.thumbnails import photo_file, schedule_derivatives
+
+DEFAULT_UPLOAD_WORKERS = 4
+BACKFILL_BATCH_SIZE = 500
+# Fotos im Druck-HTML: <img src="URL" data-photo="gespeicherter Pfad" ...>
+PHOTO_TAG = re.compile(r'<img src="[^"]*" data-photo="([^"]*)"([^>]*)>')
+
+# Feste Anzahl Sperren statt einer je PDF-Datei: Pfade mit gleichem Hash
+# teilen sich eine Sperre, der Speicherbedarf wächst nicht mit den Protokollen
+PDF_LOCK_STRIPES = 64
+_pdf_locks = [threading.Lock() for _ in range(PDF_LOCK_STRIPES)]
+
+
+def _store(app, file_storage, session):
+    # Eigener App-Kontext je Thread; der Schutz bis zum Commit gilt der Session des Requests
+    with app.app_context():
+        return store_upload(file_storage, session=session).path
+
+
+def store_protocol_uploads(meter_photos, attachments):
+    """Speichert Zählerfotos und Anhänge parallel.
+
+    ``meter_photos`` ist ``{meter_id: FileStorage}``, ``attachments`` eine
+    Liste. Leere Felder werden übersprungen. Gibt ``({meter_id: pfad},
+    [pfad, ...])`` zurück; für Fotos werden die Vorschaubilder eingeplant.
+    """
+    photos = [(str(meter_id), file) for meter_id, file in meter_photos.items() if file and file.filename]
+    files = [file for file in attachments if file and file.filename]
+    jobs = [file for _, file in photos] + files
+    if not jobs:
+        return {}, []
+
+    app = current_app._get_current_object()
+    workers = min(app.config.get('PROTOCOL_UPLOAD_WORKERS', DEFAULT_UPLOAD_WORKERS), len(jobs))
+    if workers > 1:
+        # Hashen und Kopieren geben den GIL frei; Uploads laufen so nebeneinander
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='protocol-upload') as executor:
+            session = upload_session()
+            paths = list(executor.map(lambda file: _store(app, file, session), jobs))
+    else:
+        paths = [store_upload(file).path for file in jobs]
+
+    photo_paths = {meter_id: path for (meter_id, _), path in zip(photos, paths)}
+    for path in photo_paths.values():
+        schedule_derivatives(path, 'protocols')
+    return photo_paths, paths[len(photos):]
+
+
+def parse_protocol_data(protocol):
+    """``protocol_data`` einmal parsen und Listen/Zuordnungen absichern."""
+    return _parse(protocol.protocol_data)
+
+
+def _parse(raw):
+    try:
+        data = json.loads(raw) if raw else {}
+    except (TypeError, ValueError):
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    for key in ('keys', 'meter_entries', 'attachments', 'inventory'):
+        if not isinstance(data.get(key), list):
+            data[key] = []
+    if not isinstance(data.get('meter_photos'), dict):
+        data['meter_photos'] = {}
+    if not data.get('key_count') and data['keys']:
+        try:
+            data['key_count'] = sum(int(key.get('quantity') or 1) for key in data['keys'])
+        except (TypeError, ValueError):
+            data['key_count'] = len(data['keys'])
+    return data
+
+
+def _int(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def protocol_summary(data):
+    """Kennzahlen eines Protokolls für die Spalten an ``protocols``."""
+    return {
+        'key_count': _int(data.get('key_count')),
+        'inventory_count': len(data['inventory']),
+        'meter_count': sum(1 for entry in data['meter_entries'] if entry.get('reading_value') is not None),
+        'has_damages': bool((data.get('damages') or '').strip())
+        or any((item.get('damages') or '').strip() for item in data['inventory'] if isinstance(item, dict)),
+        'notes': data.get('notes') or None,
+    }
+
+
+def apply_protocol_summary(protocol):
+    """Übernimmt die Kennzahlen aus ``protocol_data``; bei jedem Speichern aufrufen."""
+    for column, value in protocol_summary(parse_protocol_data(protocol)).items():
+        setattr(protocol, column, value)
+
+
+def backfill_protocol_summaries():
+    """Setzt die Kennzahlen für Protokolle, die vor Einführung der Spalten gespeichert wurden."""
+    table = Protocol.__table__
+    total = 0
+    while True:
+        rows = db.session.query(Protocol.id, Protocol.protocol_data).filter(
+            Protocol.key_count.is_(None)
+        ).limit(BACKFILL_BATCH_SIZE).all()
+        if not rows:
+            break
+        values = []
+        for protocol_id, raw in rows:
+            summary = protocol_summary(_parse(raw))
+            values.append(dict({'new_' + key: value for key, value in summary.items()}, row_id=protocol_id))
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('row_id')).values(
+                **{key: bindparam('new_' + key) for key in ('key_count', 'inventory_count', 'meter_count', 'has_damages', 'notes')}
+            ),
+            values,
+        )
+        db.session.commit()
+        total += len(values)
+    if total:
+        print(f"✅ Protocol summaries backfilled for {total} protocols")
+
+
+def render_protocol_document(protocol, contract, data):
+    """Druck-HTML eines Protokolls; wird als ``final_content`` gespeichert."""
+    return render_template(
+        'protocols/protocol_document.html',
+        protocol=protocol,
+        contract=contract,
+        protocol_data=data,
+        meter_entries=data.get('meter_entries', []),
+        keys=data.get('keys', []),
+        inventory_entries=data.get('inventory', []),
+    )
+
+
+def _embed_photo(match):
+    path = photo_file(html_lib.unescape(match.group(1)), 'protocols', 'print')
+    if path is None:
+        return 'Foto hinterlegt'
+    return f'<img src="{html_lib.escape(path)}"{match.group(2)}>'
+
+
+def embed_protocol_photos(html):
+    """Ersetzt die Foto-URLs des Druck-HTML für xhtml2pdf durch lokale Dateien.
+
+    Genommen wird die Druckvariante, falls sie schon existiert, sonst das
+    Original. ``final_content`` selbst enthält nur URLs, damit der Hash des
+    PDF-Caches nicht von Serverpfaden abhängt.
+    """
+    return PHOTO_TAG.sub(_embed_photo, html)
+
+
+def _pdf_lock(path):
+    digest = hashlib.sha1(path.encode('utf-8')).digest()
+    return _pdf_locks[int.from_bytes(digest[:4], 'big') % PDF_LOCK_STRIPES]
+
+
+def protocol_pdf_path(protocol, html):
+    """PDF zum aktuellen Stand des Protokolls; wird je Stand nur einmal erzeugt.
+
+    Der Dateiname enthält einen Hash des Druck-HTML. Solange sich das
+    Protokoll nicht ändert, wird die vorhandene Datei ausgeliefert. Gibt den
+    absoluten Pfad zurück oder ``None``, wenn die Erzeugung fehlschlägt.
+    """
+    version = hashlib.sha1(html.encode('utf-8')).hexdigest()[:12]
+    filename = f"protocol_{protocol.id[:8]}_{version}.pdf"
+    upload_root = current_app.config.get('UPLOAD_FOLDER') or os.path.abspath('uploads')
+    path = os.path.join(upload_root, 'protocols', filename)
+
+    with _pdf_lock(path):
+        if not os.path.exists(path):
+            partial = f'{path}.{os.getpid()}.part'
+            if not generate_pdf_from_html(embed_protocol_photos(html), partial):
+                return None
+            os.replace(partial, path)
+            previous = protocol.pdf_path
+            if previous and previous != filename and previous.startswith(f"protocol_{protocol.id[:8]}_"):
+                # Vorige Version dieses Protokolls wird nicht mehr gebraucht
+                try:
+                    os.remove(os.path.join(upload_root, 'protocols', previous))
+                except OSError:
+                    pass
+    protocol.pdf_path = filename
+    return path
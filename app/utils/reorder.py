@@ -0,0 +1,115 @@
+from bisect import bisect_left
+
+from sqlalchemy import bindparam, func, update
+
+from app.extensions import db
+from app.utils.audit import record_bulk_audit
+
+# Abstand neuer Sortierschlüssel; Verschieben belegt meist nur eine Lücke
+SORT_GAP = 1024
+
+
+def next_sort_order(model, **scope):
+    """Sortierschlüssel hinter dem letzten Eintrag eines Bereichs (z. B. eines Vertrags)."""
+    current = db.session.query(func.max(model.sort_order)).filter_by(**scope).scalar()
+    return SORT_GAP if current is None else current + SORT_GAP
+
+
+def _stable_positions(keys):
+    """Positionen einer längsten streng steigenden Teilfolge; diese Zeilen bleiben unverändert."""
+    tails, tail_positions, previous = [], [], [None] * len(keys)
+    for position, key in enumerate(keys):
+        if key is None:
+            continue
+        index = bisect_left(tails, key)
+        if index == len(tails):
+            tails.append(key)
+            tail_positions.append(position)
+        else:
+            tails[index] = key
+            tail_positions[index] = position
+        previous[position] = tail_positions[index - 1] if index else None
+    stable = set()
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        stable.add(position)
+        position = previous[position]
+    return stable
+
+
+def plan_sort_keys(keys, gap=SORT_GAP):
+    """Neue Schlüssel für Einträge in Zielreihenfolge (``keys`` = bisherige Schlüssel).
+
+    Einträge, die schon richtig zueinander stehen, behalten ihren Schlüssel;
+    die übrigen bekommen Werte aus der Lücke zwischen ihren Nachbarn. Nur
+    wenn keine Lücke mehr frei ist, wird alles im Abstand ``gap`` neu vergeben.
+    """
+    stable = _stable_positions(keys)
+    planned = list(keys)
+    position = 0
+    while position < len(keys):
+        if position in stable:
+            position += 1
+            continue
+        end = position
+        while end < len(keys) and end not in stable:
+            end += 1
+        count = end - position
+        lower = planned[position - 1] if position else None
+        upper = keys[end] if end < len(keys) else None
+        if lower is None and upper is None:
+            start, step = gap, gap
+        elif upper is None:
+            start, step = lower + gap, gap
+        elif lower is None:
+            start, step = upper - count * gap, gap
+        else:
+            step = (upper - lower) // (count + 1)
+            if step < 1:
+                return [(index + 1) * gap for index in range(len(keys))]
+            start = lower + step
+        for offset in range(count):
+            planned[position + offset] = start + offset * step
+        position = end
+    return planned
+
+
+def apply_order(model, ordered_ids, scope_column, scope_value):
+    """Sortiert Zeilen eines Bereichs in die übergebene Reihenfolge.
+
+    Liest die bisherigen Schlüssel mit einer Abfrage, schreibt nur geänderte
+    Zeilen mit einem Sammel-Update und legt einen zusammenfassenden
+    Revisionseintrag an. Gibt ``{id: (alt, neu)}`` der geänderten Zeilen zurück.
+
+    Geplant wird über alle Zeilen des Bereichs: Bei einer Teilliste tauschen
+    die übergebenen Zeilen nur die Plätze, die sie bisher belegt haben, die
+    übrigen bleiben stehen. So kann kein neuer Schlüssel mit einer nicht
+    übergebenen Zeile zusammenfallen.
+    """
+    current = dict(
+        db.session.query(model.id, model.sort_order).filter(getattr(model, scope_column) == scope_value)
+    )
+    submitted = [row_id for row_id in dict.fromkeys(str(row_id) for row_id in ordered_ids) if row_id in current]
+    submitted_set = set(submitted)
+    ids = sorted(current, key=lambda row_id: (current[row_id] is None, current[row_id] or 0, row_id))
+    slots = [position for position, row_id in enumerate(ids) if row_id in submitted_set]
+    for position, row_id in zip(slots, submitted):
+        ids[position] = row_id
+    planned = plan_sort_keys([current[row_id] for row_id in ids])
+    changes = {
+        row_id: (current[row_id], key) for row_id, key in zip(ids, planned) if current[row_id] != key
+    }
+    if not changes:
+        return changes
+
+    table = model.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('row_id')).values(sort_order=bindparam('new_key')),
+        [{'row_id': row_id, 'new_key': new} for row_id, (_, new) in changes.items()],
+    )
+    record_bulk_audit(table.name, scope_value, 'reorder', {
+        scope_column: scope_value,
+        'order': ids,
+        'sort_order': {row_id: {'old': old, 'new': new} for row_id, (old, new) in changes.items()},
+    })
+    return changes
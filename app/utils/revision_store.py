@@ -0,0 +1,308 @@
+import difflib
+import json
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+
+from sqlalchemy import func, or_
+
+from app.extensions import db
+from app.models import ContractRevision, ProtocolRevision
+from app.utils.audit import record_bulk_audit
+
+# Spätestens jede n-te Revision eines Dokuments ist ein vollständiger
+# Schnappschuss; so bleibt die Kette beim Rekonstruieren kurz.
+SNAPSHOT_INTERVAL = 10
+CACHE_SIZE = 256
+
+# Revisionstabelle -> Spalte des Dokuments
+DOCUMENT_COLUMNS = {
+    ContractRevision: 'contract_id',
+    ProtocolRevision: 'protocol_id',
+}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# --- Kodierung ----------------------------------------------------------------
+
+def _line_delta(base, target):
+    """Zeilen-Delta: ``[a, b]`` übernimmt Zeilen a..b der Basis, Text wird eingefügt."""
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(target_lines[j1:j2]))
+    return ops
+
+
+def _json_text(value):
+    # Vergleich über die JSON-Form: in Python gilt 1 == True == 1.0
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _json_delta(base, target):
+    """Delta zweier JSON-Objekte auf oberster Ebene; ``None``, wenn keine Objekte."""
+    try:
+        old, new = json.loads(base), json.loads(target)
+    except ValueError:
+        return None
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None
+    if json.dumps(new, ensure_ascii=False) != target:
+        # Formatierung ließe sich nicht exakt wiederherstellen
+        return None
+    return {
+        'set': {key: value for key, value in new.items() if key not in old or _json_text(old[key]) != _json_text(value)},
+        'del': [key for key in old if key not in new],
+        'order': list(new),
+    }
+
+
+def _encode(text, base):
+    """Kleinste Darstellung von ``text`` relativ zu ``base``."""
+    if text is None:
+        return None
+    if base is None:
+        return {'t': text}
+    if text == base:
+        return {'s': 1}
+    candidates = [{'d': _line_delta(base, text)}]
+    delta = _json_delta(base, text)
+    if delta is not None:
+        candidates.append({'j': delta})
+    # Nur Deltas, die den Text exakt wiederherstellen; Klartext geht immer
+    candidates = [candidate for candidate in candidates if _decode(candidate, base) == text]
+    candidates.append({'t': text})
+    return min(candidates, key=lambda value: len(json.dumps(value, ensure_ascii=False)))
+
+
+def _decode(value, base):
+    if value is None:
+        return None
+    if 's' in value:
+        return base
+    if 't' in value:
+        return value['t']
+    if 'j' in value:
+        data = json.loads(base)
+        data.update(value['j']['set'])
+        for key in value['j']['del']:
+            data.pop(key, None)
+        return json.dumps({key: data[key] for key in value['j']['order']}, ensure_ascii=False)
+    base_lines = base.splitlines(keepends=True)
+    return ''.join(''.join(base_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in value['d'])
+
+
+def _pack(data):
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def _unpack(payload):
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+def encode_revision(old_data, new_data, base_new_data=None, snapshot=False):
+    """Gibt ``(storage, payload)`` zurück.
+
+    Ein Schnappschuss ist eigenständig (``old_data`` relativ zu ``new_data``);
+    ein Delta bezieht beide Werte auf ``new_data`` der Basisrevision. Ist das
+    Delta nicht kleiner als der Schnappschuss, wird der Schnappschuss genommen.
+    """
+    full = _pack({'new': _encode(new_data, None), 'old': _encode(old_data, new_data)})
+    if snapshot:
+        return 'full', full
+    delta = _pack({'new': _encode(new_data, base_new_data), 'old': _encode(old_data, base_new_data)})
+    return ('delta', delta) if len(delta) < len(full) else ('full', full)
+
+
+def _decode_row(row, base_new_data):
+    if row.storage is None:
+        return row.old_data, row.new_data
+    data = _unpack(row.payload)
+    if row.storage == 'full':
+        new_data = _decode(data['new'], None)
+        return _decode(data['old'], new_data), new_data
+    return _decode(data['old'], base_new_data), _decode(data['new'], base_new_data)
+
+
+# --- Cache --------------------------------------------------------------------------
+
+def _cached(revision_id):
+    with _cache_lock:
+        value = _cache.get(revision_id)
+        if value is not None:
+            _cache.move_to_end(revision_id)
+        return value
+
+
+def _remember(revision_id, value):
+    with _cache_lock:
+        _cache[revision_id] = value
+        _cache.move_to_end(revision_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+# --- Lesen ----------------------------------------------------------------------------
+
+def _document_column(model):
+    return getattr(model, DOCUMENT_COLUMNS[model])
+
+
+def _chain_rows(model, document_id, revision_number):
+    """Revisionen ab dem letzten Schnappschuss bis ``revision_number`` (eine Abfrage)."""
+    column = _document_column(model)
+    snapshot = db.session.query(func.max(model.revision_number)).filter(
+        column == document_id,
+        model.revision_number <= revision_number,
+        or_(model.storage.is_(None), model.storage != 'delta'),
+    ).scalar_subquery()
+    return db.session.query(
+        model.id, model.revision_number, model.storage, model.payload, model.base_id, model.old_data, model.new_data
+    ).filter(
+        column == document_id,
+        model.revision_number >= func.coalesce(snapshot, 0),
+        model.revision_number <= revision_number,
+    ).all()
+
+
+def _resolve(model, rows_by_id, revision_id):
+    """Rekonstruiert ``(old_data, new_data)``; nutzt Cache und bereits geladene Zeilen."""
+    pending = []
+    current = revision_id
+    value = None
+    while current is not None:
+        value = _cached(current)
+        if value is not None:
+            break
+        row = rows_by_id.get(current)
+        if row is None:
+            row = db.session.query(
+                model.id, model.revision_number, model.storage, model.payload, model.base_id,
+                model.old_data, model.new_data,
+            ).filter(model.id == current).one()
+        pending.append(row)
+        current = row.base_id if row.storage == 'delta' else None
+    for row in reversed(pending):
+        value = _decode_row(row, value[1] if value else None)
+        _remember(row.id, value)
+    return value
+
+
+def revision_data(revision):
+    """``(old_data, new_data)`` einer Revision im Klartext, unabhängig vom Speicherformat."""
+    if revision.storage is None:
+        return revision.old_data, revision.new_data
+    cached = _cached(revision.id)
+    if cached is not None:
+        return cached
+    model = type(revision)
+    rows = _chain_rows(model, getattr(revision, DOCUMENT_COLUMNS[model]), revision.revision_number)
+    return _resolve(model, {row.id: row for row in rows}, revision.id)
+
+
+# --- Schreiben ------------------------------------------------------------------------
+
+def _latest(model, document_id):
+    column = _document_column(model)
+    return db.session.query(
+        model.id, model.revision_number, model.storage, model.payload, model.base_id, model.old_data, model.new_data
+    ).filter(column == document_id).order_by(model.revision_number.desc(), model.created_at.desc()).first()
+
+
+def add_revision(model, document_id, changed_by, change_description, old_data=None, new_data=None):
+    """Legt die nächste Revision eines Dokuments komprimiert an (ohne Commit).
+
+    Die Revisionsnummer ergibt sich aus der letzten Revision; deren Inhalt
+    dient als Basis für das Delta.
+    """
+    latest = _latest(model, document_id)
+    if latest is None:
+        storage, payload = encode_revision(old_data, new_data, snapshot=True)
+        base_id, number = None, 1
+    else:
+        rows = _chain_rows(model, document_id, latest.revision_number)
+        _, base_new_data = _resolve(model, {row.id: row for row in rows}, latest.id)
+        # Kette ab dem letzten Schnappschuss ist voll -> neuer Schnappschuss
+        snapshot = len(rows) >= SNAPSHOT_INTERVAL
+        storage, payload = encode_revision(old_data, new_data, base_new_data, snapshot=snapshot)
+        base_id, number = (latest.id if storage == 'delta' else None), latest.revision_number + 1
+
+    revision = model(
+        id=str(uuid.uuid4()),
+        revision_number=number,
+        changed_by=changed_by,
+        change_description=change_description,
+        storage=storage,
+        payload=payload,
+        base_id=base_id,
+    )
+    setattr(revision, DOCUMENT_COLUMNS[model], document_id)
+    db.session.add(revision)
+    _remember(revision.id, (old_data, new_data))
+    return revision
+
+
+# --- Bestand ---------------------------------------------------------------------------
+
+def _size(*values):
+    return sum(len(value.encode('utf-8')) for value in values if value)
+
+
+def compact_revisions(dry_run=True):
+    """Wandelt Klartext-Revisionen in das komprimierte Format um.
+
+    Gibt je Tabelle Anzahl, Klartextgröße und Größe nach Umwandlung zurück.
+    Mit ``dry_run`` wird nur gerechnet; sonst werden die Zeilen umgeschrieben.
+    """
+    report = {}
+    for model, column_name in DOCUMENT_COLUMNS.items():
+        column = getattr(model, column_name)
+        stats = {'revisions': 0, 'converted': 0, 'plain_bytes': 0, 'stored_bytes': 0}
+        rows = db.session.query(
+            model.id, column, model.revision_number, model.storage, model.payload, model.base_id,
+            model.old_data, model.new_data,
+        ).order_by(column, model.revision_number, model.created_at).all()
+
+        updates = []
+        previous_document, previous_id, previous_new, since_snapshot = None, None, None, 0
+        for row in rows:
+            if row[1] != previous_document:
+                previous_document, previous_id, previous_new, since_snapshot = row[1], None, None, 0
+            old_data, new_data = _decode_row(row, previous_new) if row.storage != 'delta' or row.base_id == previous_id \
+                else _resolve(model, {}, row.id)
+            stats['revisions'] += 1
+            stats['plain_bytes'] += _size(old_data, new_data)
+            if row.storage is None:
+                storage, payload = encode_revision(
+                    old_data, new_data, previous_new, snapshot=previous_id is None or since_snapshot >= SNAPSHOT_INTERVAL - 1
+                )
+                base_id = previous_id if storage == 'delta' else None
+                updates.append({'row_id': row.id, 'storage': storage, 'payload': payload, 'base_id': base_id})
+                stats['converted'] += 1
+            else:
+                storage, payload = row.storage, row.payload
+            stats['stored_bytes'] += len(payload)
+            since_snapshot = 0 if storage == 'full' else since_snapshot + 1
+            previous_id, previous_new = row.id, new_data
+
+        if updates and not dry_run:
+            record_bulk_audit(model.__tablename__, None, 'compact', {'converted': len(updates)})
+            for values in updates:
+                db.session.query(model).filter(model.id == values['row_id']).update({
+                    'storage': values['storage'], 'payload': values['payload'], 'base_id': values['base_id'],
+                    'old_data': None, 'new_data': None,
+                }, synchronize_session=False)
+        stats['saved_percent'] = round(100 - 100 * stats['stored_bytes'] / stats['plain_bytes'], 1) \
+            if stats['plain_bytes'] else 0.0
+        report[model.__tablename__] = stats
+    if not dry_run:
+        db.session.commit()
+    return report
@@ -0,0 +1,119 @@
+import gzip
+import time
+import urllib.error
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+USER_AGENT = 'MietAssistent/2.0 (+http://localhost:5000)'
+DEFAULT_TIMEOUT = 10
+DEFAULT_WORKERS = 8
+MAX_FEED_BYTES = 5 * 1024 * 1024
+
+
+def _read_body(response, deadline):
+    """Liest den Antwort-Body blockweise und bricht nach Ablauf der Frist ab."""
+    chunks = []
+    size = 0
+    while True:
+        if time.monotonic() > deadline:
+            raise TimeoutError('Zeitlimit beim Lesen des Feeds überschritten')
+        chunk = response.read(64 * 1024)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_FEED_BYTES:
+            raise ValueError('Feed ist größer als erlaubt')
+        chunks.append(chunk)
+    body = b''.join(chunks)
+
+    encoding = (response.headers.get('Content-Encoding') or '').lower()
+    if encoding == 'gzip':
+        body = gzip.decompress(body)
+    elif encoding == 'deflate':
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+def fetch_feed_conditional(url, etag=None, modified=None, timeout=DEFAULT_TIMEOUT):
+    """Ruft einen Feed per Conditional GET ab.
+
+    Gibt ein Dict mit ``status`` (HTTP-Status, 0 bei Netzwerkfehlern),
+    ``feed`` (geparster Feed oder ``None`` bei 304/Fehler), ``etag``,
+    ``modified``, ``elapsed_ms`` und ``error`` zurück. Bei 304 wird nicht
+    geparst; ``etag``/``modified`` bleiben dann unverändert.
+    """
+    import feedparser
+
+    started = time.monotonic()
+    deadline = started + timeout
+    result = {
+        'status': 0,
+        'feed': None,
+        'etag': etag,
+        'modified': modified,
+        'elapsed_ms': 0,
+        'error': None,
+    }
+
+    headers = {
+        'User-Agent': USER_AGENT,
+        'Accept': 'application/rss+xml, application/atom+xml, application/xml;q=0.9, */*;q=0.8',
+        'Accept-Encoding': 'gzip, deflate',
+    }
+    if etag:
+        headers['If-None-Match'] = etag
+    if modified:
+        headers['If-Modified-Since'] = modified
+
+    try:
+        request = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = _read_body(response, deadline)
+            result['status'] = response.status
+            result['etag'] = response.headers.get('ETag') or etag
+            result['modified'] = response.headers.get('Last-Modified') or modified
+            result['feed'] = feedparser.parse(body, response_headers={
+                'content-location': response.geturl(),
+                'content-type': response.headers.get('Content-Type', ''),
+            })
+            if result['feed'].bozo and not result['feed'].entries:
+                result['error'] = str(result['feed'].bozo_exception)
+    except urllib.error.HTTPError as exc:
+        result['status'] = exc.code
+        if exc.code != 304:
+            result['error'] = f'HTTP {exc.code}: {exc.reason}'
+    except Exception as exc:
+        result['error'] = str(exc) or exc.__class__.__name__
+
+    result['elapsed_ms'] = int((time.monotonic() - started) * 1000)
+    return result
+
+
+def fetch_feeds_concurrently(specs, timeout=DEFAULT_TIMEOUT, max_workers=DEFAULT_WORKERS):
+    """Ruft mehrere Feeds parallel ab.
+
+    ``specs`` ist eine Liste von Dicts mit ``id``, ``url`` und optional
+    ``etag``/``modified``. Es werden bewusst keine ORM-Objekte an die Threads
+    übergeben; die Ergebnisse werden als ``{feed_id: result}`` zurückgegeben
+    und im aufrufenden Thread gespeichert.
+    """
+    if not specs:
+        return {}
+
+    workers = max(1, min(max_workers, len(specs)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rss-fetch') as executor:
+        futures = {
+            spec['id']: executor.submit(
+                fetch_feed_conditional,
+                spec['url'],
+                spec.get('etag'),
+                spec.get('modified'),
+                timeout,
+            )
+            for spec in specs
+        }
+        return {feed_id: future.result() for feed_id, future in futures.items()}
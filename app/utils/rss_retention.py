@@ -0,0 +1,225 @@
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, insert, or_, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+
+from app.extensions import db
+from app.models import RevisionLog, RSSFeed, RSSItem, RSSItemTombstone
+from app.utils.bulk_import import chunked
+from app.utils.schema_helpers import RSS_SEARCH_TABLE, fts_enabled
+
+DEFAULT_RETENTION_DAYS = 180
+DEFAULT_MAX_ITEMS = 1000
+DEFAULT_BATCH_SIZE = 500
+# Beschreibungen gelesener Einträge werden erst nach dieser Zeit komprimiert
+COMPRESS_AFTER_DAYS = 30
+COMPRESS_MIN_BYTES = 512
+# Ohne inkrementelles Auto-Vacuum wird ab diesem freien Platz ein VACUUM ausgeführt
+VACUUM_THRESHOLD_BYTES = 8 * 1024 * 1024
+
+
+def _config(key, default):
+    value = current_app.config.get(key)
+    return default if value is None else value
+
+
+def _deletable_items(feed):
+    """Gelesene, nicht markierte Einträge eines Feeds."""
+    return db.session.query(RSSItem.id).filter(
+        RSSItem.feed_id == feed.id,
+        RSSItem.is_read == True,
+        or_(RSSItem.is_starred == False, RSSItem.is_starred.is_(None)),
+    )
+
+
+def retention_cutoff(feed, now):
+    """Einträge, die vor diesem Zeitpunkt veröffentlicht wurden, werden nicht aufbewahrt."""
+    retention_days = feed.retention_days or _config('RSS_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    return now - timedelta(days=retention_days)
+
+
+def expired_item_ids(feed, now):
+    """IDs der Einträge, die die Aufbewahrungsregel des Feeds überschritten haben.
+
+    Gelöscht werden nur gelesene, nicht markierte Einträge, die älter als
+    ``retention_days`` sind oder nicht zu den neuesten ``max_items`` gehören.
+    """
+    max_items = feed.max_items or _config('RSS_MAX_ITEMS_PER_FEED', DEFAULT_MAX_ITEMS)
+
+    cutoff = retention_cutoff(feed, now)
+    ids = {row.id for row in _deletable_items(feed).filter(RSSItem.published_date < cutoff)}
+
+    if max_items:
+        newest = select(RSSItem.id).where(RSSItem.feed_id == feed.id).order_by(
+            RSSItem.published_date.desc()
+        ).limit(max_items)
+        ids.update(row.id for row in _deletable_items(feed).filter(RSSItem.id.notin_(newest)))
+    return ids
+
+
+def _add_tombstones(chunk, published_after):
+    rows = [
+        {'guid': row.guid, 'feed_id': row.feed_id, 'published_date': row.published_date, 'deleted_at': datetime.utcnow()}
+        for row in db.session.query(RSSItem.guid, RSSItem.feed_id, RSSItem.published_date).filter(
+            RSSItem.id.in_(chunk),
+            RSSItem.guid.isnot(None),
+            RSSItem.published_date >= published_after,
+        )
+    ]
+    if not rows:
+        return
+    if db.engine.dialect.name == 'sqlite':
+        statement = sqlite_insert(RSSItemTombstone).on_conflict_do_nothing(index_elements=['guid'])
+    else:
+        statement = insert(RSSItemTombstone)
+    db.session.execute(statement, rows)
+
+
+def delete_items(ids, batch_size=DEFAULT_BATCH_SIZE, tombstone_after=None):
+    """Löscht Einträge samt ihren Revisionseinträgen blockweise.
+
+    Jeder Block wird einzeln committet, damit die SQLite-Schreibsperre nicht
+    für die gesamte Bereinigung gehalten wird. Für Einträge, die nach
+    ``tombstone_after`` veröffentlicht wurden, bleibt die GUID als Tombstone
+    erhalten; ältere Einträge verwirft bereits der Import.
+    """
+    deleted = logs_deleted = 0
+    for chunk in chunked(ids, batch_size):
+        if tombstone_after is not None:
+            _add_tombstones(chunk, tombstone_after)
+        deleted += db.session.execute(
+            delete(RSSItem).where(RSSItem.id.in_(chunk)).execution_options(synchronize_session=False)
+        ).rowcount
+        logs_deleted += db.session.execute(
+            delete(RevisionLog).where(
+                RevisionLog.table_name == 'rss_items',
+                RevisionLog.record_id.in_(chunk),
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+    return deleted, logs_deleted
+
+
+def compress_descriptions(now, batch_size=DEFAULT_BATCH_SIZE):
+    """Komprimiert lange Beschreibungen älterer, gelesener Einträge (zlib).
+
+    Komprimierte Beschreibungen sind danach nur noch über Titel und Kategorien
+    durchsuchbar. Gibt ``(anzahl, gesparte_bytes)`` zurück.
+    """
+    cutoff = now - timedelta(days=_config('RSS_COMPRESS_AFTER_DAYS', COMPRESS_AFTER_DAYS))
+    compressed = saved = 0
+    last_id = ''
+    while True:
+        rows = db.session.query(RSSItem.id, RSSItem.description).filter(
+            RSSItem.id > last_id,
+            RSSItem.is_read == True,
+            RSSItem.published_date < cutoff,
+            RSSItem.description.isnot(None),
+            db.func.length(RSSItem.description) >= COMPRESS_MIN_BYTES,
+        ).order_by(RSSItem.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for item_id, description in rows:
+            raw = description.encode('utf-8')
+            blob = zlib.compress(raw, 9)
+            if len(blob) < len(raw):
+                updates.append({'id': item_id, 'description': None, 'description_z': blob})
+                saved += len(raw) - len(blob)
+        if updates:
+            db.session.execute(update(RSSItem), updates)
+            db.session.commit()
+            compressed += len(updates)
+    return compressed, saved
+
+
+def _pragma(conn, name):
+    return conn.execute(text(f'PRAGMA {name}')).scalar() or 0
+
+
+def reclaim_space():
+    """Gibt freie Seiten der SQLite-Datei an das Dateisystem zurück.
+
+    Bei ``auto_vacuum=INCREMENTAL`` genügt ``incremental_vacuum``. Andernfalls
+    wird ab ``RSS_VACUUM_THRESHOLD_BYTES`` einmalig auf inkrementell umgestellt
+    und ein vollständiges ``VACUUM`` ausgeführt.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return None, 0
+
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        page_size = _pragma(conn, 'page_size')
+        free_before = _pragma(conn, 'freelist_count')
+        mode = None
+        if _pragma(conn, 'auto_vacuum') == 2:
+            if free_before:
+                conn.execute(text('PRAGMA incremental_vacuum'))
+                mode = 'incremental'
+        elif free_before * page_size >= _config('RSS_VACUUM_THRESHOLD_BYTES', VACUUM_THRESHOLD_BYTES):
+            try:
+                conn.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
+                conn.execute(text('VACUUM'))
+                mode = 'full'
+            except OperationalError as e:
+                # Andere Verbindungen halten die Datenbank; beim nächsten Lauf erneut
+                print(f"⚠️  VACUUM skipped: {e}")
+        free_after = _pragma(conn, 'freelist_count')
+    return mode, max(free_before - free_after, 0) * page_size
+
+
+def compact_rss_items(batch_size=DEFAULT_BATCH_SIZE):
+    """Wendet die Aufbewahrungsregeln aller Feeds an und verdichtet die Datenbank.
+
+    Gibt Kennzahlen zu gelöschten und komprimierten Einträgen sowie zum
+    freigegebenen Speicherplatz zurück.
+    """
+    started = time.monotonic()
+    now = datetime.utcnow()
+    metrics = {
+        'deleted_items': 0,
+        'deleted_revision_logs': 0,
+        'pruned_tombstones': 0,
+        'compressed_items': 0,
+        'compressed_bytes_saved': 0,
+        'vacuum': None,
+        'reclaimed_bytes': 0,
+    }
+
+    for feed in RSSFeed.query.all():
+        cutoff = retention_cutoff(feed, now)
+        ids = expired_item_ids(feed, now)
+        if ids:
+            deleted, logs_deleted = delete_items(ids, batch_size, tombstone_after=cutoff)
+            metrics['deleted_items'] += deleted
+            metrics['deleted_revision_logs'] += logs_deleted
+        # Ältere GUIDs filtert der Import über das Veröffentlichungsdatum
+        metrics['pruned_tombstones'] += db.session.execute(
+            delete(RSSItemTombstone).where(
+                RSSItemTombstone.feed_id == feed.id,
+                RSSItemTombstone.published_date < cutoff,
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+    db.session.commit()
+
+    if _config('RSS_COMPRESS_DESCRIPTIONS', False):
+        metrics['compressed_items'], metrics['compressed_bytes_saved'] = compress_descriptions(now, batch_size)
+
+    if (metrics['deleted_items'] or metrics['compressed_items']) and fts_enabled('RSS_SEARCH_FTS', RSS_SEARCH_TABLE):
+        db.session.execute(text(f"INSERT INTO {RSS_SEARCH_TABLE}({RSS_SEARCH_TABLE}) VALUES ('optimize')"))
+        db.session.commit()
+
+    metrics['vacuum'], metrics['reclaimed_bytes'] = reclaim_space()
+    metrics['duration_ms'] = int((time.monotonic() - started) * 1000)
+    print(
+        f"🧹 RSS compaction: {metrics['deleted_items']} items deleted, "
+        f"{metrics['compressed_items']} compressed, {metrics['reclaimed_bytes']} bytes reclaimed "
+        f"({metrics['duration_ms']} ms)"
+    )
+    return metrics
@@ -0,0 +1,172 @@
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import SchedulerLock
+from app.utils.events import broker
+
+DEFAULT_TICK_SECONDS = 60
+# Obergrenze der Sperrdauer während eines Laufs; stirbt der Inhaber,
+# übernimmt spätestens danach ein anderer Worker
+MAX_LOCK_TTL = 900
+
+
+def instance_id():
+    """Kennung dieses Prozesses für die Sperrzeile."""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def acquire_lock(name, owner, ttl_seconds):
+    """Übernimmt oder verlängert die Sperre ``name``.
+
+    Die Sperre gehört dem Prozess, der sie zuletzt erneuert hat, bis sie
+    abläuft. So läuft ein Job auch bei mehreren Gunicorn-Workern nur einmal.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    try:
+        result = db.session.execute(
+            update(SchedulerLock)
+            .where(SchedulerLock.name == name)
+            .where(or_(SchedulerLock.owner == owner, SchedulerLock.expires_at < now))
+            .values(owner=owner, expires_at=expires_at, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            db.session.commit()
+            return True
+        db.session.execute(insert(SchedulerLock), [{
+            'name': name, 'owner': owner, 'expires_at': expires_at, 'updated_at': now,
+        }])
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Zeile existiert und gehört einem anderen, noch aktiven Prozess
+        db.session.rollback()
+        return False
+
+
+def release_lock(name, owner):
+    db.session.execute(
+        update(SchedulerLock)
+        .where(SchedulerLock.name == name, SchedulerLock.owner == owner)
+        .values(expires_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def jobs_allowed(app):
+    """Hintergrundjobs nicht im Testmodus und nicht im Elternprozess des Debug-Reloaders."""
+    if app.testing:
+        return False
+    return not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+
+class BackgroundJob:
+    """Führt ``job()`` periodisch in einem Daemon-Thread aus.
+
+    Vor jedem Lauf wird die Sperrzeile ``name`` geprüft; nur der aktuelle
+    Inhaber arbeitet. Der Abstand zwischen Läufen streut um ``jitter``
+    (Anteil von ``tick``), damit Worker nicht gleichzeitig anfragen.
+
+    Während des Laufs gilt die Sperre höchstens ``MAX_LOCK_TTL`` Sekunden und
+    wird von einem Herzschlag-Thread verlängert. Nach dem Lauf bleibt sie bis
+    zum nächsten fälligen Lauf bestehen, damit andere Worker ihn nicht
+    vorziehen.
+    """
+
+    def __init__(self, app, name, job, tick=DEFAULT_TICK_SECONDS, jitter=0.2, initial_delay=None):
+        self.app = app
+        self.name = name
+        self.job = job
+        self.tick = tick
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self.owner = instance_id()
+        self.lock_ttl = min(max(tick * 3, 300), MAX_LOCK_TTL)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _delay(self):
+        return self.tick * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'job-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self.app.app_context():
+            try:
+                release_lock(self.name, self.owner)
+            except Exception:
+                db.session.rollback()
+
+    def _heartbeat(self, done):
+        # Eigener App-Kontext und damit eigene Session neben dem laufenden Job
+        while not done.wait(self.lock_ttl / 3):
+            with self.app.app_context():
+                try:
+                    acquire_lock(self.name, self.owner, self.lock_ttl)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️  Could not renew lock {self.name}: {e}")
+                finally:
+                    db.session.remove()
+
+    def run_once(self):
+        """Ein Lauf; gibt ``True`` zurück, wenn dieser Prozess Inhaber war.
+
+        Start und Ende werden als ``job``-Ereignis an die SSE-Abonnenten
+        dieses Prozesses gemeldet.
+        """
+        with self.app.app_context():
+            started = time.monotonic()
+            done = threading.Event()
+            try:
+                if not acquire_lock(self.name, self.owner, self.lock_ttl):
+                    return False
+                threading.Thread(
+                    target=self._heartbeat, args=(done,), name=f'lock-{self.name}', daemon=True
+                ).start()
+                broker.publish('job', {'job': self.name, 'status': 'running'})
+                result = self.job()
+                done.set()
+                # Sperre bis zum frühesten nächsten Lauf halten
+                acquire_lock(self.name, self.owner, max(self.lock_ttl, self.tick * (1 - self.jitter)))
+                broker.publish('job', {
+                    'job': self.name,
+                    'status': 'done',
+                    'duration_ms': int((time.monotonic() - started) * 1000),
+                    'result': result,
+                })
+                return True
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Background job {self.name} failed: {e}")
+                broker.publish('job', {'job': self.name, 'status': 'failed', 'error': str(e)})
+                return True
+            finally:
+                done.set()
+                db.session.remove()
+
+    def _run(self):
+        # Erster Lauf verzögert, damit der Start nicht blockiert wird
+        delay = self._delay() if self.initial_delay is None else self.initial_delay
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = self._delay()
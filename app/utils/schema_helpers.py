@@ -1,4 +1,6 @@
+from flask import current_app
 from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
 from app.extensions import db
 
 
@@ -38,3 +40,243 @@ def ensure_user_landlord_flag():
 
         if 'landlord_id' not in existing_columns:
             conn.execute(text("ALTER TABLE users ADD COLUMN landlord_id VARCHAR(36)"))
+
+
+def ensure_rss_feed_columns():
+    """Ergänzt Spalten für Conditional GET, Abrufstatistik und Planung an ``rss_feeds``."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table('rss_feeds'):
+        return
+
+    existing_columns = {col['name'] for col in inspector.get_columns('rss_feeds')}
+    columns = {
+        'etag': 'etag VARCHAR(255)',
+        'modified': 'modified VARCHAR(100)',
+        'last_fetched_at': 'last_fetched_at DATETIME',
+        'last_fetch_status': 'last_fetch_status INTEGER',
+        'last_fetch_ms': 'last_fetch_ms INTEGER',
+        'last_fetch_error': 'last_fetch_error TEXT',
+        'next_fetch_at': 'next_fetch_at DATETIME',
+        'consecutive_failures': 'consecutive_failures INTEGER DEFAULT 0',
+        'retention_days': 'retention_days INTEGER',
+        'max_items': 'max_items INTEGER',
+    }
+    missing = [ddl for name, ddl in columns.items() if name not in existing_columns]
+    if not missing:
+        return
+    with db.engine.begin() as conn:
+        for ddl in missing:
+            conn.execute(text(f"ALTER TABLE rss_feeds ADD COLUMN {ddl}"))
+
+
+def ensure_notification_columns():
+    """Ergänzt Schlüsselspalten, den Deduplizierungsindex und Abfrageindizes an ``notifications``."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table('notifications'):
+        return
+
+    existing_columns = {col['name'] for col in inspector.get_columns('notifications')}
+    columns = {
+        'kind': 'kind VARCHAR(50)',
+        'subject_id': 'subject_id VARCHAR(36)',
+        'dedup_window': 'dedup_window VARCHAR(20)',
+    }
+    with db.engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing_columns:
+                conn.execute(text(f"ALTER TABLE notifications ADD COLUMN {ddl}"))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_dedup "
+            "ON notifications (user_id, kind, subject_id, dedup_window)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_notifications_user_created ON notifications (user_id, created_at)"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notifications_created ON notifications (created_at)"))
+
+
+
+def ensure_document_columns():
+    """Ergänzt Inhalts-Hash und Spalten der Textextraktion an ``documents``."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table('documents'):
+        return
+
+    existing_columns = {col['name'] for col in inspector.get_columns('documents')}
+    columns = {
+        'content_hash': 'content_hash VARCHAR(64)',
+        'extraction_status': 'extraction_status VARCHAR(20)',
+        'extracted_text': 'extracted_text TEXT',
+        'extracted_fields': 'extracted_fields TEXT',
+        'extracted_at': 'extracted_at DATETIME',
+    }
+    with db.engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing_columns:
+                conn.execute(text(f"ALTER TABLE documents ADD COLUMN {ddl}"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)"
+        ))
+
+def ensure_revision_storage_columns():
+    """Spalten der komprimierten Revisionsablage an Vertrags- und Protokollrevisionen."""
+    inspector = inspect(db.engine)
+    columns = {
+        'storage': 'storage VARCHAR(10)',
+        'payload': 'payload BLOB',
+        'base_id': 'base_id VARCHAR(36)',
+    }
+    for table in ('contract_revisions', 'protocol_revisions'):
+        if not inspector.has_table(table):
+            continue
+        existing = {col['name'] for col in inspector.get_columns(table)}
+        missing = [ddl for name, ddl in columns.items() if name not in existing]
+        if not missing:
+            continue
+        with db.engine.begin() as conn:
+            for ddl in missing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+
+def ensure_protocol_summary_columns():
+    """Kennzahl-Spalten und Indizes an ``protocols`` (Werte aus ``protocol_data``)."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table('protocols'):
+        return
+
+    existing_columns = {col['name'] for col in inspector.get_columns('protocols')}
+    columns = {
+        'key_count': 'key_count INTEGER',
+        'inventory_count': 'inventory_count INTEGER',
+        'meter_count': 'meter_count INTEGER',
+        'has_damages': 'has_damages BOOLEAN DEFAULT 0',
+        'notes': 'notes TEXT',
+    }
+    with db.engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing_columns:
+                conn.execute(text(f"ALTER TABLE protocols ADD COLUMN {ddl}"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_protocols_has_damages ON protocols (has_damages)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_protocols_type_date ON protocols (protocol_type, protocol_date)"
+        ))
+
+
+RSS_SEARCH_TABLE = 'rss_items_fts'
+
+
+def ensure_rss_item_search():
+    """Legt Spalten, Indizes und den FTS5-Suchindex für ``rss_items`` an.
+
+    Der Suchindex ist eine External-Content-Tabelle über Titel, Beschreibung und
+    Kategorien und wird per Trigger gepflegt (auch bei Sammel-Inserts). Gibt
+    ``False`` zurück, wenn SQLite ohne FTS5 gebaut wurde; die Suche fällt dann
+    auf ``LIKE`` zurück.
+    """
+    inspector = inspect(db.engine)
+    if not inspector.has_table('rss_items'):
+        return False
+
+    item_columns = {col['name'] for col in inspector.get_columns('rss_items')}
+    with db.engine.begin() as conn:
+        if 'description_z' not in item_columns:
+            conn.execute(text("ALTER TABLE rss_items ADD COLUMN description_z BLOB"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_rss_items_feed_read ON rss_items (feed_id, is_read)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_rss_items_published ON rss_items (published_date)"))
+
+    if inspector.has_table(RSS_SEARCH_TABLE):
+        return True
+
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {RSS_SEARCH_TABLE} USING fts5("
+                "title, description, categories, "
+                "content='rss_items', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS rss_items_fts_insert AFTER INSERT ON rss_items BEGIN "
+                f"INSERT INTO {RSS_SEARCH_TABLE}(rowid, title, description, categories) "
+                "VALUES (new.rowid, new.title, new.description, new.categories); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS rss_items_fts_delete AFTER DELETE ON rss_items BEGIN "
+                f"INSERT INTO {RSS_SEARCH_TABLE}({RSS_SEARCH_TABLE}, rowid, title, description, categories) "
+                "VALUES ('delete', old.rowid, old.title, old.description, old.categories); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS rss_items_fts_update "
+                f"AFTER UPDATE OF title, description, categories ON rss_items BEGIN "
+                f"INSERT INTO {RSS_SEARCH_TABLE}({RSS_SEARCH_TABLE}, rowid, title, description, categories) "
+                "VALUES ('delete', old.rowid, old.title, old.description, old.categories); "
+                f"INSERT INTO {RSS_SEARCH_TABLE}(rowid, title, description, categories) "
+                "VALUES (new.rowid, new.title, new.description, new.categories); END"
+            ))
+            # Bestehende Einträge einmalig indizieren
+            conn.execute(text(f"INSERT INTO {RSS_SEARCH_TABLE}({RSS_SEARCH_TABLE}) VALUES ('rebuild')"))
+        print("✅ RSS full-text index created")
+        return True
+    except OperationalError as e:
+        print(f"⚠️  FTS5 not available, RSS search falls back to LIKE: {e}")
+        return False
+
+
+SEARCH_TABLE = 'search_fts'
+
+
+def fts_enabled(config_key, table):
+    """Ob der FTS5-Index ``table`` vorhanden ist; je App einmal nachgesehen.
+
+    ``flask init-db`` legt den Index an, der Serverstart prüft nichts. Ein
+    gesetzter Konfigurationswert (``SEARCH_FTS``/``RSS_SEARCH_FTS``) hat Vorrang.
+    """
+    config = current_app.config
+    if config_key not in config:
+        config[config_key] = inspect(db.engine).has_table(table)
+    return config[config_key]
+
+
+def ensure_search_index():
+    """Legt den globalen FTS5-Suchindex über ``search_documents`` an.
+
+    Wie beim RSS-Index eine External-Content-Tabelle mit Triggern. Gibt
+    ``False`` zurück, wenn SQLite ohne FTS5 gebaut wurde; die Suche nutzt
+    dann ``LIKE`` auf ``search_documents``.
+    """
+    inspector = inspect(db.engine)
+    if not inspector.has_table('search_documents'):
+        return False
+    if inspector.has_table(SEARCH_TABLE):
+        return True
+
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                "title, body, content='search_documents', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS search_documents_fts_insert AFTER INSERT ON search_documents BEGIN "
+                f"INSERT INTO {SEARCH_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS search_documents_fts_delete AFTER DELETE ON search_documents BEGIN "
+                f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, body) "
+                "VALUES ('delete', old.id, old.title, old.body); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS search_documents_fts_update "
+                f"AFTER UPDATE OF title, body ON search_documents BEGIN "
+                f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, body) "
+                "VALUES ('delete', old.id, old.title, old.body); "
+                f"INSERT INTO {SEARCH_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+            ))
+            conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+        print("✅ Global full-text index created")
+        return True
+    except OperationalError as e:
+        print(f"⚠️  FTS5 not available, global search falls back to LIKE: {e}")
+        return False
@@ -0,0 +1,283 @@
+import json
+import re
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import url_for
+from markupsafe import escape
+from sqlalchemy import delete, event, insert, inspect as sa_inspect, or_, select, text
+
+from app.extensions import db
+from app.models import (
+    Apartment, Building, Contract, Document, Meter, OperatingCost, Protocol, SearchDocument, Tenant,
+)
+from app.utils.schema_helpers import SEARCH_TABLE, fts_enabled
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+REBUILD_BATCH_SIZE = 500
+# Gewichtung für bm25: Titeltreffer zählen mehr als Treffer im Text
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+SearchEntity = namedtuple('SearchEntity', 'model title_fields body_fields endpoint id_arg')
+
+# Indizierte Datensätze: Typ -> Modell, Felder für Titel und Text, Zielseite.
+# Nur eigene Spalten, damit der Flush-Listener keine Relationen nachladen muss.
+SEARCH_ENTITIES = {
+    'tenant': SearchEntity(
+        Tenant, ('first_name', 'last_name'), ('email', 'phone', 'emergency_contact_name'),
+        'tenants.tenant_detail', 'tenant_id',
+    ),
+    'contract': SearchEntity(
+        Contract, ('contract_number',),
+        ('contract_type', 'status', 'rental_purpose', 'rental_unit_description', 'additional_agreements'),
+        'contracts.contract_detail', 'contract_id',
+    ),
+    'apartment': SearchEntity(
+        Apartment, ('apartment_number',), ('floor', 'unit_type', 'status'),
+        'apartments.apartment_detail', 'apartment_id',
+    ),
+    'building': SearchEntity(
+        Building, ('name',), ('street', 'street_number', 'zip_code', 'city', 'notes'),
+        'buildings.building_detail', 'building_id',
+    ),
+    'meter': SearchEntity(
+        Meter, ('meter_number',), ('description', 'manufacturer', 'model', 'location_description', 'notes'),
+        'meters.meter_detail', 'meter_id',
+    ),
+    'document': SearchEntity(
+        Document, ('file_name',), ('description', 'document_type', 'extracted_text'),
+        'documents.download_document', 'document_id',
+    ),
+    'cost': SearchEntity(
+        OperatingCost, ('description',), ('invoice_number', 'vendor_invoice_number', 'system_invoice_number'),
+        'costs.costs_home', None,
+    ),
+    'protocol': SearchEntity(
+        Protocol, ('protocol_type',), ('protocol_data',),
+        'protocols.protocol_detail', 'protocol_id',
+    ),
+}
+_ENTITY_BY_MODEL = {entity.model: entity_type for entity_type, entity in SEARCH_ENTITIES.items()}
+
+# Freitextfelder aus dem JSON der Protokolle
+PROTOCOL_TEXT_KEYS = (
+    'condition_summary', 'meter_notes', 'damages', 'notes', 'room_notes', 'handover_notes', 'follow_up_notes',
+)
+
+
+def _protocol_text(value):
+    try:
+        data = json.loads(value or '{}')
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return ' '.join(str(data[key]) for key in PROTOCOL_TEXT_KEYS if data.get(key))
+
+
+FIELD_FORMATTERS = {'protocol_data': _protocol_text}
+
+
+def _join(get, fields):
+    parts = []
+    for field in fields:
+        value = get(field)
+        if field in FIELD_FORMATTERS:
+            value = FIELD_FORMATTERS[field](value)
+        if value not in (None, ''):
+            parts.append(str(value))
+    return ' '.join(parts)
+
+
+def search_row(entity_type, get, now=None):
+    """Zeile für ``search_documents``; ``get(feld)`` liefert die Spaltenwerte."""
+    entity = SEARCH_ENTITIES[entity_type]
+    return {
+        'entity_type': entity_type,
+        'entity_id': str(get('id')),
+        'title': _join(get, entity.title_fields)[:255],
+        'body': _join(get, entity.body_fields),
+        'updated_at': now or datetime.utcnow(),
+    }
+
+
+def write_rows(connection, rows=(), removed=()):
+    """Ersetzt bzw. entfernt Suchzeilen; ``removed`` enthält ``(typ, id)``-Paare."""
+    keys = {(row['entity_type'], row['entity_id']) for row in rows} | set(removed)
+    by_type = {}
+    for entity_type, entity_id in keys:
+        by_type.setdefault(entity_type, []).append(entity_id)
+    for entity_type, ids in by_type.items():
+        for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+            connection.execute(delete(SearchDocument.__table__).where(
+                SearchDocument.entity_type == entity_type,
+                SearchDocument.entity_id.in_(ids[start:start + REBUILD_BATCH_SIZE]),
+            ))
+    if rows:
+        connection.execute(insert(SearchDocument.__table__), list(rows))
+
+
+def index_rows(model, rows):
+    """Indiziert Zeilen, die per Sammel-Insert am ORM vorbei gespeichert wurden."""
+    entity_type = _ENTITY_BY_MODEL.get(model)
+    if not entity_type or not rows:
+        return
+    now = datetime.utcnow()
+    write_rows(db.session.connection(), [search_row(entity_type, row.get, now) for row in rows])
+
+
+def _changed(obj, fields):
+    state = sa_inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def register_search_listeners():
+    """Hält ``search_documents`` bei jedem Flush auf dem Stand der Datensätze."""
+
+    @event.listens_for(db.session, 'after_flush')
+    def receive_after_flush(session, flush_context):
+        now = datetime.utcnow()
+        rows = []
+        removed = []
+        for obj in session.new:
+            entity_type = _ENTITY_BY_MODEL.get(type(obj))
+            if entity_type:
+                rows.append(search_row(entity_type, lambda field: getattr(obj, field), now))
+        for obj in session.dirty:
+            entity_type = _ENTITY_BY_MODEL.get(type(obj))
+            if not entity_type:
+                continue
+            entity = SEARCH_ENTITIES[entity_type]
+            if _changed(obj, entity.title_fields + entity.body_fields):
+                rows.append(search_row(entity_type, lambda field: getattr(obj, field), now))
+        for obj in session.deleted:
+            entity_type = _ENTITY_BY_MODEL.get(type(obj))
+            if entity_type:
+                removed.append((entity_type, str(obj.id)))
+        if rows or removed:
+            write_rows(session.connection(), rows, removed)
+
+
+def rebuild_search_index():
+    """Baut ``search_documents`` (und damit den FTS5-Index) vollständig neu auf."""
+    started = time.monotonic()
+    now = datetime.utcnow()
+    db.session.execute(delete(SearchDocument.__table__))
+    total = 0
+    for entity_type, entity in SEARCH_ENTITIES.items():
+        model = entity.model
+        columns = [getattr(model, field) for field in ('id',) + entity.title_fields + entity.body_fields]
+        result = db.session.execute(select(*columns)).mappings()
+        while True:
+            batch = result.fetchmany(REBUILD_BATCH_SIZE)
+            if not batch:
+                break
+            db.session.execute(
+                insert(SearchDocument.__table__),
+                [search_row(entity_type, row.get, now) for row in batch],
+            )
+            total += len(batch)
+    db.session.commit()
+    print(f"🔎 Search index rebuilt: {total} records ({int((time.monotonic() - started) * 1000)} ms)")
+    return total
+
+
+def ensure_search_populated():
+    """Füllt den Index beim ersten Start mit den vorhandenen Datensätzen."""
+    if db.session.query(SearchDocument.id).first() is None:
+        rebuild_search_index()
+
+
+def fts_match_expression(term):
+    """Wandelt eine Nutzereingabe in einen sicheren FTS5-Ausdruck (Präfixsuche je Wort)."""
+    words = re.findall(r'\w+', term, re.UNICODE)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _snippet_html(value):
+    # Markierungen erst nach dem Escapen in HTML umsetzen
+    return str(escape(value or '')).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+
+def _result_url(entity_type, entity_id):
+    entity = SEARCH_ENTITIES[entity_type]
+    try:
+        if entity.id_arg is None:
+            return url_for(entity.endpoint)
+        return url_for(entity.endpoint, **{entity.id_arg: entity_id})
+    except Exception:
+        return None
+
+
+def search(term, types=None, limit=DEFAULT_LIMIT):
+    """Durchsucht alle indizierten Datensätze und liefert Treffer nach Relevanz.
+
+    Jeder Treffer enthält Typ, ID, Titel, einen HTML-Ausschnitt mit
+    ``<mark>``-Hervorhebung und den Link zur Detailseite.
+    """
+    limit = max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+    types = [t for t in (types or []) if t in SEARCH_ENTITIES]
+
+    if fts_enabled('SEARCH_FTS', SEARCH_TABLE):
+        match = fts_match_expression(term)
+        if not match:
+            return []
+        type_filter = ''
+        params = {'match': match, 'limit': limit}
+        if types:
+            placeholders = ', '.join(f':type_{i}' for i in range(len(types)))
+            type_filter = f'AND d.entity_type IN ({placeholders})'
+            params.update({f'type_{i}': t for i, t in enumerate(types)})
+        rows = db.session.execute(text(
+            f"SELECT d.entity_type, d.entity_id, d.title, "
+            f"snippet({SEARCH_TABLE}, 1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet, "
+            f"bm25({SEARCH_TABLE}, {TITLE_WEIGHT}, {BODY_WEIGHT}) AS score "
+            f"FROM {SEARCH_TABLE} JOIN search_documents d ON d.id = {SEARCH_TABLE}.rowid "
+            f"WHERE {SEARCH_TABLE} MATCH :match {type_filter} "
+            "ORDER BY score LIMIT :limit"
+        ), params).all()
+    else:
+        term = term.strip()
+        if not term:
+            return []
+        pattern = f'%{term}%'
+        query = db.session.query(
+            SearchDocument.entity_type, SearchDocument.entity_id, SearchDocument.title,
+            db.func.substr(SearchDocument.body, 1, 120).label('snippet'),
+            db.case((SearchDocument.title.ilike(pattern), 0), else_=1).label('score'),
+        ).filter(or_(SearchDocument.title.ilike(pattern), SearchDocument.body.ilike(pattern)))
+        if types:
+            query = query.filter(SearchDocument.entity_type.in_(types))
+        rows = query.order_by('score', SearchDocument.title).limit(limit).all()
+
+    return [{
+        'type': row.entity_type,
+        'id': row.entity_id,
+        'title': row.title,
+        'snippet': _snippet_html(row.snippet),
+        'url': _result_url(row.entity_type, row.entity_id),
+        'score': round(float(row.score), 4),
+    } for row in rows]
+
+
+def matching_ids(entity_type, term):
+    """IDs eines Typs, deren Suchtext ``term`` enthält (für Listenfilter)."""
+    if fts_enabled('SEARCH_FTS', SEARCH_TABLE):
+        match = fts_match_expression(term)
+        if not match:
+            return select(SearchDocument.entity_id).where(db.false())
+        return select(SearchDocument.entity_id).where(
+            SearchDocument.entity_type == entity_type,
+            text(
+                f"search_documents.id IN (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match)"
+            ).bindparams(match=match),
+        )
+    pattern = f'%{term}%'
+    return select(SearchDocument.entity_id).where(
+        SearchDocument.entity_type == entity_type,
+        or_(SearchDocument.title.ilike(pattern), SearchDocument.body.ilike(pattern)),
+    )
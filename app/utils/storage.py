@@ -0,0 +1,355 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+
+from flask import current_app, send_file, send_from_directory
+from flask.wrappers import Request
+from sqlalchemy import event
+from werkzeug.utils import secure_filename
+
+try:
+    import fcntl
+except ImportError:  # Windows: Sperre nur innerhalb des Prozesses
+    fcntl = None
+
+CHUNK_SIZE = 64 * 1024
+BLOB_DIR = 'blobs'
+TMP_DIR = 'tmp'
+LOCK_DIR = 'locks'
+KEEP_DIR = 'keep'
+# Haltelinks aus abgebrochenen Requests werden danach entfernt
+KEEP_MAX_AGE = 24 * 60 * 60
+KEEP_KEY = 'blob_keeps'
+
+StoredFile = namedtuple('StoredFile', 'sha256 size mime_type path filename')
+
+
+class StorageError(Exception):
+    """Upload konnte nicht gespeichert werden (z. B. zu groß)."""
+
+
+def upload_root():
+    return current_app.config.get('UPLOAD_FOLDER') or os.path.abspath('uploads')
+
+
+def _temp_dir():
+    # Im Upload-Verzeichnis, damit der Blob per Hardlink statt Kopie entsteht
+    path = os.path.join(upload_root(), TMP_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def blob_path(sha256, extension=''):
+    """Relativer Pfad eines Blobs unterhalb von ``UPLOAD_FOLDER``.
+
+    Die Endung bleibt erhalten, damit Webserver und ``send_from_directory``
+    den MIME-Typ erkennen.
+    """
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+def is_blob(stored_path):
+    return bool(stored_path) and stored_path.startswith(BLOB_DIR + '/')
+
+
+_thread_locks = [threading.Lock() for _ in range(256)]
+
+
+@contextmanager
+def blob_lock(sha256):
+    """Sperre je Hash-Präfix über alle Worker-Prozesse.
+
+    ``store_upload`` und ``release_blob`` prüfen und ändern denselben Blob
+    nie gleichzeitig. 256 feste Sperrdateien statt einer je Blob.
+    """
+    stripe = sha256[:2]
+    if fcntl is None:
+        with _thread_locks[int(stripe, 16)]:
+            yield
+        return
+    directory = os.path.join(upload_root(), TMP_DIR, LOCK_DIR)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f'{stripe}.lock'), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _keep_dir():
+    path = os.path.join(upload_root(), TMP_DIR, KEEP_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def upload_session():
+    """Aktuelle Session mit offener Transaktion, damit Commit oder Rollback die Haltelinks abräumt."""
+    from app.extensions import db
+
+    session = db.session()
+    if not session.in_transaction():
+        session.begin()
+    return session
+
+
+def _keep(relative, target, session):
+    """Hält den Inhalt per Hardlink fest, bis der verweisende Datensatz committet ist.
+
+    Löscht ``release_blob`` den Blob zwischen Upload und Commit (gleicher
+    Inhalt, noch kein sichtbarer Verweis), stellt der Commit ihn wieder her.
+    """
+    keep = os.path.join(_keep_dir(), f'{os.path.basename(target)}.{uuid.uuid4().hex}')
+    try:
+        os.link(target, keep)
+    except OSError:
+        return  # Dateisystem ohne Hardlinks: nur die Sperre schützt
+    (session or upload_session()).info.setdefault(KEEP_KEY, []).append((relative, keep))
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _sweep_keeps(now=None):
+    cutoff = (now or time.time()) - KEEP_MAX_AGE
+    with os.scandir(_keep_dir()) as entries:
+        for entry in entries:
+            if entry.stat().st_mtime < cutoff:
+                _discard(entry.path)
+
+
+def register_storage_listeners():
+    """Stellt nach dem Commit Blobs wieder her, die zwischen Upload und Commit freigegeben wurden."""
+    from app.extensions import db
+
+    @event.listens_for(db.session, 'after_commit')
+    def receive_after_commit(session):
+        for relative, keep in session.info.pop(KEEP_KEY, ()):
+            target = os.path.join(upload_root(), relative)
+            with blob_lock(_blob_hash(relative)):
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.link(keep, target)
+            _discard(keep)
+
+    @event.listens_for(db.session, 'after_transaction_end')
+    def receive_after_transaction_end(session, transaction):
+        # Rollback oder Schließen ohne Commit; nach einem Commit ist die Liste schon leer
+        if transaction.parent is None:
+            for _, keep in session.info.pop(KEEP_KEY, ()):
+                _discard(keep)
+
+
+class HashingFile:
+    """Temporäre Datei, die beim Schreiben SHA-256 und Größe mitführt."""
+
+    def __init__(self, directory):
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
+class StorageRequest(Request):
+    """Request-Klasse, die Datei-Uploads direkt in eine hashende Temp-Datei schreibt.
+
+    Werkzeug puffert Uploads sonst im Speicher oder im System-Temp-Verzeichnis;
+    so wird der Inhalt beim Parsen einmal geschrieben und gehasht.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(_temp_dir())
+
+
+def _hashed_stream(file_storage):
+    stream = file_storage.stream
+    if isinstance(stream, HashingFile):
+        return stream, False
+    # Fremder Stream (z. B. BytesIO im API-Aufruf): blockweise umkopieren
+    copy = HashingFile(_temp_dir())
+    stream.seek(0)
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        copy.write(chunk)
+    return copy, True
+
+
+def store_upload(file_storage, max_size=None, session=None):
+    """Legt einen Upload inhaltsadressiert unter ``blobs/`` ab.
+
+    Identische Inhalte werden nur einmal gespeichert. Gibt ein
+    ``StoredFile`` mit Hash, Größe, MIME-Typ und relativem Pfad zurück.
+    Der Blob bleibt bis zum nächsten Commit von ``session`` (Standard: die
+    aktuelle Session) geschützt; dort muss der Verweis gespeichert werden.
+    """
+    stream, owned = _hashed_stream(file_storage)
+    try:
+        if max_size and stream.size > max_size:
+            raise StorageError(f'Datei ist zu groß (max. {max_size // (1024 * 1024)} MB)')
+
+        digest = stream.sha256.hexdigest()
+        filename = secure_filename(file_storage.filename or '') or digest
+        relative = blob_path(digest, os.path.splitext(filename)[1].lower())
+        target = os.path.join(upload_root(), relative)
+        with blob_lock(digest):
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                stream.flush()
+                os.chmod(stream.name, 0o644)
+                try:
+                    os.link(stream.name, target)
+                except FileExistsError:
+                    pass  # parallel hochgeladen
+                except OSError:
+                    # Dateisystem ohne Hardlinks: kopieren und atomar umbenennen
+                    partial = f'{target}.{os.getpid()}.part'
+                    shutil.copyfile(stream.name, partial)
+                    os.replace(partial, target)
+            _keep(relative, target, session)
+    finally:
+        if owned:
+            stream.close()
+
+    mime_type = (
+        file_storage.mimetype
+        or mimetypes.guess_type(filename)[0]
+        or 'application/octet-stream'
+    )
+    return StoredFile(digest, stream.size, mime_type, relative, filename)
+
+
+def resolve_path(stored_path, legacy_dir=None):
+    """Absoluter Pfad zu einem gespeicherten Pfad.
+
+    Blobs liegen relativ zu ``UPLOAD_FOLDER``; ältere Einträge enthalten
+    Dateinamen in ``legacy_dir`` oder Pfade relativ zum Arbeitsverzeichnis.
+    """
+    if not stored_path:
+        return None
+    if os.path.isabs(stored_path):
+        return stored_path
+    root = upload_root()
+    if is_blob(stored_path):
+        return os.path.join(root, stored_path)
+    if legacy_dir:
+        return os.path.join(root, legacy_dir, stored_path)
+    return os.path.abspath(stored_path)
+
+
+def send_stored(path, download_name, mimetype=None, etag=None, as_attachment=True):
+    """Liefert eine gespeicherte Datei mit ETag und Range-Unterstützung aus.
+
+    Mit ``STORAGE_ACCEL_REDIRECT`` (interner nginx-Pfad auf ``UPLOAD_FOLDER``)
+    übernimmt der Webserver die Auslieferung per ``X-Accel-Redirect``;
+    ``USE_X_SENDFILE`` wird von ``send_file`` selbst berücksichtigt.
+    """
+    accel_prefix = current_app.config.get('STORAGE_ACCEL_REDIRECT')
+    root = upload_root()
+    if accel_prefix and os.path.commonpath([root, os.path.abspath(path)]) == root:
+        response = current_app.response_class(mimetype=mimetype or 'application/octet-stream')
+        relative = os.path.relpath(path, root).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative}"
+        response.headers.set(
+            'Content-Disposition', 'attachment' if as_attachment else 'inline', filename=download_name
+        )
+        if etag:
+            response.set_etag(etag)
+        return response
+
+    return send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=etag or True,
+    )
+
+
+def send_upload(stored_path, legacy_dir):
+    """Liefert Blob oder Altdatei aus ``legacy_dir`` aus (Pfad aus der URL, daher ``safe_join``)."""
+    if is_blob(stored_path):
+        return send_from_directory(upload_root(), stored_path, etag=_blob_hash(stored_path))
+    return send_from_directory(os.path.join(upload_root(), legacy_dir), stored_path)
+
+
+def _blob_hash(stored_path):
+    return os.path.splitext(os.path.basename(stored_path))[0]
+
+
+def _blob_references():
+    """Alle Stellen, an denen gespeicherte Pfade stehen: ``(Spalte, im JSON?)``.
+
+    Neue Upload-Felder müssen hier eingetragen werden, sonst kann
+    ``release_blob`` eine noch benutzte Datei löschen.
+    """
+    from app.models import Contract, Document, MeterReading, OperatingCost, Protocol, Settlement
+
+    return [
+        (Document.file_path, False),
+        (MeterReading.photo_path, False),
+        (OperatingCost.document_path, False),
+        (Contract.pdf_path, False),
+        (Settlement.pdf_path, False),
+        # ``meter_photos`` und ``attachments`` im JSON des Protokolls
+        (Protocol.protocol_data, True),
+    ]
+
+
+def blob_in_use(stored_path):
+    """Ob noch ein Datensatz auf ``stored_path`` verweist."""
+    from app.extensions import db
+
+    for column, embedded in _blob_references():
+        condition = column.contains(stored_path, autoescape=True) if embedded else column == stored_path
+        if db.session.query(column).filter(condition).first() is not None:
+            return True
+    return False
+
+
+def release_blob(stored_path):
+    """Entfernt eine Datei, sobald kein Datensatz mehr auf sie verweist.
+
+    Muss nach dem Löschen des Datensatzes aufgerufen werden. Gleicher Inhalt
+    liegt immer unter demselben Pfad; gezählt werden daher die Verweise auf
+    den Pfad über alle Upload-Felder, nicht nur die Dokumente. Prüfen und
+    Löschen laufen unter der Sperre von ``store_upload``.
+    """
+    path = resolve_path(stored_path)
+    if not path or not os.path.exists(path):
+        return False
+    with blob_lock(_blob_hash(stored_path)) if is_blob(stored_path) else nullcontext():
+        if not os.path.exists(path) or blob_in_use(stored_path):
+            return False
+        os.remove(path)
+    _sweep_keeps()
+    return True
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import event, func, select
+
+from app.extensions import db
+from app.models import ClauseTemplate, ContractTemplateBlock
+from app.utils.contract_render import PLACEHOLDER_PATTERN
+
+# So lange gilt die Bibliothek ohne Rückfrage bei der Datenbank; Änderungen
+# aus anderen Prozessen werden spätestens danach bemerkt.
+DEFAULT_CHECK_SECONDS = 30
+
+ClauseEntry = namedtuple(
+    'ClauseEntry', 'id name title category content is_mandatory sort_order subclauses text'
+)
+BlockEntry = namedtuple(
+    'BlockEntry', 'id template_id block_type title category content is_required sort_order text'
+)
+
+_lock = threading.Lock()
+_state = {'library': None, 'version': 0, 'checked_at': 0.0}
+
+
+class CompiledText:
+    """Vorlagentext mit vorab ermittelten Platzhalterpositionen (``§name§``)."""
+
+    __slots__ = ('source', 'placeholders')
+
+    def __init__(self, source):
+        self.source = source or ''
+        self.placeholders = tuple(
+            (match.group(1), match.start(), match.end()) for match in PLACEHOLDER_PATTERN.finditer(self.source)
+        )
+
+    @property
+    def variables(self):
+        return list(dict.fromkeys(name for name, _, _ in self.placeholders))
+
+
+def _subclauses(raw):
+    try:
+        data = json.loads(raw) if raw else {}
+    except ValueError:
+        return []
+    return data.get('subclauses', []) if isinstance(data, dict) else []
+
+
+def _group(entries):
+    grouped = {}
+    for entry in entries:
+        grouped.setdefault(entry.category or 'allgemein', []).append(entry)
+    return grouped
+
+
+class TemplateLibrary:
+    """Unveränderlicher Stand aller aktiven Klausel- und Blockvorlagen."""
+
+    def __init__(self, clauses, blocks, stamp, version):
+        self.clauses = tuple(clauses)
+        self.blocks = tuple(blocks)
+        self.stamp = stamp
+        self.version = version
+        self.clauses_by_id = {entry.id: entry for entry in self.clauses}
+        self.blocks_by_id = {entry.id: entry for entry in self.blocks}
+        self.clauses_by_category = _group(self.clauses)
+        self.blocks_by_category = _group(self.blocks)
+        self.subclauses = {entry.id: entry.subclauses for entry in self.clauses}
+        self.payload = json.dumps({
+            'clauses': [self._clause_json(entry) for entry in self.clauses],
+            'blocks': [self._block_json(entry) for entry in self.blocks],
+        }, ensure_ascii=False, default=str)
+        self.etag = hashlib.sha1(self.payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _clause_json(entry):
+        return {
+            'id': entry.id, 'name': entry.name, 'title': entry.title, 'category': entry.category,
+            'content': entry.content, 'is_mandatory': entry.is_mandatory, 'sort_order': entry.sort_order,
+            'subclauses': entry.subclauses, 'variables': entry.text.variables,
+            'placeholders': entry.text.placeholders,
+        }
+
+    @staticmethod
+    def _block_json(entry):
+        return {
+            'id': entry.id, 'template_id': entry.template_id, 'block_type': entry.block_type,
+            'title': entry.title, 'category': entry.category, 'content': entry.content,
+            'is_required': entry.is_required, 'sort_order': entry.sort_order, 'variables': entry.text.variables,
+            'placeholders': entry.text.placeholders,
+        }
+
+
+def _stamp():
+    """Anzahl und letzte Änderung beider Tabellen (eine kleine Abfrage)."""
+    row = db.session.execute(select(
+        select(func.count()).select_from(ClauseTemplate).scalar_subquery(),
+        select(func.max(ClauseTemplate.updated_at)).scalar_subquery(),
+        select(func.count()).select_from(ContractTemplateBlock).scalar_subquery(),
+        select(func.max(ContractTemplateBlock.updated_at)).scalar_subquery(),
+    )).one()
+    return tuple(str(value) for value in row)
+
+
+def _load(stamp, version):
+    clauses = [
+        ClauseEntry(
+            tpl.id, tpl.name, tpl.title, tpl.category, tpl.content, bool(tpl.is_mandatory), tpl.sort_order,
+            _subclauses(tpl.variables), CompiledText(tpl.content),
+        )
+        for tpl in ClauseTemplate.query.filter_by(is_active=True).order_by(ClauseTemplate.sort_order)
+    ]
+    blocks = [
+        BlockEntry(
+            block.id, block.template_id, block.block_type, block.title, block.category, block.content,
+            bool(block.is_required), block.sort_order, CompiledText(block.content),
+        )
+        for block in ContractTemplateBlock.query.order_by(ContractTemplateBlock.category, ContractTemplateBlock.sort_order)
+    ]
+    return TemplateLibrary(clauses, blocks, stamp, version)
+
+
+def template_library():
+    """Aktuelle Vorlagenbibliothek des Prozesses; wird nur nach Änderungen neu geladen."""
+    interval = current_app.config.get('TEMPLATE_REGISTRY_CHECK_SECONDS', DEFAULT_CHECK_SECONDS)
+    library = _state['library']
+    now = time.monotonic()
+    if library is not None and library.version == _state['version'] and now - _state['checked_at'] < interval:
+        return library
+
+    stamp = _stamp()
+    with _lock:
+        library = _state['library']
+        version = _state['version']
+        if library is None or library.version != version or library.stamp != stamp:
+            library = _state['library'] = _load(stamp, version)
+        _state['checked_at'] = now
+    return library
+
+
+def invalidate_templates():
+    """Erhöht die Version; der nächste Zugriff lädt die Vorlagen neu."""
+    with _lock:
+        _state['version'] += 1
+
+
+def register_template_listeners():
+    """Invalidiert die Bibliothek nach jedem Commit, der Vorlagen geändert hat."""
+
+    @event.listens_for(db.session, 'after_flush')
+    def receive_after_flush(session, flush_context):
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, (ClauseTemplate, ContractTemplateBlock)):
+                session.info['templates_changed'] = True
+                return
+
+    @event.listens_for(db.session, 'after_commit')
+    def receive_after_commit(session):
+        if session.info.pop('templates_changed', False):
+            invalidate_templates()
+
+    @event.listens_for(db.session, 'after_rollback')
+    def receive_after_rollback(session):
+        session.info.pop('templates_changed', None)
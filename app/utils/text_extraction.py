@@ -0,0 +1,262 @@
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_
+
+from app.extensions import db
+from app.models import Document
+from app.utils.scheduler import BackgroundJob, jobs_allowed
+from app.utils.storage import resolve_path
+
+DEFAULT_WORKERS = 2
+DEFAULT_TICK_SECONDS = 5 * 60
+BATCH_SIZE = 20
+# Nach dieser Zeit gilt ein "pending"-Eintrag als verloren (z. B. Neustart)
+STALE_AFTER_MINUTES = 15
+MAX_TEXT_CHARS = 200_000
+OCR_LANGUAGES = 'deu+eng'
+OCR_MAX_PAGES = 5
+OCR_TIMEOUT = 120
+
+_executor = None
+_in_flight = set()
+_lock = threading.Lock()
+
+
+# --- Extraktion (läuft im Worker-Prozess, ohne App-Kontext) -----------------
+
+def _pdf_text(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return ''
+    reader = PdfReader(path)
+    return '\n'.join(page.extract_text() or '' for page in reader.pages)
+
+
+def _tesseract(path):
+    result = subprocess.run(
+        ['tesseract', path, 'stdout', '-l', OCR_LANGUAGES],
+        capture_output=True, text=True, timeout=OCR_TIMEOUT,
+    )
+    return result.stdout if result.returncode == 0 else ''
+
+
+def _ocr_pdf(path):
+    """Gescannte PDFs: Seiten mit ``pdftoppm`` rastern und mit Tesseract lesen."""
+    with tempfile.TemporaryDirectory(prefix='ocr-') as tmp:
+        subprocess.run(
+            ['pdftoppm', '-r', '200', '-png', '-l', str(OCR_MAX_PAGES), path, os.path.join(tmp, 'page')],
+            capture_output=True, timeout=OCR_TIMEOUT, check=True,
+        )
+        return '\n'.join(_tesseract(os.path.join(tmp, name)) for name in sorted(os.listdir(tmp)))
+
+
+def extract_text(path, mime_type):
+    """Liest den Text einer Datei; gibt ``(text, status)`` zurück.
+
+    PDFs werden zuerst über ihre Textebene gelesen. Tesseract (und für PDFs
+    ``pdftoppm``) wird nur genutzt, wenn es lokal installiert ist.
+    """
+    mime_type = mime_type or ''
+    has_tesseract = shutil.which('tesseract') is not None
+
+    if mime_type == 'application/pdf' or path.lower().endswith('.pdf'):
+        text = _pdf_text(path)
+        if not text.strip() and has_tesseract and shutil.which('pdftoppm'):
+            text = _ocr_pdf(path)
+    elif mime_type.startswith('image/'):
+        if not has_tesseract:
+            return None, 'unsupported'
+        text = _tesseract(path)
+    elif mime_type.startswith('text/'):
+        with open(path, encoding='utf-8', errors='replace') as handle:
+            text = handle.read(MAX_TEXT_CHARS)
+    else:
+        return None, 'unsupported'
+
+    text = re.sub(r'[ \t]+', ' ', text or '').strip()[:MAX_TEXT_CHARS]
+    return text or None, 'done' if text else 'empty'
+
+
+# --- Rechnungswerte -----------------------------------------------------------
+
+AMOUNT_PATTERN = re.compile(r'(?<![\d.,])(\d{1,3}(?:\.\d{3})*,\d{2}|\d+,\d{2}|\d+\.\d{2})(?![\d,])')
+TOTAL_KEYWORDS = re.compile(r'gesamtbetrag|rechnungsbetrag|endbetrag|zu zahlen|brutto|gesamt|summe|total', re.I)
+DATE_PATTERN = re.compile(r'\b(\d{1,2})\.(\d{1,2})\.(\d{4}|\d{2})\b|\b(\d{4})-(\d{2})-(\d{2})\b')
+DATE_KEYWORDS = re.compile(r'rechnungsdatum|datum|date', re.I)
+INVOICE_NUMBER_PATTERN = re.compile(
+    r'(?:rechnungs[- ]?(?:nr|nummer)|rechnung\s+nr|invoice\s+(?:no|number))\.?\s*:?\s*([A-Z0-9][A-Z0-9\-/]{2,})',
+    re.I,
+)
+
+
+def _parse_amount(raw):
+    if ',' in raw:
+        raw = raw.replace('.', '').replace(',', '.')
+    return float(raw)
+
+
+def _parse_date(match):
+    try:
+        if match.group(4):
+            return date(int(match.group(4)), int(match.group(5)), int(match.group(6)))
+        year = int(match.group(3))
+        if year < 100:
+            year += 2000
+        return date(year, int(match.group(2)), int(match.group(1)))
+    except ValueError:
+        return None
+
+
+def invoice_candidates(text):
+    """Ermittelt Betrag, Rechnungsdatum und Rechnungsnummer aus Rechnungstext.
+
+    Bevorzugt werden Werte in Zeilen mit passenden Stichworten; sonst der
+    größte Betrag und das erste Datum. Es sind Vorschläge, keine Buchungen.
+    """
+    candidates = {}
+    if not text:
+        return candidates
+    lines = text.splitlines()
+
+    keyed_amounts = [
+        _parse_amount(raw) for line in lines if TOTAL_KEYWORDS.search(line)
+        for raw in AMOUNT_PATTERN.findall(line)
+    ]
+    amounts = keyed_amounts or [_parse_amount(raw) for raw in AMOUNT_PATTERN.findall(text)]
+    if amounts:
+        candidates['amount_gross'] = max(amounts)
+
+    keyed_lines = [line for line in lines if DATE_KEYWORDS.search(line)]
+    for source in (keyed_lines, lines):
+        dates = [d for line in source for d in map(_parse_date, DATE_PATTERN.finditer(line)) if d]
+        if dates:
+            candidates['invoice_date'] = dates[0].isoformat()
+            break
+
+    number = INVOICE_NUMBER_PATTERN.search(text)
+    if number:
+        candidates['vendor_invoice_number'] = number.group(1)
+    return candidates
+
+
+def _extract_job(path, mime_type):
+    text, status = extract_text(path, mime_type)
+    return text, status, invoice_candidates(text)
+
+
+# --- Einbindung in die App ----------------------------------------------------
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        # "spawn": kein fork eines Prozesses mit laufenden Threads
+        _executor = ProcessPoolExecutor(
+            max_workers=app.config.get('TEXT_EXTRACTION_WORKERS', DEFAULT_WORKERS),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def _store_result(app, document_id, future):
+    with _lock:
+        _in_flight.discard(document_id)
+    with app.app_context():
+        try:
+            document = Document.query.get(document_id)
+            if document is None:
+                return
+            try:
+                text, status, fields = future.result()
+            except Exception as e:
+                print(f"⚠️  Text extraction failed for document {document_id}: {e}")
+                text, status, fields = None, 'failed', {}
+            document.extracted_text = text
+            document.extraction_status = status
+            document.extracted_fields = json.dumps(fields) if fields else None
+            document.extracted_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Could not store extracted text for document {document_id}: {e}")
+        finally:
+            db.session.remove()
+
+
+def queue_extraction(document):
+    """Übergibt ein gespeichertes Dokument an den Extraktions-Prozesspool.
+
+    Kehrt sofort zurück; das Ergebnis wird im Hintergrund am Dokument
+    gespeichert. Mit ``TEXT_EXTRACTION_WORKERS = 0`` ist die Extraktion aus.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('TEXT_EXTRACTION_WORKERS', DEFAULT_WORKERS):
+        return False
+    path = resolve_path(document.file_path)
+    if not path or not os.path.exists(path):
+        return False
+    with _lock:
+        if document.id in _in_flight:
+            return False
+        _in_flight.add(document.id)
+    try:
+        future = _get_executor(app).submit(_extract_job, path, document.mime_type)
+    except Exception:
+        with _lock:
+            _in_flight.discard(document.id)
+        raise
+    future.add_done_callback(lambda f, document_id=document.id: _store_result(app, document_id, f))
+    return True
+
+
+def mark_pending(document):
+    document.extraction_status = 'pending'
+    document.extracted_at = None
+
+
+def process_backlog(batch_size=BATCH_SIZE):
+    """Job: noch nicht extrahierte oder liegengebliebene Dokumente einreihen."""
+    stale = datetime.utcnow() - timedelta(minutes=STALE_AFTER_MINUTES)
+    documents = Document.query.filter(or_(
+        Document.extraction_status.is_(None),
+        (Document.extraction_status == 'pending') & (Document.created_at < stale),
+    )).order_by(Document.created_at).limit(batch_size).all()
+    queued = 0
+    for document in documents:
+        if queue_extraction(document):
+            queued += 1
+        elif document.id not in _in_flight:
+            # Datei fehlt: nicht bei jedem Lauf erneut versuchen
+            document.extraction_status = 'failed'
+    db.session.commit()
+    return {'queued': queued}
+
+
+def start_text_extraction(app):
+    """Startet den Job, der den Extraktions-Rückstand abarbeitet (``TEXT_EXTRACTION_ENABLED``)."""
+    if not app.config.get('TEXT_EXTRACTION_ENABLED', True) or not jobs_allowed(app):
+        return None
+    if not app.config.get('TEXT_EXTRACTION_WORKERS', DEFAULT_WORKERS):
+        return None
+
+    job = BackgroundJob(
+        app,
+        'text_extraction',
+        process_backlog,
+        tick=app.config.get('TEXT_EXTRACTION_TICK', DEFAULT_TICK_SECONDS),
+        initial_delay=30,
+    )
+    job.start()
+    app.extensions['text_extraction'] = job
+    print("✅ Text extraction job started")
+    return job
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app, send_file
+
+from app.utils.storage import is_blob, resolve_path, send_upload, upload_root
+
+DERIVATIVE_DIR = 'derivatives'
+# Marker für Quellen, aus denen keine Variante erzeugt werden konnte; nach
+# Installation von pillow-heif o. Ä. das Verzeichnis löschen
+FAILED_DIR = 'failed'
+# Größe: (längste Kante in Pixeln, Format)
+SIZES = {
+    'thumb': (320, 'WEBP'),
+    'preview': (1280, 'WEBP'),
+    'print': (1000, 'JPEG'),
+}
+EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+QUALITY = {'WEBP': 80, 'JPEG': 85}
+DEFAULT_WORKERS = 2
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _pil():
+    """Pillow erst beim ersten Bild laden; registriert dabei den optionalen HEIC-Öffner."""
+    from PIL import Image
+
+    try:
+        # HEIC-Fotos von iPhones; optional
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+    return Image
+
+
+def _key(stored_path, legacy_dir):
+    if is_blob(stored_path):
+        return os.path.splitext(os.path.basename(stored_path))[0]
+    return hashlib.sha1(f'{legacy_dir}/{stored_path}'.encode('utf-8')).hexdigest()
+
+
+def derivative_path(stored_path, legacy_dir, size):
+    """Ablageort einer Bildvariante unter ``UPLOAD_FOLDER/derivatives``."""
+    key = _key(stored_path, legacy_dir)
+    extension = EXTENSIONS[SIZES[size][1]]
+    return os.path.join(upload_root(), DERIVATIVE_DIR, size, key[:2], key + extension)
+
+
+def failure_marker(stored_path, legacy_dir):
+    key = _key(stored_path, legacy_dir)
+    return os.path.join(upload_root(), DERIVATIVE_DIR, FAILED_DIR, key[:2], key + '.failed')
+
+
+def _failed(stored_path, legacy_dir, source):
+    """Ob die Erzeugung für diese Quelle schon gescheitert ist.
+
+    Blobs ändern ihren Inhalt nie; eine ersetzte Altdatei (neuer als der
+    Marker) wird erneut versucht.
+    """
+    try:
+        marked = os.path.getmtime(failure_marker(stored_path, legacy_dir))
+    except OSError:
+        return False
+    return is_blob(stored_path) or os.path.getmtime(source) <= marked
+
+
+def render_derivatives(source, targets):
+    """Erzeugt alle Varianten aus einem einzigen Dekodiervorgang.
+
+    ``targets`` bildet Größe auf Zielpfad ab. JPEG-Quellen werden per
+    ``draft`` direkt in reduzierter Auflösung dekodiert; die Varianten
+    entstehen absteigend, jede aus der vorherigen.
+    """
+    from PIL import ImageOps
+
+    Image = _pil()
+    ordered = sorted(targets, key=lambda size: SIZES[size][0], reverse=True)
+    with Image.open(source) as original:
+        edge = SIZES[ordered[0]][0]
+        original.draft('RGB', (edge, edge))
+        image = ImageOps.exif_transpose(original)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        for size in ordered:
+            edge, fmt = SIZES[size]
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            path = targets[size]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f'{path}.{os.getpid()}.part'
+            image.save(partial, format=fmt, quality=QUALITY[fmt])
+            os.replace(partial, path)
+
+
+def _generate(app, stored_path, legacy_dir):
+    with app.app_context():
+        targets = {
+            size: derivative_path(stored_path, legacy_dir, size)
+            for size in SIZES
+            if not os.path.exists(derivative_path(stored_path, legacy_dir, size))
+        }
+        if not targets:
+            return True
+        source = resolve_path(stored_path, legacy_dir)
+        if _failed(stored_path, legacy_dir, source):
+            return False
+        Image = _pil()
+        try:
+            render_derivatives(source, targets)
+            return True
+        except (Image.UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+            # Kein lesbares Bild (oder HEIC ohne pillow-heif): Original wird ausgeliefert
+            print(f"⚠️  Thumbnail generation failed for {stored_path}: {e}")
+            marker = failure_marker(stored_path, legacy_dir)
+            os.makedirs(os.path.dirname(marker), exist_ok=True)
+            with open(marker, 'w') as handle:
+                handle.write(str(e))
+            return False
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get('THUMBNAIL_WORKERS', DEFAULT_WORKERS),
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def schedule_derivatives(stored_path, legacy_dir):
+    """Erzeugt die Varianten eines hochgeladenen Fotos im Worker-Pool.
+
+    Mit ``THUMBNAIL_WORKERS = 0`` wird sofort im Request erzeugt.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('THUMBNAIL_WORKERS', DEFAULT_WORKERS):
+        return _generate(app, stored_path, legacy_dir)
+
+    key = (stored_path, legacy_dir)
+    with _lock:
+        if key in _pending:
+            return _pending[key]
+        future = _get_executor(app).submit(_generate, app, stored_path, legacy_dir)
+        _pending[key] = future
+    future.add_done_callback(lambda _: _pending.pop(key, None))
+    return future
+
+
+def _source_file(stored_path, legacy_dir):
+    # Pfad kommt aus der URL: nur innerhalb des Upload-Verzeichnisses
+    if not stored_path or os.path.isabs(stored_path) or '..' in stored_path.split('/'):
+        return None
+    source = resolve_path(stored_path, legacy_dir)
+    return source if source and os.path.exists(source) else None
+
+
+def derivative_file(stored_path, legacy_dir, size):
+    """Pfad einer vorhandenen Variante; wartet nie auf deren Erzeugung.
+
+    Fehlende Varianten werden im Worker-Pool angestoßen, bis dahin gibt die
+    Funktion ``None`` zurück und der Aufrufer nimmt das Original. Ist die
+    Erzeugung schon einmal gescheitert, bleibt es ohne neuen Versuch beim
+    Original.
+    """
+    source = _source_file(stored_path, legacy_dir) if size in SIZES else None
+    if source is None:
+        return None
+    path = derivative_path(stored_path, legacy_dir, size)
+    if os.path.exists(path):
+        return path
+    if not _failed(stored_path, legacy_dir, source):
+        schedule_derivatives(stored_path, legacy_dir)
+    return path if os.path.exists(path) else None
+
+
+def photo_file(stored_path, legacy_dir, size):
+    """Variante, falls schon vorhanden, sonst das Original; ``None`` ohne Datei."""
+    return derivative_file(stored_path, legacy_dir, size) or _source_file(stored_path, legacy_dir)
+
+
+def send_photo(stored_path, legacy_dir, size=None):
+    """Liefert ein Foto in der gewünschten Größe, sonst das Original."""
+    path = derivative_file(stored_path, legacy_dir, size) if size else None
+    if path is None:
+        return send_upload(stored_path, legacy_dir)
+    return send_file(path, conditional=True)
@@ -0,0 +1,133 @@
+"""Speicherbedarf eines Web-Workers vor und nach Exporten messen.
+
+Aufruf aus dem Projektverzeichnis::
+
+    python bench/export_memory.py [--readings 500] [--json ergebnisse.jsonl]
+
+Für ``EXPORT_PROCESSES=0`` (PDF im Worker) und ``EXPORT_PROCESSES=1``
+(eigener Exportprozess) wird je ein frischer Prozess gestartet, der die App
+wie ein Gunicorn-Worker lädt und nacheinander Seite, PDF- und XLSX-Exporte
+abruft. Gemessen wird ``VmRSS`` des Workers und ggf. des Exportprozesses.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEED = """
+import datetime
+from wsgi import app
+from app.extensions import db
+from app.models import Apartment, Building, Contract, Meter, MeterReading, MeterType, Protocol, Tenant, User
+
+with app.app_context():
+    user = User(username='bench', role='admin'); user.set_password('bench'); db.session.add(user)
+    building = Building(name='Bench', street='Weg', street_number='1', zip_code='12345', city='Ort')
+    db.session.add(building); db.session.flush()
+    apartment = Apartment(building_id=building.id, apartment_number='1'); db.session.add(apartment)
+    meter_type = MeterType(name='Strom', category='electricity', unit='kWh'); db.session.add(meter_type)
+    db.session.flush()
+    meter = Meter(building_id=building.id, apartment_id=apartment.id, meter_type_id=meter_type.id, meter_number='M1')
+    tenant = Tenant(first_name='A', last_name='B', apartment_id=apartment.id, move_in_date=datetime.date(2024, 1, 1))
+    db.session.add_all([meter, tenant]); db.session.flush()
+    contract = Contract(apartment_id=apartment.id, tenant_id=tenant.id, contract_number='B-1',
+                        start_date=datetime.date(2024, 1, 1), rent_net=1)
+    db.session.add(contract); db.session.flush()
+    for day in range(%(readings)d):
+        db.session.add(MeterReading(meter_id=meter.id, reading_date=datetime.date(2020, 1, 1) + datetime.timedelta(days=day),
+                                    reading_value=day, reading_type='regular'))
+        db.session.add(Protocol(contract_id=contract.id, protocol_type='uebernahme', protocol_date=datetime.date(2024, 1, 1),
+                                protocol_data='{}', created_by=user.id))
+    db.session.commit()
+"""
+
+WORKER = """
+import json
+from wsgi import app
+from app.models import User
+from app.utils import export_writers
+
+
+def rss(pid='self'):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) // 1024
+    return 0
+
+
+def export_rss():
+    pool = export_writers._pool
+    return sum(rss(pid) for pid in (pool._processes or {})) if pool is not None else 0
+
+
+steps = [('import', rss(), 0)]
+client = app.test_client()
+with app.app_context():
+    user_id = User.query.filter_by(username='bench').one().id
+with client.session_transaction() as session:
+    session['user_id'] = user_id
+    session['role'] = 'admin'
+for name, url in [
+    ('seite', '/auth/login'),
+    ('pdf zaehlerstaende', '/meter-readings/export/pdf'),
+    ('pdf protokolle', '/protocols/export/pdf'),
+    ('pdf revisionen', '/settings/revisions/export?format=pdf'),
+    ('xlsx zaehlerstaende', '/meter-readings/export/excel'),
+]:
+    response = client.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+    steps.append((name, rss(), export_rss()))
+print(json.dumps(steps))
+"""
+
+
+def _env(**extra):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env.update(RSS_SCHEDULER_ENABLED='0', NOTIFICATION_SCHEDULER_ENABLED='0', TEXT_EXTRACTION_ENABLED='0')
+    env.update(extra)
+    return env
+
+
+def _run(code, cwd, **extra):
+    return subprocess.run(
+        [sys.executable, *code], cwd=cwd, env=_env(**extra), capture_output=True, text=True, check=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readings', type=int, default=500)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='mietassistent-bench-') as cwd:
+        _run(['-m', 'flask', '--app', 'wsgi', 'init-db'], cwd)
+        _run(['-c', SEED % {'readings': args.readings}], cwd)
+        for processes in ('0', '1'):
+            output = _run(['-c', WORKER], cwd, EXPORT_PROCESSES=processes).stdout
+            results[processes] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'Schritt':<22}{'im Worker':>12}{'Worker':>12}{'Exportprozess':>16}")
+    for inline, separate in zip(results['0'], results['1']):
+        print(f"{inline[0]:<22}{inline[1]:>9} MB{separate[1]:>9} MB{separate[2]:>13} MB")
+
+    if args.json_path:
+        with open(args.json_path, 'a', encoding='utf-8') as handle:
+            handle.write(json.dumps({
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'readings': args.readings,
+                'inline': results['0'],
+                'export_process': results['1'],
+            }) + '\n')
+
+
+if __name__ == '__main__':
+    main()
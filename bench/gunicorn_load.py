@@ -0,0 +1,211 @@
+"""Durchsatz und Antwortzeiten von Gunicorn je Worker/Thread-Kombination.
+
+Aufruf aus dem Projektverzeichnis::
+
+    python bench/gunicorn_load.py [--configs 1x16,2x8,2x16,2x32,4x16] [--concurrency 32]
+                                  [--seconds 15] [--json ergebnisse.jsonl]
+
+Je Kombination (``Worker x Threads``) startet Gunicorn mit ``gunicorn.conf.py``
+in einem leeren Arbeitsverzeichnis (``flask --app wsgi init-db``, 50 Zähler).
+``--concurrency`` Clients schicken dann ``--seconds`` lang eine Mischung aus
+Seitenaufruf (``GET /auth/login``), Lesezugriff (``GET /meters/api/meters``) und
+Schreibzugriff (``POST /api/meter-readings/bulk``, ein Zählerstand) im
+Verhältnis 2:2:1. Ausgegeben werden Anfragen pro Sekunde, p50/p95/p99 und
+Fehler. Lastgenerator und Server teilen sich die CPU; die Zahlen sind daher
+nur auf derselben Maschine vergleichbar.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METERS = 50
+
+SEED = """
+from flask_jwt_extended import create_access_token
+from wsgi import app
+from app.extensions import db
+from app.models import Apartment, Building, Meter, MeterType, User
+
+with app.app_context():
+    user = User(username='bench', role='admin'); user.set_password('bench'); db.session.add(user)
+    building = Building(name='Bench'); db.session.add(building); db.session.flush()
+    apartment = Apartment(building_id=building.id, apartment_number='1'); db.session.add(apartment)
+    meter_type = MeterType(name='Strom', category='electricity', unit='kWh'); db.session.add(meter_type)
+    db.session.flush()
+    meters = [Meter(building_id=building.id, apartment_id=apartment.id, meter_type_id=meter_type.id,
+                    meter_number=f'B-{number}') for number in range(%d)]
+    db.session.add_all(meters)
+    db.session.commit()
+    print(create_access_token(identity=user.id))
+    print(' '.join(meter.id for meter in meters))
+""" % METERS
+
+
+def _env(**extra):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env.update(RSS_SCHEDULER_ENABLED='0', NOTIFICATION_SCHEDULER_ENABLED='0', TEXT_EXTRACTION_ENABLED='0')
+    env.update(SECRET_KEY='bench-secret', JWT_SECRET_KEY='bench-jwt-secret')
+    env.update(extra)
+    return env
+
+
+def _run(code, cwd):
+    return subprocess.run(
+        [sys.executable, *code], cwd=cwd, env=_env(), capture_output=True, text=True, check=True
+    )
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/auth/login', timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Gunicorn antwortet nicht')
+
+
+class Load:
+    """Anfragemischung; Zählerstände mit fortlaufendem Datum, damit keine Konflikte entstehen."""
+
+    def __init__(self, port, token, meter_ids):
+        self.base = f'http://127.0.0.1:{port}'
+        self.token = token
+        self.meter_ids = meter_ids
+        self.counter = itertools.count()
+
+    def _reading(self):
+        number = next(self.counter)
+        day = datetime.date(2000, 1, 1) + datetime.timedelta(days=number // len(self.meter_ids))
+        return [{'meter_id': self.meter_ids[number % len(self.meter_ids)], 'reading_value': number,
+                 'reading_date': day.isoformat()}]
+
+    def request(self, kind):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        if kind == 'page':
+            request = urllib.request.Request(self.base + '/auth/login')
+        elif kind == 'read':
+            request = urllib.request.Request(self.base + '/meters/api/meters', headers=headers)
+        else:
+            headers['Content-Type'] = 'application/json'
+            request = urllib.request.Request(self.base + '/api/meter-readings/bulk', method='POST',
+                                             data=json.dumps(self._reading()).encode(), headers=headers)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status < 300
+        except (urllib.error.HTTPError, OSError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+
+def _percentile(values, share):
+    return round(values[max(0, int(len(values) * share) - 1)] * 1000, 1) if values else None
+
+
+def measure(workers, threads, concurrency, seconds):
+    with tempfile.TemporaryDirectory(prefix='mietassistent-bench-') as cwd:
+        _run(['-m', 'flask', '--app', 'wsgi', 'init-db'], cwd)
+        token, meter_ids = _run(['-c', SEED], cwd).stdout.strip().splitlines()[-2:]
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+             '--chdir', cwd, '-b', f'127.0.0.1:{port}', 'wsgi:app'],
+            cwd=cwd,
+            env=_env(GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads), GUNICORN_ACCESSLOG='/dev/null'),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_for(port)
+            load = Load(port, token, meter_ids.split())
+            mix = ('page', 'read', 'page', 'read', 'write')
+            results = {kind: [] for kind in set(mix)}
+            errors = {kind: 0 for kind in set(mix)}
+            lock = threading.Lock()
+            deadline = time.monotonic() + seconds
+
+            def client(offset):
+                for kind in itertools.islice(itertools.cycle(mix), offset, None):
+                    if time.monotonic() >= deadline:
+                        return
+                    elapsed, ok = load.request(kind)
+                    with lock:
+                        results[kind].append(elapsed)
+                        errors[kind] += not ok
+
+            clients = [threading.Thread(target=client, args=(number % len(mix),)) for number in range(concurrency)]
+            started = time.monotonic()
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            duration = time.monotonic() - started
+        finally:
+            server.send_signal(signal.SIGINT)
+            server.wait(timeout=60)
+
+    every = sorted(value for values in results.values() for value in values)
+    result = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cpus': os.cpu_count(),
+        'workers': workers,
+        'threads': threads,
+        'concurrency': concurrency,
+        'requests': len(every),
+        'rps': round(len(every) / duration, 1),
+        'p50_ms': _percentile(every, 0.5),
+        'p95_ms': _percentile(every, 0.95),
+        'p99_ms': _percentile(every, 0.99),
+        'errors': sum(errors.values()),
+    }
+    for kind, values in results.items():
+        values.sort()
+        result[f'{kind}_p95_ms'] = _percentile(values, 0.95)
+        result[f'{kind}_errors'] = errors[kind]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--configs', default='1x16,2x8,2x16,2x32,4x16')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    print(f"{'Worker x Threads':<17} {'Anfr./s':>8} {'p50':>7} {'p95':>7} {'p99':>7} "
+          f"{'Seite p95':>10} {'Lesen p95':>10} {'Schreiben p95':>14} {'Fehler':>7}")
+    for config in args.configs.split(','):
+        workers, threads = (int(value) for value in config.lower().split('x'))
+        result = measure(workers, threads, args.concurrency, args.seconds)
+        print(f"{config:<17} {result['rps']:>8} {result['p50_ms']:>7} {result['p95_ms']:>7} {result['p99_ms']:>7} "
+              f"{result['page_p95_ms']:>10} {result['read_p95_ms']:>10} {result['write_p95_ms']:>14} "
+              f"{result['errors']:>7}")
+        if args.json_path:
+            with open(args.json_path, 'a', encoding='utf-8') as handle:
+                handle.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
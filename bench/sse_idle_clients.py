@@ -0,0 +1,166 @@
+"""Gunicorn mit vielen wartenden SSE-Clients: bleiben normale Anfragen schnell?
+
+Aufruf aus dem Projektverzeichnis::
+
+    python bench/sse_idle_clients.py [--clients 40] [--requests 50] [--json ergebnisse.jsonl]
+
+Startet Gunicorn mit ``gunicorn.conf.py`` (ein Worker) in einem leeren
+Arbeitsverzeichnis, öffnet ``--clients`` SSE-Verbindungen, die nur lesen,
+und misst währenddessen die Antwortzeit von ``/auth/login`` sowie das
+Long-Polling. Verbindungen über ``SSE_MAX_CONNECTIONS`` müssen mit 503
+abgewiesen werden, das Long-Polling muss dann sofort mit ``retry_after``
+antworten.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET_KEY = 'bench-secret'
+
+SEED = """
+from wsgi import app
+from app.extensions import db
+from app.models import User
+
+with app.app_context():
+    user = User(username='bench', role='admin'); user.set_password('bench'); db.session.add(user)
+    db.session.commit()
+    serializer = app.session_interface.get_signing_serializer(app)
+    print(serializer.dumps({'user_id': user.id, 'role': 'admin'}))
+"""
+
+
+def _env(**extra):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env.update(RSS_SCHEDULER_ENABLED='0', NOTIFICATION_SCHEDULER_ENABLED='0', TEXT_EXTRACTION_ENABLED='0')
+    env.update(SECRET_KEY=SECRET_KEY, PREFERRED_URL_SCHEME='http')
+    env.update(extra)
+    return env
+
+
+def _run(code, cwd):
+    return subprocess.run(
+        [sys.executable, *code], cwd=cwd, env=_env(), capture_output=True, text=True, check=True
+    )
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/auth/login', timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Gunicorn antwortet nicht')
+
+
+def open_stream(port, cookie):
+    """SSE-Verbindung öffnen und den Statuscode lesen; der Socket bleibt offen."""
+    sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+    sock.sendall((
+        'GET /notifications/stream HTTP/1.1\r\n'
+        'Host: 127.0.0.1\r\n'
+        f'Cookie: session={cookie}\r\n'
+        'Accept: text/event-stream\r\n\r\n'
+    ).encode())
+    status = int(sock.recv(4096).split(b' ', 2)[1])
+    return sock, status
+
+
+def timed_get(port, path, cookie):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', headers={'Cookie': f'session={cookie}'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            body = response.read()
+        return time.perf_counter() - started, body
+    except OSError:
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=40)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='mietassistent-bench-') as cwd:
+        _run(['-m', 'flask', '--app', 'wsgi', 'init-db'], cwd)
+        cookie = _run(['-c', SEED], cwd).stdout.strip().splitlines()[-1]
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+             '--chdir', cwd, '-b', f'127.0.0.1:{port}', 'wsgi:app'],
+            cwd=cwd, env=_env(GUNICORN_WORKERS='1', GUNICORN_THREADS=str(args.threads), GUNICORN_ACCESSLOG='/dev/null'),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        streams = []
+        try:
+            _wait_for(port)
+            statuses = {}
+            for _ in range(args.clients):
+                sock, status = open_stream(port, cookie)
+                statuses[status] = statuses.get(status, 0) + 1
+                streams.append(sock)
+
+            latencies, errors = [], 0
+            for _ in range(args.requests):
+                seconds, _body = timed_get(port, '/auth/login', cookie)
+                if seconds is None:
+                    errors += 1
+                else:
+                    latencies.append(seconds)
+            cursor = f"{time.strftime('%Y-%m-%dT%H:%M:%S')}|0"
+            poll_seconds, poll_body = timed_get(port, f'/notifications/poll?cursor={cursor}&timeout=5', cookie)
+        finally:
+            for sock in streams:
+                sock.close()
+            # SIGINT: sofort beenden, nicht auf offene Streams warten
+            server.send_signal(signal.SIGINT)
+            server.wait(timeout=60)
+
+    latencies.sort()
+    result = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'threads': args.threads,
+        'clients': args.clients,
+        'streams_open': statuses.get(200, 0),
+        'streams_rejected': statuses.get(503, 0),
+        'login_p50_ms': round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        'login_p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else None,
+        'login_errors': errors,
+        'poll_ms': round(poll_seconds * 1000, 1) if poll_seconds is not None else None,
+        'poll_retry_after': json.loads(poll_body).get('retry_after') if poll_body else None,
+    }
+
+    print(f"SSE-Verbindungen      {result['streams_open']} offen, {result['streams_rejected']} abgewiesen (503)")
+    print(f"/auth/login           p50 {result['login_p50_ms']} ms, p95 {result['login_p95_ms']} ms, "
+          f"{errors} Fehler")
+    print(f"Long-Polling          {result['poll_ms']} ms (retry_after {result['poll_retry_after']})")
+
+    if args.json_path:
+        with open(args.json_path, 'a', encoding='utf-8') as handle:
+            handle.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
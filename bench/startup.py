@@ -0,0 +1,113 @@
+"""Startzeit der App messen: Importzeiten und Zeit bis zur ersten Antwort.
+
+Aufruf aus dem Projektverzeichnis::
+
+    python bench/startup.py [--runs 5] [--top 15] [--json ergebnisse.jsonl]
+
+Gemessen wird in einem leeren Arbeitsverzeichnis; vorher legt
+``flask --app wsgi init-db`` die Datenbank an. Jeder Lauf ist ein frischer
+Prozess. ``--json`` hängt das Ergebnis als eine Zeile an die Datei an, so
+lassen sich Läufe über Commits hinweg vergleichen.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bibliotheken, die erst in den Routen geladen werden sollen, die sie brauchen
+HEAVY_MODULES = ('pandas', 'numpy', 'reportlab', 'xhtml2pdf', 'pypdf', 'feedparser', 'PIL', 'openpyxl')
+
+FIRST_REQUEST = """
+import json, sys, time
+started = time.perf_counter()
+from wsgi import app
+imported = time.perf_counter()
+response = app.test_client().get('/auth/login')
+finished = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - started,
+    'first_request_s': finished - started,
+    'status': response.status_code,
+    'heavy_modules': sorted(name for name in %r if name in sys.modules),
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    # Hintergrundjobs würden die Messung verfälschen
+    env.update(RSS_SCHEDULER_ENABLED='0', NOTIFICATION_SCHEDULER_ENABLED='0', TEXT_EXTRACTION_ENABLED='0')
+    return env
+
+
+def _run(args, cwd):
+    return subprocess.run(
+        [sys.executable, *args], cwd=cwd, env=_env(), capture_output=True, text=True, check=True
+    )
+
+
+def import_times(cwd, top):
+    """``-X importtime`` auswerten: Eigenzeit summiert je Paket der obersten Ebene."""
+    result = _run(['-X', 'importtime', '-c', 'import wsgi'], cwd)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        if own.strip() == 'self [us]':
+            continue
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(own) / 1e6
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return round(sum(packages.values()), 3), [(name, round(seconds, 3)) for name, seconds in ranked[:top]]
+
+
+def first_requests(cwd, runs):
+    return [json.loads(_run(['-c', FIRST_REQUEST], cwd).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='mietassistent-bench-') as cwd:
+        _run(['-m', 'flask', '--app', 'wsgi', 'init-db'], cwd)
+        total_import, packages = import_times(cwd, args.top)
+        samples = first_requests(cwd, args.runs)
+
+    result = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'import_s': round(statistics.median(sample['import_s'] for sample in samples), 3),
+        'first_request_s': round(statistics.median(sample['first_request_s'] for sample in samples), 3),
+        'importtime_total_s': total_import,
+        'importtime_top': packages,
+        'heavy_modules': samples[-1]['heavy_modules'],
+        'status': samples[-1]['status'],
+    }
+
+    print(f"Import der App        {result['import_s']:.3f} s (Median aus {args.runs})")
+    print(f"Bis zur 1. Antwort    {result['first_request_s']:.3f} s (HTTP {result['status']})")
+    print(f"-X importtime gesamt  {total_import:.3f} s")
+    for name, seconds in packages:
+        print(f"  {name:<28}{seconds:.3f} s")
+    print(f"Schwere Module geladen: {', '.join(result['heavy_modules']) or 'keine'}")
+
+    if args.json_path:
+        with open(args.json_path, 'a', encoding='utf-8') as handle:
+            handle.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
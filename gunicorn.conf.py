@@ -0,0 +1,85 @@
+"""Gunicorn-Konfiguration (wird aus dem Arbeitsverzeichnis automatisch geladen).
+
+Alle Werte lassen sich per Umgebungsvariable überschreiben.
+"""
+import multiprocessing
+import os
+
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Die meisten Routen warten auf SQLite, Dateien oder PDF-Erzeugung: wenige
+# Prozesse mit mehreren Threads. SQLite erlaubt nur einen Schreiber, mehr
+# Prozesse als Kerne bringen daher nichts.
+#
+# Gemessen mit ``python bench/gunicorn_load.py`` (32 Clients, Seite/Lesen/
+# Schreiben 2:2:1, zwei Läufe) auf einer Maschine mit 1 CPU, Lastgenerator
+# auf derselben CPU:
+#   1x16  202-215 Anfr./s, p95 241-284 ms, p99 1,1-1,2 s
+#   2x16  175-198 Anfr./s, p95 749-961 ms, p99 2,4-2,5 s
+#   4x16  129-160 Anfr./s, p95 1,1-1,5 s,  p99 3,2-4,1 s
+# Zusätzliche Worker verlängern vor allem Schreibanfragen (SQLite-Sperre,
+# vereinzelt 500 "database is locked"), daher ein Worker je Kern. Auf
+# Maschinen mit mehreren Kernen ist das nicht gemessen.
+cpu_count = multiprocessing.cpu_count()
+worker_class = 'gthread'
+workers = _int('GUNICORN_WORKERS', min(cpu_count, _int('GUNICORN_MAX_WORKERS', 4)))
+threads = _int('GUNICORN_THREADS', 16)
+
+# Jede SSE-Verbindung und jedes Long-Polling belegt einen Thread für bis zu
+# ``SSE_MAX_STREAM_SECONDS``. Einige Threads bleiben daher für normale
+# Anfragen frei; darüber hinaus antworten Stream (503) und Long-Polling
+# sofort, der Browser fragt dann im Abstand von ``SSE_SHORT_POLL_SECONDS`` ab.
+sse_reserved_threads = _int('SSE_RESERVED_THREADS', 4)
+sse_max_connections = _int('SSE_MAX_CONNECTIONS', max(1, threads - sse_reserved_threads))
+
+# App einmal im Master laden: Importe nur einmal, Worker teilen sich den
+# Speicher der geladenen Module (copy-on-write).
+preload_app = True
+
+# gthread: ``timeout`` überwacht nur den Herzschlag des Workers, nicht die
+# Dauer einzelner Anfragen. Exporte (PDF/XLSX) und SSE-Verbindungen laufen
+# daher ungestört; beim Neustart bekommen laufende Exporte Zeit zum Beenden.
+timeout = _int('GUNICORN_TIMEOUT', 60)
+graceful_timeout = _int('GUNICORN_GRACEFUL_TIMEOUT', 120)
+keepalive = _int('GUNICORN_KEEPALIVE', 5)
+
+# Worker nach n Anfragen erneuern, falls PDF/Excel-Exporte den Speicher
+# wachsen lassen. Standard aus: unter Last ersetzt Gunicorn sonst alle paar
+# Sekunden einen Worker, und Anfragen in dessen Warteschlange gehen verloren.
+max_requests = _int('GUNICORN_MAX_REQUESTS', 0)
+max_requests_jitter = _int('GUNICORN_MAX_REQUESTS_JITTER', 50)
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '*')
+
+
+def post_fork(server, worker):
+    """Im Worker: geerbte Datenbankverbindungen verwerfen, Hintergrundjobs starten."""
+    from app import start_background_jobs
+    from app.extensions import db
+    from app.utils.events import broker
+    from wsgi import app
+
+    app.config['SSE_MAX_CONNECTIONS'] = sse_max_connections
+    broker.max_connections = sse_max_connections
+    with app.app_context():
+        # Verbindungen des Masters nicht weiterverwenden (close=False: der
+        # Master behält seine eigenen, geschlossen wird dort)
+        db.engine.dispose(close=False)
+    start_background_jobs(app)
+    server.log.info('Worker %s bereit (%s Threads, max. %s SSE)', worker.pid, threads, sse_max_connections)
+
+
+def worker_exit(server, worker):
+    """Im Worker beim Beenden: Jobsperren freigeben, damit ein anderer Worker sofort übernimmt."""
+    from app import stop_background_jobs
+    from wsgi import app
+
+    stop_background_jobs(app)
@@ -0,0 +1,112 @@
+"""Gemeinsame Fixtures: App mit SQLite-Datenbank in einem temporären Verzeichnis.
+
+Die App wird einmal je Testlauf angelegt (``flask init-db``-Pfad über
+``initialize_database``); Tests legen ihre Daten mit eindeutigen Werten an
+und räumen nicht auf.
+"""
+import contextlib
+import datetime
+import io
+import os
+import uuid
+
+import pytest
+
+os.environ.setdefault('RSS_SCHEDULER_ENABLED', '0')
+os.environ.setdefault('NOTIFICATION_SCHEDULER_ENABLED', '0')
+os.environ.setdefault('TEXT_EXTRACTION_ENABLED', '0')
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    from app import create_app
+    from app.cli import initialize_database
+
+    workdir = tmp_path_factory.mktemp('app')
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+        assert initialize_database(app)
+    app.config['TESTING'] = True
+    yield app
+    os.chdir(previous_cwd)
+
+
+@pytest.fixture
+def db_session(app):
+    from app.extensions import db
+
+    with app.app_context():
+        yield db.session
+        db.session.remove()
+
+
+@pytest.fixture
+def user(db_session):
+    from app.models import User
+
+    user = User(username=f'test-{uuid.uuid4().hex[:8]}', role='admin')
+    user.set_password('test')
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def auth_headers(app, user):
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+        session['role'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def apartment(db_session):
+    from app.models import Apartment, Building
+
+    building = Building(name=f'Haus {uuid.uuid4().hex[:6]}', street='Weg', street_number='1', zip_code='12345', city='Ort')
+    db_session.add(building)
+    db_session.flush()
+    apartment = Apartment(building_id=building.id, apartment_number='1')
+    db_session.add(apartment)
+    db_session.commit()
+    return apartment
+
+
+@pytest.fixture
+def contract(db_session, apartment, user):
+    from app.models import Contract, Tenant
+
+    tenant = Tenant(first_name='Erika', last_name='Muster', apartment_id=apartment.id,
+                    move_in_date=datetime.date(2024, 1, 1))
+    db_session.add(tenant)
+    db_session.flush()
+    contract = Contract(apartment_id=apartment.id, tenant_id=tenant.id, contract_number=f'V-{uuid.uuid4().hex[:8]}',
+                        start_date=datetime.date(2024, 1, 1), rent_net=500, created_by=user.id)
+    db_session.add(contract)
+    db_session.commit()
+    return contract
+
+
+@pytest.fixture
+def meter(db_session, apartment):
+    from app.models import Meter, MeterType
+
+    meter_type = MeterType(name='Strom', category='electricity', unit='kWh')
+    db_session.add(meter_type)
+    db_session.flush()
+    meter = Meter(building_id=apartment.building_id, apartment_id=apartment.id, meter_type_id=meter_type.id,
+                  meter_number=f'M-{uuid.uuid4().hex[:8]}')
+    db_session.add(meter)
+    db_session.commit()
+    return meter
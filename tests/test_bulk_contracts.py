@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from app.models import Contract, ContractBatch, ContractBatchItem
+from app.utils import bulk_contracts
+from app.utils.bulk_contracts import create_batch, run_batch
+from app.utils.contract_tree import insert_node, replace_tree
+
+
+@pytest.fixture
+def export_inline(app, monkeypatch):
+    # PDFs im Testprozess statt im Exportprozess erzeugen
+    monkeypatch.setitem(app.config, 'EXPORT_PROCESSES', 0)
+
+
+def _items(batch_id):
+    return ContractBatchItem.query.filter_by(batch_id=batch_id).all()
+
+
+def test_tree_writes_bump_contract_updated_at(db_session, contract):
+    before = contract.updated_at
+    replace_tree(contract.id, [{'id': 'p1', 'title': '§ 1'}])
+    db_session.commit()
+    db_session.refresh(contract)
+    after_replace = contract.updated_at
+    assert after_replace > before
+
+    insert_node(contract.id, {'id': 'p2', 'title': '§ 2'})
+    db_session.commit()
+    db_session.refresh(contract)
+    assert contract.updated_at > after_replace
+
+
+def test_run_batch_writes_pdfs(app, db_session, contract, apartment, user, export_inline):
+    batch = create_batch(user.id, {'type': 'rent_index', 'percent': 10}, building_id=apartment.building_id)
+
+    assert run_batch(app, batch.id) is True
+
+    db_session.expire_all()
+    assert db_session.get(ContractBatch, batch.id).status == 'done'
+    updated = db_session.get(Contract, contract.id)
+    assert updated.rent_net == pytest.approx(550)
+    path = os.path.join(bulk_contracts._pdf_dir(), updated.pdf_path)
+    with open(path, 'rb') as pdf:
+        assert pdf.read(5) == b'%PDF-'
+
+
+def test_tree_change_after_render_is_rerendered(app, db_session, contract, apartment, user, export_inline):
+    batch = create_batch(user.id, {'type': 'rent_index', 'percent': 10}, building_id=apartment.building_id)
+    change = {'type': 'rent_index', 'percent': 10}
+    bulk_contracts._render_pending(batch.id, change, 'test')
+    db_session.commit()
+
+    # Paragraph nach dem Rendern geändert: gerendertes HTML ist veraltet
+    insert_node(contract.id, {'id': 'neu', 'title': 'Nachtrag'})
+    db_session.commit()
+
+    assert bulk_contracts._apply_rendered(batch.id, change, user.id, 'Test') == 1
+    assert [item.status for item in _items(batch.id)] == ['pending']
+    assert db_session.get(Contract, contract.id).rent_net == pytest.approx(500)
@@ -0,0 +1,138 @@
+import json
+import uuid
+
+import pytest
+
+from app.models import IdempotencyKey, MeterReading, RevisionLog, SyncChange
+from app.utils.bulk_import import MAX_BULK_ITEMS
+
+URL = '/api/meter-readings/bulk'
+
+
+def _reading(meter, day=1, value=100):
+    return {'meter_id': meter.id, 'reading_value': value, 'reading_date': f'2024-01-{day:02d}'}
+
+
+def _readings(meter):
+    return MeterReading.query.filter_by(meter_id=meter.id).count()
+
+
+def test_json_array(app, auth_headers, meter, db_session):
+    response = app.test_client().post(URL, json=[_reading(meter, 1), _reading(meter, 2)], headers=auth_headers)
+
+    assert response.status_code == 201
+    assert response.json['created'] == 2
+    assert [result['status'] for result in response.json['results']] == ['created', 'created']
+    assert _readings(meter) == 2
+
+
+def test_items_object(app, auth_headers, meter, db_session):
+    response = app.test_client().post(URL, json={'items': [_reading(meter)]}, headers=auth_headers)
+
+    assert response.status_code == 201
+    assert _readings(meter) == 1
+
+
+def test_ndjson(app, auth_headers, meter, db_session):
+    body = '\n'.join(json.dumps(_reading(meter, day)) for day in (1, 2, 3)) + '\n\n'
+    response = app.test_client().post(URL, data=body, content_type='application/x-ndjson', headers=auth_headers)
+
+    assert response.status_code == 201
+    assert response.json['created'] == 3
+
+
+def test_ndjson_invalid_line(app, auth_headers, meter, db_session):
+    body = json.dumps(_reading(meter)) + '\n{kein json\n'
+    response = app.test_client().post(URL, data=body, content_type='application/x-ndjson', headers=auth_headers)
+
+    assert response.status_code == 400
+    assert 'Zeile 2' in response.json['error']
+    assert _readings(meter) == 0
+
+
+@pytest.mark.parametrize('body', [{'kein': 'array'}, 'text', None])
+def test_invalid_body(app, auth_headers, db_session, body):
+    response = app.test_client().post(URL, data=json.dumps(body), content_type='application/json', headers=auth_headers)
+
+    assert response.status_code == 400
+
+
+def test_item_cap(app, auth_headers, meter, db_session):
+    items = [_reading(meter)] * (MAX_BULK_ITEMS + 1)
+    client = app.test_client()
+
+    response = client.post(URL, json=items, headers=auth_headers)
+    assert response.status_code == 400
+    assert str(MAX_BULK_ITEMS) in response.json['error']
+
+    body = '\n'.join(json.dumps(item) for item in items)
+    response = client.post(URL, data=body, content_type='application/x-ndjson', headers=auth_headers)
+    assert response.status_code == 400
+    assert _readings(meter) == 0
+
+
+def test_partial_success_is_207(app, auth_headers, meter, db_session):
+    items = [_reading(meter, 1), {'meter_id': 'unbekannt', 'reading_value': 1, 'reading_date': '2024-01-01'},
+             _reading(meter, 2, value='abc')]
+    response = app.test_client().post(URL, json=items, headers=auth_headers)
+
+    assert response.status_code == 207
+    assert response.json['created'] == 1
+    assert [result['status'] for result in response.json['results']] == ['created', 'error', 'error']
+    assert _readings(meter) == 1
+
+
+def test_atomic_failure_is_422(app, auth_headers, meter, db_session):
+    items = [_reading(meter, 1), {'meter_id': meter.id, 'reading_value': 1}]
+    response = app.test_client().post(URL + '?atomic=1', json=items, headers=auth_headers)
+
+    assert response.status_code == 422
+    assert [result['status'] for result in response.json['results']] == ['skipped', 'error']
+    assert _readings(meter) == 0
+
+
+def test_idempotency_key_replay(app, auth_headers, meter, db_session):
+    key = str(uuid.uuid4())
+    headers = dict(auth_headers, **{'Idempotency-Key': key})
+    client = app.test_client()
+
+    first = client.post(URL, json=[_reading(meter)], headers=headers)
+    second = client.post(URL, json=[_reading(meter)], headers=headers)
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers.get('Idempotent-Replayed') == 'true'
+    assert second.json == first.json
+    assert _readings(meter) == 1
+    assert IdempotencyKey.query.filter_by(key=key).count() == 1
+
+    # Gleicher Schlüssel, andere Anfrage
+    other = client.post(URL, json=[_reading(meter, 5)], headers=headers)
+    assert other.status_code == 422
+    assert _readings(meter) == 1
+
+
+def test_sync_changes_and_summary_log(app, auth_headers, meter, db_session):
+    before = db_session.query(SyncChange.seq).order_by(SyncChange.seq.desc()).limit(1).scalar() or 0
+    logs_before = RevisionLog.query.filter_by(table_name='meter_readings').count()
+
+    response = app.test_client().post(URL, json=[_reading(meter, 1), _reading(meter, 2)], headers=auth_headers)
+    assert response.status_code == 201
+
+    changes = SyncChange.query.filter(SyncChange.seq > before).all()
+    # Eine Sync-Zeile je Zähler, nicht je Zählerstand
+    assert [(change.table_name, change.record_id, change.action) for change in changes] == [
+        ('meter_readings', meter.id, 'insert')
+    ]
+    # Ein zusammenfassender Revisionseintrag statt einem pro Zeile
+    assert RevisionLog.query.filter_by(table_name='meter_readings').count() == logs_before + 1
+
+
+def test_income_bulk(app, auth_headers, contract, db_session):
+    """Die Tabelle legt ``flask init-db`` an, nicht der Endpunkt."""
+    from app.models import Income
+
+    items = [{'contract_id': contract.id, 'amount': 500, 'received_on': '2024-01-03'}]
+    response = app.test_client().post('/api/incomes/bulk', json=items, headers=auth_headers)
+
+    assert response.status_code == 201, response.json
+    assert Income.query.filter_by(contract_id=contract.id).count() == 1
@@ -0,0 +1,182 @@
+import json
+
+import pytest
+
+from app.models import Contract, ContractParagraph
+from app.utils.contract_tree import (
+    END, TreeError, delete_node, insert_node, load_tree, migrate_paragraph_trees, move_node, replace_tree,
+)
+
+TREE = [
+    {'id': 'p1', 'title': '§ 1', 'children': [
+        {'id': 'p1a', 'title': '1 a', 'children': [{'id': 'p1a1', 'title': '1 a 1'}]},
+        {'id': 'p1b', 'title': '1 b'},
+    ]},
+    {'id': 'p2', 'title': '§ 2', 'mandatory': True},
+    {'id': 'p3', 'title': '§ 3', 'hinweis': 'Zusatzfeld'},
+]
+
+
+def _assert_invariants(contract_id):
+    rows = {row.node_id: row for row in ContractParagraph.query.filter_by(contract_id=contract_id)}
+    siblings = {}
+    for row in rows.values():
+        if row.parent_id is None:
+            assert (row.path, row.depth) == (f'/{row.node_id}/', 0)
+        else:
+            parent = rows[row.parent_id]
+            assert row.path == f'{parent.path}{row.node_id}/'
+            assert row.depth == parent.depth + 1
+        siblings.setdefault(row.parent_id, []).append(row.sort_key)
+    for keys in siblings.values():
+        assert len(keys) == len(set(keys))
+
+
+def _ids(nodes):
+    return [node['id'] for node in nodes]
+
+
+def _find(nodes, node_id):
+    for node in nodes:
+        if node['id'] == node_id:
+            return node
+        found = _find(node['children'], node_id)
+        if found:
+            return found
+    return None
+
+
+@pytest.fixture
+def tree(db_session, contract):
+    replace_tree(contract.id, TREE)
+    db_session.commit()
+    return contract.id
+
+
+def test_replace_and_load_roundtrip(tree):
+    loaded = load_tree(tree)
+
+    assert _ids(loaded) == ['p1', 'p2', 'p3']
+    assert _ids(loaded[0]['children']) == ['p1a', 'p1b']
+    assert _ids(loaded[0]['children'][0]['children']) == ['p1a1']
+    assert loaded[1]['mandatory'] is True
+    assert loaded[2]['hinweis'] == 'Zusatzfeld'
+    _assert_invariants(tree)
+
+
+def test_duplicate_ids_get_new_ids(db_session, contract):
+    replace_tree(contract.id, [{'id': 'x', 'title': 'A'}, {'id': 'x', 'title': 'B'}])
+    db_session.commit()
+
+    loaded = load_tree(contract.id)
+    assert [node['title'] for node in loaded] == ['A', 'B']
+    assert len(set(_ids(loaded))) == 2
+
+
+def test_insert_positions(db_session, tree):
+    insert_node(tree, {'id': 'first', 'title': 'Anfang'}, after_id=None)
+    insert_node(tree, {'id': 'middle', 'title': 'Mitte'}, after_id='p1')
+    insert_node(tree, {'id': 'last', 'title': 'Ende', 'children': [{'id': 'last-a'}]}, after_id=END)
+    insert_node(tree, {'id': 'child', 'title': 'Unterpunkt'}, parent_id='p2')
+    db_session.commit()
+
+    loaded = load_tree(tree)
+    assert _ids(loaded) == ['first', 'p1', 'middle', 'p2', 'p3', 'last']
+    assert _ids(_find(loaded, 'p2')['children']) == ['child']
+    assert _ids(_find(loaded, 'last')['children']) == ['last-a']
+    _assert_invariants(tree)
+
+
+def test_insert_renumbers_when_gap_is_used_up(db_session, tree):
+    for number in range(40):
+        insert_node(tree, {'id': f'n{number}'}, after_id='p1')
+    db_session.commit()
+
+    assert _ids(load_tree(tree)) == ['p1'] + [f'n{number}' for number in reversed(range(40))] + ['p2', 'p3']
+    _assert_invariants(tree)
+
+
+def test_move_within_parent(db_session, tree):
+    move_node(tree, 'p3', after_id=None)
+    move_node(tree, 'p1b', parent_id='p1', after_id=None)
+    db_session.commit()
+
+    loaded = load_tree(tree)
+    assert _ids(loaded) == ['p3', 'p1', 'p2']
+    assert _ids(_find(loaded, 'p1')['children']) == ['p1b', 'p1a']
+    _assert_invariants(tree)
+
+
+def test_move_subtree_to_new_parent(db_session, tree):
+    move_node(tree, 'p1a', parent_id='p3', after_id=END)
+    db_session.commit()
+
+    loaded = load_tree(tree)
+    assert _ids(_find(loaded, 'p1')['children']) == ['p1b']
+    assert _ids(_find(loaded, 'p3')['children']) == ['p1a']
+    assert _ids(_find(loaded, 'p1a')['children']) == ['p1a1']
+    grandchild = ContractParagraph.query.filter_by(contract_id=tree, node_id='p1a1').one()
+    assert (grandchild.path, grandchild.depth) == ('/p3/p1a/p1a1/', 2)
+    _assert_invariants(tree)
+
+    # Zurück auf die oberste Ebene
+    move_node(tree, 'p1a', parent_id=None, after_id='p2')
+    db_session.commit()
+    assert _ids(load_tree(tree)) == ['p1', 'p2', 'p1a', 'p3']
+    _assert_invariants(tree)
+
+
+def test_move_under_own_descendant_is_rejected(db_session, tree):
+    with pytest.raises(TreeError):
+        move_node(tree, 'p1', parent_id='p1a1')
+    with pytest.raises(TreeError):
+        move_node(tree, 'p1', parent_id='p1')
+    db_session.rollback()
+    _assert_invariants(tree)
+
+
+def test_delete_removes_subtree_only(db_session, contract):
+    # "_" ist in LIKE ein Platzhalter: /a_/ darf /ab/ nicht erfassen
+    replace_tree(contract.id, [
+        {'id': 'a_', 'children': [{'id': 'a_1'}]},
+        {'id': 'ab', 'children': [{'id': 'ab1'}]},
+    ])
+    db_session.commit()
+
+    assert delete_node(contract.id, 'a_') == 2
+    db_session.commit()
+
+    loaded = load_tree(contract.id)
+    assert _ids(loaded) == ['ab']
+    assert _ids(loaded[0]['children']) == ['ab1']
+    _assert_invariants(contract.id)
+
+
+def test_mandatory_node_cannot_be_deleted(tree):
+    with pytest.raises(TreeError):
+        delete_node(tree, 'p2')
+
+
+def test_migrate_json_trees(db_session, contract, apartment, user):
+    other = Contract(apartment_id=apartment.id, tenant_id=contract.tenant_id, contract_number=contract.contract_number + '-2',
+                     start_date=contract.start_date, rent_net=1, created_by=user.id)
+    db_session.add(other)
+    contract.contract_data = json.dumps({'paragraph_tree': TREE, 'miete': 500})
+    other.contract_data = json.dumps({'paragraph_tree': [{'id': 'neu'}]})
+    db_session.commit()
+    # Bereits migrierter Vertrag: vorhandene Zeilen werden nicht überschrieben
+    replace_tree(other.id, [{'id': 'bestand'}])
+    db_session.commit()
+
+    migrate_paragraph_trees()
+    db_session.expire_all()
+
+    assert _ids(load_tree(contract.id)) == ['p1', 'p2', 'p3']
+    assert json.loads(contract.contract_data) == {'miete': 500}
+    assert _ids(load_tree(other.id)) == ['bestand']
+    assert other.contract_data is None
+    _assert_invariants(contract.id)
+
+    # Zweiter Lauf ändert nichts
+    assert migrate_paragraph_trees() == 0
+    assert _ids(load_tree(contract.id)) == ['p1', 'p2', 'p3']
@@ -0,0 +1,67 @@
+import datetime
+import io
+import os
+import uuid
+
+import pytest
+
+from app.models import Document, OperatingCost
+from app.routes.costs import prune_draft_invoices
+from app.utils.storage import resolve_path
+
+
+@pytest.fixture(autouse=True)
+def no_extraction(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'TEXT_EXTRACTION_WORKERS', 0)
+
+
+def _analyze(client):
+    content = f'Rechnung {uuid.uuid4()}'.encode()
+    response = client.post('/costs/invoice/analyze', data={'invoice_document': (io.BytesIO(content), 'rechnung.txt')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    return response.json['document_id']
+
+
+def _save_cost(client, apartment, document_id):
+    return client.post('/costs/', data={
+        'building_id': apartment.building_id,
+        'description': f'Wartung {uuid.uuid4().hex[:6]}',
+        'amount_net': '100',
+        'tax_rate': '19',
+        'billing_period_start': '2024-01-01',
+        'invoice_document_id': document_id,
+    })
+
+
+def test_saved_cost_links_analyzed_invoice(client, db_session, apartment):
+    document_id = _analyze(client)
+    _save_cost(client, apartment, document_id)
+
+    document = db_session.get(Document, document_id)
+    cost = db_session.get(OperatingCost, document.documentable_id)
+    assert cost.document_path == document.file_path
+
+    # Eine verknüpfte Rechnung wird keiner zweiten Kostenposition zugeordnet
+    _save_cost(client, apartment, document_id)
+    db_session.expire_all()
+    assert db_session.get(Document, document_id).documentable_id == cost.id
+
+
+def test_prune_removes_only_old_unlinked_invoices(client, db_session, apartment):
+    draft_id = _analyze(client)
+    linked_id = _analyze(client)
+    _save_cost(client, apartment, linked_id)
+    draft_path = resolve_path(db_session.get(Document, draft_id).file_path)
+    assert os.path.exists(draft_path)
+
+    assert prune_draft_invoices()['deleted'] == 0
+    assert db_session.get(Document, draft_id) is not None
+
+    prune_draft_invoices(now=datetime.datetime.utcnow() + datetime.timedelta(days=2))
+    db_session.expire_all()
+
+    assert db_session.get(Document, draft_id) is None
+    assert not os.path.exists(draft_path)
+    linked = db_session.get(Document, linked_id)
+    assert linked is not None and os.path.exists(resolve_path(linked.file_path))
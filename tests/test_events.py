@@ -0,0 +1,55 @@
+import datetime
+
+import pytest
+
+from app.models import Notification
+from app.utils.events import NotificationRelay, broker
+
+
+def _notify(db_session, user, title, created_at=None):
+    notification = Notification(user_id=user.id, title=title, message='Text', created_at=created_at)
+    db_session.add(notification)
+    db_session.commit()
+    return notification
+
+
+def _received(subscription):
+    titles = []
+    while True:
+        item = subscription.get(timeout=0)
+        if item is None:
+            return titles
+        titles.append(item[1]['title'])
+
+
+@pytest.fixture
+def relay(app, db_session, user):
+    with broker.subscribe(user.id) as subscription:
+        relay = NotificationRelay(app, interval=3600, overlap=60)
+        yield relay, subscription
+
+
+def test_relay_sends_new_rows_once(db_session, user, relay):
+    relay, subscription = relay
+    _notify(db_session, user, 'vorher')
+    relay.ensure_running()
+
+    _notify(db_session, user, 'neu')
+    relay.poll_once()
+    relay.poll_once()
+
+    assert _received(subscription) == ['neu']
+
+
+def test_relay_picks_up_late_commits(db_session, user, relay):
+    relay, subscription = relay
+    relay.ensure_running()
+    now = datetime.datetime.utcnow()
+
+    _notify(db_session, user, 'später angelegt', created_at=now + datetime.timedelta(seconds=5))
+    relay.poll_once()
+    # Früher angelegt, aber erst nach der Abfrage committet
+    _notify(db_session, user, 'spät committet', created_at=now + datetime.timedelta(seconds=1))
+    relay.poll_once()
+
+    assert _received(subscription) == ['später angelegt', 'spät committet']
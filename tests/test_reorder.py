@@ -0,0 +1,86 @@
+import pytest
+
+from app.models import ContractBlock
+from app.utils.reorder import SORT_GAP, apply_order, plan_sort_keys
+
+
+def _strictly_increasing(keys):
+    return all(left < right for left, right in zip(keys, keys[1:]))
+
+
+@pytest.mark.parametrize('keys', [
+    [],
+    [1024, 2048, 3072],
+    [3072, 1024, 2048],
+    [2048, 1024],
+    [None, 1024, None],
+    [5, 5, 5],
+    [1, 2, 3, 0],
+])
+def test_plan_sort_keys_is_strictly_increasing(keys):
+    planned = plan_sort_keys(keys)
+
+    assert len(planned) == len(keys)
+    assert _strictly_increasing(planned)
+
+
+def test_plan_sort_keys_keeps_stable_rows():
+    # Nur der verschobene Eintrag bekommt einen neuen Schlüssel
+    keys = [1024, 3072, 2048, 4096]
+    planned = plan_sort_keys(keys)
+
+    assert _strictly_increasing(planned)
+    assert sum(old != new for old, new in zip(keys, planned)) == 1
+
+
+def test_plan_sort_keys_renumbers_without_gap():
+    assert plan_sort_keys([1, 3, 2]) == [SORT_GAP, 2 * SORT_GAP, 3 * SORT_GAP]
+
+
+@pytest.fixture
+def blocks(db_session, contract):
+    rows = [ContractBlock(contract_id=contract.id, block_type='text', title=title, content='',
+                          sort_order=(number + 1) * SORT_GAP)
+            for number, title in enumerate('ABCDE')]
+    db_session.add_all(rows)
+    db_session.commit()
+    return {row.title: row.id for row in rows}
+
+
+def _order(contract_id):
+    rows = ContractBlock.query.filter_by(contract_id=contract_id).order_by(ContractBlock.sort_order).all()
+    keys = [row.sort_order for row in rows]
+    assert len(keys) == len(set(keys))
+    return ''.join(row.title for row in rows)
+
+
+def test_apply_order_full_list(db_session, contract, blocks):
+    changes = apply_order(ContractBlock, [blocks[title] for title in 'EABCD'], 'contract_id', contract.id)
+    db_session.commit()
+
+    assert _order(contract.id) == 'EABCD'
+    assert list(changes) == [blocks['E']]
+
+
+def test_apply_order_partial_list_keeps_other_rows(db_session, contract, blocks):
+    # Nur D und B übergeben: sie tauschen ihre Plätze, A, C und E bleiben stehen
+    apply_order(ContractBlock, [blocks['D'], blocks['B']], 'contract_id', contract.id)
+    db_session.commit()
+
+    assert _order(contract.id) == 'ADCBE'
+
+
+def test_apply_order_partial_list_without_gap(db_session, contract, blocks):
+    # Schlüssel ohne Lücke erzwingen die Neuvergabe über den ganzen Bereich
+    for number, title in enumerate('ABCDE'):
+        db_session.get(ContractBlock, blocks[title]).sort_order = number
+    db_session.commit()
+
+    apply_order(ContractBlock, [blocks['E'], blocks['A']], 'contract_id', contract.id)
+    db_session.commit()
+
+    assert _order(contract.id) == 'EBCDA'
+
+
+def test_apply_order_ignores_foreign_and_unknown_ids(db_session, contract, blocks):
+    assert apply_order(ContractBlock, ['unbekannt', blocks['A']], 'contract_id', contract.id) == {}
@@ -0,0 +1,88 @@
+import json
+import uuid
+
+import pytest
+
+from app.models import ContractRevision
+from app.utils import revision_store
+from app.utils.revision_store import (
+    SNAPSHOT_INTERVAL, _decode, _encode, add_revision, compact_revisions, revision_data,
+)
+
+
+def _roundtrip(text, base):
+    return _decode(_encode(text, base), base)
+
+
+@pytest.mark.parametrize('base, text', [
+    (None, 'erste Fassung'),
+    ('gleich', 'gleich'),
+    ('kurz', 'komplett anderer Text'),
+    ('Zeile 1\nZeile 2\nZeile 3\n' * 20, 'Zeile 1\nZeile 2 geändert\nZeile 3\n' * 20),
+    ('a\r\nb\r\n', 'a\r\nb\r\nc\r\n'),
+    (json.dumps({'name': 'x' * 200, 'count': 1}), json.dumps({'name': 'x' * 200, 'count': 2, 'neu': [1, 2]})),
+])
+def test_encode_roundtrip(base, text):
+    assert _roundtrip(text, base) == text
+
+
+def test_json_delta_distinguishes_bool_int_and_float():
+    base = json.dumps({'name': 'x' * 200, 'flag': 1})
+    text = json.dumps({'name': 'x' * 200, 'flag': True, 'z': 1.0})
+
+    assert _roundtrip(text, base) == text
+    assert json.loads(_roundtrip(text, base))['flag'] is True
+
+
+def test_json_delta_keeps_key_order_and_deletions():
+    base = json.dumps({'a': 1, 'b': 'x' * 200, 'c': 3})
+    text = json.dumps({'c': 3, 'b': 'x' * 200})
+
+    assert _roundtrip(text, base) == text
+
+
+def _versions(count):
+    return [json.dumps({'title': 'Vertrag', 'body': 'Absatz\n' * 50, 'version': number}) for number in range(count)]
+
+
+def test_revision_chain_uses_snapshots_and_reconstructs(db_session, contract, user):
+    versions = _versions(2 * SNAPSHOT_INTERVAL + 5)
+    for old, new in zip([None] + versions, versions):
+        add_revision(ContractRevision, contract.id, user.id, 'Änderung', old_data=old, new_data=new)
+    db_session.commit()
+    revision_store._cache.clear()
+
+    rows = ContractRevision.query.filter_by(contract_id=contract.id).order_by(ContractRevision.revision_number).all()
+    assert [row.revision_number for row in rows] == list(range(1, len(versions) + 1))
+    assert rows[0].storage == 'full'
+    deltas_in_a_row = 0
+    for row in rows:
+        deltas_in_a_row = deltas_in_a_row + 1 if row.storage == 'delta' else 0
+        assert deltas_in_a_row < SNAPSHOT_INTERVAL
+    assert sum(row.storage == 'full' for row in rows) >= len(versions) // SNAPSHOT_INTERVAL
+
+    for row, old, new in zip(rows, [None] + versions, versions):
+        assert revision_data(row) == (old, new)
+
+
+def test_compact_revisions_converts_plain_rows(db_session, contract, user):
+    versions = _versions(SNAPSHOT_INTERVAL + 3)
+    for number, (old, new) in enumerate(zip([None] + versions, versions), start=1):
+        db_session.add(ContractRevision(
+            id=str(uuid.uuid4()), contract_id=contract.id, revision_number=number,
+            changed_by=user.id, change_description='alt', old_data=old, new_data=new,
+        ))
+    db_session.commit()
+
+    report = compact_revisions(dry_run=True)
+    assert report['contract_revisions']['converted'] >= len(versions)
+    assert ContractRevision.query.filter_by(contract_id=contract.id, storage=None).count() == len(versions)
+
+    compact_revisions(dry_run=False)
+    db_session.expire_all()
+    revision_store._cache.clear()
+
+    rows = ContractRevision.query.filter_by(contract_id=contract.id).order_by(ContractRevision.revision_number).all()
+    assert all(row.storage in ('full', 'delta') and row.old_data is None and row.new_data is None for row in rows)
+    for row, old, new in zip(rows, [None] + versions, versions):
+        assert revision_data(row) == (old, new)
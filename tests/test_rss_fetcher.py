@@ -0,0 +1,229 @@
+"""Conditional GET und Backoff des RSS-Abrufs gegen einen lokalen HTTP-Server.
+
+Aufruf aus dem Projektverzeichnis::
+
+    python -m unittest tests.test_rss_fetcher
+"""
+import contextlib
+import gzip
+import io
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.utils.rss_fetcher import fetch_feed_conditional
+
+ETAG = '"v1"'
+LAST_MODIFIED = 'Mon, 06 Jan 2025 10:00:00 GMT'
+FEED = f"""<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0"><channel><title>Test</title>
+<item><guid>test-1</guid><title>Erster</title><pubDate>{datetime.utcnow():%a, %d %b %Y %H:%M:%S} GMT</pubDate></item>
+<item><guid>test-2</guid><title>Zweiter</title><pubDate>{datetime.utcnow():%a, %d %b %Y %H:%M:%S} GMT</pubDate></item>
+</channel></rss>""".encode('utf-8')
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """``/feed`` mit ETag/Last-Modified, ``/gzip`` komprimiert, ``/error`` mit 500."""
+
+    requests = []
+
+    def do_GET(self):
+        FeedHandler.requests.append((self.path, dict(self.headers)))
+        if self.path == '/error':
+            self.send_error(500, 'Serverfehler')
+            return
+        if self.headers.get('If-None-Match') == ETAG or self.headers.get('If-Modified-Since') == LAST_MODIFIED:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = FEED
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml')
+        self.send_header('ETag', ETAG)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        if self.path == '/gzip':
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FeedServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FeedHandler.requests.clear()
+
+
+class FetchFeedConditionalTest(FeedServerTestCase):
+    def test_200_returns_entries_and_validators(self):
+        result = fetch_feed_conditional(self.base_url + '/feed', timeout=5)
+
+        self.assertEqual(result['status'], 200)
+        self.assertIsNone(result['error'])
+        self.assertEqual([entry.title for entry in result['feed'].entries], ['Erster', 'Zweiter'])
+        self.assertEqual(result['etag'], ETAG)
+        self.assertEqual(result['modified'], LAST_MODIFIED)
+
+    def test_gzip_body_is_decompressed(self):
+        result = fetch_feed_conditional(self.base_url + '/gzip', timeout=5)
+
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(len(result['feed'].entries), 2)
+        self.assertIn('gzip', FeedHandler.requests[-1][1].get('Accept-Encoding', ''))
+
+    def test_304_with_etag(self):
+        result = fetch_feed_conditional(self.base_url + '/feed', etag=ETAG, timeout=5)
+
+        self.assertEqual(result['status'], 304)
+        self.assertIsNone(result['feed'])
+        self.assertIsNone(result['error'])
+        self.assertEqual(result['etag'], ETAG)
+        self.assertEqual(FeedHandler.requests[-1][1].get('If-None-Match'), ETAG)
+
+    def test_304_with_last_modified(self):
+        result = fetch_feed_conditional(self.base_url + '/feed', modified=LAST_MODIFIED, timeout=5)
+
+        self.assertEqual(result['status'], 304)
+        self.assertEqual(result['modified'], LAST_MODIFIED)
+        self.assertEqual(FeedHandler.requests[-1][1].get('If-Modified-Since'), LAST_MODIFIED)
+
+    def test_http_error(self):
+        result = fetch_feed_conditional(self.base_url + '/error', etag=ETAG, timeout=5)
+
+        self.assertEqual(result['status'], 500)
+        self.assertIsNone(result['feed'])
+        self.assertTrue(result['error'].startswith('HTTP 500'))
+        # Validatoren bleiben für den nächsten Versuch erhalten
+        self.assertEqual(result['etag'], ETAG)
+
+    def test_connection_error(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        result = fetch_feed_conditional(f'http://127.0.0.1:{port}/feed', timeout=5)
+
+        self.assertEqual(result['status'], 0)
+        self.assertTrue(result['error'])
+
+
+class UpdateFeedItemsTest(FeedServerTestCase):
+    """Abrufstatus, Validatoren und Backoff über ``update_feed_items``."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.workdir = tempfile.mkdtemp(prefix='mietassistent-test-')
+        cls.previous_cwd = os.getcwd()
+        os.chdir(cls.workdir)
+
+        from app import create_app
+        from app.cli import initialize_database
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.app = create_app()
+            assert initialize_database(cls.app)
+
+    @classmethod
+    def tearDownClass(cls):
+        from app.extensions import db
+
+        with cls.app.app_context():
+            db.engine.dispose()
+        os.chdir(cls.previous_cwd)
+        shutil.rmtree(cls.workdir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        from app.extensions import db
+
+        db.session.remove()
+        self.context.pop()
+
+    def _feed(self, path):
+        from app.extensions import db
+        from app.models import RSSFeed
+
+        feed = RSSFeed(name=path, url=self.base_url + path, update_interval=60)
+        db.session.add(feed)
+        db.session.commit()
+        return feed
+
+    def _update(self, feed):
+        from app.routes.rss_feeds import update_feed_items
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            return update_feed_items(feed)
+
+    def _minutes_until_next_fetch(self, feed):
+        return (feed.next_fetch_at - datetime.utcnow()) / timedelta(minutes=1)
+
+    def test_200_then_304(self):
+        from app.models import RSSItem
+
+        feed = self._feed('/feed')
+
+        self.assertTrue(self._update(feed))
+        self.assertEqual(feed.last_fetch_status, 200)
+        self.assertEqual((feed.etag, feed.modified), (ETAG, LAST_MODIFIED))
+        self.assertEqual(RSSItem.query.filter_by(feed_id=feed.id).count(), 2)
+
+        self.assertTrue(self._update(feed))
+        self.assertEqual(feed.last_fetch_status, 304)
+        self.assertEqual(FeedHandler.requests[-1][1].get('If-None-Match'), ETAG)
+        self.assertEqual(FeedHandler.requests[-1][1].get('If-Modified-Since'), LAST_MODIFIED)
+        self.assertEqual(RSSItem.query.filter_by(feed_id=feed.id).count(), 2)
+        self.assertEqual(feed.consecutive_failures, 0)
+        self.assertLessEqual(self._minutes_until_next_fetch(feed), 60 * 1.1)
+
+    def test_errors_back_off_exponentially(self):
+        feed = self._feed('/error')
+
+        for failures in (1, 2, 3):
+            self.assertFalse(self._update(feed))
+            self.assertEqual(feed.last_fetch_status, 500)
+            self.assertEqual(feed.consecutive_failures, failures)
+            expected = 60 * 2 ** failures
+            self.assertGreaterEqual(self._minutes_until_next_fetch(feed), expected * 0.9 - 1)
+            self.assertLessEqual(self._minutes_until_next_fetch(feed), expected * 1.1)
+
+        self.app.config['RSS_MAX_BACKOFF_MINUTES'] = 300
+        try:
+            self.assertFalse(self._update(feed))
+            self.assertLessEqual(self._minutes_until_next_fetch(feed), 300 * 1.1)
+        finally:
+            self.app.config.pop('RSS_MAX_BACKOFF_MINUTES')
+
+        # Erfolgreicher Abruf setzt den Backoff zurück
+        feed.url = self.base_url + '/feed'
+        self.assertTrue(self._update(feed))
+        self.assertEqual(feed.consecutive_failures, 0)
+        self.assertLessEqual(self._minutes_until_next_fetch(feed), 60 * 1.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import threading
+import time
+import uuid
+
+from app.utils.scheduler import MAX_LOCK_TTL, BackgroundJob, acquire_lock
+
+
+def _name():
+    return f'test-{uuid.uuid4().hex[:8]}'
+
+
+def test_lock_ttl_is_capped(app):
+    assert BackgroundJob(app, _name(), lambda: None, tick=6 * 60 * 60).lock_ttl == MAX_LOCK_TTL
+    assert BackgroundJob(app, _name(), lambda: None, tick=60).lock_ttl == 300
+
+
+def test_lock_is_renewed_while_job_runs(app, db_session):
+    name = _name()
+    taken = []
+
+    def job():
+        # Länger als die Sperrdauer: ohne Herzschlag könnte ein anderer übernehmen
+        time.sleep(1.0)
+        with app.app_context():
+            taken.append(acquire_lock(name, 'anderer-worker', 60))
+
+    runner = BackgroundJob(app, name, job, tick=60)
+    runner.lock_ttl = 0.6
+    assert runner.run_once() is True
+    assert taken == [False]
+
+
+def test_lock_is_held_until_next_run_and_released_on_stop(app, db_session):
+    name = _name()
+    runner = BackgroundJob(app, name, lambda: None, tick=3600, jitter=0.2)
+    runner.lock_ttl = 0.1
+
+    assert runner.run_once() is True
+    time.sleep(0.2)
+    assert acquire_lock(name, 'anderer-worker', 60) is False
+
+    runner.stop()
+    assert acquire_lock(name, 'anderer-worker', 60) is True
+
+
+def test_second_instance_skips_while_locked(app, db_session):
+    name = _name()
+    started, release = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        release.wait(5)
+
+    first = BackgroundJob(app, name, job, tick=60)
+    second = BackgroundJob(app, name, lambda: None, tick=60)
+    thread = threading.Thread(target=first.run_once)
+    thread.start()
+    try:
+        assert started.wait(5)
+        assert second.run_once() is False
+    finally:
+        release.set()
+        thread.join()
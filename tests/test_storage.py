@@ -0,0 +1,69 @@
+import io
+import os
+import uuid
+
+from werkzeug.datastructures import FileStorage
+
+from app.models import Document
+from app.utils.storage import KEEP_DIR, TMP_DIR, release_blob, resolve_path, store_upload, upload_root
+
+
+def _upload(content):
+    return store_upload(FileStorage(io.BytesIO(content), filename='beleg.txt'))
+
+
+def _keeps():
+    directory = os.path.join(upload_root(), TMP_DIR, KEEP_DIR)
+    return os.listdir(directory) if os.path.isdir(directory) else []
+
+
+def _document(stored):
+    return Document(file_name=stored.filename, file_path=stored.path, documentable_type='other')
+
+
+def test_release_between_upload_and_commit_is_undone(db_session):
+    content = f'gleicher Inhalt {uuid.uuid4()}'.encode()
+    first = _upload(content)
+    old = _document(first)
+    db_session.add(old)
+    db_session.commit()
+
+    # Zweiter Upload gleichen Inhalts, noch nicht committet ...
+    second = _upload(content)
+    assert second.path == first.path
+    # ... während der alte Datensatz gelöscht und die Datei freigegeben wird
+    db_session.delete(old)
+    db_session.flush()
+    assert release_blob(first.path) is True
+    assert not os.path.exists(resolve_path(first.path))
+
+    db_session.add(_document(second))
+    db_session.commit()
+
+    assert os.path.exists(resolve_path(second.path))
+    assert _keeps() == []
+
+
+def test_release_after_commit_removes_file(db_session):
+    stored = _upload(f'einmalig {uuid.uuid4()}'.encode())
+    document = _document(stored)
+    db_session.add(document)
+    db_session.commit()
+
+    assert release_blob(stored.path) is False
+    db_session.delete(document)
+    db_session.commit()
+    assert release_blob(stored.path) is True
+    assert not os.path.exists(resolve_path(stored.path))
+
+    # Ein späterer Commit stellt nichts wieder her
+    db_session.commit()
+    assert not os.path.exists(resolve_path(stored.path))
+
+
+def test_rollback_discards_keep_links(db_session):
+    _upload(f'verworfen {uuid.uuid4()}'.encode())
+    assert _keeps()
+
+    db_session.rollback()
+    assert _keeps() == []
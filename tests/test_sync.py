@@ -0,0 +1,139 @@
+import datetime
+
+import pytest
+
+from app.models import MeterReading, SyncChange
+from app.routes.sync import prune_sync_changes
+
+CHANGES = '/api/sync/changes'
+READINGS = '/api/sync/readings'
+
+
+@pytest.fixture
+def api(app, auth_headers):
+    client = app.test_client()
+
+    def request(method, url, **kwargs):
+        return client.open(url, method=method, headers=auth_headers, **kwargs)
+    return request
+
+
+@pytest.fixture
+def reading(db_session, meter):
+    reading = MeterReading(meter_id=meter.id, reading_value=100, reading_date=datetime.date(2024, 1, 10),
+                           reading_type='actual')
+    db_session.add(reading)
+    db_session.commit()
+    return reading
+
+
+def _changes(api, since=None):
+    response = api('GET', CHANGES if since is None else f'{CHANGES}?since={since}')
+    assert response.status_code == 200
+    return response.json
+
+
+def test_snapshot_without_token(api, meter, reading):
+    data = _changes(api)
+
+    assert data['full_sync'] is True
+    assert meter.id in {item['id'] for item in data['meters']}
+    assert reading.id in {item['id'] for item in data['latest_readings']}
+    assert int(data['token']) > 0
+
+
+def test_delta_after_token(api, meter, reading):
+    token = _changes(api)['token']
+
+    response = api('POST', READINGS, json=[{'meter_id': meter.id, 'reading_value': 150, 'reading_date': '2024-02-01'}])
+    assert response.status_code == 201
+
+    data = _changes(api, token)
+    assert data['full_sync'] is False
+    assert int(data['token']) > int(token)
+    assert [item['reading_value'] for item in data['latest_readings'] if item['meter_id'] == meter.id] == [150]
+    assert data['meters'] == []
+
+    # Nichts Neues: leeres Delta, gleicher Token
+    again = _changes(api, data['token'])
+    assert again['full_sync'] is False and again['token'] == data['token'] and again['latest_readings'] == []
+
+
+def test_unknown_token_gets_snapshot(api, meter):
+    current = int(_changes(api)['token'])
+
+    assert _changes(api, current + 1000)['full_sync'] is True
+    assert api('GET', f'{CHANGES}?since=abc').status_code == 400
+
+
+def _upload(api, *items):
+    response = api('POST', READINGS, json=list(items))
+    return response.status_code, response.json['results']
+
+
+def test_duplicate_conflict(api, meter, reading):
+    status, results = _upload(api, {'meter_id': meter.id, 'reading_value': 100, 'reading_date': '2024-01-10',
+                                    'client_id': 'c1', 'force': True})
+
+    assert status == 422
+    assert results[0]['conflict'] == 'duplicate'
+    assert results[0]['client_id'] == 'c1'
+    assert results[0]['server_reading']['id'] == reading.id
+
+
+def test_stale_base_conflict_and_force(api, meter, reading):
+    item = {'meter_id': meter.id, 'reading_value': 120, 'reading_date': '2024-02-01', 'base_reading_id': 'veraltet'}
+
+    status, results = _upload(api, item)
+    assert status == 422
+    assert results[0]['conflict'] == 'stale_base'
+
+    status, results = _upload(api, dict(item, force=True))
+    assert status == 201
+    assert results[0]['status'] == 'created'
+
+
+def test_matching_base_is_accepted(api, meter, reading):
+    status, _ = _upload(api, {'meter_id': meter.id, 'reading_value': 120, 'reading_date': '2024-02-01',
+                              'base_reading_id': reading.id})
+
+    assert status == 201
+
+
+def test_lower_than_previous_conflict_and_force(api, meter, reading):
+    item = {'meter_id': meter.id, 'reading_value': 50, 'reading_date': '2024-02-01'}
+
+    status, results = _upload(api, item, {'meter_id': meter.id, 'reading_value': 130, 'reading_date': '2024-02-02'})
+    assert status == 207
+    assert results[0]['conflict'] == 'lower_than_previous'
+    assert results[1]['status'] == 'created'
+
+    status, results = _upload(api, dict(item, force=True))
+    assert status == 201
+    assert MeterReading.query.filter_by(meter_id=meter.id, reading_value=50).count() == 1
+
+
+def test_pruned_token_gets_snapshot(app, api, db_session, meter):
+    old = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+    stale_token = int(_changes(api)['token'])
+    for number in range(3):
+        db_session.add(SyncChange(table_name='meters', record_id=meter.id, action='update', created_at=old))
+    db_session.commit()
+    newest = db_session.query(SyncChange.seq).order_by(SyncChange.seq.desc()).limit(1).scalar()
+    old_token = newest - 1
+
+    assert _changes(api, old_token)['full_sync'] is False
+
+    app.config['SYNC_CHANGE_RETENTION_DAYS'] = 30
+    try:
+        result = prune_sync_changes()
+    finally:
+        app.config.pop('SYNC_CHANGE_RETENTION_DAYS')
+
+    assert result['deleted'] >= 2
+    # Die neueste Zeile bleibt, damit der Token erhalten bleibt
+    assert db_session.query(SyncChange.seq).filter(SyncChange.seq == newest).scalar() == newest
+    assert _changes(api, stale_token)['full_sync'] is True
+    # Token direkt vor der ältesten erhaltenen Zeile: weiterhin Delta
+    assert _changes(api, newest - 1)['full_sync'] is False
+    assert int(_changes(api)['token']) == newest
@@ -0,0 +1,77 @@
+import io
+import os
+import uuid
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from app.utils import thumbnails
+from app.utils.storage import store_upload, upload_root
+from app.utils.thumbnails import derivative_file, failure_marker
+
+
+@pytest.fixture
+def inline(app, db_session, monkeypatch):
+    monkeypatch.setitem(app.config, 'THUMBNAIL_WORKERS', 0)
+    calls = []
+    schedule = thumbnails.schedule_derivatives
+
+    def counting(*args):
+        calls.append(args)
+        return schedule(*args)
+
+    monkeypatch.setattr(thumbnails, 'schedule_derivatives', counting)
+    with app.test_request_context():
+        yield calls
+    db_session.rollback()
+
+
+def _store(content, filename):
+    return store_upload(FileStorage(io.BytesIO(content), filename=filename)).path
+
+
+def _jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), (40, 120, 200)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def test_derivative_is_created(inline):
+    path = _store(_jpeg() + uuid.uuid4().bytes, 'foto.jpg')
+
+    result = derivative_file(path, 'meter_photos', 'thumb')
+
+    assert result is not None and os.path.exists(result)
+    with Image.open(result) as image:
+        assert max(image.size) == 320
+
+
+def test_failure_is_cached(inline):
+    path = _store(f'kein Bild {uuid.uuid4()}'.encode(), 'foto.jpg')
+
+    assert derivative_file(path, 'meter_photos', 'thumb') is None
+    assert os.path.exists(failure_marker(path, 'meter_photos'))
+    assert derivative_file(path, 'meter_photos', 'preview') is None
+    assert len(inline) == 1
+
+
+def test_replaced_legacy_file_is_retried(inline):
+    name = f'{uuid.uuid4().hex}.jpg'
+    directory = os.path.join(upload_root(), 'meter_photos')
+    os.makedirs(directory, exist_ok=True)
+    source = os.path.join(directory, name)
+    with open(source, 'wb') as handle:
+        handle.write(b'kaputt')
+
+    assert derivative_file(name, 'meter_photos', 'thumb') is None
+    assert derivative_file(name, 'meter_photos', 'thumb') is None
+    assert len(inline) == 1
+
+    with open(source, 'wb') as handle:
+        handle.write(_jpeg())
+    marked = os.path.getmtime(failure_marker(name, 'meter_photos'))
+    os.utime(source, (marked + 10, marked + 10))
+
+    assert derivative_file(name, 'meter_photos', 'thumb') is not None
+    assert len(inline) == 2
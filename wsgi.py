@@ -0,0 +1,24 @@
+"""WSGI-Einstiegspunkt für den Produktivbetrieb.
+
+Start: ``flask --app wsgi init-db && gunicorn -c gunicorn.conf.py wsgi:app``
+
+Der Import legt keine Tabellen an und migriert nichts; das erledigt
+``init-db`` vorher (im Docker-Image automatisch).
+
+Die App wird (mit ``preload_app``) einmal im Master geladen. Threads
+überleben keinen Fork, deshalb startet der ``post_fork``-Hook in
+``gunicorn.conf.py`` die Hintergrundjobs in jedem Worker; die Sperrzeilen
+sorgen dafür, dass jeder Job trotzdem nur einmal läuft. Andere WSGI-Server
+rufen ``start_background_jobs(app)`` selbst auf.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+for directory in ['data', 'uploads', 'backups', 'logs']:
+    os.makedirs(directory, exist_ok=True)
+
+from app import create_app  # noqa: E402
+
+app = create_app()